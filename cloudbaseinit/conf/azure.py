@@ -30,7 +30,15 @@ class AzureOptions(conf_base.Options):
                 "transport_cert_store_name",
                 default="Windows Azure Environment",
                 help="Certificate store name for metadata certificates"),
-        ]
+            cfg.IntOpt(
+                "health_report_timeout", default=60,
+                help="The time in seconds to wait for the pending health "
+                     "and role properties reports to be posted, when the "
+                     "provisioning is completed or failed, or when the "
+                     "metadata service is cleaned up. The reports are "
+                     "posted in the background, without blocking the "
+                     "plugins execution"),
+        ] + conf_base.get_retry_options()
 
     def register(self):
         """Register the current options to the global ConfigOpts object."""
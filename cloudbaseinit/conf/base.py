@@ -14,6 +14,7 @@
 
 import abc
 
+from oslo_config import cfg
 import six
 
 
@@ -40,3 +41,29 @@ class Options(object):
     def list(self):
         """Return a list which contains all the available options."""
         pass
+
+
+def get_retry_options():
+    """Get the retry options which can be overridden by a service section.
+
+    The options which are not set in the service section default to
+    the values from the DEFAULT section.
+    """
+    return [
+        cfg.IntOpt(
+            "retry_count", default=None,
+            help="Max. number of attempts for fetching metadata in "
+                 "case of transient errors"),
+        cfg.FloatOpt(
+            "retry_count_interval", default=None,
+            help="Interval between attempts in case of transient errors, "
+                 "expressed in seconds"),
+        cfg.FloatOpt(
+            "retry_max_interval", default=None,
+            help="Max. interval between attempts in case of transient "
+                 "errors, expressed in seconds"),
+        cfg.FloatOpt(
+            "retry_call_deadline", default=None,
+            help="Max. time spent retrying a single metadata request, "
+                 "expressed in seconds"),
+    ]
@@ -46,7 +46,7 @@ class CloudStackOptions(conf_base.Options):
             cfg.BoolOpt(
                 "add_metadata_private_ip_route", default=False,
                 help="Add a route for the metadata ip address to the gateway"),
-        ]
+        ] + conf_base.get_retry_options()
 
     def register(self):
         """Register the current options to the global ConfigOpts object."""
@@ -48,7 +48,81 @@ class GlobalOptions(conf_base.Options):
             cfg.FloatOpt(
                 'retry_count_interval', default=4,
                 help='Interval between attempts in case of transient errors, '
-                     'expressed in seconds'),
+                     'expressed in seconds. The interval is doubled after '
+                     'each failed attempt, up to "retry_max_interval"'),
+            cfg.FloatOpt(
+                'retry_max_interval', default=10,
+                help='Max. interval between attempts in case of transient '
+                     'errors, expressed in seconds. It limits the delays '
+                     'requested by the metadata services through '
+                     'Retry-After as well'),
+            cfg.BoolOpt(
+                'retry_jitter', default=True,
+                help='Wait a random amount of time, up to the computed '
+                     'interval, between attempts. This avoids lockstep '
+                     'retries when many instances are booting at the '
+                     'same time'),
+            cfg.FloatOpt(
+                'retry_call_deadline', default=None,
+                help='Max. time spent retrying a single metadata request, '
+                     'expressed in seconds. Unlimited if not set'),
+            cfg.FloatOpt(
+                'retry_boot_deadline', default=None,
+                help='Max. total time spent waiting between retries '
+                     'during an execution, expressed in seconds. '
+                     'Unlimited if not set'),
+            cfg.IntOpt(
+                'metadata_http_pool_size', default=10,
+                help='Max. number of persistent connections kept open by '
+                     'each HTTP metadata service for a metadata host'),
+            cfg.FloatOpt(
+                'metadata_http_connect_timeout', default=10,
+                help='Timeout for establishing a connection to an HTTP '
+                     'metadata service, expressed in seconds. Set to None '
+                     'to wait for the operating system timeout'),
+            cfg.FloatOpt(
+                'metadata_http_read_timeout', default=60,
+                help='Timeout for receiving data from an HTTP metadata '
+                     'service, expressed in seconds. Set to None to wait '
+                     'indefinitely'),
+            cfg.BoolOpt(
+                'metadata_http_trust_env', default=True,
+                help='Use the proxy settings and the other HTTP settings '
+                     'available in the environment variables when '
+                     'connecting to the HTTP metadata services'),
+            cfg.StrOpt(
+                'metadata_cache_path', default=None,
+                help='Directory where the metadata retrieved from the HTTP '
+                     'metadata services is cached across executions. '
+                     'A cached document is revalidated with the metadata '
+                     'service and reused only if it did not change. '
+                     'The passwords and the user data are never cached. '
+                     'Set to None (default) to disable'),
+            cfg.IntOpt(
+                'metadata_cache_max_size', default=10 * 1024 * 1024,
+                help='Max. size in bytes of the metadata cached for each '
+                     'metadata service in "metadata_cache_path"'),
+            cfg.IntOpt(
+                'metadata_cache_max_memory', default=16 * 1024 * 1024,
+                help='Max. amount of memory in bytes used for caching the '
+                     'metadata retrieved during the execution. The least '
+                     'recently used metadata above this limit is moved to '
+                     'temporary files'),
+            cfg.IntOpt(
+                'metadata_cache_spill_size', default=1024 * 1024,
+                help='Size in bytes above which the metadata retrieved '
+                     'during the execution, e.g. the user data, is cached '
+                     'in a temporary file instead of memory'),
+            cfg.BoolOpt(
+                'metadata_prefetch', default=False,
+                help='Retrieve concurrently the metadata needed by the '
+                     'plugins as soon as the metadata service is loaded. '
+                     'The plugins will use the already retrieved data '
+                     'or wait for the requests still in progress'),
+            cfg.IntOpt(
+                'metadata_prefetch_workers', default=4,
+                help='Max. number of concurrent metadata requests issued '
+                     'when prefetching the metadata'),
             cfg.StrOpt(
                 'mtools_path', default=None,
                 help='Path to "mtools" program suite, used for interacting '
@@ -56,7 +130,10 @@ class GlobalOptions(conf_base.Options):
             cfg.StrOpt(
                 'bsdtar_path', default='bsdtar.exe',
                 help='Path to "bsdtar", used to extract ISO ConfigDrive '
-                     'files'),
+                     'files',
+                deprecated_for_removal=True,
+                deprecated_reason='The ISO ConfigDrive files are read '
+                                  'without "bsdtar"'),
             cfg.BoolOpt(
                 'netbios_host_name_compatibility', default=True,
                 help='Truncates the hostname to 15 characters for Netbios '
@@ -113,6 +190,34 @@ class GlobalOptions(conf_base.Options):
                 'mtu_use_dhcp_config', default=True,
                 help='Configures the network interfaces MTU based on the '
                      'values provided via DHCP'),
+            cfg.ListOpt(
+                'dhcp_options_providers',
+                default=[
+                    'cloudbaseinit.utils.dhcpoptions.'
+                    'LeaseFileDHCPOptionsProvider',
+                    'cloudbaseinit.utils.dhcpoptions.'
+                    'LiveDHCPOptionsProvider',
+                ],
+                help='The sources of the DHCP options, in order. Each '
+                     'source is asked only for the options which the '
+                     'previous ones did not provide'),
+            cfg.ListOpt(
+                'dhcp_lease_files',
+                default=[
+                    '/var/lib/dhcp/dhclient*.leases',
+                    '/var/lib/dhclient/*.lease*',
+                    '/run/systemd/netif/leases/*',
+                    '/var/lib/NetworkManager/*.lease',
+                ],
+                help='Glob patterns of the lease files written by the '
+                     'DHCP clients of the OS (dhclient, systemd-networkd, '
+                     'NetworkManager), read for the DHCP options instead '
+                     'of querying the DHCP servers'),
+            cfg.IntOpt(
+                'dhcp_options_cache_ttl', default=600,
+                help='The number of seconds for which the DHCP options are '
+                     'cached and shared by the plugins and metadata '
+                     'services. 0 disables the caching'),
             cfg.StrOpt(
                 'username', default='Admin', help='User to be added to the '
                 'system or updated if already existing'),
@@ -174,6 +279,34 @@ class GlobalOptions(conf_base.Options):
                      'to be tested for availability in the provided order. '
                      'The first available service will be used to retrieve '
                      'metadata'),
+            cfg.BoolOpt(
+                'metadata_services_parallel_discovery', default=False,
+                help='Probe all the enabled metadata services concurrently. '
+                     'The order given in "metadata_services" is still '
+                     'honored: the first service in the list which loads '
+                     'successfully is used, while the others are cleaned '
+                     'up'),
+            cfg.BoolOpt(
+                'metadata_services_fingerprint', default=False,
+                help='Identify the cloud platform from the SMBIOS / DMI '
+                     'identifiers and the attached metadata drives, in '
+                     'order to try first the metadata services used by '
+                     'the platform and skip the ones which cannot be '
+                     'available on it'),
+            cfg.BoolOpt(
+                'metadata_discovery_hints', default=False,
+                help='Remember the metadata service and the config drive '
+                     'found during the previous execution, in order to '
+                     'try them first, while the services which failed '
+                     'are tried last. The hints are discarded when the '
+                     'SMBIOS / DMI identifiers of the machine change'),
+            cfg.FloatOpt(
+                'metadata_discovery_deadline', default=None,
+                help='Max. number of seconds spent discovering the '
+                     'metadata service, including the retries. When '
+                     'exceeded, the services still loading are abandoned '
+                     'and the remaining ones are not tried. Set to None '
+                     '(default) to wait for all the services'),
             cfg.ListOpt(
                 'plugins',
                 default=[
@@ -44,7 +44,39 @@ class EC2Options(conf_base.Options):
                 "https_ca_bundle", default=None,
                 help="The path to a CA_BUNDLE file or directory with "
                      "certificates of trusted CAs."),
-        ]
+            cfg.BoolOpt(
+                "imdsv2", default=True,
+                help="Use the session tokens of the instance metadata "
+                     "service version 2 (IMDSv2). The unauthenticated "
+                     "requests of IMDSv1 are used if the metadata service "
+                     "does not provide session tokens."),
+            cfg.IntOpt(
+                "imdsv2_token_ttl", default=21600, min=1, max=21600,
+                help="The lifetime in seconds of the IMDSv2 session tokens. "
+                     "A token is reused for all the requests until shortly "
+                     "before it expires."),
+            cfg.BoolOpt(
+                "metadata_crawl", default=True,
+                help="Retrieve the metadata given by metadata_crawl_paths "
+                     "concurrently, once the service is loaded, instead of "
+                     "requesting each value when it is needed."),
+            cfg.ListOpt(
+                "metadata_crawl_paths",
+                default=["instance-id", "local-hostname",
+                         "public-keys/*/openssh-key"],
+                help="The meta-data paths to crawl. A '*' path segment "
+                     "matches all the entries of the parent listing, while "
+                     "a trailing '/' crawls the whole subtree, up to "
+                     "metadata_crawl_depth levels."),
+            cfg.IntOpt(
+                "metadata_crawl_depth", default=3, min=1,
+                help="The max. number of levels crawled below the paths "
+                     "ending with a '/'."),
+            cfg.IntOpt(
+                "metadata_crawl_workers", default=8, min=1,
+                help="The max. number of concurrent requests used for "
+                     "crawling the metadata."),
+        ] + conf_base.get_retry_options()
 
     def register(self):
         """Register the current options to the global ConfigOpts object."""
@@ -54,7 +54,7 @@ class MAASOptions(conf_base.Options):
                 "https_ca_bundle", default=None,
                 help="The path to a CA_BUNDLE file or directory with "
                      "certificates of trusted CAs."),
-        ]
+        ] + conf_base.get_retry_options()
 
     def register(self):
         """Register the current options to the global ConfigOpts object."""
@@ -42,7 +42,7 @@ class OpenStackOptions(conf_base.Options):
                 "https_ca_bundle", default=None,
                 help="The path to a CA_BUNDLE file or directory with "
                      "certificates of trusted CAs."),
-        ]
+        ] + conf_base.get_retry_options()
 
     def register(self):
         """Register the current options to the global ConfigOpts object."""
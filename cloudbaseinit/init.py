@@ -24,6 +24,7 @@ from cloudbaseinit.metadata import factory as metadata_factory
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins.common import base as plugins_base
 from cloudbaseinit.plugins import factory as plugins_factory
+from cloudbaseinit.utils import dhcpoptions
 from cloudbaseinit.utils import log as logging
 from cloudbaseinit import version
 
@@ -194,6 +195,11 @@ class InitManager(object):
             LOG.info('Metadata service loaded: \'%s\'' %
                      service.get_name())
 
+            if CONF.metadata_prefetch:
+                # Overlaps with the following steps, which wait for
+                # the requests still in progress if needed.
+                service.prefetch(wait=False)
+
             if CONF.metadata_report_provisioning_started:
                 LOG.info("Reporting provisioning started")
                 service.provisioning_started()
@@ -206,6 +212,10 @@ class InitManager(object):
                     osutils, service, instance_id,
                     plugins_base.PLUGIN_STAGE_MAIN)
             finally:
+                LOG.debug('Metadata cache statistics: %s',
+                          service.get_cache_stats())
+                LOG.debug('DHCP options cache statistics: %s',
+                          dhcpoptions.get_stats())
                 service.cleanup()
 
             if (CONF.metadata_report_provisioning_completed and
@@ -12,10 +12,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import multiprocessing
+from multiprocessing import pool as multiprocessing_pool
+import threading
+import time
+
 from oslo_log import log as oslo_logging
 
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import exception
+from cloudbaseinit.metadata import fingerprint
+from cloudbaseinit.metadata import hints
 from cloudbaseinit.utils import classloader
 
 
@@ -23,15 +30,225 @@ CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
 
 
-def get_metadata_service():
-    # Return the first service that loads correctly
+def _load_service(service, class_path):
+    start_time = time.time()
+    try:
+        if service.load():
+            return True
+    except Exception as ex:
+        LOG.error("Failed to load metadata service '%s'" % class_path)
+        LOG.exception(ex)
+    finally:
+        LOG.debug("Probing metadata service '%(class_path)s' took "
+                  "%(elapsed).2f seconds",
+                  {"class_path": class_path,
+                   "elapsed": time.time() - start_time})
+    return False
+
+
+def _get_remaining_time(deadline):
+    if deadline is None:
+        return None
+    return max(0, deadline - time.time())
+
+
+def _get_discovery_deadline():
+    if CONF.metadata_discovery_deadline is None:
+        return None
+    return time.time() + CONF.metadata_discovery_deadline
+
+
+def _load_service_with_deadline(service, class_path, deadline):
+    """Load the service, abandoning it after the discovery deadline.
+
+    An abandoned service keeps loading in a daemon thread and it is
+    cleaned up if it eventually loads.
+    """
+    if deadline is None:
+        return _load_service(service, class_path)
+
+    lock = threading.Lock()
+    state = {"abandoned": False, "loaded": False}
+
+    def _on_service_loaded(loaded):
+        with lock:
+            state["loaded"] = loaded
+            is_abandoned = state["abandoned"]
+        if loaded and is_abandoned:
+            _cleanup_service(service)
+
+    thread_pool = multiprocessing_pool.ThreadPool(1)
+    try:
+        result = thread_pool.apply_async(
+            _load_service, (service, class_path),
+            callback=_on_service_loaded)
+        try:
+            return result.get(_get_remaining_time(deadline))
+        except multiprocessing.TimeoutError:
+            with lock:
+                state["abandoned"] = True
+                is_loaded = state["loaded"]
+            if is_loaded:
+                # Loaded right at the deadline, before being abandoned.
+                _cleanup_service(service)
+            LOG.warning("Abandoning metadata service '%s' after the "
+                        "discovery deadline", class_path)
+            return False
+    finally:
+        thread_pool.close()
+
+
+def _cleanup_service(service):
+    try:
+        service.cleanup()
+    except Exception as ex:
+        LOG.error("Failed to cleanup metadata service '%s'" %
+                  service.get_name())
+        LOG.exception(ex)
+
+
+class _ParallelServiceLoader(object):
+
+    """Load all the given metadata services concurrently.
+
+    The services are probed at the same time, but the result honors
+    the order in which the services were given: a service is returned
+    only after all the services with a higher priority failed to load,
+    or were abandoned after the discovery deadline. The services which
+    loaded successfully, but were not chosen, are cleaned up, including
+    the ones which finish loading after the discovery ended.
+    """
+
+    def __init__(self, services):
+        self._services = services
+        self._lock = threading.Lock()
+        self._loaded = []
+        self._done = False
+        self.failed_class_paths = []
+
+    def _on_service_loaded(self, service, loaded):
+        if not loaded:
+            return
+        with self._lock:
+            self._loaded.append(service)
+            is_loser = self._done
+        if is_loser:
+            _cleanup_service(service)
+
+    def _finish(self, winner=None):
+        with self._lock:
+            self._done = True
+            losers = [service for service in self._loaded
+                      if service is not winner]
+        for service in losers:
+            _cleanup_service(service)
+
+    def load(self):
+        deadline = _get_discovery_deadline()
+        thread_pool = multiprocessing_pool.ThreadPool(len(self._services))
+        try:
+            results = []
+            for class_path, service in self._services:
+                callback = (lambda loaded, service=service:
+                            self._on_service_loaded(service, loaded))
+                results.append(thread_pool.apply_async(
+                    _load_service, (service, class_path), callback=callback))
+
+            for (class_path, service), result in zip(self._services,
+                                                     results):
+                try:
+                    loaded = result.get(_get_remaining_time(deadline))
+                except multiprocessing.TimeoutError:
+                    LOG.warning("Abandoning metadata service '%s' after "
+                                "the discovery deadline", class_path)
+                    loaded = False
+                if loaded:
+                    self._finish(service)
+                    return class_path, service
+                self.failed_class_paths.append(class_path)
+            self._finish()
+            return None, None
+        finally:
+            # The remaining probes are not waited for, their results
+            # are handled by the callback.
+            thread_pool.close()
+
+
+def _get_fingerprint():
+    if not (CONF.metadata_services_fingerprint or
+            CONF.metadata_discovery_hints):
+        return None
+    try:
+        return fingerprint.get_fingerprint()
+    except Exception as ex:
+        LOG.warning("Failed to get the platform fingerprint")
+        LOG.exception(ex)
+
+
+def _get_service_class_paths(platform_fingerprint=None,
+                             discovery_hints=None):
+    class_paths = CONF.metadata_services
+    if CONF.metadata_services_fingerprint and platform_fingerprint:
+        class_paths = fingerprint.order_services(class_paths,
+                                                 platform_fingerprint)
+    if discovery_hints:
+        class_paths = discovery_hints.order_services(class_paths)
+    if class_paths != CONF.metadata_services:
+        LOG.debug("Metadata services probing order: %s", class_paths)
+    return class_paths
+
+
+def _save_discovery_hints(discovery_hints, class_path, failed_class_paths):
+    try:
+        discovery_hints.set_discovery_result(class_path, failed_class_paths)
+        discovery_hints.save()
+    except Exception as ex:
+        LOG.warning("Failed to save the metadata discovery hints")
+        LOG.exception(ex)
+
+
+def _load_services(class_paths):
+    """Get the first service which loads, as a (class_path, service) tuple.
+
+    The class paths of the services which failed to load are returned
+    as well.
+    """
     cl = classloader.ClassLoader()
-    for class_path in CONF.metadata_services:
+    if CONF.metadata_services_parallel_discovery:
+        services = [(class_path, cl.load_class(class_path)())
+                    for class_path in class_paths]
+        if not services:
+            return None, None, []
+        loader = _ParallelServiceLoader(services)
+        class_path, service = loader.load()
+        return class_path, service, loader.failed_class_paths
+
+    deadline = _get_discovery_deadline()
+    failed_class_paths = []
+    for index, class_path in enumerate(class_paths):
+        if deadline is not None and time.time() >= deadline:
+            # The services not probed yet are not counted as failed.
+            LOG.warning("Metadata discovery deadline reached, not "
+                        "probing: %s", class_paths[index:])
+            break
         service = cl.load_class(class_path)()
-        try:
-            if service.load():
-                return service
-        except Exception as ex:
-            LOG.error("Failed to load metadata service '%s'" % class_path)
-            LOG.exception(ex)
+        if _load_service_with_deadline(service, class_path, deadline):
+            return class_path, service, failed_class_paths
+        failed_class_paths.append(class_path)
+    return None, None, failed_class_paths
+
+
+def get_metadata_service():
+    # Return the first service that loads correctly
+    platform_fingerprint = _get_fingerprint()
+    discovery_hints = hints.get_discovery_hints(platform_fingerprint)
+    class_paths = _get_service_class_paths(platform_fingerprint,
+                                           discovery_hints)
+
+    class_path, service, failed_class_paths = _load_services(class_paths)
+    if discovery_hints:
+        _save_discovery_hints(discovery_hints, class_path,
+                              failed_class_paths)
+    if service:
+        return service
     raise exception.MetadaNotFoundException("No available service found")
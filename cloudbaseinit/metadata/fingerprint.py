@@ -0,0 +1,159 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Identify the cloud platform before probing the metadata services."""
+
+import collections
+import hashlib
+import os
+
+from oslo_log import log as oslo_logging
+
+from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.utils import dmi
+
+LOG = oslo_logging.getLogger(__name__)
+
+PLATFORM_AZURE = "azure"
+PLATFORM_EC2 = "ec2"
+PLATFORM_OPENSTACK = "openstack"
+
+HINT_CONFIG_DRIVE = "config_drive"
+HINT_AZURE_OVF = "azure_ovf"
+
+# The chassis asset tag set by Hyper-V on Azure.
+AZURE_CHASSIS_ASSET_TAG = "7783-7084-3265-9085-8269-3286-77"
+# The file available on the Azure provisioning drive, see azureservice.
+AZURE_OVF_ENV_DRIVE_TAG = "E6DA6616-8EC4-48E0-BE93-58CE6ACE3CFB.tag"
+CONFIG_DRIVE_LABEL = "config-2"
+
+_SERVICES_PATH = "cloudbaseinit.metadata.services."
+AZURE_SERVICE = _SERVICES_PATH + "azureservice.AzureService"
+CONFIG_DRIVE_SERVICE = _SERVICES_PATH + "configdrive.ConfigDriveService"
+EC2_SERVICE = _SERVICES_PATH + "ec2service.EC2Service"
+OPENSTACK_HTTP_SERVICE = _SERVICES_PATH + "httpservice.HttpService"
+
+# The services to try first on each platform, in this order.
+_PLATFORM_SERVICES = {
+    PLATFORM_AZURE: (AZURE_SERVICE,),
+    PLATFORM_EC2: (EC2_SERVICE,),
+    PLATFORM_OPENSTACK: (CONFIG_DRIVE_SERVICE, OPENSTACK_HTTP_SERVICE),
+}
+# The services which cannot be available outside of their platform.
+_EXCLUSIVE_SERVICES = {
+    AZURE_SERVICE: PLATFORM_AZURE,
+    EC2_SERVICE: PLATFORM_EC2,
+}
+
+Fingerprint = collections.namedtuple(
+    "Fingerprint", ["dmi_info", "hints", "platform"])
+
+
+def _contains(value, text):
+    return bool(value) and text in value.lower()
+
+
+def _get_platform(dmi_info, hints):
+    asset_tag = dmi_info.get(dmi.CHASSIS_ASSET_TAG)
+    sys_vendor = dmi_info.get(dmi.SYS_VENDOR)
+    product_name = dmi_info.get(dmi.PRODUCT_NAME)
+    product_uuid = dmi_info.get(dmi.PRODUCT_UUID)
+
+    if asset_tag == AZURE_CHASSIS_ASSET_TAG or HINT_AZURE_OVF in hints:
+        return PLATFORM_AZURE
+    if (_contains(sys_vendor, "amazon") or
+            (product_uuid or "").lower().startswith("ec2")):
+        return PLATFORM_EC2
+    if (_contains(product_name, "openstack") or
+            _contains(sys_vendor, "openstack") or
+            _contains(asset_tag, "openstack")):
+        return PLATFORM_OPENSTACK
+    return None
+
+
+def _get_local_hints(osutils):
+    """Look for the metadata drives attached to the machine."""
+    hints = set()
+    try:
+        drives = osutils.get_logical_drives()
+    except (AttributeError, NotImplementedError):
+        return hints
+
+    for drive in drives:
+        if os.path.exists(os.path.join(drive, AZURE_OVF_ENV_DRIVE_TAG)):
+            hints.add(HINT_AZURE_OVF)
+        label = osutils.get_volume_label(drive)
+        if label and label.lower() == CONFIG_DRIVE_LABEL:
+            hints.add(HINT_CONFIG_DRIVE)
+    return hints
+
+
+def get_fingerprint(dmi_source=None, osutils=None):
+    """Get the identifiers of the machine and the detected platform.
+
+    :param dmi_source: A :class:`~cloudbaseinit.utils.dmi.BaseDMISource`,
+                       defaulting to the one of the current OS.
+    :param osutils: The OS utils used to look for local hints.
+    """
+    dmi_source = dmi_source or dmi.get_dmi_source()
+    osutils = osutils or osutils_factory.get_os_utils()
+
+    dmi_info = dmi_source.get_dmi_info()
+    hints = frozenset(_get_local_hints(osutils))
+    platform = _get_platform(dmi_info, hints)
+    LOG.debug("Platform fingerprint: %(dmi_info)s, hints: %(hints)s, "
+              "platform: %(platform)s",
+              {"dmi_info": dmi_info, "hints": sorted(hints),
+               "platform": platform})
+    return Fingerprint(dmi_info=dmi_info, hints=hints, platform=platform)
+
+
+def get_hardware_id(fingerprint):
+    """Get a digest of the DMI identifiers of the fingerprint."""
+    dmi_info = fingerprint.dmi_info
+    values = "\n".join("%s=%s" % (field, dmi_info.get(field) or "")
+                       for field in dmi.DMI_FIELDS)
+    return hashlib.sha256(values.encode("utf-8")).hexdigest()
+
+
+def order_services(class_paths, fingerprint):
+    """Reorder and prune the metadata services based on the fingerprint.
+
+    The services known to be used by the detected platform are moved
+    first, while the services which are exclusive to another platform
+    are removed. The relative order of the other services is kept.
+    """
+    preferred = list(_PLATFORM_SERVICES.get(fingerprint.platform, ()))
+    if HINT_CONFIG_DRIVE in fingerprint.hints:
+        preferred.insert(0, CONFIG_DRIVE_SERVICE)
+
+    candidates = []
+    for class_path in class_paths:
+        platform = _EXCLUSIVE_SERVICES.get(class_path)
+        if fingerprint.platform and platform not in (
+                None, fingerprint.platform):
+            LOG.debug("Skipping metadata service '%(class_path)s' on "
+                      "platform %(platform)s",
+                      {"class_path": class_path,
+                       "platform": fingerprint.platform})
+            continue
+        candidates.append(class_path)
+
+    def _get_rank(class_path):
+        if class_path in preferred:
+            return preferred.index(class_path)
+        return len(preferred)
+
+    # sorted() is stable, the order of the equally ranked items is kept.
+    return sorted(candidates, key=_get_rank)
@@ -0,0 +1,150 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Results of the previous metadata discovery, used to speed up the next."""
+
+from oslo_log import log as oslo_logging
+
+from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit.metadata import fingerprint
+from cloudbaseinit.osutils import factory as osutils_factory
+
+CONF = cloudbaseinit_conf.CONF
+LOG = oslo_logging.getLogger(__name__)
+
+HINTS_CONFIG_SECTION = "DiscoveryHints"
+
+HARDWARE_ID = "HardwareId"
+SERVICE = "MetadataService"
+FAILED_SERVICES = "FailedMetadataServices"
+CONFIG_DRIVE = "ConfigDrive"
+
+_FIELDS = (HARDWARE_ID, SERVICE, FAILED_SERVICES, CONFIG_DRIVE)
+
+
+class DiscoveryHints(object):
+
+    """Persistent store of the discovery results.
+
+    The hints are stored with the other persistent values of
+    Cloudbase-Init and they are valid only for the hardware they
+    were recorded on.
+    """
+
+    def __init__(self, osutils=None):
+        self._osutils = osutils or osutils_factory.get_os_utils()
+        self._values = dict.fromkeys(_FIELDS)
+        # Only the changed fields are saved, other instances may have
+        # stored their own fields in the meantime.
+        self._changed = set()
+
+    def _get_value(self, name):
+        return self._osutils.get_config_value(name, HINTS_CONFIG_SECTION)
+
+    def _set_value(self, name, value):
+        self._osutils.set_config_value(name, value or "",
+                                       HINTS_CONFIG_SECTION)
+
+    def read(self):
+        for name in _FIELDS:
+            self._values[name] = self._get_value(name) or None
+        self._changed.clear()
+        return self
+
+    def load(self, hardware_id):
+        """Load the hints, discarding them if the hardware changed."""
+        self.read()
+        stored_hardware_id = self._values[HARDWARE_ID]
+        if stored_hardware_id != hardware_id:
+            if stored_hardware_id:
+                LOG.info("The hardware changed, discarding the metadata "
+                         "discovery hints")
+            self._values = dict.fromkeys(_FIELDS)
+            self._values[HARDWARE_ID] = hardware_id
+            self._changed.update(_FIELDS)
+            self.save()
+        return self
+
+    def save(self):
+        """Store the fields changed since the hints were read."""
+        for name in _FIELDS:
+            if name in self._changed:
+                self._set_value(name, self._values[name])
+        self._changed.clear()
+
+    @property
+    def service(self):
+        return self._values[SERVICE]
+
+    @property
+    def failed_services(self):
+        failed_services = self._values[FAILED_SERVICES]
+        return failed_services.split(",") if failed_services else []
+
+    def set_discovery_result(self, service, failed_services):
+        self._values[SERVICE] = service
+        self._values[FAILED_SERVICES] = ",".join(failed_services)
+        self._changed.update((SERVICE, FAILED_SERVICES))
+
+    @property
+    def config_drive(self):
+        """The (type, location) tuple of the config drive, if any."""
+        config_drive = self._values[CONFIG_DRIVE]
+        if config_drive and ":" in config_drive:
+            return tuple(config_drive.split(":", 1))
+        return None
+
+    def set_config_drive(self, cd_type, cd_location):
+        self._values[CONFIG_DRIVE] = "%s:%s" % (cd_type, cd_location)
+        self._set_value(CONFIG_DRIVE, self._values[CONFIG_DRIVE])
+
+    def order_services(self, class_paths):
+        """Move the previous winner first and the failed services last."""
+        failed_services = self.failed_services
+
+        def _get_rank(class_path):
+            if class_path == self.service:
+                return 0
+            if class_path in failed_services:
+                return 2
+            return 1
+
+        return sorted(class_paths, key=_get_rank)
+
+
+def get_discovery_hints(platform_fingerprint=None):
+    """Get the hints valid for this machine, or None if not available."""
+    if not CONF.metadata_discovery_hints:
+        return None
+    try:
+        platform_fingerprint = (platform_fingerprint or
+                                fingerprint.get_fingerprint())
+        hardware_id = fingerprint.get_hardware_id(platform_fingerprint)
+        return DiscoveryHints().load(hardware_id)
+    except NotImplementedError:
+        LOG.debug("Metadata discovery hints are not supported")
+    except Exception as ex:
+        LOG.warning("Failed to load the metadata discovery hints")
+        LOG.exception(ex)
+    return None
+
+
+def get_stored_hints():
+    """Get the hints already validated during the current discovery."""
+    if not CONF.metadata_discovery_hints:
+        return None
+    try:
+        return DiscoveryHints().read()
+    except NotImplementedError:
+        return None
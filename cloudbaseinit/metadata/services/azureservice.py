@@ -12,15 +12,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import contextlib
 import os
 import socket
+import threading
 import time
 from xml.etree import ElementTree
 
 from oslo_log import log as oslo_logging
+import requests
 import six
-import untangle
 
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import constant
@@ -28,7 +30,8 @@ from cloudbaseinit import exception
 from cloudbaseinit.metadata.services import base
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.utils import dhcp
-from cloudbaseinit.utils import encoding
+from cloudbaseinit.utils import dhcpoptions
+from cloudbaseinit.utils import xmlrecords
 from cloudbaseinit.utils.windows import x509
 
 CONF = cloudbaseinit_conf.CONF
@@ -38,6 +41,8 @@ WIRESERVER_DHCP_OPTION = 245
 WIRE_SERVER_VERSION = '2015-04-05'
 
 GOAL_STATE_STARTED = "Started"
+# Returned for the reports referring to an outdated goal state.
+GOAL_STATE_OUTDATED_STATUS_CODE = 410
 
 HEALTH_STATE_READY = "Ready"
 HEALTH_STATE_NOT_READY = "NotReady"
@@ -53,13 +58,192 @@ DATALOSS_WARNING_PATH = '$$\\OEM\\DATALOSS_WARNING_README.txt'
 
 DEFAULT_KMS_HOST = "kms.core.windows.net"
 
+_GOAL_STATE_INCARNATION = "GoalState/Incarnation"
+_GOAL_STATE_EXPECTED_STATE = "GoalState/Machine/ExpectedState"
+_GOAL_STATE_CONTAINER_ID = "GoalState/Container/ContainerId"
+_GOAL_STATE_ROLE_INSTANCE = (
+    "GoalState/Container/RoleInstanceList/RoleInstance")
+_GOAL_STATE_ROLE_INSTANCE_CONFIG = _GOAL_STATE_ROLE_INSTANCE + "/Configuration"
+
+_PROV_CONF_SET = ("Environment/ProvisioningSection/"
+                  "WindowsProvisioningConfigurationSet")
+_PROV_CONF_SET_WINRM_LISTENER = _PROV_CONF_SET + "/WinRM/Listeners/Listener"
+_PLATFORM_SETTINGS = "Environment/PlatformSettingsSection/PlatformSettings"
+
+GoalState = collections.namedtuple(
+    "GoalState", ["incarnation", "expected_state", "container_id",
+                  "role_instance_id", "role_instance_config"])
+
+OvfEnvironment = collections.namedtuple(
+    "OvfEnvironment", ["provisioning_config", "winrm_listeners",
+                       "platform_settings"])
+
+
+def _is_true(value):
+    return (value or "").lower() == "true"
+
+
+def _parse_versions(data):
+    records = xmlrecords.parse(data, ["Versions/Supported/Version"])
+    return [record.text for record in records["Versions/Supported/Version"]]
+
+
+def _parse_goal_state(data):
+    records = xmlrecords.parse(data, [
+        _GOAL_STATE_INCARNATION, _GOAL_STATE_EXPECTED_STATE,
+        _GOAL_STATE_CONTAINER_ID, _GOAL_STATE_ROLE_INSTANCE,
+        _GOAL_STATE_ROLE_INSTANCE_CONFIG])
+    role_instances = records[_GOAL_STATE_ROLE_INSTANCE]
+    role_instance_configs = records[_GOAL_STATE_ROLE_INSTANCE_CONFIG]
+    return GoalState(
+        incarnation=xmlrecords.get_text(records, _GOAL_STATE_INCARNATION),
+        expected_state=xmlrecords.get_text(
+            records, _GOAL_STATE_EXPECTED_STATE),
+        container_id=xmlrecords.get_text(records, _GOAL_STATE_CONTAINER_ID),
+        role_instance_id=(role_instances[0].fields.get("InstanceId")
+                          if role_instances else None),
+        role_instance_config=(role_instance_configs[0].fields
+                              if role_instance_configs else {}))
+
+
+def _parse_certificates_file(data):
+    records = xmlrecords.parse(data, ["CertificateFile"])
+    fields = records["CertificateFile"][0].fields
+    return fields.get("Data"), fields.get("Format")
+
+
+def _parse_stored_certificates(data):
+    path = "HostingEnvironmentConfig/StoredCertificates/StoredCertificate"
+    records = xmlrecords.parse(data, [path])
+    return [record.attrib for record in records[path]]
+
+
+def _parse_ovf_env(path):
+    records = xmlrecords.parse_file(path, [
+        _PROV_CONF_SET, _PROV_CONF_SET_WINRM_LISTENER, _PLATFORM_SETTINGS])
+    prov_conf_sets = records[_PROV_CONF_SET]
+    platform_settings = records[_PLATFORM_SETTINGS]
+    if not prov_conf_sets:
+        raise exception.CloudbaseInitException(
+            "WindowsProvisioningConfigurationSet not found in %s" % path)
+    return OvfEnvironment(
+        provisioning_config=prov_conf_sets[0].fields,
+        winrm_listeners=[record.fields for record in
+                         records[_PROV_CONF_SET_WINRM_LISTENER]],
+        platform_settings=(platform_settings[0].fields
+                           if platform_settings else {}))
+
+
+class _HealthReporter(object):
+
+    """Post the health and role properties reports in the background.
+
+    The reports are posted by a single thread, started when needed.
+    While a report is being posted, only the latest health state is
+    kept, superseding the intermediate ones, and the role properties
+    are merged.
+    """
+
+    def __init__(self, post_health_status, post_role_properties):
+        self._post_health_status = post_health_status
+        self._post_role_properties = post_role_properties
+        self._cond = threading.Condition()
+        self._health_status = None
+        self._role_properties = {}
+        self._stopping = False
+        self._thread = None
+
+    def _has_pending_reports(self):
+        return bool(self._health_status or self._role_properties)
+
+    def _start(self):
+        if not self._thread:
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name="AzureHealthReporter")
+            self._thread.daemon = True
+            self._thread.start()
+        self._cond.notify_all()
+
+    def report_health_status(self, state, sub_status=None, description=None):
+        with self._cond:
+            if self._health_status:
+                LOG.debug("Superseding the pending health state: %s",
+                          self._health_status[0])
+            self._health_status = (state, sub_status, description)
+            self._start()
+
+    def report_role_properties(self, properties):
+        with self._cond:
+            self._role_properties.update(properties)
+            self._start()
+
+    def _post_reports(self, health_status, role_properties):
+        if role_properties:
+            try:
+                self._post_role_properties(role_properties)
+            except Exception as ex:
+                LOG.error("Failed to post the role properties")
+                LOG.exception(ex)
+        if health_status:
+            try:
+                self._post_health_status(*health_status)
+            except Exception as ex:
+                LOG.error("Failed to post the health state: %s",
+                          health_status[0])
+                LOG.exception(ex)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._has_pending_reports() or self._stopping):
+                    self._cond.wait()
+                if not self._has_pending_reports():
+                    self._thread = None
+                    self._cond.notify_all()
+                    return
+                health_status, self._health_status = self._health_status, None
+                role_properties, self._role_properties = (
+                    self._role_properties, {})
+            self._post_reports(health_status, role_properties)
+
+    def stop(self, timeout=None):
+        """Wait for the pending reports to be posted and stop the thread.
+
+        A report made afterwards starts a new thread.
+
+        :returns: False if the reports were not posted in time.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            while self._thread:
+                remaining = (None if deadline is None
+                             else deadline - time.time())
+                if remaining is not None and remaining <= 0:
+                    LOG.warning("Timed out waiting for the health reports "
+                                "to be posted")
+                    return False
+                self._cond.wait(remaining)
+        return True
+
 
 class AzureService(base.BaseHTTPMetadataService):
+    _config_group = 'azure'
+    # The WireServer documents depend on the request headers, e.g. the
+    # certificates are encrypted with the given transport certificate.
+    _disk_cache_supported = False
+    dhcp_options = (WIRESERVER_DHCP_OPTION,)
 
     def __init__(self):
         super(AzureService, self).__init__(base_url=None)
         self._enable_retry = True
         self._goal_state = None
+        self._goal_state_lock = threading.Lock()
+        self._goal_state_documents = {}
+        self._health_reporter = _HealthReporter(
+            self._post_health_status, self._post_role_properties)
         self._config_set_drive_path = None
         self._ovf_env = None
         self._headers = {"x-ms-guest-agent-name": "cloudbase-init"}
@@ -72,8 +256,10 @@ class AzureService(base.BaseHTTPMetadataService):
 
         while True:
             try:
-                options = dhcp.get_dhcp_options()
-                endpoint = (options or {}).get(WIRESERVER_DHCP_OPTION)
+                query = dhcp.get_dhcp_query()
+                options = dhcpoptions.get_dhcp_options(
+                    [query], [WIRESERVER_DHCP_OPTION])
+                endpoint = options[query.name].get(WIRESERVER_DHCP_OPTION)
                 if not endpoint:
                     raise exception.MetadaNotFoundException(
                         "Cannot find Azure WireServer endpoint address")
@@ -87,17 +273,22 @@ class AzureService(base.BaseHTTPMetadataService):
     def _check_version_header(self):
         if "x-ms-version" not in self._headers:
             versions = self._get_versions()
-            if WIRE_SERVER_VERSION not in versions.Versions.Supported.Version:
+            if WIRE_SERVER_VERSION not in versions:
                 raise exception.MetadaNotFoundException(
                     "Unsupported Azure WireServer version: %s" %
                     WIRE_SERVER_VERSION)
-            self._headers["x-ms-version"] = WIRE_SERVER_VERSION
+            # Replaced instead of updated, as the health reports may
+            # be copying the headers from another thread.
+            headers = self._headers.copy()
+            headers["x-ms-version"] = WIRE_SERVER_VERSION
+            self._headers = headers
 
     def _get_versions(self):
-        return self._wire_server_request("?comp=Versions")
+        return self._wire_server_request("?comp=Versions",
+                                         parser=_parse_versions)
 
     def _wire_server_request(self, path, data_xml=None, headers=None,
-                             parse_xml=True):
+                             parser=None):
         if not self._base_url:
             raise exception.CloudbaseInitException(
                 "Azure WireServer base url not set")
@@ -112,10 +303,9 @@ class AzureService(base.BaseHTTPMetadataService):
             lambda: super(AzureService, self)._http_request(
                 path, data_xml, headers=all_headers))
 
-        if parse_xml:
-            return untangle.parse(six.StringIO(encoding.get_as_string(data)))
-        else:
-            return data
+        if parser:
+            return parser(data)
+        return data
 
     @staticmethod
     def _encode_xml(xml_root):
@@ -172,62 +362,103 @@ class AzureService(base.BaseHTTPMetadataService):
 
         return self._encode_xml(xml_root)
 
+    def _update_goal_state(self):
+        data = self._wire_server_request("machine?comp=goalstate")
+        # The incarnation changes with every new goal state, the rest
+        # of the document is parsed only when it does.
+        incarnation = xmlrecords.find_text(data, _GOAL_STATE_INCARNATION)
+        if self._goal_state and self._goal_state.incarnation == incarnation:
+            return
+        if self._goal_state:
+            LOG.info("Azure goal state incarnation changed from "
+                     "%(old)s to %(new)s",
+                     {"old": self._goal_state.incarnation,
+                      "new": incarnation})
+        self._goal_state = _parse_goal_state(data)
+        self._goal_state_documents.clear()
+
     def _get_goal_state(self, force_update=False):
-        if not self._goal_state or force_update:
-            self._goal_state = self._wire_server_request(
-                "machine?comp=goalstate").GoalState
+        with self._goal_state_lock:
+            if not self._goal_state or force_update:
+                self._update_goal_state()
+            goal_state = self._goal_state
 
-        expected_state = self._goal_state.Machine.ExpectedState
+        expected_state = goal_state.expected_state
         if expected_state != GOAL_STATE_STARTED:
             raise exception.CloudbaseInitException(
                 "Invalid machine expected state: %s" % expected_state)
 
-        return self._goal_state
+        return goal_state
+
+    def _get_goal_state_document(self, name, parser=None):
+        """Get a document of the goal state, cached per incarnation."""
+        config = self._get_role_instance_config()
+        with self._goal_state_lock:
+            if name in self._goal_state_documents:
+                return self._goal_state_documents[name]
+        document = self._wire_server_request(config[name], parser=parser)
+        with self._goal_state_lock:
+            # Unless the goal state changed in the meantime.
+            if config is self._goal_state.role_instance_config:
+                self._goal_state_documents[name] = document
+        return document
 
     def _get_incarnation(self):
-        goal_state = self._get_goal_state()
-        return goal_state.Incarnation.cdata
+        return self._get_goal_state().incarnation
 
     def _get_container_id(self):
-        goal_state = self._get_goal_state()
-        return goal_state.Container.ContainerId.cdata
+        return self._get_goal_state().container_id
 
     def _get_role_instance_config(self):
-        goal_state = self._get_goal_state()
-        role_instance = goal_state.Container.RoleInstanceList.RoleInstance
-        return role_instance.Configuration
+        return self._get_goal_state().role_instance_config
 
     def _get_role_instance_id(self):
-        goal_state = self._get_goal_state()
-        role_instance = goal_state.Container.RoleInstanceList.RoleInstance
-        return role_instance.InstanceId.cdata
+        return self._get_goal_state().role_instance_id
 
-    def _post_health_status(self, state, sub_status=None, description=None):
+    def _post_health_report(self, state, sub_status=None, description=None):
         health_report_xml = self._get_health_report_xml(
             state, sub_status, description)
         LOG.debug("Health data: %s", health_report_xml)
         self._wire_server_request(
-            "machine?comp=health", health_report_xml, parse_xml=False)
+            "machine?comp=health", health_report_xml)
+
+    def _post_health_status(self, state, sub_status=None, description=None):
+        """Post a health report for the cached goal state incarnation.
+
+        The goal state is fetched again only if the report is rejected
+        because its incarnation is outdated.
+        """
+        try:
+            self._post_health_report(state, sub_status, description)
+        except requests.HTTPError as exc:
+            status_code = getattr(exc.response, "status_code", None)
+            if status_code != GOAL_STATE_OUTDATED_STATUS_CODE:
+                raise
+            LOG.info("The health report refers to an outdated goal state, "
+                     "updating it")
+            self._get_goal_state(force_update=True)
+            self._post_health_report(state, sub_status, description)
 
     def provisioning_started(self):
-        self._post_health_status(
+        self._health_reporter.report_health_status(
             HEALTH_STATE_NOT_READY, HEALTH_SUBSTATE_PROVISIONING,
             "Cloudbase-Init is preparing your computer for first use...")
 
     def provisioning_completed(self):
-        self._post_health_status(HEALTH_STATE_READY)
+        self._health_reporter.report_health_status(HEALTH_STATE_READY)
+        self._health_reporter.stop(CONF.azure.health_report_timeout)
 
     def provisioning_failed(self):
-        self._post_health_status(
+        self._health_reporter.report_health_status(
             HEALTH_STATE_NOT_READY, HEALTH_SUBSTATE_PROVISIONING_FAILED,
             "Provisioning failed")
+        self._health_reporter.stop(CONF.azure.health_report_timeout)
 
     def _post_role_properties(self, properties):
         role_properties_xml = self._get_role_properties_xml(properties)
         LOG.debug("Role properties data: %s", role_properties_xml)
         self._wire_server_request(
-            "machine?comp=roleProperties", role_properties_xml,
-            parse_xml=False)
+            "machine?comp=roleProperties", role_properties_xml)
 
     @property
     def can_post_rdp_cert_thumbprint(self):
@@ -235,23 +466,21 @@ class AzureService(base.BaseHTTPMetadataService):
 
     def post_rdp_cert_thumbprint(self, thumbprint):
         properties = {ROLE_PROPERTY_CERT_THUMB: thumbprint}
-        self._post_role_properties(properties)
+        self._health_reporter.report_role_properties(properties)
 
     def _get_hosting_environment(self):
-        config = self._get_role_instance_config()
-        return self._wire_server_request(config.HostingEnvironmentConfig.cdata)
+        """Get the stored certificates of the hosting environment."""
+        return self._get_goal_state_document(
+            "HostingEnvironmentConfig", parser=_parse_stored_certificates)
 
     def _get_shared_config(self):
-        config = self._get_role_instance_config()
-        return self._wire_server_request(config.SharedConfig.cdata)
+        return self._get_goal_state_document("SharedConfig")
 
     def _get_extensions_config(self):
-        config = self._get_role_instance_config()
-        return self._wire_server_request(config.ExtensionsConfig.cdata)
+        return self._get_goal_state_document("ExtensionsConfig")
 
     def _get_full_config(self):
-        config = self._get_role_instance_config()
-        return self._wire_server_request(config.FullConfig.cdata)
+        return self._get_goal_state_document("FullConfig")
 
     @contextlib.contextmanager
     def _create_transport_cert(self, cert_mgr):
@@ -267,13 +496,10 @@ class AzureService(base.BaseHTTPMetadataService):
                 store_name=CONF.azure.transport_cert_store_name)
 
     def _get_encoded_cert(self, cert_url, transport_cert):
-        cert_config = self._wire_server_request(
+        return self._wire_server_request(
             cert_url, headers={"x-ms-guest-agent-public-x509-cert":
-                               transport_cert.replace("\r\n", "")})
-
-        cert_data = cert_config.CertificateFile.Data.cdata
-        cert_format = cert_config.CertificateFile.Format.cdata
-        return cert_data, cert_format
+                               transport_cert.replace("\r\n", "")},
+            parser=_parse_certificates_file)
 
     def get_server_certs(self):
         def _get_store_location(store_location):
@@ -284,23 +510,21 @@ class AzureService(base.BaseHTTPMetadataService):
 
         certs_info = []
         config = self._get_role_instance_config()
-        if not hasattr(config, 'Certificates'):
+        if not config.get("Certificates"):
             return certs_info
 
         cert_mgr = x509.CryptoAPICertManager()
         with self._create_transport_cert(cert_mgr) as (
                 transport_cert_thumbprint, transport_cert):
 
-            cert_url = config.Certificates.cdata
+            cert_url = config["Certificates"]
             cert_data, cert_format = self._get_encoded_cert(
                 cert_url, transport_cert)
             pfx_data = cert_mgr.decode_pkcs7_base64_blob(
                 cert_data, transport_cert_thumbprint, machine_keyset=True,
                 store_name=CONF.azure.transport_cert_store_name)
 
-        host_env = self._get_hosting_environment()
-        host_env_config = host_env.HostingEnvironmentConfig
-        for cert in host_env_config.StoredCertificates.StoredCertificate:
+        for cert in self._get_hosting_environment():
             certs_info.append({
                 "store_name": cert["storeName"],
                 "store_location": _get_store_location(
@@ -342,87 +566,48 @@ class AzureService(base.BaseHTTPMetadataService):
     def _get_ovf_env(self):
         if not self._ovf_env:
             ovf_env_path = self._get_ovf_env_path()
-            self._ovf_env = untangle.parse(ovf_env_path)
+            self._ovf_env = _parse_ovf_env(ovf_env_path)
         return self._ovf_env
 
     def get_admin_username(self):
-        ovf_env = self._get_ovf_env()
-        prov_section = ovf_env.Environment.wa_ProvisioningSection
-        win_prov_conf_set = prov_section.WindowsProvisioningConfigurationSet
-        return win_prov_conf_set.AdminUsername.cdata
+        return self._get_ovf_env().provisioning_config.get("AdminUsername")
 
     def get_admin_password(self):
-        ovf_env = self._get_ovf_env()
-        prov_section = ovf_env.Environment.wa_ProvisioningSection
-        win_prov_conf_set = prov_section.WindowsProvisioningConfigurationSet
-        return win_prov_conf_set.AdminPassword.cdata
+        return self._get_ovf_env().provisioning_config.get("AdminPassword")
 
     def get_host_name(self):
-        ovf_env = self._get_ovf_env()
-        prov_section = ovf_env.Environment.wa_ProvisioningSection
-        win_prov_conf_set = prov_section.WindowsProvisioningConfigurationSet
-        return win_prov_conf_set.ComputerName.cdata
+        return self._get_ovf_env().provisioning_config.get("ComputerName")
 
     def get_enable_automatic_updates(self):
-        ovf_env = self._get_ovf_env()
-        prov_section = ovf_env.Environment.wa_ProvisioningSection
-        win_prov_conf_set = prov_section.WindowsProvisioningConfigurationSet
-        if hasattr(win_prov_conf_set, "EnableAutomaticUpdates"):
-            auto_updates = win_prov_conf_set.EnableAutomaticUpdates.cdata
-            return auto_updates.lower() == "true"
-        return False
+        prov_config = self._get_ovf_env().provisioning_config
+        return _is_true(prov_config.get("EnableAutomaticUpdates"))
 
     def get_winrm_listeners_configuration(self):
         listeners_config = []
-        ovf_env = self._get_ovf_env()
-        prov_section = ovf_env.Environment.wa_ProvisioningSection
-        win_prov_conf_set = prov_section.WindowsProvisioningConfigurationSet
-        if hasattr(win_prov_conf_set, "WinRM"):
-            for listener in win_prov_conf_set.WinRM.Listeners.Listener:
-                protocol = listener.Protocol.cdata
-                config = {"protocol": protocol}
-                if hasattr(listener, "CertificateThumbprint"):
-                    cert_thumbprint = listener.CertificateThumbprint.cdata
-                    config["certificate_thumbprint"] = cert_thumbprint
-                listeners_config.append(config)
+        for listener in self._get_ovf_env().winrm_listeners:
+            config = {"protocol": listener.get("Protocol")}
+            if "CertificateThumbprint" in listener:
+                config["certificate_thumbprint"] = listener[
+                    "CertificateThumbprint"]
+            listeners_config.append(config)
         return listeners_config
 
     def get_vm_agent_package_provisioning_data(self):
-        ovf_env = self._get_ovf_env()
-        plat_sett_section = ovf_env.Environment.wa_PlatformSettingsSection
-        plat_sett = plat_sett_section.PlatformSettings
-        prov_ga = False
-        ga_package_name = None
-        if hasattr(plat_sett, "ProvisionGuestAgent"):
-            prov_ga = plat_sett.ProvisionGuestAgent.cdata.lower() == "true"
-        if hasattr(plat_sett, "GuestAgentPackageName"):
-            ga_package_name = plat_sett.GuestAgentPackageName.cdata
-        return {"provision": prov_ga,
-                "package_name": ga_package_name}
+        plat_sett = self._get_ovf_env().platform_settings
+        return {"provision": _is_true(plat_sett.get("ProvisionGuestAgent")),
+                "package_name": plat_sett.get("GuestAgentPackageName")}
 
     def get_kms_host(self):
-        ovf_env = self._get_ovf_env()
-        plat_sett_section = ovf_env.Environment.wa_PlatformSettingsSection
-        host = None
-        if hasattr(plat_sett_section.PlatformSettings, "KmsServerHostname"):
-            host = plat_sett_section.PlatformSettings.KmsServerHostname.cdata
-        return host or DEFAULT_KMS_HOST
+        plat_sett = self._get_ovf_env().platform_settings
+        return plat_sett.get("KmsServerHostname") or DEFAULT_KMS_HOST
 
     def get_use_avma_licensing(self):
-        ovf_env = self._get_ovf_env()
-        plat_sett_section = ovf_env.Environment.wa_PlatformSettingsSection
-        if hasattr(plat_sett_section.PlatformSettings, "UseAVMA"):
-            use_avma = plat_sett_section.PlatformSettings.UseAVMA.cdata
-            return use_avma.lower() == "true"
-        return False
+        plat_sett = self._get_ovf_env().platform_settings
+        return _is_true(plat_sett.get("UseAVMA"))
 
     def _check_ovf_env_custom_data(self):
         # If the custom data file is missing, ensure the configuration matches
-        ovf_env = self._get_ovf_env()
-        prov_section = ovf_env.Environment.wa_ProvisioningSection
-        win_prov_conf_set = prov_section.WindowsProvisioningConfigurationSet
-        if hasattr(win_prov_conf_set, "CustomData"):
-            return True
+        return "CustomData" in self._get_ovf_env().provisioning_config
 
     def get_user_data(self):
         try:
@@ -465,3 +650,7 @@ class AzureService(base.BaseHTTPMetadataService):
         except Exception as ex:
             LOG.exception(ex)
             return False
+
+    def cleanup(self):
+        self._health_reporter.stop(CONF.azure.health_report_timeout)
+        super(AzureService, self).cleanup()
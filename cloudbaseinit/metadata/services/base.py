@@ -16,7 +16,10 @@
 import abc
 import gzip
 import io
-import time
+from multiprocessing import pool as multiprocessing_pool
+import os
+import posixpath
+import threading
 
 from oslo_log import log as oslo_logging
 import requests
@@ -24,7 +27,10 @@ import six
 
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import exception
+from cloudbaseinit.metadata.services import cache
+from cloudbaseinit.utils import diskcache
 from cloudbaseinit.utils import encoding
+from cloudbaseinit.utils import retry
 
 CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
@@ -37,47 +43,121 @@ class NotExistingMetadataException(Exception):
 @six.add_metaclass(abc.ABCMeta)
 class BaseMetadataService(object):
     _GZIP_MAGIC_NUMBER = b'\x1f\x8b'
+    # The config section which can override the retry options.
+    _config_group = None
 
     def __init__(self):
-        self._cache = {}
+        self._cache = cache.MetadataCache(
+            negative_errors=(NotExistingMetadataException,),
+            max_memory=CONF.metadata_cache_max_memory,
+            spill_size=CONF.metadata_cache_spill_size)
+        self._prefetch_pool = None
         self._enable_retry = False
 
     def get_name(self):
         return self.__class__.__name__
 
     def load(self):
-        self._cache = {}
+        self._cancel_prefetch()
+        self._cache.clear()
 
     @abc.abstractmethod
     def _get_data(self, path):
         pass
 
+    def _get_retry_policy(self):
+        return retry.RetryPolicy.from_config(self._config_group)
+
+    @staticmethod
+    def _is_retryable_error(exc):
+        if isinstance(exc, NotExistingMetadataException):
+            return False
+        return retry.RetryPolicy.is_retryable(exc)
+
     def _exec_with_retry(self, action):
-        i = 0
-        while True:
-            try:
-                return action()
-            except NotExistingMetadataException:
-                raise
-            except Exception:
-                if self._enable_retry and i < CONF.retry_count:
-                    i += 1
-                    time.sleep(CONF.retry_count_interval)
-                else:
-                    raise
+        if not self._enable_retry:
+            return action()
+        return self._get_retry_policy().execute(
+            action, is_retryable=self._is_retryable_error)
+
+    def _fetch_data(self, path):
+        return self._exec_with_retry(lambda: self._get_data(path))
 
     def _get_cache_data(self, path, decode=False):
-        """Get meta data with caching and decoding support."""
-        key = (path, decode)
-        if key in self._cache:
-            LOG.debug("Using cached copy of metadata: '%s'" % path)
-            return self._cache[key]
-        else:
-            data = self._exec_with_retry(lambda: self._get_data(path))
-            if decode:
-                data = encoding.get_as_string(data)
-            self._cache[key] = data
-            return data
+        """Get meta data with caching and decoding support.
+
+        Concurrent callers asking for the same data share a single
+        fetch. Missing metadata is cached as well, so that it is not
+        requested again. The raw data is cached once and decoded on
+        demand.
+        """
+        return self._get_cache_view(
+            path, encoding.get_as_string if decode else None)
+
+    def _get_cache_view(self, path, view):
+        """Get a view of the meta data, e.g. a parsed document.
+
+        :param view: A callable converting the raw data. Its result is
+                     memoized and invalidated along with the raw data.
+        """
+        return self._cache.get(path, lambda: self._fetch_data(path),
+                               view=view)
+
+    def get_cache_stats(self):
+        """Get the hit, miss and wait counters of the metadata cache."""
+        return self._cache.get_stats()
+
+    def get_prefetch_paths(self):
+        """Get the metadata worth retrieving right after loading.
+
+        :returns: A list of (path, decode) tuples, as expected by
+                  :meth:`~_get_cache_data`.
+        """
+        return []
+
+    def _prefetch_path(self, path_info):
+        path, decode = path_info
+        try:
+            self._get_cache_data(path, decode=decode)
+        except NotExistingMetadataException:
+            LOG.debug("Metadata not found while prefetching: '%s'", path)
+        except Exception as ex:
+            LOG.debug("Failed to prefetch metadata '%(path)s': %(error)s",
+                      {"path": path, "error": ex})
+
+    def prefetch(self, workers=None, wait=True):
+        """Retrieve the metadata paths to prefetch concurrently.
+
+        The paths are given by :meth:`~get_prefetch_paths` and the
+        results are stored in the metadata cache.
+
+        :param workers: Max. number of concurrent requests.
+        :param wait: If False, return without waiting for the metadata.
+                     Callers asking for data still in progress wait for
+                     the ongoing request instead of issuing a new one.
+        """
+        paths = self.get_prefetch_paths()
+        if not paths:
+            return
+
+        LOG.debug("Prefetching metadata: %s", [path for path, _ in paths])
+        workers = min(workers or CONF.metadata_prefetch_workers, len(paths))
+        self._cancel_prefetch()
+        thread_pool = multiprocessing_pool.ThreadPool(workers)
+        try:
+            result = thread_pool.map_async(self._prefetch_path, paths)
+            if wait:
+                result.wait()
+        finally:
+            thread_pool.close()
+        self._prefetch_pool = thread_pool
+
+    def _cancel_prefetch(self):
+        """Drop the queued prefetch requests and wait for the others."""
+        thread_pool, self._prefetch_pool = self._prefetch_pool, None
+        if thread_pool is not None:
+            thread_pool.terminate()
+            thread_pool.join()
 
     def get_instance_id(self):
         pass
@@ -151,7 +231,8 @@ class BaseMetadataService(object):
         pass
 
     def cleanup(self):
-        pass
+        self._cancel_prefetch()
+        self._cache.clear()
 
     @property
     def can_update_password(self):
@@ -213,6 +294,14 @@ class BaseHTTPMetadataService(BaseMetadataService):
 
     """Contract class for metadata services that are using HTTP(S)."""
 
+    # The documents holding secrets, e.g. the admin password or the user
+    # data, which are never stored in the persistent metadata cache.
+    _disk_cache_excluded_names = ("password", "user-data", "user_data",
+                                  "vendor_data.json", "vendor_data2.json")
+    # Whether the responses depend only on their url, the key of the
+    # persistent metadata cache, and not on the request headers.
+    _disk_cache_supported = True
+
     def __init__(self, base_url, https_allow_insecure=False,
                  https_ca_bundle=None):
         """Setup a new metadata service.
@@ -235,6 +324,13 @@ class BaseHTTPMetadataService(BaseMetadataService):
         self._https_allow_insecure = https_allow_insecure
         self._https_ca_bundle = https_ca_bundle
         self._base_url = base_url
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._disk_cache = None
+        if CONF.metadata_cache_path and self._disk_cache_supported:
+            self._disk_cache = diskcache.DiskCache(
+                os.path.join(CONF.metadata_cache_path, self.get_name()),
+                CONF.metadata_cache_max_size)
 
     def _verify_https_request(self):
         """Whether to disable the validation of HTTPS certificates.
@@ -248,19 +344,98 @@ class BaseHTTPMetadataService(BaseMetadataService):
         else:
             return self._https_allow_insecure
 
+    def _get_session(self):
+        """Get the HTTP session used by the current metadata service.
+
+        The session keeps a pool of persistent connections, so that
+        all the requests made to the same metadata host can reuse the
+        already established TCP (and TLS) connections.
+        """
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                session.trust_env = CONF.metadata_http_trust_env
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_maxsize=CONF.metadata_http_pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    @staticmethod
+    def _get_request_timeout():
+        """Get the (connect, read) timeouts used for the HTTP requests."""
+        connect_timeout = CONF.metadata_http_connect_timeout
+        read_timeout = CONF.metadata_http_read_timeout
+        if connect_timeout is None and read_timeout is None:
+            return None
+        return (connect_timeout, read_timeout)
+
+    def _can_cache_response(self, url):
+        """Whether the response for the given url can be stored on disk."""
+        if not self._disk_cache:
+            return False
+        path = requests.compat.urlparse(url).path
+        name = posixpath.basename(path.rstrip("/"))
+        return name not in self._disk_cache_excluded_names
+
+    def _get_cached_response(self, url, headers):
+        """Get the persistently cached response for the given url.
+
+        If a cached response exists, the headers required for
+        revalidating it are added to the given headers.
+        """
+        if not self._can_cache_response(url):
+            return None
+
+        entry = self._disk_cache.get(url)
+        if entry:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return entry
+
+    def _set_cached_response(self, url, response):
+        if not self._can_cache_response(url):
+            return
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not (etag or last_modified):
+            # The response cannot be revalidated, so it is not cached.
+            return
+        try:
+            self._disk_cache.set(url, response.content, etag, last_modified)
+        except Exception as ex:
+            LOG.warning("Failed to cache the metadata from %(url)s: "
+                        "%(error)s", {"url": url, "error": ex})
+
     def _http_request(self, url, data=None, headers=None):
         """Get content for received url."""
         if not url.startswith("http"):
             url = requests.compat.urljoin(self._base_url, url)
-        request_action = requests.get if not data else requests.post
+        session = self._get_session()
+        request_action = session.get if not data else session.post
+        cached_response = None
         if not data:
             LOG.debug('Getting metadata from: %s', url)
+            headers = dict(headers or {})
+            cached_response = self._get_cached_response(url, headers)
         else:
             LOG.debug('Posting data to %s', url)
 
         response = request_action(url=url, data=data, headers=headers,
-                                  verify=self._verify_https_request())
+                                  verify=self._verify_https_request(),
+                                  timeout=self._get_request_timeout())
+        if cached_response and response.status_code == 304:
+            LOG.debug('Metadata not modified, using the cached copy: %s',
+                      url)
+            return cached_response.data
+
         response.raise_for_status()
+        if not data:
+            self._set_cached_response(url, response)
         return response.content
 
     def _get_data(self, path):
@@ -281,3 +456,10 @@ class BaseHTTPMetadataService(BaseMetadataService):
             raise
 
         return response
+
+    def cleanup(self):
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+        super(BaseHTTPMetadataService, self).cleanup()
@@ -15,6 +15,7 @@
 
 import json
 import posixpath
+import re
 
 import netaddr
 from oslo_log import log as oslo_logging
@@ -25,6 +26,7 @@ from cloudbaseinit.metadata.services import base
 from cloudbaseinit.models import network as network_model
 from cloudbaseinit.utils import debiface
 from cloudbaseinit.utils import encoding
+from cloudbaseinit.utils import readonly
 from cloudbaseinit.utils import x509constants
 
 NETWORK_LINK_TYPE_PHYSICAL = "phy"
@@ -38,10 +40,57 @@ NETWORK_TYPE_IPV6_DHCP = "ipv6_dhcp"
 
 NETWORK_SERVICE_TYPE_DNS = "dns"
 
+LATEST_VERSION = "latest"
+# The first metadata version providing each document.
+DOCUMENT_MIN_VERSIONS = {
+    "network_data.json": "2015-10-15",
+    "password": "2013-04-04",
+}
+_VERSION_REGEX = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
 CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
 
 
+def _load_json(data):
+    data = encoding.get_as_string(data)
+    if data:
+        return readonly.freeze(json.loads(data))
+
+
+class VersionIndex(object):
+
+    """The metadata versions listed by the service.
+
+    The dated versions sort chronologically as strings. The "latest"
+    alias, when listed, is preferred over the newest dated version.
+    """
+
+    def __init__(self, versions, has_latest):
+        self.versions = tuple(sorted(versions))
+        self.has_latest = has_latest
+
+    def supports(self, version):
+        if version == LATEST_VERSION:
+            return self.has_latest
+        return version in self.versions
+
+    def get_version(self, min_version=None):
+        """Get the newest version, or None if older than min_version."""
+        newest = self.versions[-1]
+        if min_version and newest < min_version:
+            return None
+        return LATEST_VERSION if self.has_latest else newest
+
+
+def _load_version_index(data):
+    entries = [entry.strip().rstrip("/") for entry in
+               (encoding.get_as_string(data) or "").splitlines()]
+    versions = [entry for entry in entries if _VERSION_REGEX.match(entry)]
+    if versions:
+        return VersionIndex(versions, LATEST_VERSION in entries)
+
+
 class BaseOpenStackService(base.BaseMetadataService):
 
     def get_content(self, name):
@@ -49,22 +98,75 @@ class BaseOpenStackService(base.BaseMetadataService):
             posixpath.join('openstack', 'content', name))
         return self._get_cache_data(path)
 
+    @staticmethod
+    def _get_openstack_path(version, file_name):
+        return posixpath.normpath(
+            posixpath.join('openstack', version, file_name))
+
+    def _get_version_index(self):
+        """Get the :class:`VersionIndex` of the service, if available.
+
+        The index is retrieved once, from the listing of the openstack
+        directory.
+        """
+        try:
+            return self._get_cache_view('openstack', _load_version_index)
+        except base.NotExistingMetadataException:
+            return None
+
+    def _get_document_version(self, file_name):
+        """Get the newest metadata version providing the given document.
+
+        :raises: NotExistingMetadataException, if none of the versions
+                 listed by the service provides the document.
+        """
+        version_index = self._get_version_index()
+        if version_index is None:
+            return LATEST_VERSION
+
+        version = version_index.get_version(
+            DOCUMENT_MIN_VERSIONS.get(file_name))
+        if version is None:
+            LOG.debug("Metadata versions %(versions)s do not provide "
+                      "'%(file_name)s'",
+                      {"versions": version_index.versions,
+                       "file_name": file_name})
+            raise base.NotExistingMetadataException()
+        return version
+
+    def get_prefetch_paths(self):
+        paths = []
+        for file_name in ('meta_data.json', 'network_data.json',
+                          'user_data'):
+            try:
+                version = self._get_document_version(file_name)
+            except base.NotExistingMetadataException:
+                continue
+            paths.append(
+                (self._get_openstack_path(version, file_name), False))
+        return paths
+
     def get_user_data(self):
-        path = posixpath.normpath(
-            posixpath.join('openstack', 'latest', 'user_data'))
+        path = self._get_openstack_path(
+            self._get_document_version('user_data'), 'user_data')
         return self._get_cache_data(path)
 
     def _get_openstack_json_data(self, version, file_name):
-        path = posixpath.normpath(
-            posixpath.join('openstack', version, file_name))
-        data = self._get_cache_data(path, decode=True)
-        if data:
-            return json.loads(data)
+        """Get a parsed JSON document, as a read-only view.
+
+        The document is parsed once and shared by all the callers,
+        use copy.deepcopy() to get a mutable copy. If no version is
+        given, the newest one providing the document is used.
+        """
+        if version is None:
+            version = self._get_document_version(file_name)
+        path = self._get_openstack_path(version, file_name)
+        return self._get_cache_view(path, _load_json)
 
-    def _get_meta_data(self, version='latest'):
+    def _get_meta_data(self, version=None):
         return self._get_openstack_json_data(version, 'meta_data.json')
 
-    def _get_network_data(self, version='latest'):
+    def _get_network_data(self, version=None):
         return self._get_openstack_json_data(version, 'network_data.json')
 
     def get_instance_id(self):
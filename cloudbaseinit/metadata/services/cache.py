@@ -0,0 +1,314 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import os
+import tempfile
+import threading
+
+from oslo_log import log as oslo_logging
+import six
+
+LOG = oslo_logging.getLogger(__name__)
+
+_SPILL_FILE_PREFIX = "cloudbaseinit-metadata-"
+
+
+def _get_size(value):
+    if isinstance(value, (six.binary_type, six.text_type)):
+        return len(value)
+    return 0
+
+
+class _PendingFetch(object):
+
+    """A fetch in progress, shared by all the callers of the same key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+class _SpillFileRemoved(Exception):
+
+    """The spill file of an entry was removed, e.g. by clear()."""
+
+
+class _CacheEntry(object):
+
+    """The raw data of a key, held in memory or in a spill file.
+
+    The views computed from the raw data (e.g. decoded strings) are
+    memoized as long as the raw data is held in memory.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.spill_path = None
+        self.views = {}
+
+    def get_memory_size(self):
+        size = sum(_get_size(value) for value in self.views.values())
+        if self.spill_path is None:
+            size += _get_size(self.data)
+        return size
+
+
+class _NegativeEntry(object):
+
+    """A cached error, raised again for each lookup of the same key."""
+
+    def __init__(self, error):
+        self.error = error
+        self.views = {}
+
+    def get_memory_size(self):
+        return 0
+
+
+class MetadataCache(object):
+
+    """Thread-safe, single-flight and size-bounded cache for metadata.
+
+    Concurrent callers asking for the same key share a single fetch:
+    the first caller retrieves the data, while the others wait for its
+    result. Errors of the types given in `negative_errors` are cached
+    as well, so that missing metadata is not requested again.
+
+    The raw data is stored once per key, regardless of the views
+    requested by the callers. Raw data larger than `spill_size` is
+    written to a temporary file instead of being kept in memory. When
+    the memory used exceeds `max_memory`, the least recently used
+    entries are spilled as well.
+
+    The fetches still in progress when the cache is cleared are not
+    added to it, their results are only returned to their callers.
+
+    :param negative_errors: A tuple of exception types to cache.
+    :param max_memory: Memory ceiling, in bytes. None means no limit.
+    :param spill_size: Size in bytes above which the raw data is
+                       spilled to disk. None means never.
+    """
+
+    def __init__(self, negative_errors=(), max_memory=None, spill_size=None):
+        self._negative_errors = negative_errors
+        self._max_memory = max_memory
+        self._spill_size = spill_size
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._pending_fetches = {}
+        # Incremented by clear(), for discarding the fetches started
+        # before it.
+        self._generation = 0
+        self._memory_size = 0
+        self._hits = 0
+        self._misses = 0
+        self._waits = 0
+        self._negative_hits = 0
+        self._spills = 0
+
+    @staticmethod
+    def _spill(entry):
+        fd, spill_path = tempfile.mkstemp(prefix=_SPILL_FILE_PREFIX)
+        with os.fdopen(fd, "wb") as stream:
+            stream.write(entry.data)
+        entry.spill_path = spill_path
+        entry.data = None
+        entry.views = {}
+
+    @staticmethod
+    def _remove_spill_file(entry):
+        spill_path = getattr(entry, "spill_path", None)
+        if spill_path:
+            try:
+                os.remove(spill_path)
+            except OSError as ex:
+                LOG.debug("Failed to remove metadata spill file "
+                          "%(path)s: %(error)s",
+                          {"path": spill_path, "error": ex})
+
+    def _can_spill(self, entry):
+        return (isinstance(entry, _CacheEntry) and
+                entry.spill_path is None and
+                isinstance(entry.data, six.binary_type))
+
+    def _evict(self):
+        """Spill the least recently used entries above the ceiling."""
+        if self._max_memory is None:
+            return
+        for key, entry in list(self._entries.items()):
+            if self._memory_size <= self._max_memory:
+                break
+            if not self._can_spill(entry):
+                continue
+            LOG.debug("Spilling cached metadata to disk: '%s'", key)
+            size = entry.get_memory_size()
+            self._spill(entry)
+            self._memory_size -= size
+            self._spills += 1
+
+    def _touch(self, key):
+        self._entries[key] = self._entries.pop(key)
+
+    def _add_entry(self, key, entry):
+        self._entries[key] = entry
+        self._memory_size += entry.get_memory_size()
+        self._evict()
+
+    def _add_fetched_entry(self, key, entry):
+        if (self._spill_size is not None and self._can_spill(entry) and
+                _get_size(entry.data) > self._spill_size):
+            LOG.debug("Spilling cached metadata to disk: '%s'", key)
+            self._spill(entry)
+            self._spills += 1
+        self._add_entry(key, entry)
+
+    def _get_entry(self, key, fetch):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                LOG.debug("Using cached copy of metadata: '%s'", key)
+                self._touch(key)
+                if isinstance(entry, _NegativeEntry):
+                    self._negative_hits += 1
+                    raise entry.error
+                self._hits += 1
+                return entry
+            pending = self._pending_fetches.get(key)
+            is_owner = pending is None
+            if is_owner:
+                self._misses += 1
+                pending = _PendingFetch()
+                self._pending_fetches[key] = pending
+            else:
+                self._waits += 1
+            generation = self._generation
+
+        if not is_owner:
+            LOG.debug("Waiting for metadata being retrieved: '%s'", key)
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.entry
+
+        try:
+            entry = _CacheEntry(fetch())
+            with self._lock:
+                if generation == self._generation:
+                    self._add_fetched_entry(key, entry)
+                else:
+                    LOG.debug("Not caching metadata retrieved before the "
+                              "cache was cleared: '%s'", key)
+            pending.entry = entry
+            return entry
+        except Exception as ex:
+            pending.error = ex
+            if isinstance(ex, self._negative_errors):
+                with self._lock:
+                    if generation == self._generation:
+                        self._add_entry(key, _NegativeEntry(ex))
+            raise
+        finally:
+            with self._lock:
+                if self._pending_fetches.get(key) is pending:
+                    del self._pending_fetches[key]
+            pending.done.set()
+
+    def _read(self, entry):
+        with self._lock:
+            data = entry.data
+            spill_path = entry.spill_path
+        if spill_path is None:
+            return data
+        try:
+            with open(spill_path, "rb") as stream:
+                return stream.read()
+        except (IOError, OSError):
+            if not os.path.exists(spill_path):
+                raise _SpillFileRemoved()
+            raise
+
+    def _remove_entry(self, key, entry):
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+                self._memory_size -= entry.get_memory_size()
+
+    def get(self, key, fetch, view=None):
+        """Get the data for the given key, fetching it if needed.
+
+        An entry whose spill file was removed concurrently, e.g. by
+        clear(), is handled as a cache miss.
+
+        :param key: A hashable cache key, usually the metadata path.
+        :param fetch: A callable with no arguments, returning the data.
+        :param view: An optional callable, converting the raw data.
+                     Its result is memoized along with the raw data.
+        """
+        while True:
+            entry = self._get_entry(key, fetch)
+            if view is not None:
+                with self._lock:
+                    if view in entry.views:
+                        return entry.views[view]
+            try:
+                data = self._read(entry)
+                break
+            except _SpillFileRemoved:
+                LOG.debug("Metadata spill file removed, retrieving the "
+                          "metadata again: '%s'", key)
+                self._remove_entry(key, entry)
+
+        if view is None:
+            return data
+
+        value = view(data)
+        with self._lock:
+            if (entry.spill_path is None and
+                    self._entries.get(key) is entry and
+                    view not in entry.views):
+                entry.views[view] = value
+                self._memory_size += _get_size(value)
+                self._evict()
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._pending_fetches = {}
+            entries = list(self._entries.values())
+            self._entries = collections.OrderedDict()
+            self._memory_size = 0
+        for entry in entries:
+            self._remove_spill_file(entry)
+
+    def get_stats(self):
+        """Get the cache counters.
+
+        `hits` and `negative_hits` count the lookups served from the
+        cache, `misses` the lookups which required a fetch and `waits`
+        the lookups which waited for a fetch already in progress.
+        `memory_size` is the amount of cached data held in memory and
+        `spills` the number of entries written to disk.
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "negative_hits": self._negative_hits,
+                "misses": self._misses,
+                "waits": self._waits,
+                "memory_size": self._memory_size,
+                "spills": self._spills,
+            }
@@ -12,8 +12,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import contextlib
+from multiprocessing import pool as multiprocessing_pool
 import posixpath
+import socket
+import threading
 
 from oslo_log import log as oslo_logging
 from six.moves import http_client
@@ -33,6 +35,11 @@ SAVED_PASSWORD = "saved_password"
 TIMEOUT = 10
 
 
+class _RetryPasswordRequest(Exception):
+
+    """The Password Server response requires retrying the request."""
+
+
 class CloudStack(base.BaseHTTPMetadataService):
 
     """Metadata service for Apache CloudStack.
@@ -43,6 +50,8 @@ class CloudStack(base.BaseHTTPMetadataService):
     platform.
     """
 
+    _config_group = 'cloudstack'
+
     def __init__(self):
         super(CloudStack, self).__init__(
             # Note(alexcoman): The base url used by the current metadata
@@ -53,6 +62,8 @@ class CloudStack(base.BaseHTTPMetadataService):
 
         self._osutils = osutils_factory.get_os_utils()
         self._metadata_host = None
+        self._password_lock = threading.Lock()
+        self._password_connection = None
 
     @staticmethod
     def _get_path(resource, version="latest"):
@@ -62,9 +73,10 @@ class CloudStack(base.BaseHTTPMetadataService):
 
     def _test_api(self, metadata_url):
         """Test if the CloudStack API is responding properly."""
-        self._base_url = metadata_url
+        url = urllib.parse.urljoin(metadata_url,
+                                   self._get_path("service-offering"))
         try:
-            response = self._get_data(self._get_path("service-offering"))
+            response = self._get_data(url)
         except urllib.error.HTTPError as exc:
             LOG.debug('Error response code: %s', exc.code)
             return False
@@ -77,9 +89,43 @@ class CloudStack(base.BaseHTTPMetadataService):
             return False
 
         LOG.debug('Available services: %s', response)
+        return True
+
+    def _set_metadata_url(self, metadata_url):
+        self._base_url = metadata_url
         netloc = urllib.parse.urlparse(metadata_url).netloc
         self._metadata_host = netloc.split(":")[0]
-        return True
+
+    def _get_candidate_urls(self):
+        """Get the configured URL, followed by the DHCP servers in use."""
+        urls = [CONF.cloudstack.metadata_base_url]
+        dhcp_servers = self._osutils.get_dhcp_hosts_in_use()
+        if not dhcp_servers:
+            LOG.debug('No DHCP server was found.')
+            return urls
+        for _, _, ip_address in dhcp_servers:
+            url = 'http://%s/' % ip_address
+            if url not in urls:
+                urls.append(url)
+        return urls
+
+    def _probe_urls(self, urls):
+        """Test all the given URLs concurrently, the first responder wins.
+
+        The probes still in progress once an URL responded are not
+        waited for.
+        """
+        LOG.debug('Testing: %s', urls)
+        thread_pool = multiprocessing_pool.ThreadPool(len(urls))
+        try:
+            results = thread_pool.imap_unordered(
+                lambda url: (url, self._test_api(url)), urls)
+            for url, available in results:
+                if available:
+                    return url
+        finally:
+            thread_pool.close()
+        return None
 
     def load(self):
         """Obtain all the required information."""
@@ -88,19 +134,21 @@ class CloudStack(base.BaseHTTPMetadataService):
         if CONF.cloudstack.add_metadata_private_ip_route:
             network.check_metadata_ip_route(CONF.cloudstack.metadata_base_url)
 
-        if self._test_api(CONF.cloudstack.metadata_base_url):
-            return True
-
-        dhcp_servers = self._osutils.get_dhcp_hosts_in_use()
-        if not dhcp_servers:
-            LOG.debug('No DHCP server was found.')
+        metadata_url = self._probe_urls(self._get_candidate_urls())
+        if not metadata_url:
             return False
-        for _, _, ip_address in dhcp_servers:
-            LOG.debug('Testing: %s', ip_address)
-            if self._test_api('http://%s/' % ip_address):
-                return True
 
-        return False
+        LOG.debug('Using the metadata service from: %s', metadata_url)
+        self._set_metadata_url(metadata_url)
+        return True
+
+    def get_prefetch_paths(self):
+        return [
+            (self._get_path("instance-id"), True),
+            (self._get_path("local-hostname"), True),
+            (self._get_path("public-keys"), True),
+            (self._get_path("../user-data"), False),
+        ]
 
     def get_instance_id(self):
         """Instance name of the virtual machine."""
@@ -128,30 +176,70 @@ class CloudStack(base.BaseHTTPMetadataService):
             ssh_keys.append(ssh_key)
         return ssh_keys
 
+    def _close_password_connection(self):
+        if self._password_connection is not None:
+            self._password_connection.close()
+            self._password_connection = None
+
+    def _password_request(self, body, headers):
+        """Send a request through the persistent Password Server connection.
+
+        A connection which was closed by the server in the meantime is
+        opened again once.
+        """
+        reused = self._password_connection is not None
+        if not reused:
+            self._password_connection = http_client.HTTPConnection(
+                self._metadata_host, CONF.cloudstack.password_server_port,
+                timeout=TIMEOUT)
+        try:
+            self._password_connection.request("GET", "/", body=body,
+                                              headers=headers)
+            response = self._password_connection.getresponse()
+            return response, response.read()
+        except (http_client.HTTPException, socket.error):
+            self._close_password_connection()
+            if not reused:
+                raise
+            LOG.debug("The Password Server connection was closed, "
+                      "opening a new one")
+            return self._password_request(body, headers)
+
     def _password_client(self, body=None, headers=None, decode=True):
         """Client for the Password Server."""
-        port = CONF.cloudstack.password_server_port
-        with contextlib.closing(http_client.HTTPConnection(
-                self._metadata_host, port, timeout=TIMEOUT)) as connection:
+        with self._password_lock:
             try:
-                connection.request("GET", "/", body=body, headers=headers)
-                response = connection.getresponse()
-            except http_client.HTTPException as exc:
+                response, content = self._password_request(body, headers)
+            except (http_client.HTTPException, socket.error) as exc:
                 LOG.error("Request failed: %s", exc)
                 raise
 
-            content = response.read()
-            if decode:
-                content = encoding.get_as_string(content)
+        if decode:
+            content = encoding.get_as_string(content)
 
-            if response.status != 200:
-                raise http_client.HTTPException(
-                    "%(status)s %(reason)s - %(message)r",
-                    {"status": response.status, "reason": response.reason,
-                     "message": content})
+        if response.status != 200:
+            raise http_client.HTTPException(
+                "%(status)s %(reason)s - %(message)r",
+                {"status": response.status, "reason": response.reason,
+                 "message": content})
 
         return content
 
+    def _exec_password_request(self, action, retry_on_error=None):
+        """Execute the action, backing off between the retries.
+
+        :param retry_on_error: An exception type which is retried,
+                               besides the transient request errors.
+        """
+        policy = self._get_retry_policy()
+
+        def _is_retryable(exc):
+            if retry_on_error and isinstance(exc, retry_on_error):
+                return True
+            return policy.is_retryable(exc)
+
+        return policy.execute(action, is_retryable=_is_retryable)
+
     def _get_password(self):
         """Get the password from the Password Server.
 
@@ -168,36 +256,38 @@ class CloudStack(base.BaseHTTPMetadataService):
         """
         LOG.debug("Try to get password from the Password Server.")
         headers = {"DomU_Request": "send_my_password"}
-        password = None
-
-        for _ in range(CONF.retry_count):
-            try:
-                content = self._password_client(headers=headers).strip()
-            except http_client.HTTPConnection as exc:
-                LOG.error("Getting password failed: %s", exc)
-                continue
 
+        def _request_password():
+            content = self._password_client(headers=headers).strip()
             if not content:
-                LOG.warning("The Password Server did not have any "
-                            "password for the current instance.")
-                continue
-
-            if content == BAD_REQUEST:
-                LOG.error("The Password Server did not recognize the "
-                          "request.")
-                break
-
-            if content == SAVED_PASSWORD:
-                LOG.warning("The password was already taken from the "
-                            "Password Server for the current instance.")
-                break
+                # The password might not be available yet.
+                raise _RetryPasswordRequest()
+            return content
 
-            LOG.info("The password server returned a valid password "
-                     "for the current instance.")
-            password = content
-            break
-
-        return password
+        try:
+            content = self._exec_password_request(
+                _request_password, retry_on_error=_RetryPasswordRequest)
+        except _RetryPasswordRequest:
+            LOG.warning("The Password Server did not have any "
+                        "password for the current instance.")
+            return None
+        except (http_client.HTTPException, socket.error) as exc:
+            LOG.error("Getting password failed: %s", exc)
+            return None
+
+        if content == BAD_REQUEST:
+            LOG.error("The Password Server did not recognize the "
+                      "request.")
+            return None
+
+        if content == SAVED_PASSWORD:
+            LOG.warning("The password was already taken from the "
+                        "Password Server for the current instance.")
+            return None
+
+        LOG.info("The password server returned a valid password "
+                 "for the current instance.")
+        return content
 
     def _delete_password(self):
         """Delete the password from the Password Server.
@@ -209,17 +299,19 @@ class CloudStack(base.BaseHTTPMetadataService):
                   "Password Server.")
         headers = {"DomU_Request": "saved_password"}
 
-        for _ in range(CONF.retry_count):
-            try:
-                content = self._password_client(headers=headers).strip()
-            except http_client.HTTPConnection as exc:
-                LOG.error("Removing password failed: %s", exc)
-                continue
+        def _request_delete():
+            content = self._password_client(headers=headers).strip()
+            if content == BAD_REQUEST:
+                raise _RetryPasswordRequest()
+            return content
 
-            if content != BAD_REQUEST:
-                LOG.info("The password was removed from the Password Server.")
-                break
-        else:
+        try:
+            self._exec_password_request(
+                _request_delete, retry_on_error=_RetryPasswordRequest)
+            LOG.info("The password was removed from the Password Server.")
+        except (_RetryPasswordRequest, http_client.HTTPException,
+                socket.error) as exc:
+            LOG.debug("Removing password failed: %r", exc)
             LOG.warning("Fail to remove the password from the "
                         "Password Server.")
 
@@ -245,3 +337,8 @@ class CloudStack(base.BaseHTTPMetadataService):
     def is_password_changed(self):
         """Check if a new password exists in the Password Server."""
         return bool(self._get_password())
+
+    def cleanup(self):
+        with self._password_lock:
+            self._close_password_connection()
+        super(CloudStack, self).cleanup()
@@ -20,6 +20,7 @@ from oslo_log import log as oslo_logging
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import constant
 from cloudbaseinit import exception
+from cloudbaseinit.metadata import hints
 from cloudbaseinit.metadata.services import base
 from cloudbaseinit.metadata.services import baseopenstackservice
 from cloudbaseinit.metadata.services.osconfigdrive import factory
@@ -65,17 +66,42 @@ class ConfigDriveService(baseopenstackservice.BaseOpenStackService):
 
         self._preprocess_options()
         self._mgr = factory.get_config_drive_manager()
-        found = self._mgr.get_config_drive_files(
-            searched_types=self._searched_types,
-            searched_locations=self._searched_locations)
+        found = self._get_config_drive_files()
 
         if found:
             self._metadata_path = self._mgr.target_path
             LOG.debug('Metadata copied to folder: %r', self._metadata_path)
         return found
 
+    def _get_config_drive_files(self):
+        discovery_hints = hints.get_stored_hints()
+        config_drive = discovery_hints and discovery_hints.config_drive
+        if (config_drive and config_drive[0] in self._searched_types and
+                config_drive[1] in self._searched_locations):
+            LOG.debug("Looking for Config Drive %(type)s in %(location)s, "
+                      "found during the previous execution",
+                      {"type": config_drive[0], "location": config_drive[1]})
+            if self._mgr.get_config_drive_files(
+                    searched_types=[config_drive[0]],
+                    searched_locations=[config_drive[1]]):
+                return True
+
+        found = self._mgr.get_config_drive_files(
+            searched_types=self._searched_types,
+            searched_locations=self._searched_locations)
+        if found and discovery_hints and self._mgr.found_config_drive:
+            try:
+                discovery_hints.set_config_drive(
+                    *self._mgr.found_config_drive)
+            except Exception as ex:
+                LOG.warning("Failed to save the Config Drive hint: %s", ex)
+        return found
+
     def _get_data(self, path):
         norm_path = os.path.normpath(os.path.join(self._metadata_path, path))
+        if os.path.isdir(norm_path):
+            # Directories are listed like by the HTTP metadata service.
+            return "\n".join(sorted(os.listdir(norm_path))).encode()
         try:
             with open(norm_path, 'rb') as stream:
                 return stream.read()
@@ -86,3 +112,4 @@ class ConfigDriveService(baseopenstackservice.BaseOpenStackService):
         LOG.debug('Deleting metadata folder: %r', self._mgr.target_path)
         shutil.rmtree(self._mgr.target_path, ignore_errors=True)
         self._metadata_path = None
+        super(ConfigDriveService, self).cleanup()
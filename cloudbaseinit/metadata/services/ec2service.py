@@ -13,7 +13,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from multiprocessing import pool as multiprocessing_pool
+import threading
+import time
+
 from oslo_log import log as oslo_logging
+import requests
 
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit.metadata.services import base
@@ -22,8 +27,120 @@ from cloudbaseinit.utils import network
 CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
 
+IMDS_TOKEN_PATH = "latest/api/token"
+IMDS_TOKEN_HEADER = "X-aws-ec2-metadata-token"
+IMDS_TOKEN_TTL_HEADER = "X-aws-ec2-metadata-token-ttl-seconds"
+# Renew the session token this many seconds before it expires.
+IMDS_TOKEN_REFRESH_MARGIN = 60
+# Token request errors meaning that IMDSv2 is not available, the
+# others are left to the retry policy.
+IMDS_TOKEN_UNSUPPORTED_STATUS_CODES = (403, 404, 405)
+
+
+class MetadataCrawler(object):
+
+    """Retrieve a subtree of the EC2 metadata concurrently.
+
+    The paths to crawl are relative to the meta-data directory. Each
+    path segment is either a name, a '*' matching all the entries of
+    the parent listing, or an empty segment given by a trailing '/',
+    which crawls the whole subtree up to `max_depth` levels. The tree
+    is crawled one level at a time, with at most `workers` concurrent
+    requests.
+
+    :param get_data: A callable with a path and a `decode` argument,
+                     returning the metadata found at the given path.
+    """
+
+    def __init__(self, get_data, paths, max_depth, workers):
+        self._get_data = get_data
+        self._paths = paths
+        self._max_depth = max_depth
+        self._workers = workers
+
+    @staticmethod
+    def _join(path, name):
+        return "%s/%s" % (path, name) if path else name
+
+    @staticmethod
+    def _parse_listing(listing):
+        """Get the (name, is_directory) tuples of a listing.
+
+        Besides the entries ending with a '/', the '<index>=<name>'
+        entries, as listed by public-keys, are directories as well.
+        """
+        entries = []
+        for line in listing.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if "=" in line:
+                entries.append((line.split("=", 1)[0], True))
+            elif line.endswith("/"):
+                entries.append((line.rstrip("/"), True))
+            else:
+                entries.append((line, False))
+        return entries
+
+    def _get_node(self, path, segments, depth):
+        # The name segments do not require a request.
+        while segments and segments[0] not in ("", "*"):
+            path = self._join(path, segments[0])
+            segments = segments[1:]
+        return path, segments, depth
+
+    def _visit(self, node):
+        """Retrieve the given node, returning its children nodes."""
+        path, segments, depth = node
+        if not segments:
+            return path, self._get_data(path, decode=False), []
+
+        listing = self._get_data(path, decode=True)
+        children = []
+        for name, is_directory in self._parse_listing(listing):
+            child_path = self._join(path, name)
+            if segments[0] == "*":
+                children.append(
+                    self._get_node(child_path, segments[1:], depth))
+            elif not is_directory:
+                children.append((child_path, [], depth))
+            elif depth < self._max_depth:
+                children.append((child_path, [""], depth + 1))
+        return path, listing, children
+
+    def _safe_visit(self, node):
+        try:
+            return self._visit(node)
+        except base.NotExistingMetadataException:
+            LOG.debug("Metadata not found while crawling: '%s'", node[0])
+        except Exception as ex:
+            LOG.debug("Failed to crawl metadata '%(path)s': %(error)s",
+                      {"path": node[0], "error": ex})
+        return None, None, []
+
+    def crawl(self):
+        """Crawl the metadata, returning a dict with the found values."""
+        nodes = [self._get_node("", path.strip("/").split("/") +
+                                ([""] if path.endswith("/") else []), 1)
+                 for path in self._paths if path.strip("/")]
+        snapshot = {}
+        thread_pool = multiprocessing_pool.ThreadPool(self._workers)
+        try:
+            while nodes:
+                children = []
+                for path, data, node_children in thread_pool.map(
+                        self._safe_visit, nodes):
+                    if path is not None:
+                        snapshot[path] = data
+                    children.extend(node_children)
+                nodes = children
+        finally:
+            thread_pool.close()
+        return snapshot
+
 
 class EC2Service(base.BaseHTTPMetadataService):
+    _config_group = 'ec2'
     _metadata_version = '2009-04-04'
 
     def __init__(self):
@@ -32,14 +149,92 @@ class EC2Service(base.BaseHTTPMetadataService):
             https_allow_insecure=CONF.ec2.https_allow_insecure,
             https_ca_bundle=CONF.ec2.https_ca_bundle)
         self._enable_retry = True
+        self._token_lock = threading.Lock()
+        self._token = None
+        self._token_expiry = 0
+        self._imdsv2_supported = CONF.ec2.imdsv2
+        self._crawl_lock = threading.Lock()
+        self._crawl_pending = False
+
+    def _request_token(self):
+        ttl = CONF.ec2.imdsv2_token_ttl
+        url = requests.compat.urljoin(self._base_url, IMDS_TOKEN_PATH)
+        response = self._get_session().put(
+            url, headers={IMDS_TOKEN_TTL_HEADER: str(ttl)},
+            verify=self._verify_https_request(),
+            timeout=self._get_request_timeout())
+        response.raise_for_status()
+
+        self._token = response.text
+        self._token_expiry = (time.time() + ttl -
+                              min(IMDS_TOKEN_REFRESH_MARGIN, ttl / 2.0))
+
+    def _get_token(self, refresh=False):
+        """Get the IMDSv2 session token, or None for using IMDSv1.
+
+        The token is reused until shortly before it expires. Refreshing
+        it tries IMDSv2 again, if enabled, after falling back to IMDSv1.
+        """
+        with self._token_lock:
+            if refresh:
+                self._imdsv2_supported = CONF.ec2.imdsv2
+            if not self._imdsv2_supported:
+                return None
+            if (refresh or not self._token or
+                    time.time() >= self._token_expiry):
+                LOG.debug("Requesting an IMDSv2 session token")
+                try:
+                    self._request_token()
+                except requests.HTTPError as exc:
+                    status_code = getattr(exc.response, "status_code", None)
+                    if (status_code not in
+                            IMDS_TOKEN_UNSUPPORTED_STATUS_CODES):
+                        raise
+                    LOG.info("IMDSv2 session tokens are not available, "
+                             "falling back to IMDSv1: %s", exc)
+                    self._imdsv2_supported = False
+                    self._token = None
+            return self._token
+
+    def _http_request(self, url, data=None, headers=None):
+        token = self._get_token()
+        headers = dict(headers or {})
+        if token:
+            headers[IMDS_TOKEN_HEADER] = token
+        try:
+            return super(EC2Service, self)._http_request(url, data, headers)
+        except requests.HTTPError as exc:
+            if exc.response is None or exc.response.status_code != 401:
+                raise
+            if token:
+                LOG.debug("The IMDSv2 session token was rejected, "
+                          "renewing it")
+            else:
+                LOG.debug("The IMDSv1 request was rejected, requesting an "
+                          "IMDSv2 session token")
+            new_token = self._get_token(refresh=True)
+            if not token and not new_token:
+                raise
+            if new_token:
+                headers[IMDS_TOKEN_HEADER] = new_token
+            else:
+                headers.pop(IMDS_TOKEN_HEADER)
+            return super(EC2Service, self)._http_request(url, data, headers)
 
     def load(self):
         super(EC2Service, self).load()
+        with self._token_lock:
+            self._token = None
+            self._imdsv2_supported = CONF.ec2.imdsv2
+        with self._crawl_lock:
+            self._crawl_pending = False
         if CONF.ec2.add_metadata_private_ip_route:
             network.check_metadata_ip_route(CONF.ec2.metadata_base_url)
 
         try:
             self.get_host_name()
+            with self._crawl_lock:
+                self._crawl_pending = CONF.ec2.metadata_crawl
             return True
         except Exception as ex:
             LOG.exception(ex)
@@ -47,13 +242,50 @@ class EC2Service(base.BaseHTTPMetadataService):
                       CONF.ec2.metadata_base_url)
             return False
 
+    def _get_meta_data(self, name, decode=True):
+        self._crawl_metadata()
+        return self._get_cache_data(
+            '%(version)s/meta-data/%(name)s' %
+            {'version': self._metadata_version, 'name': name},
+            decode=decode)
+
+    def _crawl_metadata(self):
+        """Crawl the meta-data once, right after the service is loaded.
+
+        The crawled values are stored in the metadata cache, where the
+        accessors read them from.
+        """
+        with self._crawl_lock:
+            if not self._crawl_pending:
+                return
+            self._crawl_pending = False
+
+            prefix = '%s/meta-data' % self._metadata_version
+            crawler = MetadataCrawler(
+                lambda path, decode: self._get_cache_data(
+                    '%s/%s' % (prefix, path), decode=decode),
+                CONF.ec2.metadata_crawl_paths,
+                CONF.ec2.metadata_crawl_depth,
+                CONF.ec2.metadata_crawl_workers)
+            start_time = time.time()
+            snapshot = crawler.crawl()
+            LOG.debug("Crawled %(count)s metadata paths in %(elapsed).2f "
+                      "seconds", {"count": len(snapshot),
+                                  "elapsed": time.time() - start_time})
+
+    def get_prefetch_paths(self):
+        return [
+            ('%s/meta-data/instance-id' % self._metadata_version, True),
+            ('%s/meta-data/local-hostname' % self._metadata_version, True),
+            ('%s/meta-data/public-keys' % self._metadata_version, True),
+            ('%s/user-data' % self._metadata_version, False),
+        ]
+
     def get_host_name(self):
-        return self._get_cache_data('%s/meta-data/local-hostname' %
-                                    self._metadata_version, decode=True)
+        return self._get_meta_data('local-hostname')
 
     def get_instance_id(self):
-        return self._get_cache_data('%s/meta-data/instance-id' %
-                                    self._metadata_version, decode=True)
+        return self._get_meta_data('instance-id')
 
     def get_user_data(self):
         return self._get_cache_data('%s/user-data' %
@@ -62,16 +294,12 @@ class EC2Service(base.BaseHTTPMetadataService):
     def get_public_keys(self):
         ssh_keys = []
 
-        keys_info = self._get_cache_data(
-            '%s/meta-data/public-keys' %
-            self._metadata_version, decode=True).splitlines()
+        keys_info = self._get_meta_data('public-keys').splitlines()
 
         for key_info in keys_info:
             (idx, key_name) = key_info.split('=')
 
-            ssh_key = self._get_cache_data(
-                '%(version)s/meta-data/public-keys/%(idx)s/openssh-key' %
-                {'version': self._metadata_version, 'idx': idx}, decode=True)
+            ssh_key = self._get_meta_data('public-keys/%s/openssh-key' % idx)
             ssh_keys.append(ssh_key.strip())
 
         return ssh_keys
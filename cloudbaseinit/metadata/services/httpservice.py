@@ -25,6 +25,7 @@ LOG = oslo_logging.getLogger(__name__)
 
 
 class HttpService(base.BaseHTTPMetadataService, baseos.BaseOpenStackService):
+    _config_group = 'openstack'
     _POST_PASSWORD_MD_VER = '2013-04-04'
 
     def __init__(self):
@@ -56,6 +57,9 @@ class HttpService(base.BaseHTTPMetadataService, baseos.BaseOpenStackService):
 
     @property
     def can_post_password(self):
+        version_index = self._get_version_index()
+        if version_index is not None:
+            return version_index.supports(self._POST_PASSWORD_MD_VER)
         try:
             self._get_meta_data(self._POST_PASSWORD_MD_VER)
             return True
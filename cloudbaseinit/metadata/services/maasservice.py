@@ -12,15 +12,20 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import email.utils
 import os
 import re
 import sys
+import threading
+import time
 
 import json
 import netaddr
-from oauthlib import oauth1
+from oauthlib import common as oauth_common
+from oauthlib.oauth1.rfc5849 import utils as oauth_utils
 from oslo_log import log as oslo_logging
 import requests
+import six
 
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import exception
@@ -48,18 +53,68 @@ BOND_LACP_RATE_MAP = {
 }
 
 
-class _Realm(str):
-    # There's a bug in oauthlib which ignores empty realm strings,
-    # by checking that the given realm is always True.
-    # This string class always returns True in a boolean context,
-    # making sure that an empty realm can be used by oauthlib.
-    def __bool__(self):
-        return True
+# Clock differences below this number of seconds are not corrected.
+MIN_CLOCK_SKEW = 10
+
+
+class OAuthSigner(object):
+
+    """Sign requests with OAuth 1.0 PLAINTEXT signatures.
+
+    The PLAINTEXT signature does not depend on the signed request, so
+    the authorization header is built once, only the nonce and the
+    timestamp being added for each request. The timestamps can be
+    shifted by the clock skew detected from the server responses.
+    """
 
-    __nonzero__ = __bool__
+    def __init__(self, consumer_key, consumer_secret, token_key,
+                 token_secret):
+        signature = "%s&%s" % (self._escape(consumer_secret),
+                               self._escape(token_secret))
+        params = [
+            ("oauth_version", "1.0"),
+            ("oauth_signature_method", "PLAINTEXT"),
+            ("oauth_consumer_key", consumer_key),
+            ("oauth_token", token_key),
+            ("oauth_signature", signature),
+        ]
+        self._static_params = ", ".join(
+            '%s="%s"' % (name, self._escape(value))
+            for name, value in params)
+        self.clock_offset = 0
+
+    @staticmethod
+    def _escape(value):
+        return oauth_utils.escape(six.text_type(value or ""))
+
+    def sign(self):
+        """Get the authorization headers for a new request."""
+        timestamp = int(time.time() + self.clock_offset)
+        authorization = (
+            'OAuth realm="", oauth_nonce="%(nonce)s", '
+            'oauth_timestamp="%(timestamp)s", %(params)s' %
+            {"nonce": oauth_common.generate_nonce(),
+             "timestamp": timestamp, "params": self._static_params})
+        return {"Authorization": authorization}
+
+    def update_clock_offset(self, date):
+        """Adjust the timestamps to the given server HTTP date.
+
+        :returns: True if the clock offset changed, False if the date
+                  is invalid or close enough to the current timestamps.
+        """
+        server_date = email.utils.parsedate_tz(date or "")
+        if not server_date:
+            return False
+        clock_offset = email.utils.mktime_tz(server_date) - time.time()
+        if abs(clock_offset - self.clock_offset) < MIN_CLOCK_SKEW:
+            return False
+        self.clock_offset = clock_offset
+        return True
 
 
 class MaaSHttpService(base.BaseHTTPMetadataService):
+    _config_group = 'maas'
     _METADATA_2012_03_01 = '2012-03-01'
 
     def __init__(self):
@@ -69,6 +124,8 @@ class MaaSHttpService(base.BaseHTTPMetadataService):
             https_ca_bundle=CONF.maas.https_ca_bundle)
         self._enable_retry = True
         self._metadata_version = self._METADATA_2012_03_01
+        self._oauth_signer = None
+        self._oauth_signer_lock = threading.Lock()
 
     def load(self):
         super(MaaSHttpService, self).load()
@@ -85,26 +142,61 @@ class MaaSHttpService(base.BaseHTTPMetadataService):
                           CONF.maas.metadata_base_url)
         return False
 
+    def _get_oauth_signer(self):
+        with self._oauth_signer_lock:
+            if self._oauth_signer is None:
+                self._oauth_signer = OAuthSigner(
+                    CONF.maas.oauth_consumer_key,
+                    CONF.maas.oauth_consumer_secret,
+                    CONF.maas.oauth_token_key,
+                    CONF.maas.oauth_token_secret)
+            return self._oauth_signer
+
     def _get_oauth_headers(self, url):
-        LOG.debug("Getting authorization headers for %s.", url)
-        client = oauth1.Client(
-            CONF.maas.oauth_consumer_key,
-            client_secret=CONF.maas.oauth_consumer_secret,
-            resource_owner_key=CONF.maas.oauth_token_key,
-            resource_owner_secret=CONF.maas.oauth_token_secret,
-            signature_method=oauth1.SIGNATURE_PLAINTEXT)
-        realm = _Realm("")
-        headers = client.sign(url, realm=realm)[1]
-        return headers
+        return self._get_oauth_signer().sign()
+
+    def _is_clock_skewed(self, exc):
+        """Check if the request failed due to a clock difference.
+
+        The clock offset of the OAuth signer is adjusted to the date
+        of the server response, when the request was not authorized.
+        """
+        response = exc.response
+        if response is None or response.status_code not in (401, 403):
+            return False
+        signer = self._get_oauth_signer()
+        if not signer.update_clock_offset(response.headers.get("Date")):
+            return False
+        LOG.warning("The clock differs from the MaaS server clock by "
+                    "%.0f seconds, adjusting the OAuth timestamps",
+                    signer.clock_offset)
+        return True
 
     def _http_request(self, url, data=None, headers=None):
         """Get content for received url."""
         if not url.startswith("http"):
             url = requests.compat.urljoin(self._base_url, url)
-        headers = {} if headers is None else headers
+        headers = dict(headers or {})
         headers.update(self._get_oauth_headers(url))
 
-        return super(MaaSHttpService, self)._http_request(url, data, headers)
+        try:
+            return super(MaaSHttpService, self)._http_request(
+                url, data, headers)
+        except requests.HTTPError as exc:
+            if not self._is_clock_skewed(exc):
+                raise
+            headers.update(self._get_oauth_headers(url))
+            return super(MaaSHttpService, self)._http_request(
+                url, data, headers)
+
+    def get_prefetch_paths(self):
+        return [
+            ('%s/meta-data/instance-id' % self._metadata_version, True),
+            ('%s/meta-data/local-hostname' % self._metadata_version, True),
+            ('%s/meta-data/public-keys' % self._metadata_version, True),
+            ('%s/meta-data/x509' % self._metadata_version, True),
+            ('%s/user-data' % self._metadata_version, False),
+        ]
 
     def get_host_name(self):
         return self._get_cache_data('%s/meta-data/local-hostname' %
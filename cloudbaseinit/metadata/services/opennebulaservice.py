@@ -47,6 +47,119 @@ NETMASK = ["ETH{iid}_MASK"]
 GATEWAY = ["ETH{iid}_GATEWAY"]
 DNSNS = ["ETH{iid}_DNS"]
 
+# the names of a group are aliases, in the order of precedence
+ALIASES = [HOST_NAME, USER_DATA, PUBLIC_KEY]
+NIC_PREFIX = "ETH{iid}_"
+
+_NIC_KEY_REGEX = re.compile(r"ETH(0|[1-9]\d*)_")
+
+_ASSIGNMENT_REGEX = re.compile(br"([A-Za-z_]\w*)=")
+_BLANK_REGEX = re.compile(br"\s*")
+_UNQUOTED_REGEX = re.compile(br"[^\s'\"\\$]+")
+_DOUBLE_QUOTED_REGEX = re.compile(br'[^"\\]+')
+_ANSI_C_QUOTED_REGEX = re.compile(br"[^'\\]+")
+_ANSI_C_ESCAPES = {
+    b"a": b"\a", b"b": b"\b", b"e": b"\x1b", b"E": b"\x1b", b"f": b"\f",
+    b"n": b"\n", b"r": b"\r", b"t": b"\t", b"v": b"\v", b"\\": b"\\",
+    b"'": b"'", b'"': b'"', b"?": b"?",
+}
+_ANSI_C_NUMERIC_ESCAPE_REGEX = re.compile(br"x[0-9A-Fa-f]{1,2}|[0-7]{1,3}")
+
+
+def _find_end(content, chars, pos):
+    end = content.find(chars, pos)
+    return len(content) if end == -1 else end
+
+
+def _read_double_quoted(content, pos, parts):
+    """Read a "..." string, starting after the opening quote."""
+    while pos < len(content):
+        match = _DOUBLE_QUOTED_REGEX.match(content, pos)
+        if match:
+            parts.append(match.group())
+            pos = match.end()
+            continue
+        char = content[pos:pos + 1]
+        if char == b'"':
+            return pos + 1
+        escaped = content[pos + 1:pos + 2]
+        if escaped in (b'"', b"\\", b"$", b"`"):
+            parts.append(escaped)
+        elif escaped != b"\n":
+            # Only a few characters can be escaped in double quotes.
+            parts.append(char + escaped)
+        pos += 2
+    return pos
+
+
+def _read_ansi_c_quoted(content, pos, parts):
+    """Read a $'...' string, starting after the opening quote."""
+    while pos < len(content):
+        match = _ANSI_C_QUOTED_REGEX.match(content, pos)
+        if match:
+            parts.append(match.group())
+            pos = match.end()
+            continue
+        if content[pos:pos + 1] == b"'":
+            return pos + 1
+        escaped = content[pos + 1:pos + 2]
+        if escaped in _ANSI_C_ESCAPES:
+            parts.append(_ANSI_C_ESCAPES[escaped])
+            pos += 2
+            continue
+        match = _ANSI_C_NUMERIC_ESCAPE_REGEX.match(content, pos + 1)
+        if match:
+            number = match.group()
+            if number.startswith(b"x"):
+                parts.append(six.int2byte(int(number[1:], 16)))
+            else:
+                parts.append(six.int2byte(int(number, 8) & 0xFF))
+            pos = match.end()
+        else:
+            parts.append(content[pos:pos + 2])
+            pos += 2
+    return pos
+
+
+def _read_word(content, pos):
+    """Read a shell word, as a (value, is_quoted, end position) tuple.
+
+    The adjacent quoted and unquoted parts of the word are joined,
+    like in 'It'\''s' or "a"'b'. Every character is read once.
+    """
+    parts = []
+    is_quoted = False
+    while pos < len(content):
+        match = _UNQUOTED_REGEX.match(content, pos)
+        if match:
+            parts.append(match.group())
+            pos = match.end()
+            continue
+        char = content[pos:pos + 1]
+        if char.isspace():
+            break
+        if char == b"'":
+            end = _find_end(content, b"'", pos + 1)
+            parts.append(content[pos + 1:end])
+            pos = end + 1
+            is_quoted = True
+        elif char == b'"':
+            pos = _read_double_quoted(content, pos + 1, parts)
+            is_quoted = True
+        elif char == b"$" and content[pos + 1:pos + 2] == b"'":
+            pos = _read_ansi_c_quoted(content, pos + 2, parts)
+            is_quoted = True
+        elif char == b"\\":
+            escaped = content[pos + 1:pos + 2]
+            if escaped != b"\n":
+                # A backslash before a newline continues the line.
+                parts.append(escaped)
+            pos += 2
+        else:
+            parts.append(char)
+            pos += 1
+    return b"".join(parts), is_quoted, min(pos, len(content))
+
 
 class OpenNebulaService(base.BaseMetadataService):
 
@@ -61,39 +174,67 @@ class OpenNebulaService(base.BaseMetadataService):
         self._context_path = None
         self._raw_content = None
         self._dict_content = {}
+        self._fields = {}
+        self._nics = {}
+        self._nic_ids = []
+
+    def _index_context(self):
+        """Index the context values, to be looked up directly.
+
+        The values of the interfaces are grouped by their index and
+        keyed by their name template, e.g. "ETH{iid}_MAC". Each alias
+        resolves to the value of the first alias of its group found.
+        """
+        fields = dict(self._dict_content)
+        nics = {}
+        for key, value in self._dict_content.items():
+            match = _NIC_KEY_REGEX.match(key)
+            if match:
+                nic = nics.setdefault(int(match.group(1)), {})
+                nic[NIC_PREFIX + key[match.end():]] = value
+        for names in ALIASES:
+            for name in names:
+                if name in fields:
+                    value = fields[name]
+                    fields.update((alias, value) for alias in names)
+                    break
+
+        nic_ids = []
+        while nics.get(len(nic_ids), {}).get(MAC[0]):
+            nic_ids.append(len(nic_ids))
+        self._fields = fields
+        self._nics = nics
+        self._nic_ids = nic_ids
 
     def _nic_count(self):
         """Return the number of available interfaces."""
-        mac = MAC[0]
-        iid = 0
-        while self._dict_content.get(mac.format(iid=iid)):
-            iid += 1
-        return iid
+        return len(self._nic_ids)
 
     @staticmethod
     def _parse_shell_variables(content):
         """Returns a dictionary with variables and their values.
 
-        This is a dummy approach, because it works only with simple literals.
+        Only the assignments of the context.sh files are parsed, like
+        KEY='value', KEY="value", KEY=$'value' or KEY=10. The values are
+        not expanded and the unquoted integers are converted. The
+        content is tokenized in a single pass.
         """
-        # preprocess the content
-        lines = []
-        for line in content.splitlines():
-            if not line or line.startswith(b"#"):
-                continue
-            lines.append(line)
-        # for cleaner pattern matching
-        lines.append(b"__REGEX_DUMMY__='__regex_dummy__'")
-        sep = b"\r\n" if b"\r\n" in content else b"\n"
-        new_content = sep.join(lines)
-        # get pairs
         pairs = {}
-        pattern = (br"(?P<key>\w+)=(['\"](?P<str_value>[\s\S]+?)['\"]|"
-                   br"(?P<int_value>\d+))(?=\s+\w+=)")
-        for match in re.finditer(pattern, new_content):
-            key = encoding.get_as_string(match.group("key"))
-            pairs[key] = (match.group("str_value") or
-                          int(match.group("int_value")))
+        pos = 0
+        while pos < len(content):
+            pos = _BLANK_REGEX.match(content, pos).end()
+            if content[pos:pos + 1] == b"#":
+                pos = _find_end(content, b"\n", pos)
+                continue
+            match = _ASSIGNMENT_REGEX.match(content, pos)
+            if match:
+                value, is_quoted, pos = _read_word(content, match.end())
+                if not is_quoted and value.isdigit():
+                    value = int(value)
+                pairs[encoding.get_as_string(match.group(1))] = value
+            else:
+                # Not an assignment, like the export keyword.
+                _, _, pos = _read_word(content, pos)
         return pairs
 
     @staticmethod
@@ -138,6 +279,7 @@ class OpenNebulaService(base.BaseMetadataService):
                 self._raw_content
             )
             self._dict_content.update(vardict)
+            self._index_context()
 
     def _get_data(self, name):
         # Return the requested field's value or raise an error if not found.
@@ -148,23 +290,15 @@ class OpenNebulaService(base.BaseMetadataService):
         return self._dict_content[name]
 
     def _get_cache_data(self, names, iid=None, decode=False):
-        # Solves caching issues when working with
-        # multiple names (lists not hashable).
-        # This happens because the caching function used
-        # to store already computed results inside a dictionary
-        # and the keys were strings (and must be anything that
-        # is hashable under a dictionary, that's why the exception
-        # is thrown).
-        names = names[:]
-        if iid is not None:
-            for ind, value in enumerate(names):
-                names[ind] = value.format(iid=iid)
+        # Look up the indexed values, the names of an interface
+        # being templates like the ones of MAC.
+        fields = self._fields if iid is None else self._nics.get(iid, {})
         for name in names:
-            try:
-                return super(OpenNebulaService, self)._get_cache_data(
-                    name, decode=decode)
-            except base.NotExistingMetadataException:
-                pass
+            if name in fields:
+                value = fields[name]
+                return encoding.get_as_string(value) if decode else value
+        if iid is not None:
+            names = [name.format(iid=iid) for name in names]
         msg = "None of {} metadata was found".format(", ".join(names))
         LOG.debug(msg)
         raise base.NotExistingMetadataException(msg)
@@ -211,9 +345,8 @@ class OpenNebulaService(base.BaseMetadataService):
         this is handled by DHCP (user didn't provide sufficient data).
         """
         network_details = []
-        ncount = self._nic_count()
         # for every interface
-        for iid in range(ncount):
+        for iid in self._nic_ids:
             try:
                 # get existing values
                 mac = self._get_cache_data(MAC, iid=iid, decode=True).upper()
@@ -23,6 +23,8 @@ class BaseConfigDriveManager(object):
 
     def __init__(self):
         self.target_path = tempfile.mkdtemp()
+        # The (type, location) tuple of the config drive found, if any.
+        self.found_config_drive = None
 
     @abc.abstractmethod
     def get_config_drive_files(self, check_types=None, check_locations=None):
@@ -13,19 +13,18 @@
 #    under the License.
 
 
+import functools
 import itertools
 import os
 import shutil
 import struct
-import tempfile
-import uuid
 
 from oslo_log import log as oslo_logging
 
 from cloudbaseinit import conf as cloudbaseinit_conf
-from cloudbaseinit import exception
 from cloudbaseinit.metadata.services.osconfigdrive import base
 from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.utils import iso9660
 from cloudbaseinit.utils.windows import disk
 from cloudbaseinit.utils.windows import vfat
 
@@ -33,7 +32,6 @@ CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
 
 CONFIG_DRIVE_LABEL = 'config-2'
-MAX_SECTOR_SIZE = 4096
 # Absolute offset values and the ISO magic string.
 OFFSET_BOOT_RECORD = 0x8000
 OFFSET_ISO_ID = OFFSET_BOOT_RECORD + 1
@@ -44,6 +42,11 @@ OFFSET_BLOCK_SIZE = OFFSET_BOOT_RECORD + 128
 PEEK_SIZE = 2
 
 
+def _read_device(device, offset, size):
+    real_offset = device.seek(offset)
+    return device.read(size, skip=offset - real_offset)
+
+
 class WindowsConfigDriveManager(base.BaseConfigDriveManager):
 
     def __init__(self):
@@ -83,55 +86,27 @@ class WindowsConfigDriveManager(base.BaseConfigDriveManager):
 
         return volume_size * block_size
 
-    def _write_iso_file(self, device, iso_file_path, iso_file_size):
-        with open(iso_file_path, 'wb') as stream:
-            offset = 0
-            # Read multiples of the sector size bytes
-            # until the entire ISO content is written.
-            while offset < iso_file_size:
-                real_offset = device.seek(offset)
-                bytes_to_read = min(MAX_SECTOR_SIZE, iso_file_size - offset)
-                data = device.read(bytes_to_read, skip=offset - real_offset)
-                stream.write(data)
-                offset += bytes_to_read
-
-    def _extract_files_from_iso(self, iso_file_path):
-        args = [CONF.bsdtar_path, '-xf', iso_file_path,
-                '-C', self.target_path]
-        (out, err, exit_code) = self._osutils.execute_process(args, False)
-
-        if exit_code:
-            raise exception.CloudbaseInitException(
-                'Failed to execute "bsdtar" from path "%(bsdtar_path)s" with '
-                'exit code: %(exit_code)s\n%(out)s\n%(err)s' % {
-                    'bsdtar_path': CONF.bsdtar_path,
-                    'exit_code': exit_code,
-                    'out': out, 'err': err})
+    def _extract_files_from_iso(self, device):
+        # Only the directories and the files of the ISO are read, straight
+        # from the device.
+        reader = iso9660.ISO9660Reader(
+            functools.partial(_read_device, device), device.size)
+        reader.extract(self.target_path)
 
     def _extract_iso_from_devices(self, devices):
         """Search across multiple devices for a raw ISO."""
-        extracted = False
-        iso_file_path = os.path.join(tempfile.gettempdir(),
-                                     str(uuid.uuid4()) + '.iso')
-
         for device in devices:
             try:
                 with device:
                     iso_file_size = self._get_iso_file_size(device)
                     if iso_file_size:
                         LOG.info('ISO9660 disk found on %s', device)
-                        self._write_iso_file(device, iso_file_path,
-                                             iso_file_size)
-                        self._extract_files_from_iso(iso_file_path)
-                        extracted = True
-                        break
+                        self._extract_files_from_iso(device)
+                        return True
             except Exception as exc:
                 LOG.warning('ISO extraction failed on %(device)s with '
                             '%(error)r', {"device": device, "error": exc})
-
-        if os.path.isfile(iso_file_path):
-            os.remove(iso_file_path)
-        return extracted
+        return False
 
     def _get_config_drive_from_cdrom_drive(self):
         for drive_letter in self._osutils.get_cdrom_drives():
@@ -196,6 +171,7 @@ class WindowsConfigDriveManager(base.BaseConfigDriveManager):
             LOG.debug('Looking for Config Drive %(type)s in %(location)s',
                       {"type": cd_type, "location": cd_location})
             if self._get_config_drive_files(cd_type, cd_location):
+                self.found_config_drive = (cd_type, cd_location)
                 return True
 
         return False
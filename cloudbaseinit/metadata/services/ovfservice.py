@@ -16,16 +16,18 @@ import base64
 import os
 
 from oslo_log import log as oslo_logging
-import untangle
 
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit.metadata.services import base
 from cloudbaseinit.osutils import factory as osutils_factory
+from cloudbaseinit.utils import xmlrecords
 
 CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
 
 INSTANCE_ID = 'iid-ovf'
+PROPERTY_SECTION_PATH = 'Environment/PropertySection'
+PROPERTY_PATH = PROPERTY_SECTION_PATH + '/Property'
 
 
 class OvfService(base.BaseMetadataService):
@@ -33,6 +35,7 @@ class OvfService(base.BaseMetadataService):
         super(OvfService, self).__init__()
         self._config_drive_path = None
         self._ovf_env = None
+        self._properties = None
         self._osutils = osutils_factory.get_os_utils()
 
     def load(self):
@@ -69,33 +72,46 @@ class OvfService(base.BaseMetadataService):
 
         return ovf_env_path
 
+    @staticmethod
+    def _index_properties(ovf_env):
+        """Get the values of the properties, indexed by their key."""
+        if not ovf_env[PROPERTY_SECTION_PATH]:
+            return None
+
+        key_name = CONF.ovf.ns + ':key'
+        value_name = CONF.ovf.ns + ':value'
+        properties = {}
+        for prop in ovf_env[PROPERTY_PATH]:
+            property_key = prop.attrib.get(key_name)
+            if property_key:
+                values = properties.setdefault(property_key, [])
+                property_value = prop.attrib.get(value_name)
+                if property_value:
+                    values.append(property_value.strip())
+        return properties
+
     def _get_ovf_env(self):
         if not self._ovf_env:
             ovf_env_path = self._get_ovf_env_path()
-            self._ovf_env = untangle.parse(ovf_env_path)
+            ovf_env = xmlrecords.parse_file(
+                ovf_env_path, [PROPERTY_SECTION_PATH, PROPERTY_PATH])
+            self._properties = self._index_properties(ovf_env)
+            self._ovf_env = ovf_env
         return self._ovf_env
 
-    def _get_property_section(self):
-        ovf_env = self._get_ovf_env()
-        if not hasattr(ovf_env.Environment, 'PropertySection'):
+    def _get_properties(self):
+        self._get_ovf_env()
+        if self._properties is None:
             LOG.warning("PropertySection not found in ovf file")
-            return None
-        return ovf_env.Environment.PropertySection
+        return self._properties
 
     def _get_property_values(self, property_name):
-        prop_values = []
-        prop_section = self._get_property_section()
-        if not hasattr(prop_section, 'Property'):
+        properties = self._get_properties()
+        if not properties:
             LOG.warning("PropertySection in ovf file has no Property elements")
-            return None
-
-        for child_property in prop_section.Property:
-            property_key = child_property[CONF.ovf.ns + ':key']
-            if property_key and property_key == property_name:
-                property_value = child_property[CONF.ovf.ns + ':value']
-                if property_value:
-                    prop_values.append(property_value.strip())
+            return []
 
+        prop_values = list(properties.get(property_name, []))
         if not prop_values:
             LOG.warning("Property %s not found in PropertySection in ovf file",
                         property_name)
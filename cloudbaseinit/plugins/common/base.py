@@ -22,6 +22,9 @@ PLUGIN_STAGE_MAIN = "MAIN"
 
 class BasePlugin(object):
     execution_stage = PLUGIN_STAGE_MAIN
+    # The codes of the DHCP options used by the plugin, requested
+    # together by the first DHCP request of the boot.
+    dhcp_options = ()
 
     def get_name(self):
         return self.__class__.__name__
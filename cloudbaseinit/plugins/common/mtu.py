@@ -20,6 +20,7 @@ from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins.common import base
 from cloudbaseinit.utils import dhcp
+from cloudbaseinit.utils import dhcpoptions
 
 CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
@@ -27,15 +28,20 @@ LOG = oslo_logging.getLogger(__name__)
 
 class MTUPlugin(base.BasePlugin):
     execution_stage = base.PLUGIN_STAGE_PRE_METADATA_DISCOVERY
+    dhcp_options = (dhcp.OPTION_MTU,)
 
     def execute(self, service, shared_data):
         if CONF.mtu_use_dhcp_config:
             osutils = osutils_factory.get_os_utils()
             dhcp_hosts = osutils.get_dhcp_hosts_in_use()
+            queries = [dhcp.DHCPQuery(adapter_name, mac_address, dhcp_host)
+                       for (adapter_name, mac_address, dhcp_host)
+                       in dhcp_hosts]
+            adapters_options = dhcpoptions.get_dhcp_options(
+                queries, [dhcp.OPTION_MTU])
 
             for (adapter_name, mac_address, dhcp_host) in dhcp_hosts:
-                options_data = dhcp.get_dhcp_options(dhcp_host,
-                                                     [dhcp.OPTION_MTU])
+                options_data = adapters_options.get(adapter_name)
                 if options_data:
                     mtu_option_data = options_data.get(dhcp.OPTION_MTU)
                     if mtu_option_data:
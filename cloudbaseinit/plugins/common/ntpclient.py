@@ -20,6 +20,7 @@ from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit.osutils import factory as osutils_factory
 from cloudbaseinit.plugins.common import base
 from cloudbaseinit.utils import dhcp
+from cloudbaseinit.utils import dhcpoptions
 
 CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
@@ -27,6 +28,7 @@ LOG = oslo_logging.getLogger(__name__)
 
 class NTPClientPlugin(base.BasePlugin):
     execution_stage = base.PLUGIN_STAGE_PRE_NETWORKING
+    dhcp_options = (dhcp.OPTION_NTP_SERVERS,)
 
     def verify_time_service(self, osutils):
         """Verify that the time service is up.
@@ -56,16 +58,19 @@ class NTPClientPlugin(base.BasePlugin):
 
         if CONF.ntp_use_dhcp_config:
             dhcp_hosts = osutils.get_dhcp_hosts_in_use()
+            queries = [dhcp.DHCPQuery(adapter_name, mac_address, dhcp_host)
+                       for (adapter_name, mac_address, dhcp_host)
+                       in dhcp_hosts]
+            adapters_options = dhcpoptions.get_dhcp_options(
+                queries, [dhcp.OPTION_NTP_SERVERS])
 
             ntp_option_data = None
 
-            for (_, _, dhcp_host) in dhcp_hosts:
-                options_data = dhcp.get_dhcp_options(dhcp_host,
-                                                     [dhcp.OPTION_NTP_SERVERS])
-                if options_data:
-                    ntp_option_data = options_data.get(dhcp.OPTION_NTP_SERVERS)
-                    if ntp_option_data:
-                        break
+            for query in queries:
+                ntp_option_data = adapters_options[query.name].get(
+                    dhcp.OPTION_NTP_SERVERS)
+                if ntp_option_data:
+                    break
 
             if not ntp_option_data:
                 LOG.debug("Could not obtain the NTP configuration via DHCP")
@@ -0,0 +1,115 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A local stand-in for the EC2 instance metadata service."""
+
+import threading
+import uuid
+
+from six.moves import BaseHTTPServer
+
+TOKEN_PATH = "/latest/api/token"
+TOKEN_HEADER = "X-aws-ec2-metadata-token"
+TOKEN_TTL_HEADER = "X-aws-ec2-metadata-token-ttl-seconds"
+
+
+class _IMDSRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        imds = self.server.imds
+        with imds.lock:
+            imds.token_requests += 1
+            if imds.token_errors:
+                self._send(imds.token_errors.pop(0))
+                return
+            if self.path != TOKEN_PATH or not imds.imdsv2:
+                self._send(404)
+                return
+            if not self.headers.get(TOKEN_TTL_HEADER):
+                self._send(400)
+                return
+            imds.token = uuid.uuid4().hex
+            token = imds.token
+        self._send(200, token.encode())
+
+    def do_GET(self):
+        imds = self.server.imds
+        with imds.lock:
+            imds.requests.append(self.path)
+            token = self.headers.get(TOKEN_HEADER)
+            if imds.imdsv2_required and (not token or token != imds.token):
+                self._send(401)
+                return
+            if token and token != imds.token:
+                self._send(401)
+                return
+            data = imds.tree.get(self.path.lstrip("/"))
+        if data is None:
+            self._send(404)
+        else:
+            self._send(200, data)
+
+
+class FakeIMDS(object):
+
+    """An HTTP server serving the given metadata tree.
+
+    :param tree: A dict with the metadata, keyed by the relative path.
+    :param imdsv2: Whether session tokens are provided.
+    :param imdsv2_required: Whether requests without a token are refused.
+    :param token_errors: The HTTP statuses returned to the next token
+                         requests, before issuing tokens.
+    """
+
+    def __init__(self, tree, imdsv2=True, imdsv2_required=False,
+                 token_errors=None):
+        self.tree = tree
+        self.imdsv2 = imdsv2
+        self.imdsv2_required = imdsv2_required
+        self.token_errors = list(token_errors or [])
+        self.token = None
+        self.token_requests = 0
+        self.requests = []
+        self.lock = threading.Lock()
+        self._server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0),
+                                                 _IMDSRequestHandler)
+        self._server.imds = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:%s/" % self._server.server_address[1]
+
+    def revoke_token(self):
+        with self.lock:
+            self.token = uuid.uuid4().hex
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
@@ -0,0 +1,211 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+INCARNATION = "3"
+CONTAINER_ID = "c6d5b1d8-2c4f-4f27-8f2b-8a3b3c1e7d10"
+ROLE_INSTANCE_ID = "b2b1a8b0e0d54c1b9fbe0b4c5f6a7d8e.fake-vm"
+WIRE_SERVER_URL = "http://168.63.129.16:80/machine/"
+CERTIFICATES_URL = (WIRE_SERVER_URL + "fake?comp=certificates&incarnation=3")
+HOSTING_ENVIRONMENT_URL = (WIRE_SERVER_URL + "fake?comp=config&type="
+                           "hostingEnvironmentConfig&incarnation=3")
+
+ADMIN_USERNAME = "fake-admin"
+ADMIN_PASSWORD = "Passw0rd!"
+COMPUTER_NAME = "fake-vm"
+GUEST_AGENT_PACKAGE_NAME = "WindowsAzureVmAgent.2.7.1198.778.zip"
+KMS_SERVER_HOSTNAME = "kms.fake.windows.net"
+WINRM_THUMBPRINT = "C2A0B9A1B5D3E9A2F1D5C3B8E7A6D4C2B1A0F9E8"
+
+
+def get_fake_versions_xml():
+    return b"""<?xml version="1.0" encoding="utf-8"?>
+<Versions>
+  <Preferred>
+    <Version>2015-04-05</Version>
+  </Preferred>
+  <Supported>
+    <Version>2015-04-05</Version>
+    <Version>2012-11-30</Version>
+    <Version>2012-09-15</Version>
+    <Version>2012-05-15</Version>
+    <Version>2011-12-31</Version>
+    <Version>2011-10-15</Version>
+    <Version>2011-08-31</Version>
+    <Version>2011-04-07</Version>
+    <Version>2010-12-15</Version>
+    <Version>2010-28-10</Version>
+  </Supported>
+</Versions>"""
+
+
+def get_fake_goal_state_xml(expected_state="Started"):
+    return ("""<?xml version="1.0" encoding="utf-8"?>
+<GoalState xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+    xsi:noNamespaceSchemaLocation="goalstate10.xsd">
+  <Version>2015-04-05</Version>
+  <Incarnation>%(incarnation)s</Incarnation>
+  <Machine>
+    <ExpectedState>%(expected_state)s</ExpectedState>
+    <StopRolesDeadlineHint>300000</StopRolesDeadlineHint>
+    <LBProbePorts>
+      <Port>16001</Port>
+    </LBProbePorts>
+    <ExpectHealthReport>FALSE</ExpectHealthReport>
+  </Machine>
+  <Container>
+    <ContainerId>%(container_id)s</ContainerId>
+    <RoleInstanceList>
+      <RoleInstance>
+        <InstanceId>%(role_instance_id)s</InstanceId>
+        <State>Started</State>
+        <Configuration>
+          <HostingEnvironmentConfig>%(hosting_environment_url)s\
+</HostingEnvironmentConfig>
+          <SharedConfig>%(url)sfake?comp=config&amp;type=sharedConfig\
+&amp;incarnation=3</SharedConfig>
+          <ExtensionsConfig>%(url)sfake?comp=config&amp;type=\
+extensionsConfig&amp;incarnation=3</ExtensionsConfig>
+          <FullConfig>%(url)sfake?comp=config&amp;type=fullConfig\
+&amp;incarnation=3</FullConfig>
+          <Certificates>%(certificates_url)s</Certificates>
+          <ConfigName>fake.0.fake.3.xml</ConfigName>
+        </Configuration>
+      </RoleInstance>
+    </RoleInstanceList>
+  </Container>
+</GoalState>""" % {
+        "incarnation": INCARNATION,
+        "expected_state": expected_state,
+        "container_id": CONTAINER_ID,
+        "role_instance_id": ROLE_INSTANCE_ID,
+        "url": WIRE_SERVER_URL,
+        "hosting_environment_url": HOSTING_ENVIRONMENT_URL.replace(
+            "&", "&amp;"),
+        "certificates_url": CERTIFICATES_URL.replace("&", "&amp;"),
+    }).encode()
+
+
+def get_fake_hosting_environment_xml():
+    return b"""<?xml version="1.0" encoding="utf-8"?>
+<HostingEnvironmentConfig version="1.0.0.0" goalStateIncarnation="3">
+  <StoredCertificates>
+    <StoredCertificate name="Stored0Microsoft.WindowsAzure.Plugins.\
+RemoteAccess.PasswordEncryption" certificateId="sha1:C2A0B9A1B5D3E9A2F1D5\
+C3B8E7A6D4C2B1A0F9E8" storeName="My" configurationLevel="System" />
+    <StoredCertificate name="Stored1WinRM" certificateId="sha1:\
+A1B2C3D4E5F60718293A4B5C6D7E8F9012345678" storeName="My" \
+configurationLevel="User" />
+  </StoredCertificates>
+  <Deployment name="fake" guid="{fake-guid}" incarnation="0" />
+</HostingEnvironmentConfig>"""
+
+
+def get_fake_certificates_xml():
+    return b"""<?xml version="1.0" encoding="utf-8"?>
+<CertificateFile>
+  <Version>2012-11-30</Version>
+  <Incarnation>3</Incarnation>
+  <Format>Pkcs7BlobWithPfxContents</Format>
+  <Data>MIINswYJKoZIhvcNAQcDoIINpDCCDaACAQIxggEwMIIBLAIBAoAUZcG9X+5aK8VZ
+FpUq2Sx8ZP8b7pMwDQYJKoZIhvcNAQEBBQAEggEAcmJ6Ppxx3rOLw6qTGkMpLLXn</Data>
+</CertificateFile>"""
+
+
+def get_fake_azure_ovf_env_xml():
+    return ("""<?xml version="1.0" encoding="utf-8"?>
+<Environment xmlns="http://schemas.dmtf.org/ovf/environment/1"
+    xmlns:oe="http://schemas.dmtf.org/ovf/environment/1"
+    xmlns:wa="http://schemas.microsoft.com/windowsazure"
+    xmlns:i="http://www.w3.org/2001/XMLSchema-instance">
+  <wa:ProvisioningSection>
+    <wa:Version>1.0</wa:Version>
+    <WindowsProvisioningConfigurationSet
+        xmlns="http://schemas.microsoft.com/windowsazure"
+        xmlns:i="http://www.w3.org/2001/XMLSchema-instance">
+      <ConfigurationSetType>WindowsProvisioningConfiguration\
+</ConfigurationSetType>
+      <ComputerName>%(computer_name)s</ComputerName>
+      <AdminPassword>%(admin_password)s</AdminPassword>
+      <AdminUsername>%(admin_username)s</AdminUsername>
+      <EnableAutomaticUpdates>true</EnableAutomaticUpdates>
+      <ResetPasswordIfRequired>true</ResetPasswordIfRequired>
+      <CustomData>Q3VzdG9tRGF0YQ==</CustomData>
+      <WinRM>
+        <Listeners>
+          <Listener>
+            <Protocol>Http</Protocol>
+          </Listener>
+          <Listener>
+            <CertificateThumbprint>%(thumbprint)s</CertificateThumbprint>
+            <Protocol>Https</Protocol>
+          </Listener>
+        </Listeners>
+      </WinRM>
+      <AdditionalUnattendContent />
+    </WindowsProvisioningConfigurationSet>
+  </wa:ProvisioningSection>
+  <wa:PlatformSettingsSection>
+    <wa:Version>1.0</wa:Version>
+    <PlatformSettings xmlns="http://schemas.microsoft.com/windowsazure"
+        xmlns:i="http://www.w3.org/2001/XMLSchema-instance">
+      <KmsServerHostname>%(kms_server_hostname)s</KmsServerHostname>
+      <ProvisionGuestAgent>true</ProvisionGuestAgent>
+      <GuestAgentPackageName>%(package_name)s</GuestAgentPackageName>
+      <UseAVMA>true</UseAVMA>
+      <RetainWindowsPEPassInUnattend>true</RetainWindowsPEPassInUnattend>
+      <RetainOfflineServicingPassInUnattend>true\
+</RetainOfflineServicingPassInUnattend>
+      <PreprovisionedVm>false</PreprovisionedVm>
+    </PlatformSettings>
+  </wa:PlatformSettingsSection>
+</Environment>""" % {
+        "computer_name": COMPUTER_NAME,
+        "admin_password": ADMIN_PASSWORD,
+        "admin_username": ADMIN_USERNAME,
+        "thumbprint": WINRM_THUMBPRINT,
+        "kms_server_hostname": KMS_SERVER_HOSTNAME,
+        "package_name": GUEST_AGENT_PACKAGE_NAME,
+    }).encode()
+
+
+def get_fake_ovf_env_xml(properties):
+    """Get a VMware style OVF environment with the given properties.
+
+    :param properties: A list of (key, value) tuples.
+    """
+    property_elements = "\n".join(
+        '      <Property oe:key="%s" oe:value="%s"/>' % (key, value)
+        for key, value in properties)
+    return ("""<?xml version="1.0" encoding="UTF-8"?>
+<Environment
+     xmlns="http://schemas.dmtf.org/ovf/environment/1"
+     xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+     xmlns:oe="http://schemas.dmtf.org/ovf/environment/1"
+     xmlns:ve="http://www.vmware.com/schema/ovfenv"
+     oe:id=""
+     ve:vCenterId="vm-12345">
+   <PlatformSection>
+      <Kind>VMware ESXi</Kind>
+      <Version>6.7.0</Version>
+      <Vendor>VMware, Inc.</Vendor>
+      <Locale>en</Locale>
+   </PlatformSection>
+   <PropertySection>
+%s
+   </PropertySection>
+   <ve:EthernetAdapterSection>
+      <ve:Adapter ve:mac="00:50:56:a1:b2:c3" ve:network="VM Network"
+          ve:unitNumber="7"/>
+   </ve:EthernetAdapterSection>
+</Environment>""" % property_elements).encode()
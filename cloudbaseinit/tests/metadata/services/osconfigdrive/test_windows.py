@@ -16,6 +16,8 @@
 import importlib
 import itertools
 import os
+import shutil
+import tempfile
 import unittest
 
 try:
@@ -24,13 +26,33 @@ except ImportError:
     import mock
 
 from cloudbaseinit import conf as cloudbaseinit_conf
-from cloudbaseinit import exception
 from cloudbaseinit.tests import testutils
+from cloudbaseinit.tests.utils import fake_iso
+from cloudbaseinit.utils import iso9660
 
 
 CONF = cloudbaseinit_conf.CONF
 
-OPEN = mock.mock_open()
+
+class FakeDevice(object):
+    """A device doing sector aligned seeks and reads, like disk.Disk."""
+
+    def __init__(self, data, sector_size=512):
+        self._data = data
+        self._sector_size = sector_size
+        self._offset = 0
+        self.size = len(data)
+
+    def seek(self, offset):
+        self._offset = offset // self._sector_size * self._sector_size
+        return self._offset
+
+    def read(self, size, skip=0):
+        total = size + skip
+        sectors = (total + self._sector_size - 1) // self._sector_size
+        content = self._data[self._offset:
+                             self._offset + sectors * self._sector_size]
+        return content[skip:total]
 
 
 class TestWindowsConfigDriveManager(unittest.TestCase):
@@ -50,12 +72,6 @@ class TestWindowsConfigDriveManager(unittest.TestCase):
 
         self.conf_module.osutils_factory = mock.Mock()
         self.conf_module.disk.Disk = mock.MagicMock()
-        self.conf_module.tempfile = mock.Mock()
-        self.mock_gettempdir = self.conf_module.tempfile.gettempdir
-        self.mock_gettempdir.return_value = "tempdir"
-        self.conf_module.uuid = mock.Mock()
-        self.mock_uuid4 = self.conf_module.uuid.uuid4
-        self.mock_uuid4.return_value = "uuid"
         self._config_manager = self.conf_module.WindowsConfigDriveManager()
         self.addCleanup(os.rmdir, self._config_manager.target_path)
         self.osutils = mock.Mock()
@@ -139,62 +155,34 @@ class TestWindowsConfigDriveManager(unittest.TestCase):
     def test_get_iso_file_size(self):
         self._test_get_iso_file_size()
 
-    @mock.patch("six.moves.builtins.open", new=OPEN)
-    def test_write_iso_file(self):
-        file_path = "fake\\path"
-        file_size = 100 * 512
-        sector_size = self.conf_module.MAX_SECTOR_SIZE
-        offsets = list(range(0, file_size, sector_size))
-        remain = file_size % sector_size
-        reads = ([b"\x00" * sector_size] *
-                 (len(offsets) - int(bool(remain))) +
-                 ([b"\x00" * remain] if remain else []))
-
-        device = mock.Mock()
-        device_seek_calls = [mock.call(off) for off in offsets]
-        device_read_calls = [
-            mock.call(min(sector_size, file_size - off), skip=0)
-            for off in offsets]
-        stream_write_calls = [mock.call(read) for read in reads]
-        device.seek.side_effect = offsets
-        device.read.side_effect = reads
-
-        self._config_manager._write_iso_file(device, file_path, file_size)
-        device.seek.assert_has_calls(device_seek_calls)
-        device.read.assert_has_calls(device_read_calls)
-        OPEN.return_value.write.assert_has_calls(stream_write_calls)
-
-    def _test_extract_files_from_iso(self, exit_code):
-        fake_path = os.path.join('fake', 'path')
-        fake_target_path = os.path.join(fake_path, 'target')
-        self._config_manager.target_path = fake_target_path
-        args = [CONF.bsdtar_path, '-xf', fake_path, '-C', fake_target_path]
-
-        self.osutils.execute_process.return_value = ('fake out', 'fake err',
-                                                     exit_code)
-        if exit_code:
-            self.assertRaises(exception.CloudbaseInitException,
-                              self._config_manager._extract_files_from_iso,
-                              fake_path)
-        else:
-            self._config_manager._extract_files_from_iso(fake_path)
-
-        self.osutils.execute_process.assert_called_once_with(args, False)
-
     def test_extract_files_from_iso(self):
-        self._test_extract_files_from_iso(exit_code=0)
+        files = {
+            "openstack/latest/meta_data.json": b'{"uuid": "fake"}',
+            "openstack/latest/user_data": b"fake user data",
+        }
+        device = FakeDevice(fake_iso.get_iso_image(files))
+        target_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, target_path)
+        self._config_manager.target_path = target_path
+
+        self._config_manager._extract_files_from_iso(device)
+
+        for path, data in files.items():
+            with open(os.path.join(target_path, *path.split("/")),
+                      "rb") as stream:
+                self.assertEqual(data, stream.read())
 
     def test_extract_files_from_iso_fail(self):
-        self._test_extract_files_from_iso(exit_code=1)
+        device = FakeDevice(b"\x00" * 40 * iso9660.SECTOR_SIZE)
+        self.assertRaises(iso9660.ISO9660Error,
+                          self._config_manager._extract_files_from_iso,
+                          device)
 
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
                 'WindowsConfigDriveManager._extract_files_from_iso')
-    @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
-                'WindowsConfigDriveManager._write_iso_file')
     @mock.patch('cloudbaseinit.metadata.services.osconfigdrive.windows.'
                 'WindowsConfigDriveManager._get_iso_file_size')
     def _test_extract_iso_from_devices(self, mock_get_iso_file_size,
-                                       mock_write_iso_file,
                                        mock_extract_files_from_iso,
                                        found=True):
         # For every device (mock) in the list of available devices:
@@ -207,21 +195,19 @@ class TestWindowsConfigDriveManager(unittest.TestCase):
         devices[1].__enter__.side_effect = [Exception]
         rest = [size] if found else [None]
         mock_get_iso_file_size.side_effect = [None] + rest * 2
-        file_path = os.path.join("tempdir", "uuid.iso")
 
         with self.snatcher:
             response = self._config_manager._extract_iso_from_devices(devices)
-        self.mock_gettempdir.assert_called_once_with()
         mock_get_iso_file_size.assert_has_calls([
             mock.call(devices[0]), mock.call(devices[2])])
         expected_log = [
             "ISO extraction failed on %(device)s with %(error)r" %
             {"device": devices[1], "error": Exception()}]
         if found:
-            mock_write_iso_file.assert_called_once_with(devices[2],
-                                                        file_path, size)
-            mock_extract_files_from_iso.assert_called_once_with(file_path)
+            mock_extract_files_from_iso.assert_called_once_with(devices[2])
             expected_log.append("ISO9660 disk found on %s" % devices[2])
+        else:
+            self.assertFalse(mock_extract_files_from_iso.called)
         self.assertEqual(expected_log, self.snatcher.output)
         self.assertEqual(found, response)
 
@@ -448,6 +434,8 @@ class TestWindowsConfigDriveManager(unittest.TestCase):
         mock_get_config_drive_files.assert_has_calls(product_calls)
         self.assertEqual(expected_log, self.snatcher.output)
         self.assertEqual(found, response)
+        self.assertEqual(product[-1] if found else None,
+                         self._config_manager.found_config_drive)
 
     def test_get_config_drive_files_not_found(self):
         self._test_get_config_drive_files(found=False)
@@ -14,15 +14,22 @@
 
 import importlib
 import os
+import shutil
+import tempfile
+import threading
 import unittest
 try:
     import unittest.mock as mock
 except ImportError:
     import mock
 
+import requests
+
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import exception
+from cloudbaseinit.tests.metadata import fake_xml_response
 from cloudbaseinit.tests import testutils
+from cloudbaseinit.utils import dhcp
 from cloudbaseinit.utils import encoding
 
 CONF = cloudbaseinit_conf.CONF
@@ -34,15 +41,13 @@ class AzureServiceTest(unittest.TestCase):
     @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
     def setUp(self, mock_osutils):
         self._mock_osutils = mock_osutils
-        self._mock_untangle = mock.MagicMock()
         self._mock_ctypes = mock.MagicMock()
         self._mock_wintypes = mock.MagicMock()
         self._moves_mock = mock.MagicMock()
 
         self._module_patcher = mock.patch.dict(
             'sys.modules',
-            {'untangle': self._mock_untangle,
-             'ctypes': self._mock_ctypes,
+            {'ctypes': self._mock_ctypes,
              'ctypes.wintypes': self._mock_wintypes,
              'six.moves': self._moves_mock
              })
@@ -59,20 +64,30 @@ class AzureServiceTest(unittest.TestCase):
 
     @mock.patch('time.sleep')
     @mock.patch('socket.inet_ntoa')
-    @mock.patch('cloudbaseinit.utils.dhcp.get_dhcp_options')
-    def _test_get_wire_server_endpoint_address(self, mock_dhcp,
-                                               mock_inet_ntoa,
+    def _test_get_wire_server_endpoint_address(self, mock_inet_ntoa,
                                                mock_time_sleep,
                                                dhcp_option=None):
-        mock_dhcp.return_value = dhcp_option
-        if not dhcp_option:
-            self.assertRaises(exception.MetadaNotFoundException,
-                              (self._azureservice.
-                               _get_wire_server_endpoint_address))
-        else:
-            mock_inet_ntoa.return_value = mock.sentinel.endpoint
-            res = self._azureservice._get_wire_server_endpoint_address()
-            self.assertEqual(res, mock.sentinel.endpoint)
+        # Patched through the modules imported by the tested module.
+        dhcp_module = self._azureservice_module.dhcp
+        dhcpoptions_module = self._azureservice_module.dhcpoptions
+        with mock.patch.object(dhcp_module, 'get_dhcp_query') as \
+                mock_get_dhcp_query, \
+                mock.patch.object(dhcpoptions_module,
+                                  'get_dhcp_options') as mock_dhcp:
+            mock_get_dhcp_query.return_value = dhcp.DHCPQuery(
+                'eth0', mock.sentinel.mac_address, None)
+            mock_dhcp.return_value = {'eth0': dhcp_option or {}}
+            if not dhcp_option:
+                self.assertRaises(exception.MetadaNotFoundException,
+                                  (self._azureservice.
+                                   _get_wire_server_endpoint_address))
+            else:
+                mock_inet_ntoa.return_value = mock.sentinel.endpoint
+                res = self._azureservice._get_wire_server_endpoint_address()
+                self.assertEqual(res, mock.sentinel.endpoint)
+                mock_dhcp.assert_called_once_with(
+                    [mock_get_dhcp_query.return_value],
+                    [self._azureservice_module.WIRESERVER_DHCP_OPTION])
 
     def test_get_wire_server_endpoint_address_no_endpoint(self):
         self._test_get_wire_server_endpoint_address()
@@ -83,12 +98,18 @@ class AzureServiceTest(unittest.TestCase):
                 'mock.sentinel.endpoint'}
         self._test_get_wire_server_endpoint_address(dhcp_option=dhcp_option)
 
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    def test_disk_cache_disabled(self, mock_get_os_utils):
+        with testutils.ConfPatcher('metadata_cache_path', 'cache_path'):
+            service = self._azureservice_module.AzureService()
+        self.assertIsNone(service._disk_cache)
+
     @mock.patch('cloudbaseinit.metadata.services.base.'
                 'BaseHTTPMetadataService._http_request')
     def _test_wire_server_request(self,
                                   mock_http_request, mock_base_url=None,
                                   path=None, data_xml=None, headers=None,
-                                  parse_xml=True):
+                                  parser=None):
         self._azureservice._base_url = mock_base_url
         if not mock_base_url:
             self.assertRaises(exception.CloudbaseInitException,
@@ -99,18 +120,18 @@ class AzureServiceTest(unittest.TestCase):
             expected_headers["Content-Type"] = "text/xml; charset=utf-8"
             expected_headers.update(headers)
             self._azureservice._wire_server_request(path, data_xml, headers,
-                                                    parse_xml)
+                                                    parser)
             mock_http_request.assert_called_once_with(path, data_xml,
                                                       headers=expected_headers)
             return
         mock_http_request.return_value = str(mock.sentinel.data)
         res = self._azureservice._wire_server_request(path, data_xml,
-                                                      headers, parse_xml)
+                                                      headers, parser)
         self.assertEqual(mock_http_request.call_count, 1)
 
-        if parse_xml:
-            self.assertEqual(self._mock_untangle.parse.call_count, 1)
-            self.assertEqual(res, self._mock_untangle.parse.return_value)
+        if parser:
+            parser.assert_called_once_with(str(mock.sentinel.data))
+            self.assertEqual(res, parser.return_value)
         else:
             self.assertEqual(res, str(mock.sentinel.data))
 
@@ -119,19 +140,18 @@ class AzureServiceTest(unittest.TestCase):
 
     def test_wire_server_request_url_set_no_parse(self):
         mock_base_url = "fake-url"
-        self._test_wire_server_request(mock_base_url=mock_base_url,
-                                       parse_xml=False)
+        self._test_wire_server_request(mock_base_url=mock_base_url)
 
     def test_wire_server_request_url_set_with_headers(self):
         mock_base_url = "fake-url"
         self._test_wire_server_request(mock_base_url=mock_base_url,
-                                       parse_xml=False,
                                        headers={"fake-header": "fake-value"},
                                        data_xml="fake-data")
 
     def test_wire_server_request_parse_xml(self):
         mock_base_url = "fake-url"
-        self._test_wire_server_request(mock_base_url=mock_base_url)
+        self._test_wire_server_request(mock_base_url=mock_base_url,
+                                       parser=mock.Mock())
 
     def test_encode_xml(self):
         fake_root_xml = self._azureservice_module.ElementTree.Element(
@@ -173,31 +193,27 @@ class AzureServiceTest(unittest.TestCase):
                              mock_substatus,
                              mock_description))
 
+    def _get_goal_state(self, expected_state="Started"):
+        return self._azureservice_module._parse_goal_state(
+            fake_xml_response.get_fake_goal_state_xml(expected_state))
+
     @mock.patch(MODPATH + "._wire_server_request")
     def _test_get_goal_state(self, mock_wire_server_request,
                              goal_state=True, invalid_state=False):
-        mock_goalstate = mock.Mock()
-        mock_goalstate.GoalState = mock.Mock()
-        mock_goalstate.GoalState.Machine = mock.Mock()
-        mock_wire_server_request.return_value = mock_goalstate
+        expected_state = "Stopped" if invalid_state else "Started"
+        mock_wire_server_request.return_value = (
+            fake_xml_response.get_fake_goal_state_xml(expected_state))
         if goal_state:
-            self._azureservice._goal_state = mock_goalstate
+            self._azureservice._goal_state = self._get_goal_state(
+                expected_state)
         else:
-            self._azureservice._goal_state = False
+            self._azureservice._goal_state = None
         if invalid_state:
-            mock_goalstate.GoalState.Machine.ExpectedState = \
-                not self._azureservice_module.GOAL_STATE_STARTED
             self.assertRaises(exception.CloudbaseInitException,
                               self._azureservice._get_goal_state)
         else:
-            if not goal_state:
-                mock_goalstate.GoalState.Machine.ExpectedState = \
-                    self._azureservice_module.GOAL_STATE_STARTED
-            else:
-                self._azureservice._goal_state.Machine.ExpectedState = \
-                    self._azureservice_module.GOAL_STATE_STARTED
             res = self._azureservice._get_goal_state()
-            self.assertEqual(res, mock_goalstate.GoalState)
+            self.assertEqual(res, self._get_goal_state(expected_state))
 
         if not goal_state:
             mock_wire_server_request.assert_called_once_with(
@@ -209,49 +225,89 @@ class AzureServiceTest(unittest.TestCase):
     def test_get_goal_state(self):
         self._test_get_goal_state(goal_state=False)
 
+    @mock.patch(MODPATH + "._wire_server_request")
+    def _test_get_goal_state_force_update(self, mock_wire_server_request,
+                                          incarnation):
+        goal_state = self._get_goal_state()
+        self._azureservice._goal_state = goal_state
+        self._azureservice._goal_state_documents["FullConfig"] = (
+            mock.sentinel.full_config)
+        mock_wire_server_request.return_value = (
+            fake_xml_response.get_fake_goal_state_xml().replace(
+                b"<Incarnation>%s<" % fake_xml_response.INCARNATION.encode(),
+                b"<Incarnation>%s<" % incarnation.encode()))
+
+        with self._logsnatcher:
+            res = self._azureservice._get_goal_state(force_update=True)
+        mock_wire_server_request.assert_called_once_with(
+            "machine?comp=goalstate")
+        self.assertEqual(incarnation, res.incarnation)
+        return goal_state, res
+
+    def test_get_goal_state_force_update_same_incarnation(self):
+        goal_state, res = self._test_get_goal_state_force_update(
+            incarnation=fake_xml_response.INCARNATION)
+        self.assertIs(goal_state, res)
+        self.assertEqual([], self._logsnatcher.output)
+        self.assertEqual(mock.sentinel.full_config,
+                         self._azureservice._get_full_config())
+
+    def test_get_goal_state_force_update_new_incarnation(self):
+        goal_state, res = self._test_get_goal_state_force_update(
+            incarnation="4")
+        self.assertIsNot(goal_state, res)
+        self.assertEqual(["Azure goal state incarnation changed from 3 to 4"],
+                         self._logsnatcher.output)
+        self.assertEqual({}, self._azureservice._goal_state_documents)
+
+    def test_parse_goal_state(self):
+        goal_state = self._get_goal_state()
+        self.assertEqual(fake_xml_response.INCARNATION,
+                         goal_state.incarnation)
+        self.assertEqual(self._azureservice_module.GOAL_STATE_STARTED,
+                         goal_state.expected_state)
+        self.assertEqual(fake_xml_response.CONTAINER_ID,
+                         goal_state.container_id)
+        self.assertEqual(fake_xml_response.ROLE_INSTANCE_ID,
+                         goal_state.role_instance_id)
+        self.assertEqual(fake_xml_response.CERTIFICATES_URL,
+                         goal_state.role_instance_config["Certificates"])
+        self.assertEqual(
+            fake_xml_response.HOSTING_ENVIRONMENT_URL,
+            goal_state.role_instance_config["HostingEnvironmentConfig"])
+
     @mock.patch(MODPATH + "._get_goal_state")
     def test__get_incarnation(self, mock_get_goal_state):
-        mock_goal_state = mock.Mock()
-        mock_get_goal_state.return_value = mock_goal_state
-        mock_goal_state.Incarnation.cdata = mock.sentinel.cdata
+        mock_get_goal_state.return_value = self._get_goal_state()
 
         res = self._azureservice._get_incarnation()
         mock_get_goal_state.assert_called_once_with()
-        self.assertEqual(res, mock.sentinel.cdata)
+        self.assertEqual(res, fake_xml_response.INCARNATION)
 
     @mock.patch(MODPATH + "._get_goal_state")
     def test__get_container_id(self, mock_get_goal_state):
-        mock_goal_state = mock.Mock()
-        mock_get_goal_state.return_value = mock_goal_state
-        mock_goal_state.Container.ContainerId.cdata = mock.sentinel.cdata
+        mock_get_goal_state.return_value = self._get_goal_state()
 
         res = self._azureservice._get_container_id()
         mock_get_goal_state.assert_called_once_with()
-        self.assertEqual(res, mock.sentinel.cdata)
+        self.assertEqual(res, fake_xml_response.CONTAINER_ID)
 
     @mock.patch(MODPATH + "._get_goal_state")
     def test__get_role_instance_config(self, mock_get_goal_state):
-        mock_goal_state = mock.Mock()
-        mock_role = mock.Mock()
-        mock_get_goal_state.return_value = mock_goal_state
-        mock_goal_state.Container.RoleInstanceList.RoleInstance = mock_role
-        mock_role.Configuration = mock.sentinel.config_role
+        goal_state = self._get_goal_state()
+        mock_get_goal_state.return_value = goal_state
 
         res = self._azureservice._get_role_instance_config()
         mock_get_goal_state.assert_called_once_with()
-        self.assertEqual(res, mock.sentinel.config_role)
+        self.assertEqual(res, goal_state.role_instance_config)
 
     @mock.patch(MODPATH + "._get_goal_state")
     def test__get_role_instance_id(self, mock_get_goal_state):
-        mock_goal_state = mock.Mock()
-        mock_role = mock.Mock()
-        mock_get_goal_state.return_value = mock_goal_state
-        mock_goal_state.Container.RoleInstanceList.RoleInstance = mock_role
-        mock_role.InstanceId.cdata = mock.sentinel.config_role
+        mock_get_goal_state.return_value = self._get_goal_state()
 
         res = self._azureservice._get_role_instance_id()
         mock_get_goal_state.assert_called_once_with()
-        self.assertEqual(res, mock.sentinel.config_role)
+        self.assertEqual(res, fake_xml_response.ROLE_INSTANCE_ID)
 
     @mock.patch(MODPATH + "._wire_server_request")
     @mock.patch(MODPATH + "._get_health_report_xml")
@@ -261,34 +317,145 @@ class AzureServiceTest(unittest.TestCase):
         mock_state = mock.sentinel.state
         expected_logging = ["Health data: %s" % mock.sentinel.report_xml]
         with self._logsnatcher:
-            self._azureservice._post_health_status(state=mock_state)
+            with mock.patch.object(self._azureservice,
+                                   "_get_goal_state") as mock_get_goal_state:
+                self._azureservice._post_health_status(state=mock_state)
         self.assertEqual(self._logsnatcher.output, expected_logging)
+        # The cached goal state is used by the report.
+        self.assertFalse(mock_get_goal_state.called)
         mock_get_health_report_xml.assert_called_once_with(mock_state,
                                                            None, None)
         mock_wire_server_request.assert_called_once_with(
-            "machine?comp=health", mock.sentinel.report_xml, parse_xml=False)
+            "machine?comp=health", mock.sentinel.report_xml)
 
-    @mock.patch(MODPATH + "._post_health_status")
-    def test_provisioning_started(self, mock_post_health_status):
+    @mock.patch(MODPATH + "._wire_server_request")
+    @mock.patch(MODPATH + "._get_health_report_xml")
+    def _test_post_health_status_error(self, mock_get_health_report_xml,
+                                       mock_wire_server_request,
+                                       status_code):
+        response = mock.Mock(status_code=status_code)
+        mock_wire_server_request.side_effect = [
+            requests.HTTPError(response=response), None]
+        with self._logsnatcher:
+            with mock.patch.object(self._azureservice,
+                                   "_get_goal_state") as mock_get_goal_state:
+                self._azureservice._post_health_status(
+                    mock.sentinel.state)
+        self.assertEqual(2, mock_wire_server_request.call_count)
+        self.assertEqual(2, mock_get_health_report_xml.call_count)
+        mock_get_goal_state.assert_called_once_with(force_update=True)
+
+    def test_post_health_status_outdated_goal_state(self):
+        self._test_post_health_status_error(status_code=410)
+
+    def test_post_health_status_error(self):
+        self.assertRaises(requests.HTTPError,
+                          self._test_post_health_status_error,
+                          status_code=500)
+
+    def _mock_health_reporter(self):
+        patcher = mock.patch.object(self._azureservice, "_health_reporter")
+        mock_health_reporter = patcher.start()
+        self.addCleanup(patcher.stop)
+        return mock_health_reporter
+
+    def test_provisioning_started(self):
+        mock_health_reporter = self._mock_health_reporter()
         self._azureservice.provisioning_started()
-        mock_post_health_status.assert_called_once_with(
+        mock_health_reporter.report_health_status.assert_called_once_with(
             self._azureservice_module.HEALTH_STATE_NOT_READY,
             self._azureservice_module.HEALTH_SUBSTATE_PROVISIONING,
             "Cloudbase-Init is preparing your computer for first use...")
+        self.assertFalse(mock_health_reporter.stop.called)
 
-    @mock.patch(MODPATH + "._post_health_status")
-    def test_provisioning_completed(self, mock_post_health_status):
+    def test_provisioning_completed(self):
+        mock_health_reporter = self._mock_health_reporter()
         self._azureservice.provisioning_completed()
-        mock_post_health_status.assert_called_once_with(
+        mock_health_reporter.report_health_status.assert_called_once_with(
             self._azureservice_module.HEALTH_STATE_READY)
+        mock_health_reporter.stop.assert_called_once_with(
+            CONF.azure.health_report_timeout)
 
-    @mock.patch(MODPATH + "._post_health_status")
-    def test_provisioning_failed(self, mock_post_health_status):
+    def test_provisioning_failed(self):
+        mock_health_reporter = self._mock_health_reporter()
         self._azureservice.provisioning_failed()
-        mock_post_health_status.assert_called_once_with(
+        mock_health_reporter.report_health_status.assert_called_once_with(
             self._azureservice_module.HEALTH_STATE_NOT_READY,
             self._azureservice_module.HEALTH_SUBSTATE_PROVISIONING_FAILED,
             "Provisioning failed")
+        mock_health_reporter.stop.assert_called_once_with(
+            CONF.azure.health_report_timeout)
+
+    @mock.patch('cloudbaseinit.metadata.services.base.'
+                'BaseHTTPMetadataService.cleanup')
+    def test_cleanup(self, mock_cleanup):
+        mock_health_reporter = self._mock_health_reporter()
+        self._azureservice.cleanup()
+        mock_health_reporter.stop.assert_called_once_with(
+            CONF.azure.health_report_timeout)
+        mock_cleanup.assert_called_once_with()
+
+    def _get_health_reporter(self, post_health_status=None):
+        self._posted = []
+        post_health_status = post_health_status or (
+            lambda *args: self._posted.append(args))
+        health_reporter = self._azureservice_module._HealthReporter(
+            post_health_status, self._posted.append)
+        self.addCleanup(health_reporter.stop)
+        return health_reporter
+
+    def test_health_reporter_coalesce(self):
+        posting = threading.Event()
+        release = threading.Event()
+
+        def _post_health_status(*args):
+            self._posted.append(args)
+            posting.set()
+            release.wait(5)
+
+        health_reporter = self._get_health_reporter(_post_health_status)
+        health_reporter.report_health_status("state1")
+        self.assertTrue(posting.wait(5))
+        # Reported while the first state is being posted.
+        health_reporter.report_role_properties({"prop1": "value1"})
+        health_reporter.report_health_status("state2", "sub", "desc")
+        health_reporter.report_role_properties({"prop2": "value2"})
+        health_reporter.report_health_status("state3")
+        release.set()
+
+        self.assertTrue(health_reporter.stop(5))
+        self.assertEqual([("state1", None, None),
+                          {"prop1": "value1", "prop2": "value2"},
+                          ("state3", None, None)], self._posted)
+
+    def test_health_reporter_restart(self):
+        health_reporter = self._get_health_reporter()
+        health_reporter.report_health_status("state1")
+        self.assertTrue(health_reporter.stop(5))
+        health_reporter.report_health_status("state2")
+        self.assertTrue(health_reporter.stop(5))
+        self.assertEqual([("state1", None, None), ("state2", None, None)],
+                         self._posted)
+
+    def test_health_reporter_error(self):
+        health_reporter = self._get_health_reporter(
+            mock.Mock(side_effect=Exception("fake error")))
+        with self._logsnatcher:
+            health_reporter.report_health_status("state")
+            self.assertTrue(health_reporter.stop(5))
+        self.assertEqual("Failed to post the health state: state",
+                         self._logsnatcher.output[0])
+
+    def test_health_reporter_stop_timeout(self):
+        release = threading.Event()
+        health_reporter = self._get_health_reporter(
+            lambda *args: release.wait(5))
+        self.addCleanup(release.set)
+        health_reporter.report_health_status("state")
+        with self._logsnatcher:
+            self.assertFalse(health_reporter.stop(0.1))
+        self.assertEqual(["Timed out waiting for the health reports to be "
+                          "posted"], self._logsnatcher.output)
 
     @mock.patch(MODPATH + "._wire_server_request")
     @mock.patch(MODPATH + "._get_role_properties_xml")
@@ -302,67 +469,61 @@ class AzureServiceTest(unittest.TestCase):
         self.assertEqual(self._logsnatcher.output, expected_logging)
         mock_get_role_properties_xml.assert_called_once_with(mock_properties)
         mock_wire_server_request.assert_called_once_with(
-            "machine?comp=roleProperties", mock_properties, parse_xml=False)
+            "machine?comp=roleProperties", mock_properties)
 
     def test_can_post_rdp_cert_thumbprint(self):
         self.assertTrue(self._azureservice.can_post_rdp_cert_thumbprint)
 
-    @mock.patch(MODPATH + "._post_role_properties")
-    def test_post_rdp_cert_thumbprint(self, mock_post_role_properties):
+    def test_post_rdp_cert_thumbprint(self):
+        mock_health_reporter = self._mock_health_reporter()
         mock_thumbprint = mock.sentinel.thumbprint
         self._azureservice.post_rdp_cert_thumbprint(mock_thumbprint)
         expected_props = {
             self._azureservice_module.ROLE_PROPERTY_CERT_THUMB:
                 mock_thumbprint}
-        mock_post_role_properties.assert_called_once_with(expected_props)
-
-    @mock.patch(MODPATH + "._wire_server_request")
-    @mock.patch(MODPATH + "._get_role_instance_config")
-    def test__get_hosting_environment(self, mock_get_role_instance_config,
-                                      mock_wire_server_request):
-        mock_config = mock.Mock()
-        mock_get_role_instance_config.return_value = mock_config
-        mock_config.HostingEnvironmentConfig.cdata = mock.sentinel.data
-
-        self._azureservice._get_hosting_environment()
-        mock_get_role_instance_config.assert_called_once_with()
-        mock_wire_server_request.assert_called_once_with(mock.sentinel.data)
+        mock_health_reporter.report_role_properties.assert_called_once_with(
+            expected_props)
 
     @mock.patch(MODPATH + "._wire_server_request")
-    @mock.patch(MODPATH + "._get_role_instance_config")
-    def test__get_shared_config(self, mock_get_role_instance_config,
-                                mock_wire_server_request):
-        mock_config = mock.Mock()
-        mock_get_role_instance_config.return_value = mock_config
-        mock_config.SharedConfig.cdata = mock.sentinel.data
-
-        self._azureservice._get_shared_config()
-        mock_get_role_instance_config.assert_called_once_with()
-        mock_wire_server_request.assert_called_once_with(mock.sentinel.data)
-
-    @mock.patch(MODPATH + "._wire_server_request")
-    @mock.patch(MODPATH + "._get_role_instance_config")
-    def test__get_extensions_config(self, mock_get_role_instance_config,
-                                    mock_wire_server_request):
-        mock_config = mock.Mock()
-        mock_get_role_instance_config.return_value = mock_config
-        mock_config.ExtensionsConfig.cdata = mock.sentinel.data
-
-        self._azureservice._get_extensions_config()
-        mock_get_role_instance_config.assert_called_once_with()
-        mock_wire_server_request.assert_called_once_with(mock.sentinel.data)
-
-    @mock.patch(MODPATH + "._wire_server_request")
-    @mock.patch(MODPATH + "._get_role_instance_config")
-    def test__get_full_config(self, mock_get_role_instance_config,
-                              mock_wire_server_request):
-        mock_config = mock.Mock()
-        mock_get_role_instance_config.return_value = mock_config
-        mock_config.FullConfig.cdata = mock.sentinel.data
-
-        self._azureservice._get_full_config()
-        mock_get_role_instance_config.assert_called_once_with()
-        mock_wire_server_request.assert_called_once_with(mock.sentinel.data)
+    def _test_get_goal_state_document(self, mock_wire_server_request,
+                                      method_name, config_name,
+                                      parser=None):
+        goal_state = self._get_goal_state()
+        self._azureservice._goal_state = goal_state
+
+        res = getattr(self._azureservice, method_name)()
+        # Cached until the goal state incarnation changes.
+        self.assertEqual(res, getattr(self._azureservice, method_name)())
+        mock_wire_server_request.assert_called_once_with(
+            goal_state.role_instance_config[config_name], parser=parser)
+        self.assertEqual(mock_wire_server_request.return_value, res)
+
+    def test__get_hosting_environment(self):
+        self._test_get_goal_state_document(
+            method_name="_get_hosting_environment",
+            config_name="HostingEnvironmentConfig",
+            parser=self._azureservice_module._parse_stored_certificates)
+
+    def test_parse_stored_certificates(self):
+        certs = self._azureservice_module._parse_stored_certificates(
+            fake_xml_response.get_fake_hosting_environment_xml())
+        self.assertEqual(2, len(certs))
+        self.assertEqual("Stored1WinRM", certs[1]["name"])
+        self.assertEqual("My", certs[1]["storeName"])
+        self.assertEqual("User", certs[1]["configurationLevel"])
+
+    def test__get_shared_config(self):
+        self._test_get_goal_state_document(
+            method_name="_get_shared_config", config_name="SharedConfig")
+
+    def test__get_extensions_config(self):
+        self._test_get_goal_state_document(
+            method_name="_get_extensions_config",
+            config_name="ExtensionsConfig")
+
+    def test__get_full_config(self):
+        self._test_get_goal_state_document(
+            method_name="_get_full_config", config_name="FullConfig")
 
     def test__create_transport_cert(self):
         mock_cert_mgr = mock.Mock()
@@ -385,36 +546,41 @@ class AzureServiceTest(unittest.TestCase):
 
     @mock.patch(MODPATH + "._wire_server_request")
     def test__get_encoded_cert(self, mock_wire_server_request):
-        mock_cert_config = mock.Mock()
         mock_transport_cert = mock.Mock()
         mock_cert_url = mock.sentinel.cert_url
 
         mock_transport_cert.replace.return_value = mock.sentinel.transport_cert
-        mock_wire_server_request.return_value = mock_cert_config
-        mock_cert_config.CertificateFile.Data.cdata = mock.sentinel.cert_data
-        mock_cert_config.CertificateFile.Format.cdata = mock.sentinel.cert_fmt
 
         expected_headers = {
             "x-ms-guest-agent-public-x509-cert": mock.sentinel.transport_cert}
-        expected_result = (mock.sentinel.cert_data, mock.sentinel.cert_fmt)
         res = self._azureservice._get_encoded_cert(mock_cert_url,
                                                    mock_transport_cert)
         (mock_wire_server_request.
-            assert_called_once_with(mock_cert_url, headers=expected_headers))
-        self.assertEqual(res, expected_result)
+            assert_called_once_with(
+                mock_cert_url, headers=expected_headers,
+                parser=self._azureservice_module._parse_certificates_file))
+        self.assertEqual(res, mock_wire_server_request.return_value)
+
+    def test_parse_certificates_file(self):
+        cert_data, cert_format = (
+            self._azureservice_module._parse_certificates_file(
+                fake_xml_response.get_fake_certificates_xml()))
+        self.assertTrue(cert_data.startswith("MIINswYJKoZIhvcNAQcD"))
+        self.assertEqual("Pkcs7BlobWithPfxContents", cert_format)
 
     @mock.patch(MODPATH + "._get_versions")
     def _test__check_version_header(self, mock_get_versions, version):
-        mock_version = mock.Mock()
-        mock_get_versions.return_value = mock_version
-        mock_version.Versions.Supported.Version = [version]
-        if self._azureservice_module.WIRE_SERVER_VERSION is not version:
+        mock_get_versions.return_value = [version]
+        if self._azureservice_module.WIRE_SERVER_VERSION != version:
             self.assertRaises(exception.MetadaNotFoundException,
                               self._azureservice._check_version_header)
         else:
+            headers = self._azureservice._headers
             self._azureservice._check_version_header()
             self.assertEqual(self._azureservice._headers["x-ms-version"],
                              version)
+            # The headers copied by other threads are not changed.
+            self.assertNotIn("x-ms-version", headers)
 
     def test_check_version_header_unsupported_version(self):
         version = "fake-version"
@@ -428,9 +594,16 @@ class AzureServiceTest(unittest.TestCase):
     def test__get_versions(self, mock_server_request):
         mock_server_request.return_value = mock.sentinel.version
         res = self._azureservice._get_versions()
-        mock_server_request.assert_called_once_with("?comp=Versions")
+        mock_server_request.assert_called_once_with(
+            "?comp=Versions", parser=self._azureservice_module._parse_versions)
         self.assertEqual(res, mock.sentinel.version)
 
+    def test_parse_versions(self):
+        versions = self._azureservice_module._parse_versions(
+            fake_xml_response.get_fake_versions_xml())
+        self.assertEqual(10, len(versions))
+        self.assertIn(self._azureservice_module.WIRE_SERVER_VERSION, versions)
+
     @mock.patch(MODPATH + "._get_role_instance_id")
     def test_get_instance_id(self, mock_get_role_instance_id):
         mock_get_role_instance_id.return_value = mock.sentinel.id
@@ -461,130 +634,111 @@ class AzureServiceTest(unittest.TestCase):
     def test_get_ovf_env_path_not_exists(self):
         self._test__get_ovf_env_path(path_exists=False)
 
-    @mock.patch(MODPATH + "._get_ovf_env_path")
-    def test_get_ovf_env(self, mock_get_ovf_env_path):
-        fake_xml = '<?xml version="1.0"?><root><child name="fake"/></root>'
-        mock_get_ovf_env_path.return_value = fake_xml
+    def _set_ovf_env(self, ovf_env_xml=None):
+        if ovf_env_xml is None:
+            ovf_env_xml = fake_xml_response.get_fake_azure_ovf_env_xml()
+        ovf_env_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, ovf_env_dir)
+        ovf_env_path = os.path.join(
+            ovf_env_dir, self._azureservice_module.OVF_ENV_FILENAME)
+        with open(ovf_env_path, "wb") as stream:
+            stream.write(ovf_env_xml)
+
+        patcher = mock.patch(MODPATH + "._get_ovf_env_path",
+                             return_value=ovf_env_path)
+        mock_get_ovf_env_path = patcher.start()
+        self.addCleanup(patcher.stop)
+        return mock_get_ovf_env_path
+
+    def _set_empty_ovf_env(self):
+        self._set_ovf_env(
+            b'<Environment xmlns:wa="http://schemas.microsoft.com/'
+            b'windowsazure"><wa:ProvisioningSection>'
+            b'<WindowsProvisioningConfigurationSet/>'
+            b'</wa:ProvisioningSection></Environment>')
+
+    def test_get_ovf_env(self):
+        mock_get_ovf_env_path = self._set_ovf_env()
         res = self._azureservice._get_ovf_env()
-        self.assertIsNotNone(res)
+        self.assertIs(res, self._azureservice._get_ovf_env())
         mock_get_ovf_env_path.assert_called_once_with()
 
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_admin_username(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_prov_section = mock.Mock()
-        mock_win_prov = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.wa_ProvisioningSection = mock_prov_section
-        mock_prov_section.WindowsProvisioningConfigurationSet = mock_win_prov
-        mock_win_prov.AdminUsername.cdata = mock.sentinel.cdata
+    def test_get_ovf_env_invalid(self):
+        self._set_ovf_env(b'<?xml version="1.0"?><root><child/></root>')
+        self.assertRaises(exception.CloudbaseInitException,
+                          self._azureservice._get_ovf_env)
+
+    def test_get_admin_username(self):
+        self._set_ovf_env()
         res = self._azureservice.get_admin_username()
-        mock_get_ovf_env.assert_called_once_with()
-        self.assertEqual(res, mock.sentinel.cdata)
+        self.assertEqual(res, fake_xml_response.ADMIN_USERNAME)
 
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_admin_password(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_prov_section = mock.Mock()
-        mock_win_prov = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.wa_ProvisioningSection = mock_prov_section
-        mock_prov_section.WindowsProvisioningConfigurationSet = mock_win_prov
-        mock_win_prov.AdminPassword.cdata = mock.sentinel.cdata
+    def test_get_admin_password(self):
+        self._set_ovf_env()
         res = self._azureservice.get_admin_password()
-        mock_get_ovf_env.assert_called_once_with()
-        self.assertEqual(res, mock.sentinel.cdata)
+        self.assertEqual(res, fake_xml_response.ADMIN_PASSWORD)
 
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_host_name(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_prov_section = mock.Mock()
-        mock_win_prov = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.wa_ProvisioningSection = mock_prov_section
-        mock_prov_section.WindowsProvisioningConfigurationSet = mock_win_prov
-        mock_win_prov.ComputerName.cdata = mock.sentinel.cdata
+    def test_get_host_name(self):
+        self._set_ovf_env()
         res = self._azureservice.get_host_name()
-        mock_get_ovf_env.assert_called_once_with()
-        self.assertEqual(res, mock.sentinel.cdata)
+        self.assertEqual(res, fake_xml_response.COMPUTER_NAME)
 
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_enable_automatic_updates(self, mock_get_ovf_env,
-                                          enable_updates=True):
-        mock_ovf_env = mock.Mock()
-        mock_prov_section = mock.Mock()
-        mock_win_prov = mock.Mock()
-        if not enable_updates:
-            mock_win_prov = mock.MagicMock(spec="")
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.wa_ProvisioningSection = mock_prov_section
-        mock_prov_section.WindowsProvisioningConfigurationSet = mock_win_prov
-        res = self._azureservice.get_enable_automatic_updates()
-        mock_get_ovf_env.assert_called_once_with()
-        self.assertFalse(res)
+    def test_get_enable_automatic_updates(self):
+        self._set_ovf_env()
+        self.assertTrue(self._azureservice.get_enable_automatic_updates())
 
     def test_get_enable_automatic_updates_no_updates(self):
-        self.test_get_enable_automatic_updates(enable_updates=False)
-
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_winrm_listeners_configuration(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_prov_section = mock.Mock()
-        mock_win_prov = mock.Mock()
-        mock_listener = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.wa_ProvisioningSection = mock_prov_section
-        mock_prov_section.WindowsProvisioningConfigurationSet = mock_win_prov
-        mock_win_prov.WinRM.Listeners.Listener = [mock_listener]
-        mock_listener.Protocol.cdata = mock.sentinel.fake_protocol
-        (mock_listener.CertificateThumbprint.
-            cdata) = mock.sentinel.fake_thumbprint
+        self._set_empty_ovf_env()
+        self.assertFalse(self._azureservice.get_enable_automatic_updates())
 
+    def test_get_winrm_listeners_configuration(self):
+        self._set_ovf_env()
         expected_result = [
             {
-                'certificate_thumbprint': mock.sentinel.fake_thumbprint,
-                'protocol': mock.sentinel.fake_protocol,
+                'protocol': 'Http',
+            },
+            {
+                'certificate_thumbprint': fake_xml_response.WINRM_THUMBPRINT,
+                'protocol': 'Https',
             }]
         res = self._azureservice.get_winrm_listeners_configuration()
-        mock_get_ovf_env.assert_called_once_with()
         self.assertEqual(res, expected_result)
 
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_vm_agent_package_provisioning_data(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_package_name = mock.sentinel.package_name
-        mock_get_ovf_env.return_value = mock_ovf_env
-        (mock_ovf_env.Environment.wa_PlatformSettingsSection.
-            PlatformSettings.GuestAgentPackageName.cdata) = mock_package_name
+    def test_get_winrm_listeners_configuration_no_listeners(self):
+        self._set_empty_ovf_env()
+        res = self._azureservice.get_winrm_listeners_configuration()
+        self.assertEqual([], res)
+
+    def test_get_vm_agent_package_provisioning_data(self):
+        self._set_ovf_env()
         res = self._azureservice.get_vm_agent_package_provisioning_data()
         expected_provisioning_data = {
-            'provision': False, 'package_name': mock_package_name}
+            'provision': True,
+            'package_name': fake_xml_response.GUEST_AGENT_PACKAGE_NAME}
         self.assertEqual(res, expected_provisioning_data)
 
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_kms_host(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        self.assertTrue(self._azureservice.get_kms_host())
+    def test_get_vm_agent_package_provisioning_data_unset(self):
+        self._set_empty_ovf_env()
+        res = self._azureservice.get_vm_agent_package_provisioning_data()
+        self.assertEqual({'provision': False, 'package_name': None}, res)
 
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def _test_get_use_avma_licensing(self, mock_get_ovf_env, use_avma):
-        mock_ovf_env = mock.Mock()
-        mock_ovf_env.Environment = mock.Mock()
-        plat_sett_section = mock.Mock()
-        if not use_avma:
-            plat_sett_section.PlatformSettings = mock.MagicMock(spec="")
-        mock_ovf_env.Environment.wa_PlatformSettingsSection = plat_sett_section
-        mock_get_ovf_env.return_value = mock_ovf_env
+    def test_get_kms_host(self):
+        self._set_ovf_env()
+        self.assertEqual(fake_xml_response.KMS_SERVER_HOSTNAME,
+                         self._azureservice.get_kms_host())
 
-        self.assertFalse(self._azureservice.get_use_avma_licensing())
-        mock_get_ovf_env.assert_called_once_with()
+    def test_get_kms_host_default(self):
+        self._set_empty_ovf_env()
+        self.assertEqual(self._azureservice_module.DEFAULT_KMS_HOST,
+                         self._azureservice.get_kms_host())
 
     def test_get_use_avma_licensing(self):
-        self._test_get_use_avma_licensing(use_avma=True)
+        self._set_ovf_env()
+        self.assertTrue(self._azureservice.get_use_avma_licensing())
 
     def test_get_use_avma_licensing_no_use_avma(self):
-        self._test_get_use_avma_licensing(use_avma=False)
+        self._set_empty_ovf_env()
+        self.assertFalse(self._azureservice.get_use_avma_licensing())
 
     @mock.patch(MODPATH + "._get_ovf_env")
     @mock.patch(MODPATH + "._check_version_header")
@@ -649,21 +803,13 @@ class AzureServiceTest(unittest.TestCase):
     def test_get_config_set_drive_path_not_exists(self):
         self._test_get_config_set_drive_path(path_exists=False)
 
-    @mock.patch(MODPATH + '._get_ovf_env')
-    def test_check_ovf_env_custom_data(self, mock_get_ovf_env,
-                                       custom_data=True):
-        mock_ovf_env = mock.Mock()
-        mock_prov_section = mock.Mock()
-        mock_win_prov = mock.Mock()
-        mock_win_prov.PlatformSettings = mock.Mock()
-        if not custom_data:
-            mock_win_prov.PlatformSettings = mock.MagicMock(spec="")
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.wa_ProvisioningSection = mock_prov_section
-        mock_prov_section.WindowsProvisioningConfigurationSet = mock_win_prov
-        res = self._azureservice._check_ovf_env_custom_data()
-        mock_get_ovf_env.assert_called_once_with()
-        self.assertTrue(res)
+    def test_check_ovf_env_custom_data(self):
+        self._set_ovf_env()
+        self.assertTrue(self._azureservice._check_ovf_env_custom_data())
+
+    def test_check_ovf_env_custom_data_missing(self):
+        self._set_empty_ovf_env()
+        self.assertFalse(self._azureservice._check_ovf_env_custom_data())
 
     @mock.patch(MODPATH + '._check_ovf_env_custom_data')
     def test_get_user_data_ItemNotFound(self, mock_check_custom_data):
@@ -682,7 +828,7 @@ class AzureServiceTest(unittest.TestCase):
 
     @mock.patch(MODPATH + '._get_role_instance_config')
     def test_get_server_certs_no_certs(self, mock_get_instance_config):
-        mock_get_instance_config.return_value = mock.MagicMock(spec="")
+        mock_get_instance_config.return_value = {}
         res = self._azureservice.get_server_certs()
         self.assertEqual(res, [])
 
@@ -708,11 +854,9 @@ class AzureServiceTest(unittest.TestCase):
             (mock.sentinel.thumbprint, mock.sentinel.cert)
         mock_get_encoded_cert.return_value = \
             (mock.sentinel.cert_data, mock.sentinel.cert_format)
-        mock_host_env = mock.Mock()
-        mock_host_env_config = mock_host_env.HostingEnvironmentConfig
-        mock_host_env_config.StoredCertificates.StoredCertificate = \
-            [cert_model]
-        mock_get_hosting_env.return_value = mock_host_env
+        mock_get_config.return_value = {
+            "Certificates": fake_xml_response.CERTIFICATES_URL}
+        mock_get_hosting_env.return_value = [cert_model]
 
         res = self._azureservice.get_server_certs()
         expected_result = [{
@@ -12,12 +12,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+import threading
+import unittest
+
 import mock
 import requests
-import unittest
 
 from cloudbaseinit import exception
 from cloudbaseinit.metadata.services import base
+from cloudbaseinit.tests import testutils
+from cloudbaseinit.utils import diskcache
 
 
 class FakeService(base.BaseMetadataService):
@@ -54,6 +59,152 @@ class TestBase(unittest.TestCase):
     def test_is_password_changed(self):
         self.assertFalse(self._service.is_password_changed())
 
+    def test_get_cache_data(self):
+        with mock.patch.object(self._service, '_get_data',
+                               create=True) as mock_get_data:
+            mock_get_data.return_value = b"data"
+            self.assertEqual("data", self._service._get_cache_data(
+                "path", decode=True))
+            self.assertEqual("data", self._service._get_cache_data(
+                "path", decode=True))
+        mock_get_data.assert_called_once_with("path")
+
+    def test_get_cache_data_single_flight(self):
+        fetching = threading.Event()
+        release = threading.Event()
+
+        def _get_data(path):
+            fetching.set()
+            release.wait(5)
+            return b"data"
+
+        results = []
+        with mock.patch.object(self._service, '_get_data', create=True,
+                               side_effect=_get_data) as mock_get_data:
+            threads = [threading.Thread(
+                target=lambda: results.append(
+                    self._service._get_cache_data("path")))
+                for _ in range(3)]
+            threads[0].start()
+            fetching.wait(5)
+            for thread in threads[1:]:
+                thread.start()
+            release.set()
+            for thread in threads:
+                thread.join(5)
+
+        mock_get_data.assert_called_once_with("path")
+        self.assertEqual([b"data"] * 3, results)
+
+    def test_get_cache_data_not_existing(self):
+        with mock.patch.object(
+                self._service, '_get_data', create=True,
+                side_effect=base.NotExistingMetadataException) as mock_get:
+            for _ in range(2):
+                self.assertRaises(base.NotExistingMetadataException,
+                                  self._service._get_cache_data, "path")
+        mock_get.assert_called_once_with("path")
+        stats = self._service.get_cache_stats()
+        self.assertEqual(1, stats["negative_hits"])
+        self.assertEqual(1, stats["misses"])
+
+    def test_get_cache_data_raw_and_decoded(self):
+        with mock.patch.object(self._service, '_get_data', create=True,
+                               return_value=b"data") as mock_get_data:
+            self.assertEqual(b"data", self._service._get_cache_data("path"))
+            self.assertEqual("data", self._service._get_cache_data(
+                "path", decode=True))
+        mock_get_data.assert_called_once_with("path")
+
+    def test_get_cache_data_error_not_cached(self):
+        with mock.patch.object(self._service, '_get_data', create=True,
+                               side_effect=[Exception, b"data"]):
+            self.assertRaises(Exception, self._service._get_cache_data,
+                              "path")
+            self.assertEqual(b"data", self._service._get_cache_data("path"))
+
+    def test_load_clears_cache(self):
+        with mock.patch.object(self._service, '_get_data', create=True,
+                               return_value=b"data") as mock_get_data:
+            self._service._get_cache_data("path")
+            self._service.load()
+            self._service._get_cache_data("path")
+        self.assertEqual(2, mock_get_data.call_count)
+
+    def test_prefetch(self):
+        self._service.get_prefetch_paths = mock.Mock(
+            return_value=[("path1", True), ("path2", False),
+                          ("path3", False)])
+        self._service._get_cache_data = mock.Mock(
+            side_effect=[None, base.NotExistingMetadataException(),
+                         Exception()])
+
+        self._service.prefetch(workers=1)
+
+        self._service._get_cache_data.assert_has_calls(
+            [mock.call("path1", decode=True),
+             mock.call("path2", decode=False),
+             mock.call("path3", decode=False)])
+
+    def test_cleanup_waits_for_prefetch(self):
+        fetching = threading.Event()
+        release = threading.Event()
+        fetched = []
+
+        def _get_data(path):
+            fetching.set()
+            release.wait(5)
+            fetched.append(path)
+            return b"data"
+
+        self._service.get_prefetch_paths = mock.Mock(
+            return_value=[("path1", False), ("path2", False)])
+        with mock.patch.object(self._service, '_get_data', create=True,
+                               side_effect=_get_data):
+            self._service.prefetch(workers=1, wait=False)
+            fetching.wait(5)
+            cleanup = threading.Thread(target=self._service.cleanup)
+            cleanup.start()
+            release.set()
+            cleanup.join(5)
+
+        self.assertFalse(cleanup.is_alive())
+        self.assertIn("path1", fetched)
+        self.assertIsNone(self._service._prefetch_pool)
+        self.assertEqual(0, len(self._service._cache._entries))
+
+    def test_prefetch_no_paths(self):
+        self._service._get_cache_data = mock.Mock()
+        self._service.prefetch()
+        self.assertFalse(self._service._get_cache_data.called)
+
+    def test_exec_with_retry_disabled(self):
+        action = mock.Mock(side_effect=requests.ConnectionError())
+        self.assertRaises(requests.ConnectionError,
+                          self._service._exec_with_retry, action)
+        action.assert_called_once_with()
+
+    @mock.patch('cloudbaseinit.utils.retry.RetryPolicy.from_config')
+    def test_exec_with_retry(self, mock_from_config):
+        self._service._enable_retry = True
+        mock_policy = mock_from_config.return_value
+
+        result = self._service._exec_with_retry(mock.sentinel.action)
+
+        mock_from_config.assert_called_once_with(None)
+        mock_policy.execute.assert_called_once_with(
+            mock.sentinel.action,
+            is_retryable=self._service._is_retryable_error)
+        self.assertEqual(mock_policy.execute.return_value, result)
+
+    def test_is_retryable_error(self):
+        self.assertFalse(self._service._is_retryable_error(
+            base.NotExistingMetadataException()))
+        self.assertFalse(self._service._is_retryable_error(
+            exception.CertificateVerifyFailed()))
+        self.assertTrue(self._service._is_retryable_error(
+            requests.ConnectionError()))
+
 
 class TestBaseHTTPMetadataService(unittest.TestCase):
 
@@ -80,36 +231,39 @@ class TestBaseHTTPMetadataService(unittest.TestCase):
     def test_verify_https_request_with_ca_bundle(self):
         self._test_verify_https_request(https_ca_bundle="/path/to/resource")
 
-    @mock.patch('requests.post')
-    @mock.patch('requests.get')
+    @mock.patch("cloudbaseinit.metadata.services.base.BaseHTTPMetadataService."
+                "_get_session")
     @mock.patch("cloudbaseinit.metadata.services.base.BaseHTTPMetadataService."
                 "_verify_https_request")
-    def _test_http_request(self, mock_verify, mock_get, mock_post,
+    def _test_http_request(self, mock_verify, mock_get_session,
                            mock_url, mock_data=None, mock_headers=None):
         if not mock_url.startswith('http'):
             mock_url = requests.compat.urljoin(self._mock_base_url, mock_url)
 
+        mock_session = mock_get_session.return_value
         mock_response = mock.Mock()
         mock_response_status = mock.Mock()
         mock_response.raise_for_status = mock_response_status
         mock_response.content = mock.sentinel.content
 
-        mock_get.return_value = mock_response
-        mock_post.return_value = mock_response
+        mock_session.get.return_value = mock_response
+        mock_session.post.return_value = mock_response
         mock_verify.return_value = mock.sentinel.verify
 
         response = self._service._http_request(url=mock_url, data=mock_data,
                                                headers=mock_headers)
 
         if mock_data:
-            mock_post.assert_called_once_with(
+            mock_session.post.assert_called_once_with(
                 url=mock_url, data=mock_data, headers=mock_headers,
-                verify=mock.sentinel.verify
+                verify=mock.sentinel.verify,
+                timeout=self._service._get_request_timeout()
             )
         else:
-            mock_get.assert_called_once_with(
+            mock_session.get.assert_called_once_with(
                 url=mock_url, data=mock_data, headers=mock_headers,
-                verify=mock.sentinel.verify
+                verify=mock.sentinel.verify,
+                timeout=self._service._get_request_timeout()
             )
 
         mock_response_status.assert_called_once_with()
@@ -125,6 +279,122 @@ class TestBaseHTTPMetadataService(unittest.TestCase):
                                 mock_data={"X-Cloudbase-Init", True},
                                 mock_headers={})
 
+    def _test_http_request_disk_cache(self, status_code, headers=None):
+        mock_cache = mock.Mock()
+        mock_cache.get.return_value = diskcache.CacheEntry(
+            data=mock.sentinel.cached_data, etag='"etag"',
+            last_modified="date")
+        self._service._disk_cache = mock_cache
+        self._service._session = mock.Mock()
+        mock_response = self._service._session.get.return_value
+        mock_response.status_code = status_code
+        mock_response.headers = headers or {}
+        url = self._mock_base_url + "path"
+
+        response = self._service._http_request(url)
+
+        self._service._session.get.assert_called_once_with(
+            url=url, data=None, verify=False,
+            timeout=self._service._get_request_timeout(),
+            headers={"If-None-Match": '"etag"',
+                     "If-Modified-Since": "date"})
+        return mock_cache, mock_response, response
+
+    def test_http_request_disk_cache_not_modified(self):
+        mock_cache, mock_response, response = (
+            self._test_http_request_disk_cache(304))
+
+        self.assertEqual(mock.sentinel.cached_data, response)
+        self.assertFalse(mock_response.raise_for_status.called)
+        self.assertFalse(mock_cache.set.called)
+
+    def test_http_request_disk_cache_modified(self):
+        mock_cache, mock_response, response = (
+            self._test_http_request_disk_cache(200, {"ETag": '"new"'}))
+
+        self.assertEqual(mock_response.content, response)
+        mock_cache.set.assert_called_once_with(
+            self._mock_base_url + "path", mock_response.content,
+            '"new"', None)
+
+    def test_http_request_disk_cache_no_validators(self):
+        mock_cache, _, _ = self._test_http_request_disk_cache(200)
+        self.assertFalse(mock_cache.set.called)
+
+    def test_http_request_disk_cache_excluded(self):
+        mock_cache = mock.Mock()
+        self._service._disk_cache = mock_cache
+        self._service._session = mock.Mock()
+        mock_response = self._service._session.get.return_value
+        mock_response.headers = {"ETag": '"etag"'}
+
+        for path in ("openstack/latest/password", "latest/user-data",
+                     "openstack/latest/user_data", "latest/user-data/"):
+            url = self._mock_base_url + path
+            response = self._service._http_request(url)
+
+            self.assertEqual(mock_response.content, response)
+            self._service._session.get.assert_called_with(
+                url=url, data=None, headers={}, verify=False,
+                timeout=self._service._get_request_timeout())
+        self.assertFalse(mock_cache.get.called)
+        self.assertFalse(mock_cache.set.called)
+
+    @testutils.ConfPatcher('metadata_cache_path', 'cache_path')
+    def test_disk_cache_enabled(self):
+        service = base.BaseHTTPMetadataService(self._mock_base_url)
+        self.assertEqual(
+            os.path.join('cache_path', 'BaseHTTPMetadataService'),
+            service._disk_cache._path)
+        self.assertIsNone(self._service._disk_cache)
+
+    @testutils.ConfPatcher('metadata_cache_path', 'cache_path')
+    def test_disk_cache_not_supported(self):
+        with mock.patch.object(base.BaseHTTPMetadataService,
+                               '_disk_cache_supported', False):
+            service = base.BaseHTTPMetadataService(self._mock_base_url)
+        self.assertIsNone(service._disk_cache)
+
+    @mock.patch('requests.adapters.HTTPAdapter')
+    @mock.patch('requests.Session')
+    def test_get_session(self, mock_session_class, mock_adapter_class):
+        mock_session = mock_session_class.return_value
+
+        with testutils.ConfPatcher('metadata_http_pool_size', 3):
+            with testutils.ConfPatcher('metadata_http_trust_env', False):
+                session = self._service._get_session()
+        same_session = self._service._get_session()
+
+        self.assertIs(mock_session, session)
+        self.assertIs(session, same_session)
+        mock_session_class.assert_called_once_with()
+        self.assertFalse(mock_session.trust_env)
+        mock_adapter_class.assert_called_once_with(pool_maxsize=3)
+        mock_session.mount.assert_has_calls(
+            [mock.call("http://", mock_adapter_class.return_value),
+             mock.call("https://", mock_adapter_class.return_value)])
+
+    def test_get_request_timeout(self):
+        with testutils.ConfPatcher('metadata_http_connect_timeout', None):
+            with testutils.ConfPatcher('metadata_http_read_timeout', None):
+                self.assertIsNone(self._service._get_request_timeout())
+
+        with testutils.ConfPatcher('metadata_http_connect_timeout', 1.5):
+            with testutils.ConfPatcher('metadata_http_read_timeout', 10):
+                timeout = self._service._get_request_timeout()
+        self.assertEqual((1.5, 10), timeout)
+
+    @mock.patch('requests.Session')
+    def test_cleanup(self, mock_session_class):
+        session = self._service._get_session()
+
+        self._service.cleanup()
+
+        session.close.assert_called_once_with()
+        self.assertIsNone(self._service._session)
+        self._service._get_session()
+        self.assertEqual(2, mock_session_class.call_count)
+
     @mock.patch('requests.compat.urljoin')
     @mock.patch("cloudbaseinit.metadata.services.base."
                 "BaseHTTPMetadataService._http_request")
@@ -14,6 +14,7 @@
 
 
 import functools
+import json
 import posixpath
 import unittest
 
@@ -69,23 +70,136 @@ class TestBaseOpenStackService(unittest.TestCase):
         mock_get_cache_data.assert_called_once_with(path)
         self.assertEqual(mock_get_cache_data.return_value, response)
 
+    @mock.patch(MODPATH + ".BaseOpenStackService._get_version_index")
+    def test_get_prefetch_paths(self, mock_get_version_index):
+        mock_get_version_index.return_value = None
+        expected_paths = [
+            ('openstack/latest/meta_data.json', False),
+            ('openstack/latest/network_data.json', False),
+            ('openstack/latest/user_data', False),
+        ]
+        self.assertEqual(expected_paths, self._service.get_prefetch_paths())
+
+    @mock.patch(MODPATH + ".BaseOpenStackService._get_version_index")
+    def test_get_prefetch_paths_version_index(self, mock_get_version_index):
+        mock_get_version_index.return_value = (
+            baseopenstackservice.VersionIndex(["2013-04-04"], False))
+        expected_paths = [
+            ('openstack/2013-04-04/meta_data.json', False),
+            ('openstack/2013-04-04/user_data', False),
+        ]
+        self.assertEqual(expected_paths, self._service.get_prefetch_paths())
+
+    def test_load_version_index(self):
+        version_index = baseopenstackservice._load_version_index(
+            b"2012-08-10\n2015-10-15\n2013-04-04/\ncontent\nlatest\n")
+        self.assertEqual(("2012-08-10", "2013-04-04", "2015-10-15"),
+                         version_index.versions)
+        self.assertTrue(version_index.has_latest)
+
+    def test_load_version_index_no_versions(self):
+        self.assertIsNone(baseopenstackservice._load_version_index(b""))
+        self.assertIsNone(
+            baseopenstackservice._load_version_index(b'{"fake": "data"}'))
+
+    def test_version_index(self):
+        version_index = baseopenstackservice.VersionIndex(
+            ["2013-04-04", "2012-08-10"], has_latest=False)
+        self.assertTrue(version_index.supports("2012-08-10"))
+        self.assertFalse(version_index.supports("2015-10-15"))
+        self.assertFalse(version_index.supports("latest"))
+        self.assertEqual("2013-04-04", version_index.get_version())
+        self.assertEqual("2013-04-04",
+                         version_index.get_version("2013-04-04"))
+        self.assertIsNone(version_index.get_version("2015-10-15"))
+
+        version_index.has_latest = True
+        self.assertTrue(version_index.supports("latest"))
+        self.assertEqual("latest", version_index.get_version())
+
+    def test_get_version_index_not_existing(self):
+        with mock.patch.object(
+                self._service, '_get_data',
+                side_effect=base.NotExistingMetadataException):
+            self.assertIsNone(self._service._get_version_index())
+
+    def _test_get_network_data_versions(self, index, expected_paths):
+        data = {"openstack": index,
+                "openstack/latest/network_data.json": b'{"links": []}'}
+
+        def _get_data(path):
+            if path not in data:
+                raise base.NotExistingMetadataException()
+            return data[path]
+
+        with mock.patch.object(self._service, '_get_data',
+                               side_effect=_get_data) as mock_get_data:
+            try:
+                self._service.get_network_details_v2()
+                # The version index is requested once.
+                self._service.get_network_details_v2()
+            finally:
+                self.assertEqual(
+                    expected_paths,
+                    [args[0] for args, _ in mock_get_data.call_args_list])
+
+    def test_get_network_data_version_not_supported(self):
+        self._test_get_network_data_versions(
+            b"2012-08-10\n2013-04-04\nlatest",
+            expected_paths=["openstack"])
+
+    def test_get_network_data_version_supported(self):
+        self._test_get_network_data_versions(
+            b"2013-04-04\n2015-10-15\nlatest",
+            expected_paths=["openstack",
+                            "openstack/latest/network_data.json"])
+
+    @mock.patch(MODPATH + ".BaseOpenStackService._get_version_index")
     @mock.patch(MODPATH +
                 ".BaseOpenStackService._get_cache_data")
-    def test_get_user_data(self, mock_get_cache_data):
+    def test_get_user_data(self, mock_get_cache_data,
+                           mock_get_version_index):
+        mock_get_version_index.return_value = None
         response = self._service.get_user_data()
         path = posixpath.join('openstack', 'latest', 'user_data')
         mock_get_cache_data.assert_called_once_with(path)
         self.assertEqual(mock_get_cache_data.return_value, response)
 
-    @mock.patch(MODPATH +
-                ".BaseOpenStackService._get_cache_data")
-    def test_get_meta_data(self, mock_get_cache_data):
-        mock_get_cache_data.return_value = '{"fake": "data"}'
-        response = self._service._get_meta_data(
-            version='fake version')
+    def test_get_meta_data(self):
+        with mock.patch.object(self._service, '_get_data',
+                               return_value=b'{"fake": ["data"]}') as mock_get:
+            response = self._service._get_meta_data(
+                version='fake version')
+            self.assertIs(response, self._service._get_meta_data(
+                version='fake version'))
         path = posixpath.join('openstack', 'fake version', 'meta_data.json')
-        mock_get_cache_data.assert_called_with(path, decode=True)
-        self.assertEqual({"fake": "data"}, response)
+        mock_get.assert_called_once_with(path)
+        self.assertEqual({"fake": ["data"]}, response)
+        self.assertRaises(TypeError, response.update, {})
+        self.assertRaises(TypeError, response["fake"].append, "data")
+
+    def test_get_meta_data_empty(self):
+        with mock.patch.object(self._service, '_get_data', return_value=b''):
+            self.assertIsNone(self._service._get_meta_data())
+
+    def test_get_meta_data_parse_count(self):
+        meta_data = fake_json_response.get_fake_metadata_json("2013-04-04")
+        meta_data["meta"] = {"admin_pass": "fake pass"}
+        meta_data.pop("network_config")
+        with mock.patch.object(
+                self._service, '_get_data',
+                return_value=json.dumps(meta_data).encode()):
+            with mock.patch(MODPATH + ".json.loads",
+                            side_effect=json.loads) as mock_loads:
+                self._service.get_instance_id()
+                self._service.get_host_name()
+                self._service.get_public_keys()
+                self._service.get_admin_password()
+                self._service.get_client_auth_certs()
+                self._service.get_network_details()
+
+        # Each of the calls above used to parse meta_data.json again.
+        self.assertEqual(1, mock_loads.call_count)
 
     @mock.patch(MODPATH +
                 ".BaseOpenStackService._get_meta_data")
@@ -0,0 +1,237 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import threading
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit.metadata.services import cache
+
+
+class MetadataCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self._cache = cache.MetadataCache(negative_errors=(KeyError,))
+
+    def _assert_stats(self, **expected_stats):
+        stats = self._cache.get_stats()
+        for name, value in expected_stats.items():
+            self.assertEqual(value, stats[name], name)
+
+    def test_get(self):
+        fetch = mock.Mock(return_value=mock.sentinel.data)
+
+        for _ in range(3):
+            self.assertEqual(mock.sentinel.data,
+                             self._cache.get(("path", False), fetch))
+
+        fetch.assert_called_once_with()
+        self._assert_stats(hits=2, negative_hits=0, misses=1, waits=0)
+
+    def test_get_negative(self):
+        fetch = mock.Mock(side_effect=KeyError)
+
+        for _ in range(2):
+            self.assertRaises(KeyError, self._cache.get,
+                              ("path", False), fetch)
+
+        fetch.assert_called_once_with()
+        self.assertEqual(1, self._cache.get_stats()["negative_hits"])
+
+    def test_get_error_not_cached(self):
+        fetch = mock.Mock(side_effect=[ValueError, mock.sentinel.data])
+
+        self.assertRaises(ValueError, self._cache.get, ("path", False), fetch)
+        self.assertEqual(mock.sentinel.data,
+                         self._cache.get(("path", False), fetch))
+        self.assertEqual(2, fetch.call_count)
+
+    def _test_get_concurrent(self, fetch_result):
+        fetching = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def _fetch():
+            fetching.set()
+            release.wait(5)
+            if isinstance(fetch_result, Exception):
+                raise fetch_result
+            return fetch_result
+
+        def _get():
+            try:
+                results.append(self._cache.get(("path", False), fetch))
+            except Exception as ex:
+                results.append(ex)
+
+        fetch = mock.Mock(side_effect=_fetch)
+        owner = threading.Thread(target=_get)
+        owner.start()
+        fetching.wait(5)
+        waiters = [threading.Thread(target=_get) for _ in range(2)]
+        for thread in waiters:
+            thread.start()
+        # Let the waiters reach the pending fetch before releasing it.
+        while self._cache.get_stats()["waits"] < len(waiters):
+            release.wait(0.01)
+        release.set()
+        for thread in [owner] + waiters:
+            thread.join(5)
+
+        fetch.assert_called_once_with()
+        self.assertEqual([fetch_result] * 3, results)
+        self._assert_stats(hits=0, negative_hits=0, misses=1, waits=2)
+
+    def test_get_concurrent(self):
+        self._test_get_concurrent(mock.sentinel.data)
+
+    def test_get_concurrent_error(self):
+        self._test_get_concurrent(ValueError())
+
+    def test_clear(self):
+        fetch = mock.Mock(return_value=mock.sentinel.data)
+        self._cache.get(("path", False), fetch)
+        self._cache.clear()
+        self._cache.get(("path", False), fetch)
+        self.assertEqual(2, fetch.call_count)
+
+    def _test_get_spill_file_removed(self, view=None):
+        self._cache = cache.MetadataCache(spill_size=0)
+        self.addCleanup(self._cache.clear)
+        fetch = mock.Mock(side_effect=[b"data1", b"data2"])
+        self._cache.get("path", fetch)
+        get_entry = self._cache._get_entry
+
+        def _get_entry(key, fetch):
+            entry = get_entry(key, fetch)
+            if fetch.call_count == 1:
+                # Cleared right before the spill file is read.
+                self._cache.clear()
+            return entry
+
+        with mock.patch.object(self._cache, '_get_entry',
+                               side_effect=_get_entry):
+            data = self._cache.get("path", fetch, view=view)
+
+        self.assertEqual(2, fetch.call_count)
+        self.assertEqual(b"data2", self._cache.get("path", fetch))
+        return data
+
+    def test_get_spill_file_removed(self):
+        self.assertEqual(b"data2", self._test_get_spill_file_removed())
+
+    def test_get_view_spill_file_removed(self):
+        view = mock.Mock(return_value=u"data2")
+        self.assertEqual(u"data2",
+                         self._test_get_spill_file_removed(view=view))
+        view.assert_called_once_with(b"data2")
+
+    def test_get_spill_file_missing(self):
+        self._cache = cache.MetadataCache(spill_size=0)
+        self.addCleanup(self._cache.clear)
+        fetch = mock.Mock(side_effect=[b"data1", b"data2"])
+        self._cache.get("path", fetch)
+        os.remove(self._cache._entries["path"].spill_path)
+
+        self.assertEqual(b"data2", self._cache.get("path", fetch))
+        self.assertEqual(b"data2", self._cache.get("path", fetch))
+        self.assertEqual(2, fetch.call_count)
+
+    def _test_clear_during_fetch(self, fetch_result):
+        self._cache = cache.MetadataCache(negative_errors=(KeyError,),
+                                          spill_size=0)
+
+        def _fetch():
+            self._cache.clear()
+            if isinstance(fetch_result, Exception):
+                raise fetch_result
+            return fetch_result
+
+        fetch = mock.Mock(side_effect=_fetch)
+        for _ in range(2):
+            try:
+                result = self._cache.get("path", fetch)
+            except Exception as ex:
+                result = ex
+            self.assertEqual(fetch_result, result)
+
+        # The results retrieved before clearing the cache are discarded.
+        self.assertEqual(2, fetch.call_count)
+        self.assertEqual({}, self._cache._pending_fetches)
+        self.assertEqual(0, len(self._cache._entries))
+        self._assert_stats(memory_size=0, spills=0)
+
+    def test_clear_during_fetch(self):
+        self._test_clear_during_fetch(b"data")
+
+    def test_clear_during_fetch_negative(self):
+        self._test_clear_during_fetch(KeyError())
+
+    def test_get_view(self):
+        fetch = mock.Mock(return_value=b"data")
+        view = mock.Mock(return_value=u"data")
+
+        for _ in range(2):
+            self.assertEqual(u"data", self._cache.get("path", fetch,
+                                                      view=view))
+        self.assertEqual(b"data", self._cache.get("path", fetch))
+
+        fetch.assert_called_once_with()
+        view.assert_called_once_with(b"data")
+        self._assert_stats(memory_size=8)
+
+    def test_get_spill_size(self):
+        self._cache = cache.MetadataCache(spill_size=4)
+        fetch = mock.Mock(return_value=b"large data")
+        view = mock.Mock(return_value=u"large data")
+
+        for _ in range(2):
+            self.assertEqual(b"large data", self._cache.get("path", fetch))
+            self.assertEqual(u"large data", self._cache.get(
+                "path", fetch, view=view))
+
+        fetch.assert_called_once_with()
+        # Views of spilled data are not kept in memory.
+        self.assertEqual(2, view.call_count)
+        self._assert_stats(memory_size=0, spills=1)
+
+    def test_get_max_memory(self):
+        self._cache = cache.MetadataCache(max_memory=10)
+        fetch = mock.Mock(side_effect=[b"data1", b"data2", b"data3"])
+
+        self._cache.get("path1", fetch)
+        self._cache.get("path2", fetch)
+        # path2 becomes the least recently used entry.
+        self._cache.get("path1", fetch)
+        self._cache.get("path3", fetch)
+
+        self._assert_stats(memory_size=10, spills=1)
+        self.assertEqual(b"data2", self._cache.get("path2", fetch))
+        self.assertEqual(3, fetch.call_count)
+
+    def test_clear_removes_spill_files(self):
+        self._cache = cache.MetadataCache(spill_size=0)
+        self._cache.get("path", mock.Mock(return_value=b"data"))
+        spill_path = self._cache._entries["path"].spill_path
+        self.assertTrue(os.path.exists(spill_path))
+
+        self._cache.clear()
+
+        self.assertFalse(os.path.exists(spill_path))
+        self._assert_stats(memory_size=0)
@@ -14,12 +14,14 @@
 
 import functools
 import socket
+import threading
 import unittest
 
 try:
     import unittest.mock as mock
 except ImportError:
     import mock
+from six.moves import http_client
 from six.moves import urllib
 
 from cloudbaseinit import conf as cloudbaseinit_conf
@@ -115,6 +117,88 @@ class CloudStackTest(unittest.TestCase):
         self.assertFalse(self._service.load())
         self.assertEqual(2, mock_test_api.call_count)
 
+    @mock.patch('cloudbaseinit.utils.network.check_metadata_ip_route')
+    def test_load_first_responder(self, mock_check_metadata_ip_route):
+        self._service._osutils.get_dhcp_hosts_in_use.return_value = [
+            ('eth0', mock.sentinel.mac_address, '10.10.0.1'),
+            ('eth1', mock.sentinel.mac_address, '10.10.0.2'),
+            ('eth2', mock.sentinel.mac_address, '10.10.0.1')]
+        responded = threading.Event()
+        tested_urls = []
+
+        def _test_api(url):
+            tested_urls.append(url)
+            if url == 'http://10.10.0.2/':
+                responded.set()
+                return True
+            # The other hosts do not respond before the winner.
+            responded.wait(5)
+            return False
+
+        with mock.patch.object(self._service, '_test_api',
+                               side_effect=_test_api):
+            self.assertTrue(self._service.load())
+
+        self.assertEqual('http://10.10.0.2/', self._service._base_url)
+        self.assertEqual('10.10.0.2', self._service._metadata_host)
+        self.assertEqual(
+            sorted([CONF.cloudstack.metadata_base_url, 'http://10.10.0.1/',
+                    'http://10.10.0.2/']), sorted(tested_urls))
+
+    @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack'
+                '._get_data')
+    def test_test_api_url(self, mock_get_data):
+        self.assertTrue(self._service._test_api('http://10.10.0.1/'))
+        mock_get_data.assert_called_once_with(
+            'http://10.10.0.1/latest/meta-data/service-offering')
+        self.assertIsNone(self._service._metadata_host)
+
+    @mock.patch('six.moves.http_client.HTTPConnection')
+    def test_password_client_connection_reuse(self, mock_connection):
+        self._service._metadata_host = mock.sentinel.host
+        connection = mock_connection.return_value
+        response = connection.getresponse.return_value
+        response.status = 200
+        response.read.return_value = b"password"
+
+        for _ in range(3):
+            self.assertEqual("password", self._service._password_client())
+        mock_connection.assert_called_once_with(
+            mock.sentinel.host, CONF.cloudstack.password_server_port,
+            timeout=cloudstack.TIMEOUT)
+        self.assertEqual(3, connection.request.call_count)
+
+        self._service.cleanup()
+        connection.close.assert_called_once_with()
+        self.assertIsNone(self._service._password_connection)
+
+    @mock.patch('six.moves.http_client.HTTPConnection')
+    def test_password_client_reconnect(self, mock_connection):
+        stale_connection = mock.Mock()
+        self._service._password_connection = stale_connection
+        stale_connection.getresponse.side_effect = (
+            http_client.BadStatusLine(""))
+        response = mock_connection.return_value.getresponse.return_value
+        response.status = 200
+        response.read.return_value = b"password"
+
+        self.assertEqual("password", self._service._password_client())
+        stale_connection.close.assert_called_once_with()
+        self.assertIs(mock_connection.return_value,
+                      self._service._password_connection)
+
+    @mock.patch('six.moves.http_client.HTTPConnection')
+    def test_password_client_error(self, mock_connection):
+        connection = mock_connection.return_value
+        connection.getresponse.side_effect = socket.error("fake error")
+
+        with testutils.LogSnatcher('cloudbaseinit.metadata.services.'
+                                   'cloudstack') as snatcher:
+            self.assertRaises(socket.error, self._service._password_client)
+        self.assertEqual(["Request failed: fake error"], snatcher.output)
+        connection.close.assert_called_once_with()
+        self.assertIsNone(self._service._password_connection)
+
     @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack'
                 '._get_data')
     def test_get_cache_data(self, mock_get_data):
@@ -198,7 +282,7 @@ class CloudStackTest(unittest.TestCase):
     @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack'
                 '._password_client')
     def test_get_password_fail(self, mock_password_client):
-        mock_password_client.side_effect = ["", cloudstack.BAD_REQUEST,
+        mock_password_client.side_effect = ["", "", cloudstack.BAD_REQUEST,
                                             cloudstack.SAVED_PASSWORD]
         expected_output = [
             ["Try to get password from the Password Server.",
@@ -218,31 +302,47 @@ class CloudStackTest(unittest.TestCase):
                 self.assertIsNone(self._service._get_password())
                 self.assertEqual(expected_output.pop(), snatcher.output)
 
-        self.assertEqual(3, mock_password_client.call_count)
+        # The empty response is retried.
+        self.assertEqual(4, mock_password_client.call_count)
+
+    @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack'
+                '._password_client')
+    def test_get_password_error(self, mock_password_client):
+        mock_password_client.side_effect = [
+            socket.error("fake error"), "password"]
+        self.assertEqual("password", self._service._get_password())
+
+        mock_password_client.side_effect = http_client.HTTPException(
+            "fake error")
+        with testutils.LogSnatcher('cloudbaseinit.metadata.services.'
+                                   'cloudstack') as snatcher:
+            self.assertIsNone(self._service._get_password())
+        self.assertEqual("Getting password failed: fake error",
+                         snatcher.output[-1])
 
     @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack'
                 '._password_client')
     def test_delete_password(self, mock_password_client):
         mock_password_client.side_effect = [cloudstack.BAD_REQUEST,
+                                            cloudstack.BAD_REQUEST,
                                             cloudstack.SAVED_PASSWORD]
         expected_output = [
             'Remove the password for this instance from the '
             'Password Server.',
+            'Removing password failed: _RetryPasswordRequest()',
             'Fail to remove the password from the Password Server.',
 
             'Remove the password for this instance from the '
             'Password Server.',
-            'The password was removed from the Password Server',
-
+            'The password was removed from the Password Server.',
         ]
 
         with testutils.LogSnatcher('cloudbaseinit.metadata.services.'
                                    'cloudstack') as snatcher:
             self.assertIsNone(self._service._delete_password())
             self.assertIsNone(self._service._delete_password())
-            self.assertEqual(2, mock_password_client.call_count)
-        for expected, output in zip(expected_output, snatcher.output):
-            self.assertTrue(output.startswith(expected))
+        self.assertEqual(3, mock_password_client.call_count)
+        self.assertEqual(expected_output, snatcher.output)
 
     @mock.patch('cloudbaseinit.metadata.services.cloudstack.CloudStack.'
                 '_delete_password')
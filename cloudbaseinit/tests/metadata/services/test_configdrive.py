@@ -15,6 +15,8 @@
 
 import importlib
 import os
+import shutil
+import tempfile
 import unittest
 
 try:
@@ -23,6 +25,7 @@ except ImportError:
     import mock
 
 from cloudbaseinit import exception
+from cloudbaseinit.metadata.services import base
 from cloudbaseinit.tests import testutils
 
 
@@ -108,6 +111,42 @@ class TestConfigDriveService(unittest.TestCase):
         self.assertTrue(response)
         self.assertEqual(fake_path, self._config_drive._metadata_path)
 
+    def _test_get_config_drive_files_hints(self, found_results):
+        # The module imported in setUp uses its own hints module.
+        hints_module = self.configdrive_module.hints
+        self._config_drive._mgr = mock.Mock()
+        self._config_drive._mgr.get_config_drive_files.side_effect = (
+            found_results)
+        self._config_drive._mgr.found_config_drive = ("vfat", "hdd")
+        self._config_drive._searched_types = {"iso", "vfat"}
+        self._config_drive._searched_locations = {"cdrom", "hdd"}
+
+        with mock.patch.object(hints_module, 'get_stored_hints') as \
+                mock_get_stored_hints, self.snatcher:
+            mock_hints = mock_get_stored_hints.return_value
+            mock_hints.config_drive = ("iso", "cdrom")
+            found = self._config_drive._get_config_drive_files()
+
+        self.assertEqual(found_results[-1], found)
+        calls = [mock.call(searched_types=["iso"],
+                           searched_locations=["cdrom"])]
+        if len(found_results) > 1:
+            calls.append(mock.call(searched_types={"iso", "vfat"},
+                                   searched_locations={"cdrom", "hdd"}))
+        self.assertEqual(
+            calls, self._config_drive._mgr.get_config_drive_files.mock_calls)
+        return mock_hints
+
+    def test_get_config_drive_files_hint_found(self):
+        mock_hints = self._test_get_config_drive_files_hints(
+            found_results=[True])
+        self.assertFalse(mock_hints.set_config_drive.called)
+
+    def test_get_config_drive_files_hint_missed(self):
+        mock_hints = self._test_get_config_drive_files_hints(
+            found_results=[False, True])
+        mock_hints.set_config_drive.assert_called_once_with("vfat", "hdd")
+
     @mock.patch('os.path.normpath')
     @mock.patch('os.path.join')
     def test_get_data(self, mock_join, mock_normpath):
@@ -120,6 +159,21 @@ class TestConfigDriveService(unittest.TestCase):
                 self._config_drive._metadata_path, fake_path)
             mock_normpath.assert_called_once_with(mock_join.return_value)
 
+    def test_get_data_directory(self):
+        metadata_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metadata_path)
+        for version in ("latest", "2013-04-04", "content"):
+            os.makedirs(os.path.join(metadata_path, "openstack", version))
+        self._config_drive._metadata_path = metadata_path
+
+        response = self._config_drive._get_data("openstack")
+        self.assertEqual(b"2013-04-04\ncontent\nlatest", response)
+        self.assertEqual(
+            "latest", self._config_drive._get_document_version("user_data"))
+        self.assertRaises(base.NotExistingMetadataException,
+                          self._config_drive._get_document_version,
+                          "network_data.json")
+
     @mock.patch('shutil.rmtree')
     def test_cleanup(self, mock_rmtree):
         fake_path = os.path.join('fake', 'path')
@@ -134,3 +188,10 @@ class TestConfigDriveService(unittest.TestCase):
         mock_rmtree.assert_called_once_with(fake_path,
                                             ignore_errors=True)
         self.assertEqual(None, self._config_drive._metadata_path)
+
+    def test_cleanup_clears_cache(self):
+        self._config_drive._mgr = mock.Mock()
+        with mock.patch.object(self._config_drive, '_cache') as mock_cache:
+            with mock.patch('shutil.rmtree'):
+                self._config_drive.cleanup()
+        mock_cache.clear.assert_called_once_with()
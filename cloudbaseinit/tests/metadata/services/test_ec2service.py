@@ -19,8 +19,12 @@ try:
 except ImportError:
     import mock
 
+import requests
+
 from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit.metadata.services import base
 from cloudbaseinit.metadata.services import ec2service
+from cloudbaseinit.tests.metadata import fake_imds
 from cloudbaseinit.tests import testutils
 
 CONF = cloudbaseinit_conf.CONF
@@ -96,3 +100,199 @@ class EC2ServiceTest(unittest.TestCase):
         path = '%s/user-data' % self._service._metadata_version
         mock_get_cache_data.assert_called_once_with(path)
         self.assertEqual(mock_get_cache_data.return_value, response)
+
+
+class MetadataCrawlerTest(unittest.TestCase):
+
+    _tree = {
+        "instance-id": "i-12345",
+        "public-keys": "0=key0\n1=key1",
+        "public-keys/0": "openssh-key",
+        "public-keys/0/openssh-key": "ssh-rsa key0",
+        "public-keys/1": "openssh-key",
+        "public-keys/1/openssh-key": "ssh-rsa key1",
+        "placement": "availability-zone\nregion/",
+        "placement/availability-zone": "zone-a",
+        "placement/region": "nested/",
+        "placement/region/nested": "name",
+        "placement/region/nested/name": "region-a",
+    }
+
+    def setUp(self):
+        self._requests = []
+
+    def _get_data(self, path, decode):
+        self._requests.append(path)
+        if path not in self._tree:
+            raise base.NotExistingMetadataException()
+        return self._tree[path]
+
+    def _crawl(self, paths, max_depth=3):
+        crawler = ec2service.MetadataCrawler(
+            self._get_data, paths, max_depth, workers=2)
+        return crawler.crawl()
+
+    def test_crawl_wildcard(self):
+        snapshot = self._crawl(["instance-id", "public-keys/*/openssh-key"])
+        self.assertEqual({
+            "instance-id": "i-12345",
+            "public-keys": "0=key0\n1=key1",
+            "public-keys/0/openssh-key": "ssh-rsa key0",
+            "public-keys/1/openssh-key": "ssh-rsa key1",
+        }, snapshot)
+        self.assertEqual(4, len(self._requests))
+
+    def test_crawl_subtree(self):
+        snapshot = self._crawl(["placement/"])
+        self.assertEqual("region-a", snapshot["placement/region/nested/name"])
+        self.assertEqual(5, len(snapshot))
+
+    def test_crawl_subtree_max_depth(self):
+        snapshot = self._crawl(["placement/"], max_depth=2)
+        self.assertNotIn("placement/region/nested", snapshot)
+        self.assertEqual(["placement", "placement/availability-zone",
+                          "placement/region"], sorted(snapshot))
+
+    def test_crawl_missing(self):
+        with testutils.LogSnatcher('cloudbaseinit.metadata.services.'
+                                   'ec2service') as snatcher:
+            snapshot = self._crawl(["missing", "missing/*/name"])
+        self.assertEqual({}, snapshot)
+        self.assertEqual(["Metadata not found while crawling: 'missing'"] * 2,
+                         snatcher.output)
+
+
+class EC2ServiceIMDSTest(unittest.TestCase):
+
+    _tree = {
+        "2009-04-04/meta-data/instance-id": b"i-12345",
+        "2009-04-04/meta-data/local-hostname": b"fake-host",
+        "2009-04-04/meta-data/public-keys": b"0=key0\n1=key1\n2=key2",
+        "2009-04-04/meta-data/public-keys/0/openssh-key": b"ssh-rsa key0",
+        "2009-04-04/meta-data/public-keys/1/openssh-key": b"ssh-rsa key1",
+        "2009-04-04/meta-data/public-keys/2/openssh-key": b"ssh-rsa key2\n",
+    }
+
+    def _get_service(self, imds):
+        with testutils.ConfPatcher("metadata_base_url", imds.base_url,
+                                   group="ec2"):
+            service = ec2service.EC2Service()
+        self.addCleanup(service.cleanup)
+        return service
+
+    def _get_metadata(self, **imds_kwargs):
+        with testutils.ConfPatcher("metadata_http_trust_env", False):
+            with fake_imds.FakeIMDS(self._tree, **imds_kwargs) as imds:
+                service = self._get_service(imds)
+                instance_id = service.get_instance_id()
+                host_name = service.get_host_name()
+        self.assertEqual("i-12345", instance_id)
+        self.assertEqual("fake-host", host_name)
+        return imds, service
+
+    def test_imdsv2(self):
+        imds, _ = self._get_metadata(imdsv2_required=True)
+        self.assertEqual(1, imds.token_requests)
+        self.assertEqual(2, len(imds.requests))
+
+    def test_imdsv1_fallback(self):
+        with testutils.LogSnatcher('cloudbaseinit.metadata.services.'
+                                   'ec2service'):
+            imds, service = self._get_metadata(imdsv2=False)
+        self.assertEqual(1, imds.token_requests)
+        self.assertEqual(2, len(imds.requests))
+        self.assertFalse(service._imdsv2_supported)
+
+    def test_imdsv2_token_server_error(self):
+        with testutils.ConfPatcher("retry_count_interval", 0, group="ec2"):
+            imds, service = self._get_metadata(imdsv2_required=True,
+                                               token_errors=[503])
+        self.assertEqual(2, imds.token_requests)
+        self.assertEqual(2, len(imds.requests))
+        self.assertTrue(service._imdsv2_supported)
+
+    def test_imdsv2_token_server_error_not_retried(self):
+        with testutils.ConfPatcher("metadata_http_trust_env", False), \
+                testutils.ConfPatcher("retry_count", 0, group="ec2"):
+            with fake_imds.FakeIMDS(self._tree, imdsv2_required=True,
+                                    token_errors=[503]) as imds:
+                service = self._get_service(imds)
+                self.assertRaises(requests.HTTPError,
+                                  service.get_instance_id)
+        self.assertEqual(1, imds.token_requests)
+        self.assertEqual([], imds.requests)
+        self.assertTrue(service._imdsv2_supported)
+
+    def test_imdsv2_required_after_fallback(self):
+        with testutils.LogSnatcher('cloudbaseinit.metadata.services.'
+                                   'ec2service'):
+            imds, service = self._get_metadata(imdsv2_required=True,
+                                               token_errors=[403])
+        # The first request without a token is refused, then a new
+        # token is requested.
+        self.assertEqual(2, imds.token_requests)
+        self.assertEqual(3, len(imds.requests))
+        self.assertTrue(service._imdsv2_supported)
+
+    def test_imdsv2_disabled(self):
+        with testutils.ConfPatcher("imdsv2", False, group="ec2"):
+            imds, _ = self._get_metadata()
+        self.assertEqual(0, imds.token_requests)
+
+    def test_imdsv2_token_revoked(self):
+        with testutils.ConfPatcher("metadata_http_trust_env", False):
+            with fake_imds.FakeIMDS(self._tree,
+                                    imdsv2_required=True) as imds:
+                service = self._get_service(imds)
+                service.get_instance_id()
+                imds.revoke_token()
+                host_name = service.get_host_name()
+
+        self.assertEqual("fake-host", host_name)
+        self.assertEqual(2, imds.token_requests)
+        self.assertEqual(3, len(imds.requests))
+
+    @mock.patch('time.time')
+    def test_imdsv2_token_expired(self, mock_time):
+        mock_time.return_value = 1000
+        with testutils.ConfPatcher("metadata_http_trust_env", False):
+            with testutils.ConfPatcher("imdsv2_token_ttl", 120, group="ec2"):
+                with fake_imds.FakeIMDS(self._tree,
+                                        imdsv2_required=True) as imds:
+                    service = self._get_service(imds)
+                    service.get_instance_id()
+                    # Within the refresh margin before the expiration.
+                    mock_time.return_value = 1000 + 61
+                    service.get_host_name()
+
+        self.assertEqual(2, imds.token_requests)
+        self.assertEqual(2, len(imds.requests))
+
+    def _test_crawl(self, metadata_crawl):
+        with testutils.ConfPatcher("metadata_http_trust_env", False), \
+                testutils.ConfPatcher("add_metadata_private_ip_route", False,
+                                      group="ec2"), \
+                testutils.ConfPatcher("metadata_crawl", metadata_crawl,
+                                      group="ec2"):
+            with fake_imds.FakeIMDS(self._tree) as imds:
+                service = self._get_service(imds)
+                self.assertTrue(service.load())
+                public_keys = service.get_public_keys()
+                crawl_requests = list(imds.requests)
+                self.assertEqual("i-12345", service.get_instance_id())
+                self.assertEqual("fake-host", service.get_host_name())
+
+        self.assertEqual(["ssh-rsa key0", "ssh-rsa key1", "ssh-rsa key2"],
+                         public_keys)
+        return crawl_requests, imds.requests
+
+    def test_crawl(self):
+        crawl_requests, requests = self._test_crawl(metadata_crawl=True)
+        # local-hostname, retrieved by load(), is not requested again.
+        self.assertEqual(6, len(crawl_requests))
+        self.assertEqual(crawl_requests, requests)
+
+    def test_crawl_disabled(self):
+        crawl_requests, requests = self._test_crawl(metadata_crawl=False)
+        self.assertEqual(5, len(crawl_requests))
+        self.assertEqual(6, len(requests))
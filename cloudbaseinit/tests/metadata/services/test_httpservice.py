@@ -23,6 +23,7 @@ from six.moves.urllib import error
 
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit.metadata.services import base
+from cloudbaseinit.metadata.services import baseopenstackservice as baseos
 from cloudbaseinit.metadata.services import httpservice
 
 CONF = cloudbaseinit_conf.CONF
@@ -71,13 +72,31 @@ class HttpServiceTest(unittest.TestCase):
         self.assertEqual('openstack/%s/password' %
                          self._httpservice._POST_PASSWORD_MD_VER, response)
 
+    @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
+                '._get_version_index')
     @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
                 '._get_meta_data')
-    def test_can_post_password(self, mock_get_meta_data):
+    def test_can_post_password(self, mock_get_meta_data,
+                               mock_get_version_index):
+        mock_get_version_index.return_value = None
         self.assertTrue(self._httpservice.can_post_password)
         mock_get_meta_data.side_effect = base.NotExistingMetadataException
         self.assertFalse(self._httpservice.can_post_password)
 
+    @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
+                '._get_version_index')
+    @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
+                '._get_meta_data')
+    def test_can_post_password_version_index(self, mock_get_meta_data,
+                                             mock_get_version_index):
+        mock_get_version_index.return_value = baseos.VersionIndex(
+            ["2012-08-10", "2013-04-04"], has_latest=True)
+        self.assertTrue(self._httpservice.can_post_password)
+        mock_get_version_index.return_value = baseos.VersionIndex(
+            ["2012-08-10"], has_latest=True)
+        self.assertFalse(self._httpservice.can_post_password)
+        self.assertFalse(mock_get_meta_data.called)
+
     @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
                 '._get_password_path')
     @mock.patch('cloudbaseinit.metadata.services.httpservice.HttpService'
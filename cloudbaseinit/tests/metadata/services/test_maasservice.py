@@ -12,12 +12,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import email.utils
 import unittest
 
 try:
     import unittest.mock as mock
 except ImportError:
     import mock
+from oauthlib import oauth1
+import requests
 
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import exception
@@ -30,6 +33,65 @@ from cloudbaseinit.utils import x509constants
 CONF = cloudbaseinit_conf.CONF
 
 
+class OAuthSignerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._signer = maasservice.OAuthSigner(
+            "consumer_key", "consumer secret&", "token_key", "token_secret")
+
+    def _get_params(self, headers):
+        authorization = headers["Authorization"]
+        self.assertTrue(authorization.startswith("OAuth "))
+        params = dict(param.split("=", 1) for param in
+                      authorization[len("OAuth "):].split(", "))
+        params.pop("oauth_nonce")
+        params.pop("oauth_timestamp")
+        return params
+
+    def test_sign_compatibility(self):
+        client = oauth1.Client(
+            "consumer_key", client_secret="consumer secret&",
+            resource_owner_key="token_key",
+            resource_owner_secret="token_secret",
+            signature_method=oauth1.SIGNATURE_PLAINTEXT,
+            realm="fake_realm")
+        expected_headers = client.sign("http://fake.url")[1]
+        expected_params = self._get_params(expected_headers)
+        expected_params["realm"] = '""'
+
+        self.assertEqual(expected_params,
+                         self._get_params(self._signer.sign()))
+
+    @mock.patch('oauthlib.common.generate_nonce')
+    @mock.patch('time.time')
+    def test_sign(self, mock_time, mock_generate_nonce):
+        mock_time.return_value = 1000.5
+        mock_generate_nonce.side_effect = ["nonce1", "nonce2"]
+        self._signer.clock_offset = -100
+
+        authorization = self._signer.sign()["Authorization"]
+        self.assertTrue(authorization.startswith(
+            'OAuth realm="", oauth_nonce="nonce1", '
+            'oauth_timestamp="900", '))
+        self.assertIn('oauth_nonce="nonce2"',
+                      self._signer.sign()["Authorization"])
+
+    @mock.patch('time.time')
+    def test_update_clock_offset(self, mock_time):
+        mock_time.return_value = 1000
+        self.assertFalse(self._signer.update_clock_offset(None))
+        self.assertFalse(self._signer.update_clock_offset("invalid"))
+        self.assertFalse(self._signer.update_clock_offset(
+            email.utils.formatdate(1005, usegmt=True)))
+        self.assertEqual(0, self._signer.clock_offset)
+
+        self.assertTrue(self._signer.update_clock_offset(
+            email.utils.formatdate(400, usegmt=True)))
+        self.assertEqual(-600, self._signer.clock_offset)
+        self.assertFalse(self._signer.update_clock_offset(
+            email.utils.formatdate(405, usegmt=True)))
+
+
 class MaaSHttpServiceTest(unittest.TestCase):
 
     def setUp(self):
@@ -93,6 +155,59 @@ class MaaSHttpServiceTest(unittest.TestCase):
         self.assertEqual('"consumer_secret%26token_secret"',
                          auth_parts['oauth_signature'])
 
+    def test_get_oauth_signer(self):
+        signer = self._maasservice._get_oauth_signer()
+        self.assertIs(signer, self._maasservice._get_oauth_signer())
+
+    def _get_http_error(self, status_code, date=None):
+        response = requests.Response()
+        response.status_code = status_code
+        if date:
+            response.headers["Date"] = email.utils.formatdate(date,
+                                                              usegmt=True)
+        return requests.HTTPError(response=response)
+
+    @mock.patch('time.time')
+    @mock.patch('cloudbaseinit.metadata.services.base.'
+                'BaseHTTPMetadataService._http_request')
+    def test_http_request_clock_skew(self, mock_http_request, mock_time):
+        mock_time.return_value = 1000
+        mock_http_request.side_effect = [
+            self._get_http_error(401, date=4600), mock.sentinel.response]
+
+        with testutils.LogSnatcher('cloudbaseinit.metadata.services.'
+                                   'maasservice') as snatcher:
+            response = self._maasservice._http_request("http://fake.url")
+
+        self.assertEqual(mock.sentinel.response, response)
+        self.assertEqual(["The clock differs from the MaaS server clock by "
+                          "3600 seconds, adjusting the OAuth timestamps"],
+                         snatcher.output)
+        authorization = mock_http_request.call_args[0][2]["Authorization"]
+        self.assertIn('oauth_timestamp="4600"', authorization)
+
+    @mock.patch('time.time')
+    @mock.patch('cloudbaseinit.metadata.services.base.'
+                'BaseHTTPMetadataService._http_request')
+    def _test_http_request_error(self, mock_http_request, mock_time, error):
+        mock_time.return_value = 1000
+        mock_http_request.side_effect = [error]
+
+        self.assertRaises(requests.HTTPError,
+                          self._maasservice._http_request, "http://fake.url")
+        self.assertEqual(1, mock_http_request.call_count)
+
+    def test_http_request_unauthorized(self):
+        self._test_http_request_error(
+            error=self._get_http_error(401, date=1005))
+
+    def test_http_request_unauthorized_no_date(self):
+        self._test_http_request_error(error=self._get_http_error(401))
+
+    def test_http_request_not_found(self):
+        self._test_http_request_error(
+            error=self._get_http_error(404, date=4600))
+
     @mock.patch('cloudbaseinit.metadata.services.base.'
                 'BaseHTTPMetadataService._http_request')
     @mock.patch('cloudbaseinit.metadata.services.maasservice.MaaSHttpService'
@@ -84,7 +84,8 @@ USER_DATA='{user_data}'
     mac=MAC.lower(),    # warning: mac is in lowercase
     host_name=HOST_NAME,
     public_key=PUBLIC_KEY,
-    user_data=USER_DATA
+    # escaped by OpenNebula, like the embedded single quotes
+    user_data=USER_DATA.replace("'", "'\\''")
 )
 
 CONTEXT2 = ("""
@@ -174,6 +175,49 @@ class TestOpenNebulaService(_TestOpenNebulaService):
                 (False, True)):
             self._test_parse_shell_variables(crlf=crlf, comment=comment)
 
+    def test_parse_shell_variables_quoting(self):
+        content = textwrap.dedent("""
+            export DQ="a \\"b\\" \\$c \\d"
+            SQ='It'\\''s'
+            ANSI=$'line1\\nline2\\t\\x41\\101\\\\ \\' end'
+            EMPTY=''
+            UNQUOTED=abc#def # a comment
+            CONCAT="a"'b'c
+            INT=007
+            QUOTED_INT='10'
+            CONT=a\\
+            b
+        """)
+        pairs = self._service._parse_shell_variables(content.encode())
+        self.assertEqual({
+            "DQ": b'a "b" $c \\d',
+            "SQ": b"It's",
+            "ANSI": b"line1\nline2\tAA\\ ' end",
+            "EMPTY": b"",
+            "UNQUOTED": b"abc#def",
+            "CONCAT": b"abc",
+            "INT": 7,
+            "QUOTED_INT": b"10",
+            "CONT": b"ab",
+        }, pairs)
+
+    def test_parse_shell_variables_large_values(self):
+        # The regex based parser was quadratic on long unquoted words.
+        user_data = b"QUJD" * (1024 * 1024)
+        content = (b"DISK_ID='1'\nUSER_DATA=" + user_data +
+                   b"\nENCODED='" + user_data +
+                   b"'\nSET_HOSTNAME='" + b"x" * 1024 * 1024 + b"'\n")
+        pairs = self._service._parse_shell_variables(content)
+        self.assertEqual(user_data, pairs["USER_DATA"])
+        self.assertEqual(user_data, pairs["ENCODED"])
+        self.assertEqual(1024 * 1024, len(pairs["SET_HOSTNAME"]))
+        self.assertEqual(b"1", pairs["DISK_ID"])
+
+    def test_parse_shell_variables_unterminated(self):
+        pairs = self._service._parse_shell_variables(
+            b"VAR1='1'\nVAR2='abc\nVAR3=\"def")
+        self.assertEqual({"VAR1": b"1", "VAR2": b"abc\nVAR3=\"def"}, pairs)
+
     def test_calculate_netmask(self):
         address, gateway, _netmask = (
             "192.168.0.10",
@@ -277,6 +321,7 @@ class TestLoadedOpenNebulaService(_TestOpenNebulaService):
             self._service._raw_content
         )
         self._service._dict_content = vardict
+        self._service._index_context()
 
     def test_get_cache_data(self):
         names = ["smt"]
@@ -346,3 +391,30 @@ class TestLoadedOpenNebulaService(_TestOpenNebulaService):
         mock_get_cache.side_effect = [mock_mac, mock_address, exc, exc]
         result_details = self._service.get_network_details()
         self.assertEqual(result_details, [])
+
+    def test_index_context(self):
+        nics = "".join(
+            "ETH{iid}_MAC='{mac}'\nETH{iid}_IP='{address}'\n"
+            "ETH{iid}_MASK='{netmask}'\nETH{iid}_DNS='{dnsns}'\n".format(
+                iid=iid, mac=MAC.lower(), address=ADDRESS, netmask=NETMASK,
+                dnsns=DNSNS)
+            for iid in list(range(40)) + [41])
+        self.load_context(context=nics + "HOSTNAME='fake'\nSSH_KEY='key'\n"
+                          "SET_HOSTNAME='{}'\n".format(HOST_NAME))
+
+        # the interfaces following a missing one are ignored
+        self.assertEqual(40, self._service._nic_count())
+        self.assertEqual(list(range(40)), self._service._nic_ids)
+        self.assertEqual(MAC.lower().encode(),
+                         self._service._nics[41]["ETH{iid}_MAC"])
+        self.assertEqual(ADDRESS, self._service._get_cache_data(
+            opennebulaservice.ADDRESS, iid=39, decode=True))
+        self.assertEqual(HOST_NAME, self._service.get_host_name())
+        self.assertEqual(["key"], self._service.get_public_keys())
+        self.assertEqual(40, len(self._service.get_network_details()))
+
+    def test_get_cache_data_nic_missing(self):
+        with self.assertRaises(base.NotExistingMetadataException) as cm:
+            self._service._get_cache_data(opennebulaservice.MAC, iid=1)
+        self.assertEqual("None of ETH1_MAC metadata was found",
+                         str(cm.exception))
@@ -15,6 +15,8 @@
 import base64
 import importlib
 import os
+import shutil
+import tempfile
 import unittest
 try:
     import unittest.mock as mock
@@ -23,6 +25,7 @@ except ImportError:
 
 from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit.metadata.services import base
+from cloudbaseinit.tests.metadata import fake_xml_response
 from cloudbaseinit.tests import testutils
 
 CONF = cloudbaseinit_conf.CONF
@@ -34,15 +37,13 @@ class OvfServiceTest(unittest.TestCase):
     @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
     def setUp(self, mock_osutils):
         self._mock_osutils = mock_osutils
-        self._mock_untangle = mock.MagicMock()
         self._mock_ctypes = mock.MagicMock()
         self._mock_wintypes = mock.MagicMock()
         self._moves_mock = mock.MagicMock()
 
         self._module_patcher = mock.patch.dict(
             'sys.modules',
-            {'untangle': self._mock_untangle,
-             'ctypes': self._mock_ctypes,
+            {'ctypes': self._mock_ctypes,
              'ctypes.wintypes': self._mock_wintypes,
              'six.moves': self._moves_mock
              })
@@ -84,78 +85,99 @@ class OvfServiceTest(unittest.TestCase):
     def test_get_ovf_env_path_not_exists(self):
         self._test__get_ovf_env_path(path_exists=False)
 
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_instance_id(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.PropertySection.Property = \
-            self._get_test_properties('instance-id')
+    def _set_ovf_env(self, properties, ovf_env_xml=None):
+        if ovf_env_xml is None:
+            ovf_env_xml = fake_xml_response.get_fake_ovf_env_xml(properties)
+        ovf_env_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, ovf_env_dir)
+        ovf_env_path = os.path.join(ovf_env_dir, "ovf-env.xml")
+        with open(ovf_env_path, "wb") as stream:
+            stream.write(ovf_env_xml)
+
+        patcher = mock.patch(MODPATH + "._get_ovf_env_path",
+                             return_value=ovf_env_path)
+        mock_get_ovf_env_path = patcher.start()
+        self.addCleanup(patcher.stop)
+        return mock_get_ovf_env_path
+
+    def test_get_ovf_env(self):
+        mock_get_ovf_env_path = self._set_ovf_env(
+            self._get_test_properties('hostname'))
+        self.assertEqual(str(id(mock.sentinel.value)),
+                         self._ovfservice.get_host_name())
+        self.assertEqual('iid-ovf', self._ovfservice.get_instance_id())
+        mock_get_ovf_env_path.assert_called_once_with()
+
+    def test_get_instance_id(self):
+        self._set_ovf_env(self._get_test_properties('instance-id'))
         res = self._ovfservice.get_instance_id()
-        mock_get_ovf_env.assert_called_once_with()
         self.assertEqual(res, str(id(mock.sentinel.value)))
 
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_instance_id_unset(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.PropertySection.Property = []
-        res = self._ovfservice.get_instance_id()
-        mock_get_ovf_env.assert_called_once_with()
+    def test_get_instance_id_unset(self):
+        self._set_ovf_env([])
+        with self._logsnatcher:
+            res = self._ovfservice.get_instance_id()
         self.assertEqual(res, 'iid-ovf')
+        self.assertEqual(["PropertySection in ovf file has no Property "
+                          "elements"], self._logsnatcher.output)
 
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_decoded_user_data(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.PropertySection.Property = \
-            self._get_test_properties('user-data', True)
+    def test_get_decoded_user_data(self):
+        self._set_ovf_env(self._get_test_properties('user-data', True))
         res = self._ovfservice.get_decoded_user_data()
-        mock_get_ovf_env.assert_called_once_with()
         self.assertEqual(res, str(id(mock.sentinel.value)).encode())
 
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_host_name(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.PropertySection.Property = \
-            self._get_test_properties('hostname')
+    def test_get_host_name(self):
+        self._set_ovf_env(self._get_test_properties('hostname'))
         res = self._ovfservice.get_host_name()
-        mock_get_ovf_env.assert_called_once_with()
         self.assertEqual(res, str(id(mock.sentinel.value)))
 
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_public_keys(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.PropertySection.Property = \
-            self._get_test_properties('public-keys')
+    def test_get_public_keys(self):
+        self._set_ovf_env(self._get_test_properties('public-keys'))
         res = self._ovfservice.get_public_keys()
-        mock_get_ovf_env.assert_called_once_with()
-        assert type(res) == list
-        assert len(res) == 1
-        self.assertEqual(res[0], str(id(mock.sentinel.value)))
-
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_admin_username(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.PropertySection.Property = \
-            self._get_test_properties('username')
+        self.assertEqual([str(id(mock.sentinel.value))], res)
+
+    def test_get_admin_username(self):
+        self._set_ovf_env(self._get_test_properties('username'))
         res = self._ovfservice.get_admin_username()
-        mock_get_ovf_env.assert_called_once_with()
         self.assertEqual(res, str(id(mock.sentinel.value)))
 
-    @mock.patch(MODPATH + "._get_ovf_env")
-    def test_get_admin_password(self, mock_get_ovf_env):
-        mock_ovf_env = mock.Mock()
-        mock_get_ovf_env.return_value = mock_ovf_env
-        mock_ovf_env.Environment.PropertySection.Property = \
-            self._get_test_properties('password')
-
+    def test_get_admin_password(self):
+        self._set_ovf_env(self._get_test_properties('password'))
         res = self._ovfservice.get_admin_password()
-        mock_get_ovf_env.assert_called_once_with()
         self.assertEqual(res, str(id(mock.sentinel.value)))
 
+    def test_get_property_value_duplicated(self):
+        self._set_ovf_env([('hostname', 'first'), ('hostname', 'second')])
+        with self._logsnatcher:
+            res = self._ovfservice.get_host_name()
+        self.assertEqual('first', res)
+        self.assertEqual(["Expected one value for property hostname, found "
+                          "more. Returning first one"],
+                         self._logsnatcher.output)
+
+    def test_get_public_keys_multiple(self):
+        self._set_ovf_env([('public-keys', ' key1 '), ('hostname', 'fake'),
+                           ('public-keys', ''), ('public-keys', 'key2')])
+        self.assertEqual(['key1', 'key2'], self._ovfservice.get_public_keys())
+        # The index is not changed by its callers.
+        self._ovfservice.get_public_keys().append('key3')
+        self.assertEqual(['key1', 'key2'], self._ovfservice.get_public_keys())
+
+    def test_get_property_values_no_property_section(self):
+        self._set_ovf_env(None, ovf_env_xml=b"<Environment/>")
+        with self._logsnatcher:
+            res = self._ovfservice.get_public_keys()
+        self.assertEqual([], res)
+        self.assertEqual(["PropertySection not found in ovf file",
+                          "PropertySection in ovf file has no Property "
+                          "elements"], self._logsnatcher.output)
+
+    def test_index_properties_namespace(self):
+        properties = [('hostname', 'fake'), ('instance-id', 'fake-id')]
+        self._set_ovf_env(properties)
+        with testutils.ConfPatcher('ns', 'other', group='ovf'):
+            self.assertEqual({}, self._ovfservice._get_properties())
+
     def _get_test_properties(self, property_name, is_encoded=False):
         tested_prop = self._get_tested_property(property_name, is_encoded)
         another_prop = self._get_another_property('AnotherProperty')
@@ -166,12 +188,10 @@ class OvfServiceTest(unittest.TestCase):
         if not is_encoded:
             value = str(id(mock.sentinel.value))
         else:
-            value = base64.b64encode(str(id(mock.sentinel.value)).encode())
+            value = base64.b64encode(
+                str(id(mock.sentinel.value)).encode()).decode()
 
-        return {'oe:key': property_name, 'oe:value': value}
+        return (property_name, value)
 
     def _get_another_property(self, property_name):
-        return {
-            'oe:key': property_name,
-            'oe:value': str(id(mock.sentinel.another_value))
-        }
+        return (property_name, str(id(mock.sentinel.another_value)))
@@ -12,6 +12,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+import time
 import unittest
 
 try:
@@ -19,10 +21,15 @@ try:
 except ImportError:
     import mock
 
+from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit import exception
 from cloudbaseinit.metadata import factory
+from cloudbaseinit.metadata import hints
+from cloudbaseinit.tests.metadata import test_hints
 from cloudbaseinit.tests import testutils
 
+CONF = cloudbaseinit_conf.CONF
+
 
 class MetadataServiceFactoryTests(unittest.TestCase):
 
@@ -54,3 +61,254 @@ class MetadataServiceFactoryTests(unittest.TestCase):
         with testutils.LogSnatcher('cloudbaseinit.metadata.'
                                    'factory'):
             self._test_get_metadata_service(load_exception=True)
+
+    @mock.patch('cloudbaseinit.metadata.fingerprint.order_services')
+    def test_get_service_class_paths_fingerprint(self, mock_order_services):
+        mock_order_services.return_value = []
+        with testutils.ConfPatcher('metadata_services_fingerprint', True):
+            class_paths = factory._get_service_class_paths(
+                mock.sentinel.fingerprint)
+
+        mock_order_services.assert_called_once_with(
+            CONF.metadata_services, mock.sentinel.fingerprint)
+        self.assertEqual(mock_order_services.return_value, class_paths)
+
+    def test_get_service_class_paths_hints(self):
+        mock_hints = mock.Mock()
+        mock_hints.order_services.return_value = []
+
+        class_paths = factory._get_service_class_paths(
+            discovery_hints=mock_hints)
+
+        mock_hints.order_services.assert_called_once_with(
+            CONF.metadata_services)
+        self.assertEqual(mock_hints.order_services.return_value, class_paths)
+
+    def test_get_service_class_paths(self):
+        self.assertEqual(CONF.metadata_services,
+                         factory._get_service_class_paths())
+
+    @mock.patch('cloudbaseinit.metadata.fingerprint.get_fingerprint')
+    def test_get_fingerprint(self, mock_get_fingerprint):
+        self.assertIsNone(factory._get_fingerprint())
+        with testutils.ConfPatcher('metadata_discovery_hints', True):
+            self.assertEqual(mock_get_fingerprint.return_value,
+                             factory._get_fingerprint())
+
+    @mock.patch('cloudbaseinit.metadata.fingerprint.get_fingerprint')
+    def test_get_fingerprint_fails(self, mock_get_fingerprint):
+        mock_get_fingerprint.side_effect = Exception("failed")
+        with testutils.ConfPatcher('metadata_services_fingerprint', True):
+            with testutils.LogSnatcher('cloudbaseinit.metadata.factory'):
+                self.assertIsNone(factory._get_fingerprint())
+
+
+class DiscoveryHintsMetadataServiceFactoryTests(unittest.TestCase):
+
+    @mock.patch('cloudbaseinit.metadata.hints.get_discovery_hints')
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    def _test_get_metadata_service(self, mock_load_class,
+                                   mock_get_discovery_hints,
+                                   parallel=False):
+        services = [FakeService("first", False), FakeService("second", True),
+                    FakeService("third", True)]
+        mock_load_class.side_effect = [lambda service=service: service
+                                       for service in services]
+        mock_hints = mock_get_discovery_hints.return_value
+        mock_hints.order_services.side_effect = lambda class_paths: (
+            class_paths)
+        class_paths = [service.name for service in services]
+        with testutils.ConfPatcher('metadata_services', class_paths):
+            with testutils.ConfPatcher(
+                    'metadata_services_parallel_discovery', parallel):
+                service = factory.get_metadata_service()
+
+        self.assertIs(services[1], service)
+        mock_get_discovery_hints.assert_called_once_with(None)
+        mock_hints.set_discovery_result.assert_called_once_with(
+            "second", ["first"])
+        mock_hints.save.assert_called_once_with()
+
+    def test_get_metadata_service(self):
+        self._test_get_metadata_service()
+
+    def test_get_metadata_service_parallel(self):
+        self._test_get_metadata_service(parallel=True)
+
+    @mock.patch('cloudbaseinit.metadata.fingerprint.get_fingerprint')
+    @mock.patch('cloudbaseinit.metadata.fingerprint.get_hardware_id')
+    @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    def test_get_metadata_service_keeps_config_drive_hint(
+            self, mock_load_class, mock_get_os_utils, mock_get_hardware_id,
+            mock_get_fingerprint):
+        osutils = test_hints.FakeOSUtils()
+        mock_get_os_utils.return_value = osutils
+        mock_get_hardware_id.return_value = "hardware id"
+
+        def load():
+            # Recorded through its own instance, like ConfigDriveService.
+            hints.get_stored_hints().set_config_drive("iso", "cdrom")
+            return True
+
+        service = FakeService("config drive", True)
+        service.load = load
+        mock_load_class.return_value = lambda: service
+        with testutils.ConfPatcher('metadata_discovery_hints', True), \
+                testutils.ConfPatcher('metadata_services',
+                                      ["config drive"]):
+            self.assertIs(service, factory.get_metadata_service())
+            stored_hints = hints.get_discovery_hints()
+
+        self.assertEqual("config drive", stored_hints.service)
+        self.assertEqual(("iso", "cdrom"), stored_hints.config_drive)
+
+
+class DeadlineMetadataServiceFactoryTests(unittest.TestCase):
+
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    def _get_metadata_service(self, services, mock_load_class,
+                              parallel=False):
+        mock_load_class.side_effect = [lambda service=service: service
+                                       for service in services]
+        class_paths = [service.name for service in services]
+        with testutils.ConfPatcher('metadata_services', class_paths):
+            with testutils.ConfPatcher(
+                    'metadata_services_parallel_discovery', parallel):
+                with testutils.ConfPatcher('metadata_discovery_deadline',
+                                           0.1):
+                    with testutils.LogSnatcher(
+                            'cloudbaseinit.metadata.factory') as snatcher:
+                        try:
+                            service = factory.get_metadata_service()
+                        except exception.MetadaNotFoundException:
+                            service = None
+        return service, snatcher.output
+
+    def test_get_metadata_service_deadline(self):
+        event = threading.Event()
+        first = FakeService("first", True, event)
+        second = FakeService("second", True)
+        second.load = mock.Mock()
+
+        service, logging = self._get_metadata_service([first, second])
+        event.set()
+
+        # The deadline covers the whole discovery, not each service.
+        self.assertIsNone(service)
+        self.assertFalse(second.load.called)
+        self.assertTrue([message for message in logging if message.startswith(
+            "Abandoning metadata service 'first'")])
+        self.assertIn("Metadata discovery deadline reached, not probing: "
+                      "['second']", logging)
+        self.assertTrue(first.cleaned_up.wait(5))
+
+    def test_get_metadata_service_deadline_failed_services(self):
+        first = FakeService("first", False)
+        first.load = lambda: time.sleep(0.1)
+        second = FakeService("second", True)
+        second.load = mock.Mock()
+
+        service, _ = self._get_metadata_service([first, second])
+
+        self.assertIsNone(service)
+        self.assertFalse(second.load.called)
+
+    def test_get_metadata_service_deadline_parallel(self):
+        event = threading.Event()
+        first = FakeService("first", True, event)
+        second = FakeService("second", True)
+
+        service, logging = self._get_metadata_service(
+            [first, second], parallel=True)
+        event.set()
+
+        self.assertIs(second, service)
+        self.assertTrue([message for message in logging if message.startswith(
+            "Abandoning metadata service 'first'")])
+        self.assertTrue(first.cleaned_up.wait(5))
+        self.assertFalse(second.cleaned_up.is_set())
+
+    def test_get_metadata_service_deadline_not_reached(self):
+        service = FakeService("first", True)
+
+        loaded_service, logging = self._get_metadata_service([service])
+
+        self.assertIs(service, loaded_service)
+        self.assertIn("Probing metadata service 'first' took", logging[0])
+
+
+class FakeService(object):
+
+    def __init__(self, name, loaded, event=None):
+        self.name = name
+        self.loaded = loaded
+        self.event = event
+        self.cleaned_up = threading.Event()
+
+    def get_name(self):
+        return self.name
+
+    def load(self):
+        if self.event:
+            self.event.wait(5)
+        if isinstance(self.loaded, Exception):
+            raise self.loaded
+        return self.loaded
+
+    def cleanup(self):
+        self.cleaned_up.set()
+
+
+class ParallelMetadataServiceFactoryTests(unittest.TestCase):
+
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    def _get_metadata_service(self, services, mock_load_class):
+        mock_load_class.side_effect = [lambda service=service: service
+                                       for service in services]
+        class_paths = [service.name for service in services]
+        with testutils.ConfPatcher('metadata_services', class_paths):
+            with testutils.ConfPatcher(
+                    'metadata_services_parallel_discovery', True):
+                return factory.get_metadata_service()
+
+    def test_get_metadata_service_priority(self):
+        event = threading.Event()
+        first = FakeService("first", True, event)
+        second = FakeService("second", True)
+
+        threading.Timer(0.1, event.set).start()
+        service = self._get_metadata_service([first, second])
+
+        self.assertIs(first, service)
+        self.assertTrue(second.cleaned_up.wait(5))
+        self.assertFalse(first.cleaned_up.is_set())
+
+    def test_get_metadata_service_fallback(self):
+        first = FakeService("first", Exception("failed"))
+        second = FakeService("second", False)
+        third = FakeService("third", True)
+
+        with testutils.LogSnatcher('cloudbaseinit.metadata.factory'):
+            service = self._get_metadata_service([first, second, third])
+
+        self.assertIs(third, service)
+        self.assertFalse(third.cleaned_up.is_set())
+
+    def test_get_metadata_service_late_loser_cleanup(self):
+        event = threading.Event()
+        first = FakeService("first", True)
+        second = FakeService("second", True, event)
+
+        service = self._get_metadata_service([first, second])
+        event.set()
+
+        self.assertIs(first, service)
+        self.assertTrue(second.cleaned_up.wait(5))
+
+    def test_get_metadata_service_not_found(self):
+        services = [FakeService("first", False),
+                    FakeService("second", False)]
+
+        self.assertRaises(exception.MetadaNotFoundException,
+                          self._get_metadata_service, services)
@@ -0,0 +1,131 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit.metadata import fingerprint
+from cloudbaseinit.utils import dmi
+
+SERVICES = [
+    fingerprint.OPENSTACK_HTTP_SERVICE,
+    fingerprint.CONFIG_DRIVE_SERVICE,
+    fingerprint.EC2_SERVICE,
+    "cloudbaseinit.metadata.services.maasservice.MaaSHttpService",
+    fingerprint.AZURE_SERVICE,
+]
+
+
+class FingerprintTest(unittest.TestCase):
+
+    def setUp(self):
+        self._sysfs_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._sysfs_path)
+        self._dmi_source = dmi.SysfsDMISource(self._sysfs_path)
+        self._osutils = mock.Mock(spec=[])
+
+    def _set_dmi_info(self, **dmi_info):
+        for field, value in dmi_info.items():
+            with open(os.path.join(self._sysfs_path, field), "w") as stream:
+                stream.write(value + "\n")
+
+    def _get_fingerprint(self):
+        return fingerprint.get_fingerprint(self._dmi_source, self._osutils)
+
+    def test_get_fingerprint_azure(self):
+        self._set_dmi_info(
+            sys_vendor="Microsoft Corporation",
+            chassis_asset_tag=fingerprint.AZURE_CHASSIS_ASSET_TAG)
+
+        platform_fingerprint = self._get_fingerprint()
+
+        self.assertEqual(fingerprint.PLATFORM_AZURE,
+                         platform_fingerprint.platform)
+        self.assertEqual("Microsoft Corporation",
+                         platform_fingerprint.dmi_info[dmi.SYS_VENDOR])
+        self.assertEqual(frozenset(), platform_fingerprint.hints)
+
+    def test_get_fingerprint_ec2(self):
+        self._set_dmi_info(product_uuid="EC2E1916-9099-7CAF-FD21-012345ABCDEF")
+        self.assertEqual(fingerprint.PLATFORM_EC2,
+                         self._get_fingerprint().platform)
+
+    def test_get_fingerprint_openstack(self):
+        self._set_dmi_info(sys_vendor="OpenStack Foundation",
+                           product_name="OpenStack Nova")
+        self.assertEqual(fingerprint.PLATFORM_OPENSTACK,
+                         self._get_fingerprint().platform)
+
+    def test_get_fingerprint_unknown(self):
+        self._set_dmi_info(sys_vendor="QEMU")
+        self.assertIsNone(self._get_fingerprint().platform)
+
+    @mock.patch('os.path.exists')
+    def test_get_fingerprint_local_hints(self, mock_exists):
+        self._osutils = mock.Mock()
+        self._osutils.get_logical_drives.return_value = ["C:\\", "D:\\",
+                                                         "E:\\"]
+        self._osutils.get_volume_label.side_effect = [None, "CONFIG-2", None]
+        mock_exists.side_effect = [False, False, True]
+
+        platform_fingerprint = self._get_fingerprint()
+
+        self.assertEqual(frozenset([fingerprint.HINT_CONFIG_DRIVE,
+                                    fingerprint.HINT_AZURE_OVF]),
+                         platform_fingerprint.hints)
+        self.assertEqual(fingerprint.PLATFORM_AZURE,
+                         platform_fingerprint.platform)
+
+    def test_get_hardware_id(self):
+        self._set_dmi_info(product_uuid="fake uuid")
+        hardware_id = fingerprint.get_hardware_id(self._get_fingerprint())
+        self.assertEqual(hardware_id, fingerprint.get_hardware_id(
+            self._get_fingerprint()))
+
+        self._set_dmi_info(product_uuid="other uuid")
+        self.assertNotEqual(hardware_id, fingerprint.get_hardware_id(
+            self._get_fingerprint()))
+
+    def _test_order_services(self, expected_services, platform=None,
+                             hints=()):
+        platform_fingerprint = fingerprint.Fingerprint(
+            dmi_info={}, hints=frozenset(hints), platform=platform)
+        self.assertEqual(expected_services, fingerprint.order_services(
+            SERVICES, platform_fingerprint))
+
+    def test_order_services_unknown_platform(self):
+        self._test_order_services(SERVICES)
+
+    def test_order_services_azure(self):
+        self._test_order_services(
+            [SERVICES[4], SERVICES[0], SERVICES[1], SERVICES[3]],
+            platform=fingerprint.PLATFORM_AZURE)
+
+    def test_order_services_openstack(self):
+        self._test_order_services(
+            [SERVICES[1], SERVICES[0], SERVICES[3]],
+            platform=fingerprint.PLATFORM_OPENSTACK)
+
+    def test_order_services_config_drive_hint(self):
+        self._test_order_services(
+            [SERVICES[1], SERVICES[0], SERVICES[2], SERVICES[3],
+             SERVICES[4]],
+            hints=[fingerprint.HINT_CONFIG_DRIVE])
@@ -0,0 +1,134 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit.metadata import hints
+from cloudbaseinit.tests import testutils
+
+
+class FakeOSUtils(object):
+
+    def __init__(self):
+        self.values = {}
+
+    def get_config_value(self, name, section=None):
+        return self.values.get((section, name))
+
+    def set_config_value(self, name, value, section=None):
+        self.values[(section, name)] = value
+
+
+class DiscoveryHintsTest(unittest.TestCase):
+
+    def setUp(self):
+        self._osutils = FakeOSUtils()
+
+    def _get_hints(self, hardware_id="hardware id"):
+        return hints.DiscoveryHints(self._osutils).load(hardware_id)
+
+    def test_load_empty(self):
+        discovery_hints = self._get_hints()
+
+        self.assertIsNone(discovery_hints.service)
+        self.assertEqual([], discovery_hints.failed_services)
+        self.assertIsNone(discovery_hints.config_drive)
+        self.assertEqual("hardware id", self._osutils.values[
+            (hints.HINTS_CONFIG_SECTION, hints.HARDWARE_ID)])
+
+    def test_save_and_load(self):
+        discovery_hints = self._get_hints()
+        discovery_hints.set_discovery_result("winner", ["failed1", "failed2"])
+        discovery_hints.save()
+        discovery_hints.set_config_drive("iso", "cdrom")
+
+        discovery_hints = self._get_hints()
+
+        self.assertEqual("winner", discovery_hints.service)
+        self.assertEqual(["failed1", "failed2"],
+                         discovery_hints.failed_services)
+        self.assertEqual(("iso", "cdrom"), discovery_hints.config_drive)
+
+    def test_save_keeps_fields_of_other_instances(self):
+        discovery_hints = self._get_hints()
+        hints.DiscoveryHints(self._osutils).read().set_config_drive(
+            "iso", "cdrom")
+        discovery_hints.set_discovery_result("winner", [])
+        discovery_hints.save()
+
+        discovery_hints = self._get_hints()
+        self.assertEqual("winner", discovery_hints.service)
+        self.assertEqual(("iso", "cdrom"), discovery_hints.config_drive)
+
+    def test_load_hardware_changed(self):
+        discovery_hints = self._get_hints()
+        discovery_hints.set_discovery_result("winner", ["failed"])
+        discovery_hints.save()
+        discovery_hints.set_config_drive("iso", "cdrom")
+
+        with testutils.LogSnatcher('cloudbaseinit.metadata.hints') as snatcher:
+            discovery_hints = self._get_hints("new hardware id")
+
+        self.assertIsNone(discovery_hints.service)
+        self.assertEqual([], discovery_hints.failed_services)
+        self.assertIsNone(discovery_hints.config_drive)
+        self.assertEqual(["The hardware changed, discarding the metadata "
+                          "discovery hints"], snatcher.output)
+        self.assertIsNone(hints.DiscoveryHints(self._osutils).read().service)
+
+    def test_order_services(self):
+        discovery_hints = self._get_hints()
+        discovery_hints.set_discovery_result("third", ["first"])
+
+        self.assertEqual(
+            ["third", "second", "fourth", "first"],
+            discovery_hints.order_services(
+                ["first", "second", "third", "fourth"]))
+
+    @mock.patch('cloudbaseinit.metadata.fingerprint.get_hardware_id')
+    @mock.patch('cloudbaseinit.metadata.hints.DiscoveryHints')
+    def test_get_discovery_hints(self, mock_hints, mock_get_hardware_id):
+        self.assertIsNone(hints.get_discovery_hints(mock.sentinel.fp))
+
+        with testutils.ConfPatcher('metadata_discovery_hints', True):
+            discovery_hints = hints.get_discovery_hints(mock.sentinel.fp)
+
+        mock_get_hardware_id.assert_called_once_with(mock.sentinel.fp)
+        mock_hints.return_value.load.assert_called_once_with(
+            mock_get_hardware_id.return_value)
+        self.assertEqual(mock_hints.return_value.load.return_value,
+                         discovery_hints)
+
+    @mock.patch('cloudbaseinit.metadata.fingerprint.get_hardware_id')
+    @mock.patch('cloudbaseinit.metadata.hints.DiscoveryHints')
+    def test_get_discovery_hints_not_supported(self, mock_hints,
+                                               mock_get_hardware_id):
+        mock_hints.return_value.load.side_effect = NotImplementedError
+        with testutils.ConfPatcher('metadata_discovery_hints', True):
+            self.assertIsNone(hints.get_discovery_hints(mock.sentinel.fp))
+
+    @mock.patch('cloudbaseinit.metadata.hints.DiscoveryHints')
+    def test_get_stored_hints(self, mock_hints):
+        self.assertIsNone(hints.get_stored_hints())
+
+        with testutils.ConfPatcher('metadata_discovery_hints', True):
+            discovery_hints = hints.get_stored_hints()
+
+        self.assertEqual(mock_hints.return_value.read.return_value,
+                         discovery_hints)
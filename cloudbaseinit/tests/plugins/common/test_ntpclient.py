@@ -35,7 +35,7 @@ class NTPClientPluginTests(unittest.TestCase):
 
     @testutils.ConfPatcher("real_time_clock_utc", True)
     @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
-    @mock.patch('cloudbaseinit.utils.dhcp.get_dhcp_options')
+    @mock.patch('cloudbaseinit.utils.dhcpoptions.get_dhcp_options')
     @mock.patch(MODULE_PATH + '.NTPClientPlugin.verify_time_service')
     @mock.patch(MODULE_PATH + '.NTPClientPlugin._unpack_ntp_hosts')
     def _test_execute(self, mock_unpack_ntp_hosts,
@@ -55,7 +55,8 @@ class NTPClientPluginTests(unittest.TestCase):
         mock_get_os_utils.return_value = mock_osutils
         mock_osutils.get_dhcp_hosts_in_use.return_value = [(
             'fake friendly name', 'fake mac address', 'fake dhcp host')]
-        mock_get_dhcp_options.return_value = mock_options_data
+        mock_get_dhcp_options.return_value = {
+            'fake friendly name': mock_options_data}
         mock_options_data.get.return_value = ntp_data
 
         expected_logging = []
@@ -83,7 +84,9 @@ class NTPClientPluginTests(unittest.TestCase):
         if use_dhcp_config:
             mock_osutils.get_dhcp_hosts_in_use.assert_called_once_with()
             mock_get_dhcp_options.assert_called_once_with(
-                'fake dhcp host', [dhcp.OPTION_NTP_SERVERS])
+                [dhcp.DHCPQuery('fake friendly name', 'fake mac address',
+                                'fake dhcp host')],
+                [dhcp.OPTION_NTP_SERVERS])
             mock_options_data.get.assert_called_once_with(
                 dhcp.OPTION_NTP_SERVERS)
             if ntp_data:
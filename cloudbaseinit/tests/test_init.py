@@ -226,6 +226,7 @@ class TestInitManager(unittest.TestCase):
     def test_handle_plugins_stage_stage_fails(self):
         self._test_handle_plugins_stage(success=False)
 
+    @mock.patch('cloudbaseinit.utils.dhcpoptions.get_stats')
     @mock.patch('cloudbaseinit.init.InitManager.'
                 '_reset_service_password_and_respawn')
     @mock.patch('cloudbaseinit.init.InitManager'
@@ -239,7 +240,7 @@ class TestInitManager(unittest.TestCase):
                              mock_get_os_utils, mock_load_plugins,
                              mock_get_version, mock_check_latest_version,
                              mock_handle_plugins_stage, mock_reset_service,
-                             expected_logging,
+                             mock_get_dhcp_options_stats, expected_logging,
                              version, name, instance_id, reboot=True,
                              last_stage=False):
         sys.platform = 'win32'
@@ -251,6 +252,8 @@ class TestInitManager(unittest.TestCase):
         mock_get_metadata_service.return_value = fake_service
         fake_service.get_name.return_value = name
         fake_service.get_instance_id.return_value = instance_id
+        fake_service.get_cache_stats.return_value = {}
+        mock_get_dhcp_options_stats.return_value = {}
         mock_handle_plugins_stage.side_effect = [(True, False), (True, False),
                                                  (last_stage, True)]
         stages = [
@@ -276,6 +279,10 @@ class TestInitManager(unittest.TestCase):
         fake_service.get_name.assert_called_once_with()
         fake_service.get_instance_id.assert_called_once_with()
         fake_service.cleanup.assert_called_once_with()
+        if CONF.metadata_prefetch:
+            fake_service.prefetch.assert_called_once_with(wait=False)
+        else:
+            self.assertFalse(fake_service.prefetch.called)
         mock_handle_plugins_stage.assert_has_calls(stage_calls)
         if reboot:
             self.osutils.reboot.assert_called_once_with()
@@ -291,6 +298,8 @@ class TestInitManager(unittest.TestCase):
             'Cloudbase-Init version: %s' % version,
             'Metadata service loaded: %r' % name,
             'Instance id: %s' % instance_id,
+            'Metadata cache statistics: {}',
+            'DHCP options cache statistics: {}',
         ]
         if CONF.metadata_report_provisioning_started:
             expected_logging.insert(2, 'Reporting provisioning started')
@@ -325,6 +334,11 @@ class TestInitManager(unittest.TestCase):
         self._test_configure_host_with_logging(
             extra_logging=['Reporting provisioning failed', 'Rebooting'])
 
+    @testutils.ConfPatcher('metadata_prefetch', True)
+    @testutils.ConfPatcher('allow_reboot', True)
+    def test_configure_host_metadata_prefetch(self):
+        self._test_configure_host_with_logging(extra_logging=['Rebooting'])
+
     @testutils.ConfPatcher('check_latest_version', False)
     @mock.patch('cloudbaseinit.version.check_latest_version')
     def test_configure_host(self, mock_check_last_version):
@@ -0,0 +1,115 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A local stand-in for a DHCP server."""
+
+import binascii
+import socket
+import struct
+import threading
+
+from cloudbaseinit.utils import dhcp
+
+
+def get_dhcp_reply_data(id_reply, mac_address, options):
+    """Get a DHCP offer with the given options, keyed by their code."""
+    data = struct.pack('!BBBBL', 2, 1, 6, 0, id_reply)
+    data += b'\x00' * 20
+    data += binascii.unhexlify(mac_address.replace(':', ''))
+    data += b'\x00' * (10 + 64 + 128)
+    data += dhcp._DHCP_COOKIE
+    data += b'\x35\x01\x02'
+    for code, value in sorted(options.items()):
+        data += struct.pack('!BB', code, len(value)) + value
+    return data + dhcp._OPTION_END
+
+
+def _parse_dhcp_request(data):
+    id_req = struct.unpack_from('!L', data, 4)[0]
+    mac_address = ':'.join('%02x' % byte for byte in bytearray(data[28:34]))
+    requested_options = []
+    i = 240
+    while i < len(data) and data[i:i + 1] != dhcp._OPTION_END:
+        code, length = struct.unpack_from('!BB', data, i)
+        if code == 0x37:
+            requested_options = list(bytearray(data[i + 2:i + 2 + length]))
+        i += 2 + length
+    return id_req, mac_address, requested_options
+
+
+class FakeDHCPServer(object):
+
+    """A UDP server replying with the options of the requesting MAC.
+
+    The DHCP client is expected to target the server's port, set as
+    the DHCP server port, replies being sent back to the request's
+    source address.
+
+    :param options: A dict with the options of each MAC address, as
+                    dicts keyed by the option code. The requests of
+                    other MAC addresses are not replied to.
+    :param delay: The number of seconds to wait before replying.
+    """
+
+    def __init__(self, options, delay=0):
+        self.options = options
+        self.delay = delay
+        self.requests = []
+        self.lock = threading.Lock()
+        self._timers = []
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(("127.0.0.1", 0))
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+
+    @property
+    def port(self):
+        return self._socket.getsockname()[1]
+
+    def _serve(self):
+        while True:
+            data, address = self._socket.recvfrom(4096)
+            if not data:
+                # Sent by __exit__.
+                return
+            id_req, mac_address, requested_options = _parse_dhcp_request(
+                data)
+            with self.lock:
+                self.requests.append((mac_address, requested_options))
+            options = self.options.get(mac_address)
+            if options is None:
+                continue
+            reply = get_dhcp_reply_data(
+                id_req, mac_address,
+                dict((code, value) for code, value in options.items()
+                     if code in requested_options))
+            timer = threading.Timer(self.delay, self._socket.sendto,
+                                    (reply, address))
+            self._timers.append(timer)
+            timer.start()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        stop = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            stop.sendto(b"", ("127.0.0.1", self.port))
+        finally:
+            stop.close()
+        self._thread.join()
+        for timer in self._timers:
+            timer.join()
+        self._socket.close()
@@ -0,0 +1,230 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Generate small ISO9660 images, with Joliet and Rock Ridge names."""
+
+import itertools
+import posixpath
+import struct
+
+from cloudbaseinit.utils import iso9660
+
+SECTOR_SIZE = iso9660.SECTOR_SIZE
+_ROCK_RIDGE_SP = b'SP\x07\x01\xbe\xef\x00'
+# The Rock Ridge entries recorded in each directory record.
+_ROCK_RIDGE_RR = b'RR\x05\x01\x08'
+
+
+def _both_endian(fmt, value):
+    return struct.pack('<' + fmt, value) + struct.pack('>' + fmt, value)
+
+
+def _get_record(name, extent, size, is_dir, system_use=b''):
+    name_padding = b'' if len(name) % 2 else b'\x00'
+    length = 33 + len(name) + len(name_padding) + len(system_use)
+    record = (struct.pack('<BB', length + length % 2, 0) +
+              _both_endian('I', extent) + _both_endian('I', size) +
+              b'\x00' * 7 + struct.pack('<BBB', 2 if is_dir else 0, 0, 0) +
+              _both_endian('H', 1) + struct.pack('<B', len(name)) +
+              name + name_padding + system_use)
+    return record + b'\x00' * (length % 2)
+
+
+def _get_nm_entry(name):
+    return b'NM' + struct.pack('<BBB', 5 + len(name), 1, 0) + name
+
+
+def _get_ce_entry(sector, length):
+    return (b'CE' + struct.pack('<BB', 28, 1) + _both_endian('I', sector) +
+            _both_endian('I', 0) + _both_endian('I', length))
+
+
+def _get_path_tables(root_extent):
+    """Get the little and big endian path tables, listing only the root."""
+    return (struct.pack('<BBIH2s', 1, 0, root_extent, 1, b'\x00'),
+            struct.pack('>BBIH2s', 1, 0, root_extent, 1, b'\x00'))
+
+
+def _get_volume_descriptor(descriptor_type, volume_size, root_record,
+                           path_table_sector, escape_sequences=b''):
+    descriptor = bytearray(SECTOR_SIZE)
+    descriptor[0:7] = struct.pack('<B', descriptor_type) + b'CD001\x01'
+    descriptor[40:72] = b'config-2'.ljust(32)
+    descriptor[80:88] = _both_endian('I', volume_size)
+    descriptor[88:88 + len(escape_sequences)] = escape_sequences
+    descriptor[120:124] = _both_endian('H', 1)
+    descriptor[124:128] = _both_endian('H', 1)
+    descriptor[128:132] = _both_endian('H', SECTOR_SIZE)
+    descriptor[132:140] = _both_endian('I', len(_get_path_tables(0)[0]))
+    descriptor[140:144] = struct.pack('<I', path_table_sector)
+    descriptor[148:152] = struct.pack('>I', path_table_sector + 1)
+    descriptor[156:190] = root_record
+    descriptor[881] = 1
+    return bytes(descriptor)
+
+
+def _get_sectors(size):
+    return (size + SECTOR_SIZE - 1) // SECTOR_SIZE
+
+
+class _Tree(object):
+
+    def __init__(self, directories, files_extents, files_sizes, get_name,
+                 rock_ridge, continuation):
+        self._directories = directories
+        self._files_extents = files_extents
+        self._files_sizes = files_sizes
+        self._get_name = get_name
+        self._rock_ridge = rock_ridge
+        self._continuation = continuation
+        self.extents = {}
+        self.sizes = {}
+        self.path_table_sector = None
+
+    def _get_system_use(self, name, parent, ce_sector):
+        if not self._rock_ridge:
+            return b''
+        if name is None:
+            return (b'' if parent else _ROCK_RIDGE_SP) + _ROCK_RIDGE_RR
+        nm_entry = _get_nm_entry(name.encode('utf-8'))
+        if ce_sector is None:
+            return _ROCK_RIDGE_RR + nm_entry
+        return _ROCK_RIDGE_RR + _get_ce_entry(ce_sector, len(nm_entry))
+
+    def _get_extent(self, path):
+        return self.extents.get(path, self._files_extents.get(path, 0))
+
+    def _get_size(self, path):
+        return self.sizes.get(path, self._files_sizes.get(path, 0))
+
+    def _get_records(self, path, ce_sectors):
+        get_extent = self._get_extent
+        get_size = self._get_size
+        records = [_get_record(b'\x00', get_extent(path), get_size(path),
+                               True, self._get_system_use(None, False, None)),
+                   _get_record(b'\x01', get_extent(posixpath.dirname(path)),
+                               get_size(posixpath.dirname(path)), True,
+                               self._get_system_use(None, True, None))]
+        for name, child, is_dir in self._directories[path]:
+            ce_sector = next(ce_sectors) if self._continuation else None
+            records.append(_get_record(
+                self._get_name(name, is_dir), get_extent(child),
+                get_size(child), is_dir,
+                self._get_system_use(name, False, ce_sector)))
+        return records
+
+    def _pack(self, records):
+        data = b''
+        for record in records:
+            used = len(data) % SECTOR_SIZE
+            if used + len(record) > SECTOR_SIZE:
+                data += b'\x00' * (SECTOR_SIZE - used)
+            data += record
+        return data + b'\x00' * (-len(data) % SECTOR_SIZE)
+
+    def _get_continuation_areas(self, path):
+        if not self._continuation:
+            return []
+        return [_get_nm_entry(name.encode('utf-8'))
+                for name, _, _ in self._directories[path]]
+
+    def layout(self, sector):
+        """Assign the extents, starting with the given sector.
+
+        The path tables come first, followed by the directories, each
+        one followed by the Rock Ridge continuation areas of its entries.
+        """
+        self.path_table_sector = sector
+        sector += 2
+        for path in sorted(self._directories):
+            # The extents do not change the size of the records.
+            self.sizes[path] = len(self._pack(
+                self._get_records(path, itertools.repeat(0))))
+            self.extents[path] = sector
+            sector += (_get_sectors(self.sizes[path]) +
+                       len(self._get_continuation_areas(path)))
+        return sector
+
+    def get_data(self):
+        data = b''.join(table + b'\x00' * (SECTOR_SIZE - len(table))
+                        for table in _get_path_tables(self.extents['']))
+        for path in sorted(self._directories):
+            ce_sectors = itertools.count(
+                self.extents[path] + _get_sectors(self.sizes[path]))
+            data += self._pack(self._get_records(path, ce_sectors))
+            data += b''.join(area + b'\x00' * (SECTOR_SIZE - len(area))
+                             for area in self._get_continuation_areas(path))
+        return data
+
+
+def _get_primary_name(name, is_dir):
+    name = name.upper().encode('ascii', 'replace')
+    return name if is_dir else name + b';1'
+
+
+def _get_joliet_name(name, is_dir):
+    return (name if is_dir else name + ';1').encode('utf-16-be')
+
+
+def get_iso_image(files, joliet=True, rock_ridge=True, continuation=False):
+    """Get an ISO9660 image holding the given files.
+
+    :param files: A dict with the content of the files, as bytes, keyed
+                  by their path, e.g. "openstack/latest/meta_data.json".
+    :param continuation: Store the Rock Ridge names in continuation
+                         areas, instead of the directory records.
+    """
+    directories = {'': []}
+    for path in sorted(files):
+        parent = ''
+        for name in path.split('/')[:-1]:
+            child = posixpath.join(parent, name)
+            if child not in directories:
+                directories[child] = []
+                directories[parent].append((name, child, True))
+            parent = child
+        directories[parent].append((posixpath.basename(path), path, False))
+
+    files_extents = {}
+    files_sizes = dict((path, len(data)) for path, data in files.items())
+    trees = [_Tree(directories, files_extents, files_sizes,
+                   _get_primary_name, rock_ridge, continuation)]
+    if joliet:
+        trees.append(_Tree(directories, files_extents, files_sizes,
+                           _get_joliet_name, False, False))
+
+    # The volume descriptors, followed by the directories and the files.
+    sector = 16 + len(trees) + 1
+    for tree in trees:
+        sector = tree.layout(sector)
+    for path in sorted(files):
+        files_extents[path] = sector
+        sector += _get_sectors(len(files[path]))
+
+    descriptors = []
+    for tree, descriptor_type, escape_sequences in zip(
+            trees, (1, 2), (b'', b'%/E')):
+        root_record = _get_record(b'\x00', tree.extents[''],
+                                  tree.sizes[''], True)
+        descriptors.append(_get_volume_descriptor(
+            descriptor_type, sector, root_record, tree.path_table_sector,
+            escape_sequences))
+    descriptors.append(b'\xffCD001\x01'.ljust(SECTOR_SIZE, b'\x00'))
+
+    data = b'\x00' * (16 * SECTOR_SIZE) + b''.join(descriptors)
+    for tree in trees:
+        data += tree.get_data()
+    for path in sorted(files):
+        data += files[path] + b'\x00' * (-len(files[path]) % SECTOR_SIZE)
+    return data
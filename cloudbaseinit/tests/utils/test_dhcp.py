@@ -23,6 +23,7 @@ except ImportError:
     import mock
 
 from cloudbaseinit.tests import testutils
+from cloudbaseinit.tests.utils import fake_dhcp
 from cloudbaseinit.utils import dhcp
 
 
@@ -63,59 +64,55 @@ class DHCPUtilsTests(unittest.TestCase):
             requested_options=[100], vendor_id='fake id')
         self.assertEqual(data, response)
 
-    @mock.patch('struct.unpack')
-    def _test_parse_dhcp_reply(self, mock_unpack, message_type,
-                               id_reply, equals_cookie):
-        fake_data = 236 * b"1"
-        if equals_cookie:
-            fake_data += dhcp._DHCP_COOKIE + b'11'
-        else:
-            fake_data += b'111111'
-        fake_data += b'fake'
-        fake_data += dhcp._OPTION_END
+    def test_get_dhcp_request_data_no_vendor_id(self):
+        response = dhcp._get_dhcp_request_data(
+            id_req=9999, mac_address='01:02:03:04:05:06',
+            requested_options=[26, 42], vendor_id=None)
 
-        mock_unpack.side_effect = [(message_type, None), (id_reply, None),
-                                   (100, None), (4, None)]
+        self.assertEqual(b'\x35\x01\x01\x3d\x07\x01\x01\x02\x03\x04'
+                         b'\x05\x06\x37\x02\x1a\x2a\xff',
+                         bytes(response[240:]))
 
-        response = dhcp._parse_dhcp_reply(data=fake_data, id_req=9999)
+    def test_parse_dhcp_reply(self):
+        data = fake_dhcp.get_dhcp_reply_data(
+            9999, '01:02:03:04:05:06', {100: b'fake', 26: b'\x05\xdc'})
+        # pad options are not followed by a length
+        data = data[:243] + b'\x00\x00' + data[243:]
 
-        if message_type != 2:
-            self.assertEqual((False, {}), response)
-        elif id_reply != 9999:
-            self.assertEqual((False, {}), response)
-        elif fake_data[236:240] != dhcp._DHCP_COOKIE:
-            self.assertEqual((False, {}), response)
-        else:
-            self.assertEqual((True, {100: b'fake'}), response)
+        response = dhcp._parse_dhcp_reply(memoryview(data))
 
-    def test_parse_dhcp_reply(self):
-        self._test_parse_dhcp_reply(message_type=2, id_reply=9999,
-                                    equals_cookie=True)
+        self.assertEqual((9999, {53: b'\x02', 26: b'\x05\xdc',
+                                 100: b'fake'}), response)
 
-    def test_parse_dhcp_reply_false(self):
-        self._test_parse_dhcp_reply(message_type=2, id_reply=111,
-                                    equals_cookie=True)
+    def test_parse_dhcp_reply_truncated(self):
+        data = fake_dhcp.get_dhcp_reply_data(
+            9999, '01:02:03:04:05:06', {100: b'fake'})
 
-    def test_parse_dhcp_reply_cookie_false(self):
-        self._test_parse_dhcp_reply(message_type=2, id_reply=9999,
-                                    equals_cookie=False)
+        self.assertEqual((9999, {53: b'\x02', 100: b'fa'}),
+                         dhcp._parse_dhcp_reply(data[:-3]))
+        self.assertEqual((9999, {53: b'\x02'}),
+                         dhcp._parse_dhcp_reply(data[:244]))
+
+    def _test_parse_dhcp_reply_invalid(self, offset, value):
+        data = bytearray(fake_dhcp.get_dhcp_reply_data(
+            9999, '01:02:03:04:05:06', {100: b'fake'}))
+        data[offset:offset + len(value)] = value
 
-    def test_parse_dhcp_reply_other_message_type(self):
-        self._test_parse_dhcp_reply(message_type=3, id_reply=9999,
-                                    equals_cookie=True)
+        self.assertEqual((None, {}), dhcp._parse_dhcp_reply(data))
 
-    def test_parse_dhcp_reply_other_reply(self):
-        self._test_parse_dhcp_reply(message_type=3, id_reply=111,
-                                    equals_cookie=True)
+    def test_parse_dhcp_reply_request(self):
+        self._test_parse_dhcp_reply_invalid(0, b'\x01')
+
+    def test_parse_dhcp_reply_cookie_false(self):
+        self._test_parse_dhcp_reply_invalid(236, b'1111')
 
-    def test_parse_dhcp_reply_other_than_cookie(self):
-        self._test_parse_dhcp_reply(message_type=3, id_reply=111,
-                                    equals_cookie=False)
+    def test_parse_dhcp_reply_too_short(self):
+        self.assertEqual((None, {}), dhcp._parse_dhcp_reply(b'\x02'))
 
     @mock.patch('netifaces.ifaddresses')
     @mock.patch('netifaces.interfaces')
-    def test_get_mac_address_by_local_ip(self, mock_interfaces,
-                                         mock_ifaddresses):
+    def test_get_interface_by_local_ip(self, mock_interfaces,
+                                       mock_ifaddresses):
         fake_addresses = {}
         fake_addresses[netifaces.AF_INET] = [{'addr': 'fake address'}]
         fake_addresses[netifaces.AF_LINK] = [{'addr': 'fake mac'}]
@@ -123,57 +120,230 @@ class DHCPUtilsTests(unittest.TestCase):
         mock_interfaces.return_value = ['fake interface']
         mock_ifaddresses.return_value = fake_addresses
 
-        response = dhcp._get_mac_address_by_local_ip('fake address')
+        response = dhcp._get_interface_by_local_ip('fake address')
 
         mock_interfaces.assert_called_once_with()
         mock_ifaddresses.assert_called_once_with('fake interface')
-        self.assertEqual(fake_addresses[netifaces.AF_LINK][0]['addr'],
-                         response)
+        self.assertEqual(('fake interface', 'fake mac'), response)
+        self.assertEqual((None, None),
+                         dhcp._get_interface_by_local_ip('other address'))
+
+    @mock.patch('cloudbaseinit.utils.dhcp._get_interface_by_local_ip')
+    @mock.patch('cloudbaseinit.utils.network.get_local_ip')
+    def test_get_dhcp_query(self, mock_get_local_ip,
+                            mock_get_interface_by_local_ip):
+        mock_get_interface_by_local_ip.return_value = ('eth0', 'fake mac')
+
+        self.assertEqual(
+            dhcp.DHCPQuery('eth0', 'fake mac', mock.sentinel.dhcp_host),
+            dhcp.get_dhcp_query(mock.sentinel.dhcp_host))
+        mock_get_local_ip.assert_called_once_with(mock.sentinel.dhcp_host)
+        mock_get_interface_by_local_ip.assert_called_once_with(
+            mock_get_local_ip.return_value)
+
+    @mock.patch('netifaces.ifaddresses')
+    @mock.patch('netifaces.interfaces')
+    def test_get_dhcp_queries(self, mock_interfaces, mock_ifaddresses):
+        addresses = {
+            'lo': {netifaces.AF_INET: [{'addr': '127.0.0.1'}],
+                   netifaces.AF_LINK: [{'addr': '00:00:00:00:00:00'}]},
+            'eth0': {netifaces.AF_INET: [{'addr': '10.0.0.5'}],
+                     netifaces.AF_LINK: [{'addr': '01:02:03:04:05:06'}]},
+            'eth1': {netifaces.AF_LINK: [{'addr': '01:02:03:04:05:07'}]},
+        }
+        mock_interfaces.return_value = ['lo', 'eth0', 'eth1']
+        mock_ifaddresses.side_effect = addresses.get
+
+        self.assertEqual(
+            [dhcp.DHCPQuery('eth0', '01:02:03:04:05:06', None)],
+            dhcp._get_dhcp_queries())
+
+    def test_send_dhcp_requests(self):
+        queries = [dhcp.DHCPQuery('eth0', '01:02:03:04:05:06', None),
+                   dhcp.DHCPQuery('eth1', '01:02:03:04:05:07', '10.1.0.1')]
+        mock_socket = mock.Mock()
+
+        pending = dhcp._send_dhcp_requests(mock_socket, queries, [], None)
+
+        # The broadcast requests go to 255.255.255.255, as the directed
+        # broadcasts are dropped by many networks and DHCP relays.
+        self.assertEqual(
+            [('<broadcast>', dhcp._DHCP_SERVER_PORT),
+             ('10.1.0.1', dhcp._DHCP_SERVER_PORT)],
+            [call[0][1] for call in mock_socket.sendto.call_args_list])
+        self.assertEqual(['eth0', 'eth1'], sorted(pending.values()))
+
+    @mock.patch('sys.platform', 'linux')
+    def test_tie_socket_to_interface_linux(self):
+        mock_socket = mock.Mock()
+        with mock.patch.object(socket, 'SO_BINDTODEVICE', 25, create=True):
+            self.assertEqual(
+                '', dhcp._tie_socket_to_interface(mock_socket, 'eth0'))
+
+        mock_socket.setsockopt.assert_called_once_with(
+            socket.SOL_SOCKET, 25, b'eth0')
 
-    @mock.patch('random.randint')
+    @mock.patch('netifaces.ifaddresses')
+    @mock.patch('sys.platform', 'win32')
+    def test_tie_socket_to_interface(self, mock_ifaddresses):
+        addresses = {
+            'eth0': {netifaces.AF_INET: [{'addr': '10.0.0.5',
+                                          'broadcast': '10.0.0.255'}]},
+        }
+
+        def ifaddresses(iface):
+            if iface not in addresses:
+                raise ValueError(iface)
+            return addresses[iface]
+        mock_ifaddresses.side_effect = ifaddresses
+        mock_socket = mock.Mock()
+
+        self.assertEqual(
+            '10.0.0.5', dhcp._tie_socket_to_interface(mock_socket, 'eth0'))
+        self.assertEqual(
+            '', dhcp._tie_socket_to_interface(mock_socket, 'missing'))
+        self.assertFalse(mock_socket.setsockopt.called)
+
+    @mock.patch('cloudbaseinit.utils.dhcp._tie_socket_to_interface')
+    @mock.patch('cloudbaseinit.utils.dhcp._bind_dhcp_client_socket')
     @mock.patch('socket.socket')
-    @mock.patch('cloudbaseinit.utils.dhcp._get_mac_address_by_local_ip')
-    @mock.patch('cloudbaseinit.utils.dhcp._get_dhcp_request_data')
-    @mock.patch('cloudbaseinit.utils.dhcp._parse_dhcp_reply')
-    def test_get_dhcp_options(self, mock_parse_dhcp_reply,
-                              mock_get_dhcp_request_data,
-                              mock_get_mac_address_by_local_ip, mock_socket,
-                              mock_randint):
-        mock_randint.return_value = 'fake int'
-        mock_socket().getsockname.return_value = ['fake local ip']
-        mock_get_mac_address_by_local_ip.return_value = 'fake mac'
-        mock_get_dhcp_request_data.return_value = 'fake data'
-        mock_parse_dhcp_reply.return_value = (True, 'fake replied options')
-
-        response = dhcp.get_dhcp_options(
-            dhcp_host='fake host', requested_options=['fake option'])
-
-        mock_randint.assert_called_once_with(0, 2 ** 32 - 1)
-        mock_socket.assert_called_with(socket.AF_INET, socket.SOCK_DGRAM)
-        mock_socket().setsockopt.assert_called_once_with(
-            socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        mock_socket().bind.assert_called_once_with(('', 68))
-        mock_socket().settimeout.assert_called_once_with(5)
-        mock_socket().getsockname.assert_called_once_with()
-        mock_get_mac_address_by_local_ip.assert_called_once_with(
-            'fake local ip')
-        mock_get_dhcp_request_data.assert_called_once_with('fake int',
-                                                           'fake mac',
-                                                           ['fake option'],
-                                                           'cloudbase-init')
-        mock_socket().sendto.assert_called_once_with(
-            'fake data', ('fake host', 67))
-        mock_socket().recv.assert_called_once_with(1024)
-        mock_parse_dhcp_reply.assert_called_once_with(mock_socket().recv(),
-                                                      'fake int')
-        mock_socket().close.assert_called_once_with()
-        self.assertEqual('fake replied options', response)
+    def test_get_dhcp_options_by_interface_sockets(
+            self, mock_socket_class, mock_bind_dhcp_client_socket,
+            mock_tie_socket_to_interface):
+        sockets = [mock.Mock(), mock.Mock(), mock.Mock()]
+        mock_socket_class.side_effect = sockets
+        mock_tie_socket_to_interface.side_effect = ['10.0.0.5', '']
+        queries = [dhcp.DHCPQuery('eth0', '01:02:03:04:05:06', None),
+                   dhcp.DHCPQuery('eth1', '01:02:03:04:05:07', '10.1.0.1'),
+                   dhcp.DHCPQuery('eth2', '01:02:03:04:05:08', None),
+                   dhcp.DHCPQuery('eth3', '01:02:03:04:05:09', '10.1.0.1')]
+
+        with mock.patch('select.select', return_value=([], [], [])):
+            with testutils.LogSnatcher('cloudbaseinit.utils.dhcp'):
+                dhcp.get_dhcp_options_by_interface(queries, timeout=0.1)
+
+        # Each broadcast request is sent from a socket tied to its
+        # interface, the unicast requests share a socket.
+        self.assertEqual(
+            [mock.call(sockets[0], 'eth0'), mock.call(sockets[2], 'eth2')],
+            mock_tie_socket_to_interface.call_args_list)
+        self.assertEqual(
+            [mock.call(sockets[0], 10, 3, '10.0.0.5'),
+             mock.call(sockets[1], 10, 3, ''),
+             mock.call(sockets[2], 10, 3, '')],
+            mock_bind_dhcp_client_socket.call_args_list)
+        self.assertEqual(
+            [[('<broadcast>', dhcp._DHCP_SERVER_PORT)],
+             [('10.1.0.1', dhcp._DHCP_SERVER_PORT)] * 2,
+             [('<broadcast>', dhcp._DHCP_SERVER_PORT)]],
+            [[call[0][1] for call in s.sendto.call_args_list]
+             for s in sockets])
+        self.assertFalse(sockets[1].setsockopt.call_args_list[1:])
+        for s in sockets:
+            s.close.assert_called_once_with()
+
+    def _get_dhcp_options(self, options, queries, delay=0, **kwargs):
+        with fake_dhcp.FakeDHCPServer(options, delay=delay) as server:
+            with mock.patch.object(dhcp, '_DHCP_SERVER_PORT', server.port):
+                with mock.patch.object(dhcp, '_DHCP_CLIENT_PORT', 0):
+                    response = dhcp.get_dhcp_options_by_interface(
+                        queries, **kwargs)
+        return server, response
+
+    def test_get_dhcp_options_by_interface(self):
+        options = {
+            '01:02:03:04:05:06': {dhcp.OPTION_MTU: b'\x05\xdc',
+                                  dhcp.OPTION_NTP_SERVERS: b'\x0a\x00\x00'
+                                                           b'\x01'},
+            '01:02:03:04:05:07': {dhcp.OPTION_MTU: b'\x23\x28'},
+        }
+        queries = [
+            dhcp.DHCPQuery('eth%d' % iid, mac_address, '127.0.0.1')
+            for iid, mac_address in enumerate(
+                ['01:02:03:04:05:06', '01:02:03:04:05:07',
+                 '01:02:03:04:05:08'])]
+
+        with testutils.LogSnatcher('cloudbaseinit.utils.dhcp') as snatcher:
+            server, response = self._get_dhcp_options(
+                options, queries, delay=0.1,
+                requested_options=[dhcp.OPTION_MTU], timeout=1)
+
+        self.assertEqual({
+            'eth0': {53: b'\x02', dhcp.OPTION_MTU: b'\x05\xdc'},
+            'eth1': {53: b'\x02', dhcp.OPTION_MTU: b'\x23\x28'},
+            'eth2': None,
+        }, response)
+        self.assertEqual(
+            [(query.mac_address, [dhcp.OPTION_MTU]) for query in queries],
+            server.requests)
+        self.assertEqual(["No DHCP reply received for interface: eth2"],
+                         snatcher.output)
+
+    def test_get_dhcp_options_by_interface_send_failed(self):
+        options = {'01:02:03:04:05:06': {dhcp.OPTION_MTU: b'\x05\xdc'}}
+        queries = [dhcp.DHCPQuery('eth0', '01:02:03:04:05:06', '127.0.0.1'),
+                   dhcp.DHCPQuery('eth1', '01:02:03:04:05:07', 'fake host')]
+
+        with testutils.LogSnatcher('cloudbaseinit.utils.dhcp') as snatcher:
+            _, response = self._get_dhcp_options(
+                options, queries, requested_options=[dhcp.OPTION_MTU])
+
+        self.assertEqual({'eth0': {53: b'\x02',
+                                   dhcp.OPTION_MTU: b'\x05\xdc'},
+                          'eth1': None}, response)
+        self.assertTrue(snatcher.output[0].startswith(
+            "Failed to send the DHCP request for interface eth1: "))
 
+    @mock.patch('socket.socket')
+    def test_get_dhcp_options_by_interface_no_queries(self, mock_socket):
+        self.assertEqual({}, dhcp.get_dhcp_options_by_interface([]))
+        self.assertFalse(mock_socket.called)
+
+    @mock.patch('cloudbaseinit.utils.dhcp._get_dhcp_queries')
     @mock.patch('cloudbaseinit.utils.dhcp._bind_dhcp_client_socket')
-    def test_get_dhcp_options_timeout(self, mock_client_socket):
-        mock_client_socket.side_effect = [socket.timeout]
-        dhcp.get_dhcp_options(dhcp_host='fake host',
-                              requested_options=['fake option'])
+    def test_get_dhcp_options_by_interface_bind_failed(
+            self, mock_bind_dhcp_client_socket, mock_get_dhcp_queries):
+        mock_get_dhcp_queries.return_value = [
+            dhcp.DHCPQuery('eth0', '01:02:03:04:05:06', None)]
+        mock_bind_dhcp_client_socket.side_effect = socket.error
+
+        with mock.patch('socket.socket') as mock_socket:
+            self.assertRaises(socket.error,
+                              dhcp.get_dhcp_options_by_interface)
+
+        mock_socket().setsockopt.assert_has_calls([
+            mock.call(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1),
+            mock.call(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)])
+        mock_socket().close.assert_called_once_with()
+
+    @mock.patch('cloudbaseinit.utils.dhcp._get_interface_by_local_ip')
+    def _test_get_dhcp_options(self, mock_get_interface_by_local_ip,
+                               replied):
+        mac_address = '01:02:03:04:05:06'
+        mock_get_interface_by_local_ip.return_value = ('lo', mac_address)
+        options = {mac_address: {dhcp.OPTION_MTU: b'\x05\xdc'}}
+        if not replied:
+            options = {}
+
+        with fake_dhcp.FakeDHCPServer(options) as server:
+            with mock.patch.object(dhcp, '_DHCP_SERVER_PORT', server.port):
+                with mock.patch.object(dhcp, '_DHCP_CLIENT_PORT', 0):
+                    response = dhcp.get_dhcp_options(
+                        dhcp_host='127.0.0.1',
+                        requested_options=[dhcp.OPTION_MTU], timeout=0.2)
+
+        mock_get_interface_by_local_ip.assert_called_once_with('127.0.0.1')
+        if replied:
+            self.assertEqual({53: b'\x02', dhcp.OPTION_MTU: b'\x05\xdc'},
+                             response)
+        else:
+            self.assertIsNone(response)
+
+    def test_get_dhcp_options(self):
+        self._test_get_dhcp_options(replied=True)
+
+    def test_get_dhcp_options_timeout(self):
+        self._test_get_dhcp_options(replied=False)
 
     def test__bind_dhcp_client_socket_bind_succeeds(self):
         mock_socket = mock.Mock()
@@ -0,0 +1,148 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import textwrap
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit.utils import dhcpleases
+
+DHCLIENT_LEASES = textwrap.dedent("""
+    default-duration 3600;
+    lease {
+      interface "eth0";
+      fixed-address 10.0.0.4;
+      option subnet-mask 255.255.255.0;
+      option routers 10.0.0.1;
+      option interface-mtu 1400;
+      option unknown-245 a8:3f:81:10;
+      expire 4 2019/05/02 06:00:00;
+    }
+    lease {
+      interface "eth0";
+      fixed-address 10.0.0.4;
+      option interface-mtu 1500;
+      option ntp-servers 10.0.0.1,10.0.0.2;
+      option unknown-245 a8:3f:81:10;
+      option unknown-250 "ab\\"c\\001";
+      option unknown-251 a8:3f:81:1;
+      option domain-name "example.org";
+      expire epoch 1556776800; # Thu May 02 06:00:00 2019
+    }
+    lease {
+      interface "eth1";
+      option interface-mtu 9000;
+      option ntp-servers 10.0.0.256;
+      expire never;
+    }
+""")
+
+NETWORKD_LEASE = textwrap.dedent("""
+    # This is private data. Do not parse.
+    ADDRESS=10.0.0.4
+    NETMASK=255.255.255.0
+    ROUTER=10.0.0.1
+    SERVER_ADDRESS=168.63.129.16
+    MTU=1500
+    DNS=168.63.129.16
+    NTP=10.0.0.1 10.0.0.2
+    DOMAINNAME=example.org
+    OPTION_245=A83F8110
+    OPTION_246=XY
+""")
+
+# 2019/05/02 05:00:00 UTC
+NOW = 1556773200
+
+
+class DHCPLeasesTest(unittest.TestCase):
+
+    def test_parse_dhclient_leases(self):
+        leases = dhcpleases.parse_dhclient_leases(DHCLIENT_LEASES, now=NOW)
+
+        self.assertEqual([
+            dhcpleases.Lease("eth0", {1: b"\xff\xff\xff\x00",
+                                      3: b"\x0a\x00\x00\x01",
+                                      26: b"\x05\x78",
+                                      245: b"\xa8\x3f\x81\x10"}),
+            dhcpleases.Lease("eth0", {26: b"\x05\xdc",
+                                      42: b"\x0a\x00\x00\x01"
+                                          b"\x0a\x00\x00\x02",
+                                      245: b"\xa8\x3f\x81\x10",
+                                      250: b"ab\"c\x01",
+                                      251: b"\xa8\x3f\x81\x01"}),
+            # the invalid NTP servers are skipped
+            dhcpleases.Lease("eth1", {26: b"\x23\x28"}),
+        ], leases)
+
+    def test_parse_dhclient_leases_expired(self):
+        leases = dhcpleases.parse_dhclient_leases(DHCLIENT_LEASES,
+                                                  now=NOW + 3600)
+
+        self.assertEqual(["eth1"], [lease.interface for lease in leases])
+
+    def test_parse_networkd_lease(self):
+        lease = dhcpleases.parse_networkd_lease(NETWORKD_LEASE, "eth0")
+
+        self.assertEqual(dhcpleases.Lease("eth0", {
+            1: b"\xff\xff\xff\x00",
+            3: b"\x0a\x00\x00\x01",
+            6: b"\xa8\x3f\x81\x10",
+            26: b"\x05\xdc",
+            42: b"\x0a\x00\x00\x01\x0a\x00\x00\x02",
+            54: b"\xa8\x3f\x81\x10",
+            245: b"\xa8\x3f\x81\x10",
+        }), lease)
+
+    def _write_lease_file(self, path, content, mtime):
+        path = os.path.join(self._tmp_dir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as stream:
+            stream.write(content)
+        os.utime(path, (mtime, mtime))
+
+    @mock.patch("time.time")
+    def test_get_leases(self, mock_time):
+        mock_time.return_value = NOW
+        self._tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._tmp_dir)
+        self._write_lease_file("dhclient/dhclient.eth0.leases",
+                               DHCLIENT_LEASES, NOW - 10)
+        self._write_lease_file(
+            "nm/internal-0bfe4c33-1f1c-4d2c-a5a4-2b2e6ad05b9e-eth2.lease",
+            "MTU=1450\n", NOW - 20)
+        self._write_lease_file("nm/timestamps", "[timestamps]\n", NOW - 30)
+        self._write_lease_file("networkd/999999", NETWORKD_LEASE, NOW)
+
+        with mock.patch("socket.if_indextoname", create=True,
+                        return_value="eth3"):
+            leases = dhcpleases.get_leases(
+                [os.path.join(self._tmp_dir, "dhclient", "*.leases"),
+                 os.path.join(self._tmp_dir, "nm", "*"),
+                 os.path.join(self._tmp_dir, "networkd", "*"),
+                 os.path.join(self._tmp_dir, "missing", "*")])
+
+        # sorted by modification time
+        self.assertEqual(["eth2", "eth0", "eth0", "eth1", "eth3"],
+                         [lease.interface for lease in leases])
+        self.assertEqual({26: b"\x05\xaa"}, leases[0].options)
+        self.assertEqual(b"\x05\xdc", leases[-1].options[26])
@@ -0,0 +1,202 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit.tests import testutils
+from cloudbaseinit.utils import dhcp
+from cloudbaseinit.utils import dhcpleases
+from cloudbaseinit.utils import dhcpoptions
+
+QUERIES = [dhcp.DHCPQuery("eth0", "01:02:03:04:05:06", None),
+           dhcp.DHCPQuery("eth1", "01:02:03:04:05:07", None)]
+
+
+class DHCPOptionsProvidersTest(unittest.TestCase):
+
+    @mock.patch('cloudbaseinit.utils.dhcpleases.get_leases')
+    def test_lease_file_provider(self, mock_get_leases):
+        mock_get_leases.return_value = [
+            dhcpleases.Lease("eth0", {26: b"\x05\x78", 42: b"old"}),
+            dhcpleases.Lease("eth0", {26: b"\x05\xdc"}),
+            dhcpleases.Lease("eth2", {26: b"\x23\x28"}),
+        ]
+        provider = dhcpoptions.LeaseFileDHCPOptionsProvider()
+
+        with testutils.ConfPatcher('dhcp_lease_files', ['fake pattern']):
+            for _ in range(2):
+                options = provider.get_dhcp_options(QUERIES, [26, 42])
+
+        # only the latest lease of an interface is used
+        self.assertEqual({"eth0": {26: b"\x05\xdc"}}, options)
+        mock_get_leases.assert_called_once_with(['fake pattern'])
+
+    @mock.patch('cloudbaseinit.utils.dhcp.get_dhcp_options_by_interface')
+    def test_live_provider(self, mock_get_dhcp_options_by_interface):
+        mock_get_dhcp_options_by_interface.return_value = {
+            "eth0": {26: b"\x05\xdc"}, "eth1": None}
+        provider = dhcpoptions.LiveDHCPOptionsProvider()
+
+        options = provider.get_dhcp_options(QUERIES, [26])
+
+        self.assertEqual({"eth0": {26: b"\x05\xdc"}, "eth1": None},
+                         options)
+        mock_get_dhcp_options_by_interface.assert_called_once_with(
+            QUERIES, [26])
+
+
+class GetDHCPOptionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self._lease_provider = mock.Mock()
+        self._lease_provider.get_dhcp_options.return_value = {
+            "eth0": {26: b"\x05\xdc", 42: b"\x0a\x00\x00\x01"}}
+        self._live_provider = mock.Mock()
+        self._live_provider.get_dhcp_options.return_value = {
+            "eth1": {26: b"\x23\x28", 53: b"\x02"}, "eth2": None}
+        self._now = 1000
+
+        patcher = mock.patch.multiple(
+            dhcpoptions, _options={}, _declared_options=set(),
+            _stats={"hits": 0, "misses": 0, "expired": 0},
+            _providers=[self._lease_provider, self._live_provider],
+            _clock=lambda: self._now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_dhcp_options(self):
+        options = dhcpoptions.get_dhcp_options(QUERIES, [26])
+
+        self.assertEqual({"eth0": {26: b"\x05\xdc"},
+                          "eth1": {26: b"\x23\x28"}}, options)
+        self._lease_provider.get_dhcp_options.assert_called_once_with(
+            QUERIES, [26])
+        # only the interfaces missing options are queried further
+        self._live_provider.get_dhcp_options.assert_called_once_with(
+            QUERIES[1:], [26])
+        self.assertEqual({"hits": 0, "misses": 2, "expired": 0},
+                         dhcpoptions.get_stats())
+
+    def test_get_dhcp_options_cached(self):
+        dhcpoptions.get_dhcp_options(QUERIES, [26])
+        options = dhcpoptions.get_dhcp_options(QUERIES, [26])
+
+        self.assertEqual({"eth0": {26: b"\x05\xdc"},
+                          "eth1": {26: b"\x23\x28"}}, options)
+        self.assertEqual(1, self._lease_provider.get_dhcp_options.call_count)
+        self.assertEqual(1, self._live_provider.get_dhcp_options.call_count)
+        self.assertEqual({"hits": 2, "misses": 2, "expired": 0},
+                         dhcpoptions.get_stats())
+
+    def test_get_dhcp_options_declared(self):
+        dhcpoptions._declared_options.update([42, 245])
+
+        dhcpoptions.get_dhcp_options(QUERIES, [26])
+        options = dhcpoptions.get_dhcp_options(QUERIES, [42, 245])
+
+        self.assertEqual({"eth0": {42: b"\x0a\x00\x00\x01"},
+                          "eth1": {}}, options)
+        self.assertEqual(
+            [mock.call(QUERIES[1:], [26, 42, 245]),
+             # the options not provided are not cached
+             mock.call(QUERIES, [42, 245])],
+            self._live_provider.get_dhcp_options.mock_calls)
+        self.assertEqual({"hits": 0, "misses": 4, "expired": 0},
+                         dhcpoptions.get_stats())
+
+    def test_get_dhcp_options_polled(self):
+        query = dhcp.DHCPQuery("eth2", "01:02:03:04:05:08", None)
+        self._live_provider.get_dhcp_options.side_effect = [
+            {"eth2": {26: b"\x05\xdc"}},
+            {"eth2": {26: b"\x05\xdc", 245: b"\xa8\x3f\x81\x10"}}]
+
+        options = [dhcpoptions.get_dhcp_options([query], [245])
+                   for _ in range(2)]
+
+        self.assertEqual([{"eth2": {}},
+                          {"eth2": {245: b"\xa8\x3f\x81\x10"}}], options)
+
+    def test_get_dhcp_options_by_mac_address(self):
+        dhcpoptions.get_dhcp_options(QUERIES[1:], [26])
+        query = dhcp.DHCPQuery("Ethernet 2", "01-02-03-04-05-07".upper(),
+                               "10.0.0.1")
+        options = dhcpoptions.get_dhcp_options([query], [26])
+
+        self.assertEqual({"Ethernet 2": {26: b"\x23\x28"}}, options)
+        self.assertEqual(1, self._live_provider.get_dhcp_options.call_count)
+        self.assertEqual({"hits": 1, "misses": 1, "expired": 0},
+                         dhcpoptions.get_stats())
+
+    def test_get_dhcp_options_no_reply(self):
+        query = dhcp.DHCPQuery("eth2", "01:02:03:04:05:08", None)
+        for _ in range(2):
+            options = dhcpoptions.get_dhcp_options([query], [26])
+
+        self.assertEqual({"eth2": {}}, options)
+        # the interfaces without a reply are queried again
+        self.assertEqual(2, self._live_provider.get_dhcp_options.call_count)
+
+    def test_get_dhcp_options_expired(self):
+        with testutils.ConfPatcher('dhcp_options_cache_ttl', 60):
+            dhcpoptions.get_dhcp_options(QUERIES, [26])
+            self._now += 59
+            dhcpoptions.get_dhcp_options(QUERIES, [26])
+            self._now += 1
+            self._lease_provider.get_dhcp_options.return_value = {
+                "eth0": {26: b"\x05\x78"}}
+            options = dhcpoptions.get_dhcp_options(QUERIES, [26])
+
+        self.assertEqual({"eth0": {26: b"\x05\x78"},
+                          "eth1": {26: b"\x23\x28"}}, options)
+        self.assertEqual(2, self._lease_provider.get_dhcp_options.call_count)
+        self.assertEqual({"hits": 2, "misses": 4, "expired": 2},
+                         dhcpoptions.get_stats())
+
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader')
+    def test_get_providers(self, mock_class_loader):
+        mock_load_class = mock_class_loader.return_value.load_class
+
+        with mock.patch.object(dhcpoptions, '_providers', None):
+            with testutils.ConfPatcher('dhcp_options_providers',
+                                       ['fake provider']):
+                providers = dhcpoptions._get_providers()
+                self.assertIs(providers, dhcpoptions._get_providers())
+
+        mock_load_class.assert_called_once_with('fake provider')
+        self.assertEqual([mock_load_class.return_value.return_value],
+                         providers)
+
+    def test_get_declared_options(self):
+        plugins = ['cloudbaseinit.plugins.common.mtu.MTUPlugin',
+                   'cloudbaseinit.plugins.common.ntpclient.NTPClientPlugin',
+                   'cloudbaseinit.plugins.common.sethostname.'
+                   'SetHostNamePlugin',
+                   'fake.missing.Plugin']
+
+        with mock.patch.object(dhcpoptions, '_declared_options', None):
+            with testutils.ConfPatcher('plugins', plugins), \
+                    testutils.ConfPatcher('metadata_services', []):
+                with testutils.LogSnatcher('cloudbaseinit.utils.'
+                                           'dhcpoptions') as snatcher:
+                    declared_options = dhcpoptions._get_declared_options()
+
+        self.assertEqual({dhcp.OPTION_MTU, dhcp.OPTION_NTP_SERVERS},
+                         declared_options)
+        self.assertTrue(snatcher.output[0].startswith(
+            "Cannot get the DHCP options of fake.missing.Plugin: "))
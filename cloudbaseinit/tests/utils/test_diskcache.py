@@ -0,0 +1,103 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import unittest
+
+from cloudbaseinit.tests import testutils
+from cloudbaseinit.utils import diskcache
+
+
+class DiskCacheTest(unittest.TestCase):
+
+    def test_set_get(self):
+        with testutils.create_tempdir() as temp:
+            cache = diskcache.DiskCache(os.path.join(temp, "cache"), 1024)
+
+            self.assertIsNone(cache.get("key"))
+            self.assertTrue(cache.set("key", b"data\n", etag='"etag"'))
+
+            entry = diskcache.DiskCache(
+                os.path.join(temp, "cache"), 1024).get("key")
+            self.assertEqual(b"data\n", entry.data)
+            self.assertEqual('"etag"', entry.etag)
+            self.assertIsNone(entry.last_modified)
+
+    @unittest.skipIf(os.name == "nt", "POSIX file permissions")
+    def test_set_permissions(self):
+        with testutils.create_tempdir() as temp:
+            cache_path = os.path.join(temp, "cache")
+            cache = diskcache.DiskCache(cache_path, 1024)
+            cache.set("key", b"secret")
+
+            self.assertEqual(0, os.stat(cache_path).st_mode & 0o077)
+            self.assertEqual(
+                0, os.stat(cache._get_entry_path("key")).st_mode & 0o077)
+
+    def test_set_overwrite(self):
+        with testutils.create_tempdir() as temp:
+            cache = diskcache.DiskCache(temp, 1024)
+            cache.set("key", b"old", last_modified="date1")
+            cache.set("key", b"new", last_modified="date2")
+
+            entry = cache.get("key")
+            self.assertEqual(b"new", entry.data)
+            self.assertEqual("date2", entry.last_modified)
+            self.assertEqual(1, len(os.listdir(temp)))
+
+    def test_set_entry_too_large(self):
+        with testutils.create_tempdir() as temp:
+            cache = diskcache.DiskCache(temp, 1024, max_entry_size=2)
+            self.assertFalse(cache.set("key", b"data"))
+            self.assertIsNone(cache.get("key"))
+
+    def test_evict(self):
+        with testutils.create_tempdir() as temp:
+            cache = diskcache.DiskCache(temp, 250)
+            cache.set("first", b"1" * 100)
+            first_path = cache._get_entry_path("first")
+            os.utime(first_path, (0, 0))
+            cache.set("second", b"2" * 100)
+
+            self.assertIsNone(cache.get("first"))
+            self.assertEqual(b"2" * 100, cache.get("second").data)
+
+    def test_get_invalid_entry(self):
+        with testutils.create_tempdir() as temp:
+            cache = diskcache.DiskCache(temp, 1024)
+            cache.set("key", b"data")
+            entry_path = cache._get_entry_path("key")
+            with open(entry_path, "wb") as stream:
+                stream.write(b"invalid\ndata")
+
+            self.assertIsNone(cache.get("key"))
+            self.assertFalse(os.path.exists(entry_path))
+
+    def test_get_truncated_entry(self):
+        with testutils.create_tempdir() as temp:
+            cache = diskcache.DiskCache(temp, 1024)
+            cache.set("key", b"data")
+            entry_path = cache._get_entry_path("key")
+            with open(entry_path, "rb+") as stream:
+                stream.truncate(os.path.getsize(entry_path) - 1)
+
+            self.assertIsNone(cache.get("key"))
+
+    def test_delete(self):
+        with testutils.create_tempdir() as temp:
+            cache = diskcache.DiskCache(temp, 1024)
+            cache.set("key", b"data")
+            cache.delete("key")
+            cache.delete("key")
+            self.assertIsNone(cache.get("key"))
@@ -0,0 +1,58 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit.utils import dmi
+
+
+class SysfsDMISourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self._sysfs_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._sysfs_path)
+
+    def _write_field(self, field, value):
+        with open(os.path.join(self._sysfs_path, field), "wb") as stream:
+            stream.write(value)
+
+    def test_get_dmi_info(self):
+        self._write_field(dmi.SYS_VENDOR, b"OpenStack Foundation\n")
+        self._write_field(dmi.PRODUCT_NAME, b"OpenStack Nova\n")
+        self._write_field(dmi.CHASSIS_ASSET_TAG, b"\n")
+
+        dmi_info = dmi.SysfsDMISource(self._sysfs_path).get_dmi_info()
+
+        self.assertEqual({dmi.SYS_VENDOR: "OpenStack Foundation",
+                          dmi.PRODUCT_NAME: "OpenStack Nova",
+                          dmi.PRODUCT_UUID: None,
+                          dmi.CHASSIS_ASSET_TAG: None}, dmi_info)
+
+    @mock.patch('cloudbaseinit.utils.classloader.ClassLoader.load_class')
+    @mock.patch('os.name', 'posix')
+    def test_get_dmi_source(self, mock_load_class):
+        dmi_source = dmi.get_dmi_source()
+
+        mock_load_class.assert_called_once_with(
+            'cloudbaseinit.utils.dmi.SysfsDMISource')
+        self.assertEqual(mock_load_class.return_value.return_value,
+                         dmi_source)
@@ -0,0 +1,175 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit.tests.utils import fake_iso
+from cloudbaseinit.utils import iso9660
+
+META_DATA_PATH = "openstack/latest/meta_data.json"
+USER_DATA_PATH = "openstack/latest/user_data"
+
+
+class TestISO9660Reader(unittest.TestCase):
+
+    def setUp(self):
+        self._files = {
+            META_DATA_PATH: b'{"uuid": "fake"}',
+            USER_DATA_PATH: os.urandom(3 * iso9660.SECTOR_SIZE + 1),
+            "openstack/2013-04-04/Mixed_Case.json": b"",
+            "ec2/latest/meta-data.json": b"{}",
+        }
+        self._reads = []
+
+    def _get_reader(self, files=None, size=None, **kwargs):
+        stream = io.BytesIO(
+            fake_iso.get_iso_image(files or self._files, **kwargs))
+
+        def read(offset, size):
+            self._reads.append((offset, size))
+            stream.seek(offset)
+            return stream.read(size)
+        return iso9660.ISO9660Reader(read, size)
+
+    def _test_read_file(self, expected_names, **kwargs):
+        reader = self._get_reader(**kwargs)
+        self.assertEqual(["ec2", "openstack"], reader.listdir())
+        self.assertEqual(expected_names,
+                         reader.listdir("openstack/2013-04-04"))
+        self.assertEqual(self._files[META_DATA_PATH],
+                         reader.read_file(META_DATA_PATH))
+        self.assertEqual(self._files[USER_DATA_PATH],
+                         reader.read_file("openstack\\latest\\user_data"))
+        return reader
+
+    def test_read_file_rock_ridge(self):
+        reader = self._test_read_file(["Mixed_Case.json"])
+        self.assertTrue(reader._rock_ridge)
+        self.assertFalse(reader._joliet)
+
+    def test_read_file_rock_ridge_continuation(self):
+        reader = self._test_read_file(["Mixed_Case.json"], joliet=False,
+                                      continuation=True)
+        self.assertTrue(reader._rock_ridge)
+
+    def test_read_file_joliet(self):
+        reader = self._test_read_file(["Mixed_Case.json"], rock_ridge=False)
+        self.assertFalse(reader._rock_ridge)
+        self.assertTrue(reader._joliet)
+
+    def test_read_file_primary(self):
+        self._files = dict((path.upper(), data)
+                           for path, data in self._files.items())
+        reader = self._get_reader(joliet=False, rock_ridge=False)
+        self.assertEqual(["MIXED_CASE.JSON"],
+                         reader.listdir("OPENSTACK/2013-04-04"))
+        self.assertEqual(self._files[META_DATA_PATH.upper()],
+                         reader.read_file(META_DATA_PATH.upper()))
+
+    def test_read_file_only_needed_extents(self):
+        reader = self._get_reader()
+        del self._reads[:]
+        reader.read_file(META_DATA_PATH)
+        # The root, openstack and latest directories, then the file.
+        self.assertEqual(4, len(self._reads))
+        self.assertEqual(len(self._files[META_DATA_PATH]),
+                         self._reads[-1][1])
+
+        del self._reads[:]
+        reader.read_file("openstack/latest/meta_data.json")
+        self.assertEqual(1, len(self._reads))
+
+    @mock.patch.object(iso9660, "_CHUNK_SIZE", iso9660.SECTOR_SIZE)
+    def test_read_file_chunks(self):
+        reader = self._get_reader()
+        del self._reads[:]
+        data = reader.read_file(USER_DATA_PATH)
+        self.assertEqual(self._files[USER_DATA_PATH], data)
+        file_reads = self._reads[-4:]
+        self.assertEqual([iso9660.SECTOR_SIZE] * 3 + [1],
+                         [size for _, size in file_reads])
+        self.assertEqual(
+            [file_reads[0][0] + index * iso9660.SECTOR_SIZE
+             for index in range(4)],
+            [offset for offset, _ in file_reads])
+
+    def test_read_file_large_directory(self):
+        files = dict(("many/file-%03d.txt" % index, str(index).encode())
+                     for index in range(100))
+        reader = self._get_reader(files)
+        self.assertEqual(sorted(os.path.basename(path) for path in files),
+                         reader.listdir("many"))
+        self.assertEqual(b"99", reader.read_file("many/file-099.txt"))
+
+    def test_isdir(self):
+        reader = self._get_reader()
+        self.assertTrue(reader.isdir(""))
+        self.assertTrue(reader.isdir("openstack/latest"))
+        self.assertFalse(reader.isdir(META_DATA_PATH))
+        self.assertFalse(reader.isdir("openstack/missing"))
+
+    def test_not_found(self):
+        reader = self._get_reader()
+        for path in ("openstack/missing", META_DATA_PATH + "/missing"):
+            self.assertRaises(iso9660.ISO9660Error, reader.read_file, path)
+        self.assertRaises(iso9660.ISO9660Error, reader.read_file,
+                          "openstack")
+        self.assertRaises(iso9660.ISO9660Error, reader.listdir,
+                          META_DATA_PATH)
+
+    def test_not_iso(self):
+        self.assertRaises(iso9660.ISO9660Error,
+                          iso9660.ISO9660Reader.from_stream,
+                          io.BytesIO(b"\x00" * 20 * iso9660.SECTOR_SIZE))
+
+    def test_short_read(self):
+        image = fake_iso.get_iso_image(self._files)
+        self.assertRaises(iso9660.ISO9660Error,
+                          iso9660.ISO9660Reader.from_stream,
+                          io.BytesIO(image[:18 * iso9660.SECTOR_SIZE]))
+
+    def test_volume_size_exceeds_device_size(self):
+        image = fake_iso.get_iso_image(self._files)
+        reader = iso9660.ISO9660Reader.from_stream(io.BytesIO(image),
+                                                   len(image))
+        self.assertEqual(len(image), reader.volume_size)
+        self.assertRaises(iso9660.ISO9660Error,
+                          iso9660.ISO9660Reader.from_stream,
+                          io.BytesIO(image), len(image) - 1)
+
+    def test_invalid_name(self):
+        reader = self._get_reader({"openstack/..": b""}, joliet=False)
+        self.assertRaises(iso9660.ISO9660Error, reader.listdir, "openstack")
+
+    def test_extract(self):
+        target_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, target_path)
+
+        self._get_reader().extract(target_path)
+
+        for path, data in self._files.items():
+            with open(os.path.join(target_path, *path.split("/")),
+                      "rb") as stream:
+                self.assertEqual(data, stream.read())
+        self.assertEqual(["ec2", "openstack"], sorted(
+            os.listdir(target_path)))
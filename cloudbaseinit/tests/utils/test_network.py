@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import socket
 import unittest
 
 try:
@@ -33,6 +34,14 @@ class NetworkUtilsTest(unittest.TestCase):
     def test_check_url(self, mock_url_open):
         mock_url_open.return_value = None
         self.assertTrue(network.check_url("fake_url"))
+        mock_url_open.assert_called_once_with(
+            "fake_url", timeout=CONF.metadata_http_connect_timeout)
+
+    @mock.patch('six.moves.urllib.request.urlopen')
+    def test_check_url_timeout(self, mock_url_open):
+        mock_url_open.side_effect = socket.timeout
+        self.assertFalse(network.check_url("fake_url", timeout=1))
+        mock_url_open.assert_called_with("fake_url", timeout=1)
 
     @mock.patch('sys.platform', new='win32')
     @mock.patch('cloudbaseinit.osutils.factory.get_os_utils')
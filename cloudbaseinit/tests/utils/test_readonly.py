@@ -0,0 +1,61 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import copy
+import unittest
+
+from cloudbaseinit.utils import readonly
+
+
+class ReadOnlyUtilsTest(unittest.TestCase):
+
+    def setUp(self):
+        self._document = {"keys": [{"type": "ssh", "data": "key"}],
+                          "uuid": "fake uuid"}
+        self._frozen = readonly.freeze(self._document)
+
+    def test_freeze(self):
+        self.assertEqual(self._document, self._frozen)
+        self.assertIsInstance(self._frozen, readonly.ReadOnlyDict)
+        self.assertIsInstance(self._frozen["keys"], readonly.ReadOnlyList)
+        self.assertIsInstance(self._frozen["keys"][0], readonly.ReadOnlyDict)
+
+    def test_dict_read_only(self):
+        self.assertRaises(TypeError, self._frozen.__setitem__, "uuid", "id")
+        self.assertRaises(TypeError, self._frozen.__delitem__, "uuid")
+        self.assertRaises(TypeError, self._frozen.update, {})
+        self.assertRaises(TypeError, self._frozen.pop, "uuid")
+        self.assertRaises(TypeError, self._frozen.setdefault, "id", "id")
+        self.assertRaises(TypeError, self._frozen.clear)
+
+    def test_list_read_only(self):
+        keys = self._frozen["keys"]
+        self.assertRaises(TypeError, keys.append, {})
+        self.assertRaises(TypeError, keys.__setitem__, 0, {})
+        self.assertRaises(TypeError, keys.pop)
+        self.assertRaises(TypeError, keys.sort)
+        self.assertRaises(TypeError, keys[0].update, {})
+
+    def test_deepcopy(self):
+        document = copy.deepcopy(self._frozen)
+        document["keys"][0]["type"] = "x509"
+
+        self.assertEqual(dict, type(document))
+        self.assertEqual(list, type(document["keys"]))
+        self.assertEqual("ssh", self._frozen["keys"][0]["type"])
+
+    def test_thaw(self):
+        document = readonly.thaw(self._frozen)
+        self.assertEqual(self._document, document)
+        self.assertEqual(dict, type(document["keys"][0]))
@@ -0,0 +1,198 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import socket
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+import requests
+
+from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit import exception
+from cloudbaseinit.tests import testutils
+from cloudbaseinit.utils import retry
+
+CONF = cloudbaseinit_conf.CONF
+
+
+def _get_http_error(status_code, headers=None):
+    response = mock.Mock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    return requests.HTTPError(response=response)
+
+
+class RetryUtilsTest(unittest.TestCase):
+
+    def test_classify_error(self):
+        refused = socket.error(errno.ECONNREFUSED, "Connection refused")
+        errors = [
+            (exception.CertificateVerifyFailed(), retry.ERROR_TLS),
+            (requests.exceptions.SSLError(), retry.ERROR_TLS),
+            (_get_http_error(503), retry.ERROR_SERVER),
+            (_get_http_error(429), retry.ERROR_TIMEOUT),
+            (_get_http_error(403), retry.ERROR_CLIENT),
+            (requests.Timeout(), retry.ERROR_TIMEOUT),
+            (socket.timeout(), retry.ERROR_TIMEOUT),
+            (requests.ConnectionError(refused),
+             retry.ERROR_CONNECTION_REFUSED),
+            (requests.ConnectionError("reset"), retry.ERROR_CONNECTION),
+            (refused, retry.ERROR_CONNECTION_REFUSED),
+            (ValueError(), retry.ERROR_UNKNOWN),
+        ]
+        for error, category in errors:
+            self.assertEqual(category, retry.classify_error(error))
+
+    def test_get_retry_after(self):
+        self.assertIsNone(retry.get_retry_after(ValueError()))
+        self.assertIsNone(retry.get_retry_after(_get_http_error(503)))
+        self.assertEqual(2.0, retry.get_retry_after(
+            _get_http_error(503, {"Retry-After": "2"})))
+        self.assertIsNone(retry.get_retry_after(
+            _get_http_error(503, {"Retry-After": "invalid"})))
+
+    @mock.patch('time.time')
+    def test_get_retry_after_http_date(self, mock_time):
+        mock_time.return_value = 784111777 - 30
+        delay = retry.get_retry_after(_get_http_error(
+            503, {"Retry-After": "Sun, 06 Nov 1994 08:49:37 GMT"}))
+        self.assertEqual(30, delay)
+
+    def test_retry_budget(self):
+        budget = retry.RetryBudget(10)
+        budget.consume(4)
+        self.assertEqual(6, budget.remaining())
+        budget.consume(10)
+        self.assertEqual(0, budget.remaining())
+        self.assertIsNone(retry.RetryBudget().remaining())
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_get_interval(self):
+        policy = retry.RetryPolicy(retry_count=5, interval=1,
+                                   max_interval=5, jitter=False)
+        intervals = [policy.get_interval(attempt) for attempt in range(5)]
+        self.assertEqual([1, 2, 4, 5, 5], intervals)
+
+    @mock.patch('random.uniform')
+    def test_get_interval_jitter(self, mock_uniform):
+        policy = retry.RetryPolicy(retry_count=5, interval=1, jitter=True)
+        interval = policy.get_interval(3)
+        mock_uniform.assert_called_once_with(0, 8)
+        self.assertEqual(mock_uniform.return_value, interval)
+
+    @mock.patch('time.sleep')
+    def test_execute(self, mock_sleep):
+        action = mock.Mock(side_effect=[requests.ConnectionError(),
+                                        _get_http_error(500),
+                                        mock.sentinel.result])
+        policy = retry.RetryPolicy(retry_count=5, interval=1, jitter=False)
+
+        result = policy.execute(action)
+
+        self.assertEqual(mock.sentinel.result, result)
+        mock_sleep.assert_has_calls([mock.call(1), mock.call(2)])
+
+    @mock.patch('time.sleep')
+    def test_execute_not_retryable(self, mock_sleep):
+        action = mock.Mock(side_effect=_get_http_error(404))
+        policy = retry.RetryPolicy(retry_count=5, interval=1)
+
+        self.assertRaises(requests.HTTPError, policy.execute, action)
+        self.assertEqual(1, action.call_count)
+        self.assertFalse(mock_sleep.called)
+
+    @mock.patch('time.sleep')
+    def test_execute_retry_count_exceeded(self, mock_sleep):
+        action = mock.Mock(side_effect=requests.ConnectionError())
+        policy = retry.RetryPolicy(retry_count=2, interval=1, jitter=False)
+
+        self.assertRaises(requests.ConnectionError, policy.execute, action)
+        self.assertEqual(3, action.call_count)
+        self.assertEqual(2, mock_sleep.call_count)
+
+    @mock.patch('time.sleep')
+    def test_execute_retry_after(self, mock_sleep):
+        action = mock.Mock(side_effect=[
+            _get_http_error(503, {"Retry-After": "7"}), None])
+        policy = retry.RetryPolicy(retry_count=2, interval=1, jitter=False)
+
+        policy.execute(action)
+
+        mock_sleep.assert_called_once_with(7.0)
+
+    def _test_execute_retry_after_large(self, expected_delay, **kwargs):
+        action = mock.Mock(side_effect=[
+            _get_http_error(503, {"Retry-After": "86400"}), None])
+        policy = retry.RetryPolicy(retry_count=2, interval=1, jitter=False,
+                                   **kwargs)
+
+        with mock.patch('time.sleep') as mock_sleep:
+            policy.execute(action)
+
+        mock_sleep.assert_called_once_with(expected_delay)
+
+    def test_execute_retry_after_max_interval(self):
+        self._test_execute_retry_after_large(10, max_interval=10)
+
+    @mock.patch('time.time')
+    def test_execute_retry_after_call_deadline(self, mock_time):
+        mock_time.side_effect = [0, 1]
+        self._test_execute_retry_after_large(4, call_deadline=5)
+
+    def test_execute_retry_after_boot_budget(self):
+        budget = retry.RetryBudget(3)
+        self._test_execute_retry_after_large(3, boot_budget=budget)
+        self.assertEqual(0, budget.remaining())
+
+    @mock.patch('time.time')
+    @mock.patch('time.sleep')
+    def test_execute_call_deadline(self, mock_sleep, mock_time):
+        mock_time.side_effect = [0, 1, 4]
+        action = mock.Mock(side_effect=requests.ConnectionError())
+        policy = retry.RetryPolicy(retry_count=5, interval=2, jitter=False,
+                                   call_deadline=5)
+
+        self.assertRaises(requests.ConnectionError, policy.execute, action)
+        self.assertEqual(2, action.call_count)
+        mock_sleep.assert_called_once_with(2)
+
+    @mock.patch('time.sleep')
+    def test_execute_boot_budget(self, mock_sleep):
+        budget = retry.RetryBudget(3)
+        action = mock.Mock(side_effect=requests.ConnectionError())
+        policy = retry.RetryPolicy(retry_count=5, interval=2, jitter=False,
+                                   boot_budget=budget)
+
+        self.assertRaises(requests.ConnectionError, policy.execute, action)
+        mock_sleep.assert_called_once_with(2)
+        self.assertEqual(1, budget.remaining())
+
+    @mock.patch('cloudbaseinit.utils.retry.get_boot_budget')
+    def test_from_config(self, mock_get_boot_budget):
+        with testutils.ConfPatcher('retry_count', 2, group='ec2'):
+            with testutils.ConfPatcher('retry_max_interval', 30):
+                policy = retry.RetryPolicy.from_config('ec2')
+
+        self.assertEqual(2, policy.retry_count)
+        self.assertEqual(CONF.retry_count_interval, policy.interval)
+        self.assertEqual(30, policy.max_interval)
+        self.assertIsNone(policy.call_deadline)
+        self.assertEqual(mock_get_boot_budget.return_value,
+                         policy.boot_budget)
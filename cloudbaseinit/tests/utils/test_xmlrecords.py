@@ -0,0 +1,89 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cloudbaseinit.tests.metadata import fake_xml_response
+from cloudbaseinit.utils import xmlrecords
+
+
+class TestXMLRecords(unittest.TestCase):
+
+    def test_parse(self):
+        records = xmlrecords.parse(
+            fake_xml_response.get_fake_goal_state_xml(),
+            ["GoalState/Incarnation",
+             "GoalState/Container/RoleInstanceList/RoleInstance",
+             "GoalState/Missing"])
+
+        self.assertEqual(fake_xml_response.INCARNATION,
+                         xmlrecords.get_text(records,
+                                             "GoalState/Incarnation"))
+        role_instance = records[
+            "GoalState/Container/RoleInstanceList/RoleInstance"][0]
+        self.assertEqual(fake_xml_response.ROLE_INSTANCE_ID,
+                         role_instance.fields["InstanceId"])
+        # Only the text of the direct children is kept.
+        self.assertEqual("", role_instance.fields["Configuration"].strip())
+        self.assertEqual([], records["GoalState/Missing"])
+        self.assertIsNone(xmlrecords.get_text(records, "GoalState/Missing"))
+
+    def test_parse_text(self):
+        records = xmlrecords.parse(u"<a><b>\xe9</b><b>c</b></a>", ["a/b"])
+        self.assertEqual([u"\xe9", u"c"],
+                         [record.text for record in records["a/b"]])
+
+    def test_parse_namespaces(self):
+        records = xmlrecords.parse(
+            fake_xml_response.get_fake_ovf_env_xml([("hostname", "fake")]),
+            ["Environment/PropertySection/Property",
+             "Environment/EthernetAdapterSection/Adapter"])
+
+        prop = records["Environment/PropertySection/Property"][0]
+        self.assertEqual({"oe:key": "hostname", "oe:value": "fake"},
+                         prop.attrib)
+        adapter = records["Environment/EthernetAdapterSection/Adapter"][0]
+        self.assertEqual("VM Network", adapter.attrib["ve:network"])
+
+    def test_parse_nested_records(self):
+        records = xmlrecords.parse(
+            "<a><b><c>1</c><c>2</c></b></a>", ["a/b", "a/b/c"])
+        self.assertEqual({"c": "1"}, records["a/b"][0].fields)
+        self.assertEqual(["1", "2"],
+                         [record.text for record in records["a/b/c"]])
+
+    def test_parse_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, "versions.xml")
+        with open(path, "wb") as stream:
+            stream.write(fake_xml_response.get_fake_versions_xml())
+
+        records = xmlrecords.parse_file(path, ["Versions/Preferred/Version"])
+        self.assertEqual("2015-04-05", xmlrecords.get_text(
+            records, "Versions/Preferred/Version"))
+
+    def test_find_text(self):
+        data = fake_xml_response.get_fake_goal_state_xml()
+        self.assertEqual(fake_xml_response.INCARNATION,
+                         xmlrecords.find_text(data, "GoalState/Incarnation"))
+        self.assertEqual(fake_xml_response.CONTAINER_ID,
+                         xmlrecords.find_text(
+                             data, "GoalState/Container/ContainerId"))
+        self.assertIsNone(xmlrecords.find_text(data, "GoalState/Missing"))
+        self.assertEqual("fake", xmlrecords.find_text(
+            data, "GoalState/Missing", default="fake"))
@@ -0,0 +1,64 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import importlib
+import unittest
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
+from cloudbaseinit.utils import dmi
+
+MODPATH = "cloudbaseinit.utils.windows.dmi"
+
+
+class WindowsDMISourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self._wmi_mock = mock.MagicMock()
+        self._module_patcher = mock.patch.dict(
+            'sys.modules', {'wmi': self._wmi_mock})
+        self._module_patcher.start()
+        self.addCleanup(self._module_patcher.stop)
+        self._dmi = importlib.import_module(MODPATH)
+        self._conn = self._wmi_mock.WMI.return_value
+
+    def _test_get_dmi_info(self, products, enclosures, expected_dmi_info):
+        self._conn.query.side_effect = [products, enclosures]
+
+        dmi_info = self._dmi.WindowsDMISource().get_dmi_info()
+
+        self.assertEqual(expected_dmi_info, dmi_info)
+        self._wmi_mock.WMI.assert_called_once_with(
+            moniker='//./root/cimv2')
+        self._conn.query.assert_has_calls([
+            mock.call("SELECT Vendor, Name, UUID FROM "
+                      "Win32_ComputerSystemProduct"),
+            mock.call("SELECT SMBIOSAssetTag FROM Win32_SystemEnclosure")])
+
+    def test_get_dmi_info(self):
+        product = mock.Mock(Vendor="Microsoft Corporation",
+                            Name="Virtual Machine", UUID="fake uuid")
+        enclosure = mock.Mock(SMBIOSAssetTag=" fake tag ")
+        self._test_get_dmi_info(
+            [product], [enclosure],
+            {dmi.SYS_VENDOR: "Microsoft Corporation",
+             dmi.PRODUCT_NAME: "Virtual Machine",
+             dmi.PRODUCT_UUID: "fake uuid",
+             dmi.CHASSIS_ASSET_TAG: "fake tag"})
+
+    def test_get_dmi_info_not_available(self):
+        self._test_get_dmi_info([], [], dict.fromkeys(dmi.DMI_FIELDS))
@@ -12,11 +12,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import datetime
+import collections
 import netifaces
 import random
+import select
 import socket
 import struct
+import sys
 import time
 
 from oslo_log import log as oslo_logging
@@ -25,90 +27,157 @@ from cloudbaseinit.utils import network
 
 _DHCP_COOKIE = b'\x63\x82\x53\x63'
 _OPTION_END = b'\xff'
+_OPTION_PAD = 0
+_OPTION_END_CODE = 255
+_DHCP_CLIENT_PORT = 68
+_DHCP_SERVER_PORT = 67
+_MAX_DHCP_MESSAGE_SIZE = 4096
+
+# op, htype, hlen, hops, xid, secs and flags, followed by the zeroed
+# ciaddr, yiaddr, siaddr and giaddr, then chaddr, sname, file and the
+# magic cookie, see: http://www.ietf.org/rfc/rfc2131.txt
+_HEADER = struct.Struct('!BBBBLHH16x6s10x64x128x4s')
+_BOOTREPLY = 2
+_XID = struct.Struct('!L')
+_BYTE = struct.Struct('!B')
 
 OPTION_MTU = 26
 OPTION_NTP_SERVERS = 42
 
 LOG = oslo_logging.getLogger(__name__)
 
+# A DHCP request to send on behalf of an interface, the server
+# being reached by broadcast when dhcp_host is None.
+DHCPQuery = collections.namedtuple(
+    "DHCPQuery", ["name", "mac_address", "dhcp_host"])
+
 
 def _get_dhcp_request_data(id_req, mac_address, requested_options,
                            vendor_id):
-
-    mac_address_b = bytearray.fromhex(mac_address.replace(':', ''))
-    # See: http://www.ietf.org/rfc/rfc2131.txt
-    data = b'\x01'
-    data += b'\x01'
-    data += b'\x06'
-    data += b'\x00'
-    data += struct.pack('!L', id_req)
-    data += b'\x00\x00'
-    data += b'\x00\x00'
-    data += b'\x00\x00\x00\x00'
-    data += b'\x00\x00\x00\x00'
-    data += b'\x00\x00\x00\x00'
-    data += b'\x00\x00\x00\x00'
-    data += mac_address_b
-    data += b'\x00' * 10
-    data += b'\x00' * 64
-    data += b'\x00' * 128
-    data += _DHCP_COOKIE
-    data += b'\x35\x01\x01'
-
-    if vendor_id:
-        vendor_id_b = vendor_id.encode('ascii')
-        data += b'\x3c' + struct.pack('B', len(vendor_id_b)) + vendor_id_b
-
-    data += b'\x3d\x07\x01' + mac_address_b
-    data += b'\x37' + struct.pack('B', len(requested_options))
-
-    for option in requested_options:
-        data += struct.pack('B', option)
-
-    data += _OPTION_END
+    mac_address_b = bytes(bytearray.fromhex(mac_address.replace(':', '')))
+    vendor_id_b = vendor_id.encode('ascii') if vendor_id else b''
+
+    size = _HEADER.size + 3 + 9 + 2 + len(requested_options) + 1
+    if vendor_id_b:
+        size += 2 + len(vendor_id_b)
+    data = bytearray(size)
+
+    _HEADER.pack_into(data, 0, 1, 1, 6, 0, id_req, 0, 0, mac_address_b,
+                      _DHCP_COOKIE)
+    offset = _HEADER.size
+    # DHCP message type
+    struct.pack_into('!BBB', data, offset, 0x35, 1, 1)
+    offset += 3
+
+    if vendor_id_b:
+        struct.pack_into('!BB%ds' % len(vendor_id_b), data, offset,
+                         0x3c, len(vendor_id_b), vendor_id_b)
+        offset += 2 + len(vendor_id_b)
+
+    # client identifier
+    struct.pack_into('!BBB6s', data, offset, 0x3d, 7, 1, mac_address_b)
+    offset += 9
+    # parameter request list
+    struct.pack_into('!BB%dB' % len(requested_options), data, offset,
+                     0x37, len(requested_options), *requested_options)
+    offset += 2 + len(requested_options)
+
+    data[offset:] = _OPTION_END
     return data
 
 
-def _parse_dhcp_reply(data, id_req):
-    message_type = struct.unpack('B', data[0:1])[0]
-
-    if message_type != 2:
-        return False, {}
+def _parse_dhcp_reply(data):
+    """Get the transaction id and the options of a DHCP reply.
 
-    id_reply = struct.unpack('!L', data[4:8])[0]
-    if id_reply != id_req:
-        return False, {}
-
-    if data[236:240] != _DHCP_COOKIE:
-        return False, {}
+    The message is parsed in place, only the option values are copied.
+    The transaction id is None if the data is not a DHCP reply.
+    """
+    data_len = len(data)
+    if (data_len < _HEADER.size or
+            _BYTE.unpack_from(data, 0)[0] != _BOOTREPLY or
+            data[236:240] != _DHCP_COOKIE):
+        return None, {}
 
+    id_reply = _XID.unpack_from(data, 4)[0]
+    view = memoryview(data)
     options = {}
 
-    i = 240
-    data_len = len(data)
-    while i < data_len and data[i:i + 1] != _OPTION_END:
-        id_option = struct.unpack('B', data[i:i + 1])[0]
-        option_data_len = struct.unpack('B', data[i + 1:i + 2])[0]
-        i += 2
-        options[id_option] = data[i: i + option_data_len]
+    i = _HEADER.size
+    while i < data_len:
+        id_option = _BYTE.unpack_from(data, i)[0]
+        if id_option == _OPTION_END_CODE:
+            break
+        i += 1
+        if id_option == _OPTION_PAD or i >= data_len:
+            continue
+        option_data_len = _BYTE.unpack_from(data, i)[0]
+        i += 1
+        options[id_option] = view[i:i + option_data_len].tobytes()
         i += option_data_len
 
-    return True, options
+    return id_reply, options
 
 
-def _get_mac_address_by_local_ip(ip_addr):
+def _get_interface_by_local_ip(ip_addr):
     for iface in netifaces.interfaces():
         addrs = netifaces.ifaddresses(iface)
         for addr in addrs.get(netifaces.AF_INET, []):
             if addr['addr'] == ip_addr:
-                return addrs[netifaces.AF_LINK][0]['addr']
+                return iface, addrs[netifaces.AF_LINK][0]['addr']
+    return None, None
+
 
+def _get_dhcp_queries():
+    """Get a query for each interface with an IPv4 address and a MAC."""
+    queries = []
+    for iface in netifaces.interfaces():
+        addrs = netifaces.ifaddresses(iface)
+        ip_addrs = [addr['addr'] for addr in addrs.get(netifaces.AF_INET, [])
+                    if not addr['addr'].startswith('127.')]
+        links = addrs.get(netifaces.AF_LINK, [])
+        if ip_addrs and links and links[0].get('addr'):
+            queries.append(DHCPQuery(iface, links[0]['addr'], None))
+    return queries
 
-def _bind_dhcp_client_socket(s, max_bind_attempts, bind_retry_interval):
+
+def _get_interface_address(iface):
+    try:
+        addrs = netifaces.ifaddresses(iface)
+    except ValueError:
+        return None
+    for addr in addrs.get(netifaces.AF_INET, []):
+        if addr.get('addr'):
+            return addr['addr']
+    return None
+
+
+def _tie_socket_to_interface(s, iface):
+    """Make the broadcasts sent from the socket go out on an interface.
+
+    The OS sends the limited broadcast address on the interface of the
+    default route only. On Linux the socket is bound to the device,
+    elsewhere to the IPv4 address of the interface.
+
+    :returns: The local address to bind the socket to.
+    """
+    bind_to_device = getattr(socket, 'SO_BINDTODEVICE', None)
+    if bind_to_device is not None and sys.platform.startswith('linux'):
+        try:
+            s.setsockopt(socket.SOL_SOCKET, bind_to_device,
+                         iface.encode('utf-8'))
+        except socket.error as ex:
+            LOG.debug("Failed to bind the DHCP client socket to interface "
+                      "%(name)s: %(ex)s", {"name": iface, "ex": ex})
+        return ''
+    return _get_interface_address(iface) or ''
+
+
+def _bind_dhcp_client_socket(s, max_bind_attempts, bind_retry_interval,
+                             address=''):
     bind_attempts = 1
     while True:
         try:
-            s.bind(('', 68))
+            s.bind((address, _DHCP_CLIENT_PORT))
             break
         except socket.error as ex:
             if (bind_attempts >= max_bind_attempts or
@@ -121,41 +190,113 @@ def _bind_dhcp_client_socket(s, max_bind_attempts, bind_retry_interval):
             time.sleep(bind_retry_interval)
 
 
-def get_dhcp_options(dhcp_host=None, requested_options=[], timeout=5.0,
-                     vendor_id='cloudbase-init', max_bind_attempts=10,
-                     bind_retry_interval=3):
-    id_req = random.randint(0, 2 ** 32 - 1)
-    options = None
-
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    if not dhcp_host:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-
+def _send_dhcp_requests(s, queries, requested_options, vendor_id):
+    """Send the requests and return the queried interfaces by request id."""
+    pending = {}
+    for query in queries:
+        id_req = random.randint(0, 2 ** 32 - 1)
+        data = _get_dhcp_request_data(id_req, query.mac_address,
+                                      requested_options, vendor_id)
+        try:
+            s.sendto(data, (query.dhcp_host or "<broadcast>",
+                            _DHCP_SERVER_PORT))
+        except socket.error as ex:
+            LOG.warning("Failed to send the DHCP request for interface "
+                        "%(name)s: %(ex)s", {"name": query.name, "ex": ex})
+            continue
+        pending[id_req] = query.name
+    return pending
+
+
+def _receive_dhcp_replies(sockets, pending, timeout):
+    """Get the options replied to the pending requests, by interface.
+
+    The replies are received from all the sockets in the same buffer
+    until all the requests are answered or the timeout expires.
+    """
+    replies = {}
+    data = bytearray(_MAX_DHCP_MESSAGE_SIZE)
+    view = memoryview(data)
+    deadline = time.time() + timeout
+    while pending:
+        remaining = deadline - time.time()
+        ready = remaining > 0 and select.select(sockets, [], [],
+                                                remaining)[0]
+        if not ready:
+            break
+        for s in ready:
+            size = s.recv_into(data)
+            id_reply, options = _parse_dhcp_reply(view[:size])
+            if id_reply in pending:
+                replies[pending.pop(id_reply)] = options
+    return replies
+
+
+def get_dhcp_options_by_interface(queries=None, requested_options=[],
+                                  timeout=5.0, vendor_id='cloudbase-init',
+                                  max_bind_attempts=10,
+                                  bind_retry_interval=3):
+    """Get the DHCP options of multiple interfaces at once.
+
+    The requests are sent together and the replies are matched to them
+    by their transaction id, so all the interfaces are waited for at
+    most once. The broadcast requests are sent from a client socket
+    tied to their interface, the unicast ones share a socket.
+
+    :param queries: A list of :class:`DHCPQuery`, by default the
+                    interfaces having an IPv4 address are queried
+                    by broadcast.
+    :returns: A dict with the options of each queried interface,
+              keyed by name, None if no reply was received.
+    """
+    if queries is None:
+        queries = _get_dhcp_queries()
+    options = dict((query.name, None) for query in queries)
+    if not queries:
+        return options
+
+    queries_by_iface = collections.OrderedDict()
+    for query in queries:
+        iface = None if query.dhcp_host else query.name
+        queries_by_iface.setdefault(iface, []).append(query)
+
+    sockets = []
     try:
-        _bind_dhcp_client_socket(s, max_bind_attempts, bind_retry_interval)
-
-        s.settimeout(timeout)
+        pending = {}
+        for iface, iface_queries in queries_by_iface.items():
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sockets.append(s)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            address = ''
+            if iface is not None:
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+                address = _tie_socket_to_interface(s, iface)
+            _bind_dhcp_client_socket(s, max_bind_attempts,
+                                     bind_retry_interval, address)
+            pending.update(_send_dhcp_requests(
+                s, iface_queries, requested_options, vendor_id))
+        options.update(_receive_dhcp_replies(sockets, pending, timeout))
+    finally:
+        for s in sockets:
+            s.close()
 
-        local_ip_addr = network.get_local_ip(dhcp_host)
-        mac_address = _get_mac_address_by_local_ip(local_ip_addr)
+    for name, replied_options in options.items():
+        if replied_options is None:
+            LOG.debug("No DHCP reply received for interface: %s", name)
+    return options
 
-        data = _get_dhcp_request_data(id_req, mac_address, requested_options,
-                                      vendor_id)
 
-        s.sendto(data, (dhcp_host or "<broadcast>", 67))
+def get_dhcp_query(dhcp_host=None):
+    """Get the query of the interface used to reach the DHCP server."""
+    local_ip_addr = network.get_local_ip(dhcp_host)
+    iface, mac_address = _get_interface_by_local_ip(local_ip_addr)
+    return DHCPQuery(iface or local_ip_addr, mac_address, dhcp_host)
 
-        start = datetime.datetime.now()
-        now = start
-        replied = False
-        while (not replied and
-                now - start < datetime.timedelta(seconds=timeout)):
-            data = s.recv(1024)
-            (replied, options) = _parse_dhcp_reply(data, id_req)
-            now = datetime.datetime.now()
-    except socket.timeout:
-        pass
-    finally:
-        s.close()
 
-    return options
+def get_dhcp_options(dhcp_host=None, requested_options=[], timeout=5.0,
+                     vendor_id='cloudbase-init', max_bind_attempts=10,
+                     bind_retry_interval=3):
+    query = get_dhcp_query(dhcp_host)
+    return get_dhcp_options_by_interface(
+        [query], requested_options, timeout, vendor_id, max_bind_attempts,
+        bind_retry_interval)[query.name]
@@ -0,0 +1,214 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Read the DHCP options stored by the DHCP clients of the OS."""
+
+import calendar
+import collections
+import glob
+import os
+import re
+import socket
+import struct
+import time
+
+from oslo_log import log as oslo_logging
+import six
+
+LOG = oslo_logging.getLogger(__name__)
+
+# The options of the DHCP lease of an interface, keyed by their code,
+# with the values in their wire format.
+Lease = collections.namedtuple("Lease", ["interface", "options"])
+
+
+def _pack_addresses(value):
+    return b"".join(socket.inet_aton(address)
+                    for address in re.split(r"[\s,]+", value.strip())
+                    if address)
+
+
+def _pack_uint16(value):
+    return struct.pack("!H", int(value))
+
+
+# The options of the dhclient leases, by name.
+_DHCLIENT_OPTIONS = {
+    "subnet-mask": (1, _pack_addresses),
+    "routers": (3, _pack_addresses),
+    "domain-name-servers": (6, _pack_addresses),
+    "interface-mtu": (26, _pack_uint16),
+    "ntp-servers": (42, _pack_addresses),
+    "dhcp-server-identifier": (54, _pack_addresses),
+}
+
+# The options of the systemd-networkd leases, by key.
+_NETWORKD_OPTIONS = {
+    "NETMASK": (1, _pack_addresses),
+    "ROUTER": (3, _pack_addresses),
+    "DNS": (6, _pack_addresses),
+    "MTU": (26, _pack_uint16),
+    "NTP": (42, _pack_addresses),
+    "SERVER_ADDRESS": (54, _pack_addresses),
+}
+
+_DHCLIENT_STATEMENT_REGEX = re.compile(r"^(?:option\s+)?(\S+)\s+(.*);")
+_DHCLIENT_UNKNOWN_OPTION_REGEX = re.compile(r"^(?:unknown|option)-(\d+)$")
+_DHCLIENT_ESCAPE_REGEX = re.compile(r"\\([0-7]{1,3}|.)")
+_NETWORKD_OPTION_REGEX = re.compile(r"^OPTION_(\d+)$")
+_NM_INTERNAL_LEASE_REGEX = re.compile(
+    r"^internal-[0-9a-fA-F-]{36}-(.+)\.lease$")
+
+
+def _unescape(match):
+    escaped = match.group(1)
+    if escaped.isdigit():
+        return six.unichr(int(escaped, 8))
+    return escaped
+
+
+def _unpack_dhclient_value(value):
+    """Get the bytes of an option which dhclient has no name for.
+
+    The value is either a quoted string, with the non-printable
+    characters escaped in octal, or hex digits separated by colons.
+    """
+    if value.startswith('"') and value.endswith('"'):
+        return _DHCLIENT_ESCAPE_REGEX.sub(
+            _unescape, value[1:-1]).encode("latin-1")
+    return bytes(bytearray(int(byte, 16) for byte in value.split(":")))
+
+
+def _parse_dhclient_time(value):
+    """Get the timestamp of a lease time, None if it never ends."""
+    fields = value.split()
+    if fields[0] == "never":
+        return None
+    if fields[0] == "epoch":
+        return int(fields[1])
+    # The week day is followed by the UTC time.
+    return calendar.timegm(time.strptime(
+        " ".join(fields[1:3]), "%Y/%m/%d %H:%M:%S"))
+
+
+def parse_dhclient_leases(content, now=None):
+    """Get the unexpired leases of a dhclient leases file.
+
+    The leases of an interface are listed from the oldest to the newest.
+    """
+    now = time.time() if now is None else now
+    leases = []
+    interface = options = expire = None
+
+    for line in content.splitlines():
+        line = line.strip()
+        if line.startswith("lease {"):
+            interface, options, expire = None, {}, None
+        elif line == "}" and options is not None:
+            if expire is None or expire > now:
+                leases.append(Lease(interface, options))
+            options = None
+        elif options is not None:
+            match = _DHCLIENT_STATEMENT_REGEX.match(line)
+            if not match:
+                continue
+            name, value = match.groups()
+            try:
+                if name == "interface":
+                    interface = value.strip('"')
+                elif name == "expire":
+                    expire = _parse_dhclient_time(value)
+                elif name in _DHCLIENT_OPTIONS:
+                    code, pack = _DHCLIENT_OPTIONS[name]
+                    options[code] = pack(value)
+                else:
+                    unknown_match = _DHCLIENT_UNKNOWN_OPTION_REGEX.match(name)
+                    if unknown_match:
+                        options[int(unknown_match.group(1))] = (
+                            _unpack_dhclient_value(value))
+            except (ValueError, socket.error) as ex:
+                LOG.debug("Cannot parse the dhclient lease statement "
+                          "%(line)r: %(ex)s", {"line": line, "ex": ex})
+    return leases
+
+
+def parse_networkd_lease(content, interface):
+    """Get the lease of a systemd-networkd or NetworkManager lease file."""
+    options = {}
+    for line in content.splitlines():
+        key, sep, value = line.strip().partition("=")
+        if not sep or key.startswith("#"):
+            continue
+        try:
+            if key in _NETWORKD_OPTIONS:
+                code, pack = _NETWORKD_OPTIONS[key]
+                options[code] = pack(value)
+            else:
+                match = _NETWORKD_OPTION_REGEX.match(key)
+                if match:
+                    options[int(match.group(1))] = bytes(
+                        bytearray.fromhex(value))
+        except (ValueError, socket.error) as ex:
+            LOG.debug("Cannot parse the lease field %(line)r: %(ex)s",
+                      {"line": line, "ex": ex})
+    return Lease(interface, options)
+
+
+def _get_networkd_lease_interface(path):
+    """Get the interface of a lease file named by index or by name."""
+    file_name = os.path.basename(path)
+    if file_name.isdigit():
+        if_indextoname = getattr(socket, "if_indextoname", None)
+        try:
+            return if_indextoname(int(file_name)) if if_indextoname else None
+        except (OSError, socket.error):
+            return None
+    match = _NM_INTERNAL_LEASE_REGEX.match(file_name)
+    return match.group(1) if match else None
+
+
+def _read_leases(path):
+    with open(path, "rb") as stream:
+        content = stream.read().decode("utf-8", "replace")
+    if "lease {" in content:
+        return parse_dhclient_leases(content)
+    interface = _get_networkd_lease_interface(path)
+    return [parse_networkd_lease(content, interface)] if interface else []
+
+
+def _get_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+def get_leases(patterns):
+    """Get the leases of the lease files matching the given patterns.
+
+    The files are read from the least to the most recently modified,
+    so the latest lease of an interface comes last.
+    """
+    paths = set()
+    for pattern in patterns:
+        paths.update(glob.glob(pattern))
+
+    leases = []
+    for path in sorted(paths, key=_get_mtime):
+        try:
+            leases.extend(_read_leases(path))
+        except (IOError, OSError) as ex:
+            LOG.debug("Cannot read the DHCP lease file %(path)s: %(ex)s",
+                      {"path": path, "ex": ex})
+    return leases
@@ -0,0 +1,238 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Get the DHCP options of the network interfaces from several sources."""
+
+import abc
+import threading
+import time
+
+from oslo_log import log as oslo_logging
+import six
+
+from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit.utils import classloader
+from cloudbaseinit.utils import dhcp
+from cloudbaseinit.utils import dhcpleases
+
+CONF = cloudbaseinit_conf.CONF
+LOG = oslo_logging.getLogger(__name__)
+
+
+@six.add_metaclass(abc.ABCMeta)
+class BaseDHCPOptionsProvider(object):
+
+    """Source of the DHCP options of the network interfaces."""
+
+    @abc.abstractmethod
+    def get_dhcp_options(self, queries, requested_options):
+        """Get the requested options of the queried interfaces.
+
+        :param queries: A list of :class:`dhcp.DHCPQuery`.
+        :param requested_options: A list of option codes.
+        :returns: A dict with the options found for each interface,
+                  keyed by name, as dicts keyed by the option code.
+                  The interfaces without any answer are missing or
+                  None.
+        """
+
+
+class LeaseFileDHCPOptionsProvider(BaseDHCPOptionsProvider):
+
+    """Read the options from the lease files of the OS DHCP clients.
+
+    The lease files are read once, the latest lease of each interface
+    being kept.
+    """
+
+    def __init__(self, patterns=None):
+        self._patterns = patterns
+        self._leases = None
+
+    def _get_leases(self):
+        if self._leases is None:
+            patterns = self._patterns
+            if patterns is None:
+                patterns = CONF.dhcp_lease_files
+            self._leases = dict(
+                (lease.interface, lease.options)
+                for lease in dhcpleases.get_leases(patterns))
+        return self._leases
+
+    def get_dhcp_options(self, queries, requested_options):
+        leases = self._get_leases()
+        options = {}
+        for query in queries:
+            lease_options = leases.get(query.name)
+            if lease_options is not None:
+                options[query.name] = dict(
+                    (code, lease_options[code]) for code in requested_options
+                    if code in lease_options)
+        return options
+
+
+class LiveDHCPOptionsProvider(BaseDHCPOptionsProvider):
+
+    """Query the DHCP servers of the interfaces."""
+
+    def get_dhcp_options(self, queries, requested_options):
+        return dhcp.get_dhcp_options_by_interface(queries, requested_options)
+
+
+_lock = threading.Lock()
+_providers = None
+_declared_options = None
+# The options of each interface as (value, expiration) tuples keyed
+# by code. The interfaces are keyed by MAC address, as the callers
+# may know them under different names, e.g. on Windows.
+_options = {}
+_stats = {"hits": 0, "misses": 0, "expired": 0}
+_clock = getattr(time, "monotonic", time.time)
+
+
+def _get_providers():
+    global _providers
+    if _providers is None:
+        cl = classloader.ClassLoader()
+        _providers = [cl.load_class(class_path)()
+                      for class_path in CONF.dhcp_options_providers]
+    return _providers
+
+
+def _get_declared_options():
+    """Get the options declared by the plugins and metadata services.
+
+    The options are declared by the "dhcp_options" class attribute.
+    """
+    global _declared_options
+    if _declared_options is None:
+        declared_options = set()
+        cl = classloader.ClassLoader()
+        for class_path in CONF.plugins + CONF.metadata_services:
+            try:
+                declared_options.update(
+                    getattr(cl.load_class(class_path), "dhcp_options", ()))
+            except Exception as ex:
+                LOG.debug("Cannot get the DHCP options of %(class_path)s: "
+                          "%(ex)s", {"class_path": class_path, "ex": ex})
+        _declared_options = declared_options
+    return _declared_options
+
+
+def _get_cache_key(query):
+    if query.mac_address:
+        return query.mac_address.lower().replace("-", ":")
+    return query.name
+
+
+def _get_missing_options(query, requested_options, now):
+    options = _options.get(_get_cache_key(query), {})
+    return [code for code in requested_options
+            if code not in options or options[code][1] <= now]
+
+
+def _get_found_options(query, requested_options):
+    options = _options.get(_get_cache_key(query), {})
+    return dict((code, options[code][0]) for code in requested_options
+                if code in options)
+
+
+def _update_options(queries, requested_options, options_codes, now):
+    """Ask the providers for the options, the earlier ones first.
+
+    All the codes of options_codes are asked for, the next providers
+    being asked only for the interfaces still missing some of the
+    requested options. The options not provided are not cached, the
+    callers waiting for one, like the Azure WireServer address, ask
+    the providers again.
+    """
+    expiration = now + CONF.dhcp_options_cache_ttl
+    for query in queries:
+        options = _options.setdefault(_get_cache_key(query), {})
+        for code in list(options):
+            if options[code][1] <= now:
+                del options[code]
+
+    providers = _get_providers()
+    for provider in providers:
+        if not queries:
+            break
+        LOG.debug("Getting the DHCP options %(options)s of %(names)s "
+                  "from %(provider)s",
+                  {"options": options_codes,
+                   "names": [query.name for query in queries],
+                   "provider": provider.__class__.__name__})
+        provided = provider.get_dhcp_options(queries, options_codes)
+        for query in queries:
+            provided_options = provided.get(query.name)
+            if provided_options is None:
+                continue
+            options = _options[_get_cache_key(query)]
+            for code, value in provided_options.items():
+                options.setdefault(code, (value, expiration))
+        queries = [query for query in queries
+                   if _get_missing_options(query, requested_options, now)]
+
+
+def get_dhcp_options(queries, requested_options):
+    """Get the requested DHCP options of the queried interfaces.
+
+    The options are cached for "dhcp_options_cache_ttl" seconds and
+    shared by all the callers, the interfaces being identified by
+    their MAC address. On a cache miss, the options declared
+    by the enabled plugins and metadata services are requested as
+    well, so that a single DHCP request serves all of them.
+
+    The providers set in "dhcp_options_providers" are asked in order,
+    each only for the interfaces missing some of the options.
+
+    :param queries: A list of :class:`dhcp.DHCPQuery`.
+    :param requested_options: A list of option codes.
+    :returns: A dict with the options found for each interface, keyed
+              by name, as dicts keyed by the option code.
+    """
+    with _lock:
+        now = _clock()
+        missing = []
+        for query in queries:
+            missing_options = _get_missing_options(
+                query, requested_options, now)
+            if missing_options:
+                missing.append(query)
+                if any(code in _options.get(_get_cache_key(query), {})
+                       for code in missing_options):
+                    _stats["expired"] += 1
+        _stats["hits"] += len(queries) - len(missing)
+        _stats["misses"] += len(missing)
+
+        if missing:
+            options_codes = sorted(
+                set(requested_options) | _get_declared_options())
+            _update_options(missing, requested_options, options_codes, now)
+
+        return dict((query.name,
+                     _get_found_options(query, requested_options))
+                    for query in queries)
+
+
+def get_stats():
+    """Get the cache counters.
+
+    `hits` counts the interfaces served from the cache, each being a
+    DHCP request saved, `misses` the interfaces for which the
+    providers were asked and `expired` the misses due to an expired
+    option.
+    """
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,141 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from oslo_log import log as oslo_logging
+
+LOG = oslo_logging.getLogger(__name__)
+
+_ENTRY_SUFFIX = ".entry"
+# The entries are created by mkstemp, readable only by their owner.
+_DIRECTORY_MODE = 0o700
+
+CacheEntry = collections.namedtuple(
+    "CacheEntry", ["data", "etag", "last_modified"])
+
+
+def _replace_file(source, destination):
+    replace = getattr(os, "replace", None)
+    if replace:
+        replace(source, destination)
+    else:
+        # Python 2 does not provide an atomic replace on Windows.
+        if os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+
+class DiskCache(object):
+
+    """A size-bounded key-value store, persisted on disk.
+
+    Each entry is stored in its own file, as a JSON header line
+    followed by the raw data. The files are written atomically,
+    so that an interrupted write (e.g. a reboot) never leaves a
+    truncated entry behind. When the total size exceeds `max_size`,
+    the least recently written entries are removed. The cache
+    directory and the entries are accessible only by their owner.
+    """
+
+    def __init__(self, path, max_size, max_entry_size=None):
+        self._path = path
+        self._max_size = max_size
+        self._max_entry_size = max_entry_size or max_size
+        self._lock = threading.Lock()
+
+    def _get_entry_path(self, key):
+        key_hash = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self._path, key_hash + _ENTRY_SUFFIX)
+
+    def get(self, key):
+        """Get the :class:`CacheEntry` for the given key, if any."""
+        entry_path = self._get_entry_path(key)
+        try:
+            with open(entry_path, "rb") as stream:
+                header = json.loads(stream.readline().decode("utf-8"))
+                data = stream.read()
+        except (IOError, OSError):
+            return None
+        except ValueError:
+            LOG.debug("Removing invalid cache entry: %s", entry_path)
+            self.delete(key)
+            return None
+
+        if header.get("key") != key or header.get("size") != len(data):
+            return None
+        return CacheEntry(data=data, etag=header.get("etag"),
+                          last_modified=header.get("last_modified"))
+
+    def set(self, key, data, etag=None, last_modified=None):
+        """Store the given data, returning whether it was stored."""
+        if len(data) > self._max_entry_size:
+            LOG.debug("Not caching %(key)s, size %(size)s exceeds the "
+                      "limit", {"key": key, "size": len(data)})
+            return False
+
+        header = json.dumps({"key": key, "size": len(data), "etag": etag,
+                             "last_modified": last_modified})
+        with self._lock:
+            if not os.path.isdir(self._path):
+                os.makedirs(self._path, _DIRECTORY_MODE)
+
+            fd, temp_path = tempfile.mkstemp(dir=self._path)
+            try:
+                with os.fdopen(fd, "wb") as stream:
+                    stream.write(header.encode("utf-8") + b"\n")
+                    stream.write(data)
+                _replace_file(temp_path, self._get_entry_path(key))
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+            self._evict()
+        return True
+
+    def delete(self, key):
+        try:
+            os.remove(self._get_entry_path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self._path):
+            if not file_name.endswith(_ENTRY_SUFFIX):
+                continue
+            entry_path = os.path.join(self._path, file_name)
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+            total_size += stat.st_size
+
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self._max_size:
+                break
+            LOG.debug("Evicting cache entry: %s", entry_path)
+            try:
+                os.remove(entry_path)
+                total_size -= size
+            except OSError:
+                pass
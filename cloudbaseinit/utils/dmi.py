@@ -0,0 +1,76 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import abc
+import os
+
+from oslo_log import log as oslo_logging
+import six
+
+from cloudbaseinit.utils import classloader
+
+LOG = oslo_logging.getLogger(__name__)
+
+SYS_VENDOR = "sys_vendor"
+PRODUCT_NAME = "product_name"
+PRODUCT_UUID = "product_uuid"
+CHASSIS_ASSET_TAG = "chassis_asset_tag"
+
+DMI_FIELDS = (SYS_VENDOR, PRODUCT_NAME, PRODUCT_UUID, CHASSIS_ASSET_TAG)
+
+SYSFS_DMI_PATH = "/sys/class/dmi/id"
+
+
+@six.add_metaclass(abc.ABCMeta)
+class BaseDMISource(object):
+
+    """Source of the SMBIOS / DMI identifiers of the machine."""
+
+    @abc.abstractmethod
+    def get_dmi_info(self):
+        """Get a dict with the values of the :data:`DMI_FIELDS`.
+
+        The values which cannot be read are None.
+        """
+
+
+class SysfsDMISource(BaseDMISource):
+
+    """Read the DMI identifiers exposed by the Linux kernel in sysfs."""
+
+    def __init__(self, path=SYSFS_DMI_PATH):
+        self._path = path
+
+    def _read_field(self, field):
+        try:
+            with open(os.path.join(self._path, field), "rb") as stream:
+                value = stream.read().decode("utf-8", "replace").strip()
+        except (IOError, OSError) as ex:
+            LOG.debug("Cannot read DMI field %(field)s: %(error)s",
+                      {"field": field, "error": ex})
+            return None
+        return value or None
+
+    def get_dmi_info(self):
+        return dict((field, self._read_field(field)) for field in DMI_FIELDS)
+
+
+def get_dmi_source():
+    dmi_source_class_paths = {
+        'nt': 'cloudbaseinit.utils.windows.dmi.WindowsDMISource',
+        'posix': 'cloudbaseinit.utils.dmi.SysfsDMISource',
+    }
+
+    cl = classloader.ClassLoader()
+    return cl.load_class(dmi_source_class_paths[os.name])()
@@ -0,0 +1,301 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Read the files of ISO9660 images, with Joliet and Rock Ridge names."""
+
+import collections
+import os
+import struct
+
+from cloudbaseinit import exception
+
+SECTOR_SIZE = 2048
+ISO_ID = b'CD001'
+
+_VOLUME_DESCRIPTORS_SECTOR = 16
+# Guards against images without a volume descriptor set terminator.
+_MAX_VOLUME_DESCRIPTORS = 32
+# The primary, Joliet and terminator descriptors are usually read at once.
+_VOLUME_DESCRIPTORS_BATCH = 4
+_PRIMARY_VOLUME_DESCRIPTOR = 1
+_SUPPLEMENTARY_VOLUME_DESCRIPTOR = 2
+_VOLUME_DESCRIPTOR_TERMINATOR = 255
+_JOLIET_ESCAPE_SEQUENCES = (b'%/@', b'%/C', b'%/E')
+_OFFSET_JOLIET_ESCAPE_SEQUENCE = 88
+_OFFSET_VOLUME_SIZE = 80
+_OFFSET_ROOT_RECORD = 156
+
+# Length, extended attribute length, extent (LE), size (LE), flags
+# and name length of a directory record, followed by its name.
+_RECORD = struct.Struct('<BBI4xI4x7xB6xB')
+_FLAG_DIRECTORY = 0x02
+_SELF_NAME = b'\x00'
+_PARENT_NAME = b'\x01'
+
+# System Use Sharing Protocol entries, used by Rock Ridge.
+_SUSP_HEADER = struct.Struct('<2sBB')
+_SUSP_CONTINUATION = struct.Struct('<I4xI4xI')
+_NM_CONTINUE = 0x01
+# Files are read in chunks of this size, a multiple of the sector size.
+_CHUNK_SIZE = 1024 * 1024
+
+Entry = collections.namedtuple('Entry', ['name', 'extent', 'size',
+                                         'is_dir'])
+
+
+class ISO9660Error(exception.CloudbaseInitException):
+    pass
+
+
+def _strip_version(name):
+    """Remove the ";1" version and the empty extension of a name."""
+    name = name.split(';', 1)[0]
+    if name.endswith('.'):
+        name = name[:-1]
+    return name
+
+
+class ISO9660Reader(object):
+    """Read the files of an ISO9660 image.
+
+    Only the volume descriptors, the directories leading to the
+    requested paths and the extents of the read files are fetched.
+    The Rock Ridge names of the primary volume are preferred, then the
+    Joliet ones, before the plain ISO9660 names, without their version.
+
+    :param read: A callable getting the data found at a given offset of
+                 the image, as read(offset, size). The offsets and sizes
+                 are sector aligned, except for the last sector of a
+                 file.
+    :param size: The size of the device holding the image, if known,
+                 used to validate the image.
+    """
+
+    def __init__(self, read, size=None):
+        self._read = read
+        self._directories = {}
+        self._rock_ridge = False
+        self._joliet = False
+
+        primary, joliet = self._get_volume_descriptors()
+        volume_size = struct.unpack_from(
+            '<I', primary, _OFFSET_VOLUME_SIZE)[0] * SECTOR_SIZE
+        if size is not None and volume_size > size:
+            raise ISO9660Error('ISO9660 volume size %(volume_size)s '
+                               'exceeds the device size %(size)s' %
+                               {'volume_size': volume_size, 'size': size})
+        self.volume_size = volume_size
+
+        self._root = self._get_root(primary)
+        self._rock_ridge = self._has_rock_ridge(self._root)
+        if joliet and not self._rock_ridge:
+            self._joliet = True
+            self._root = self._get_root(joliet)
+
+    @classmethod
+    def from_stream(cls, stream, size=None):
+        """Read an image from a seekable binary stream, e.g. a file."""
+        def read(offset, size):
+            stream.seek(offset)
+            return stream.read(size)
+        return cls(read, size)
+
+    def _read_sectors(self, sector, size):
+        data = self._read(sector * SECTOR_SIZE, size)
+        if len(data) != size:
+            raise ISO9660Error('Short read of %(size)s bytes at sector '
+                               '%(sector)s' % {'size': size,
+                                               'sector': sector})
+        return data
+
+    def _iter_volume_descriptors(self):
+        for sector in range(_VOLUME_DESCRIPTORS_SECTOR,
+                            _VOLUME_DESCRIPTORS_SECTOR +
+                            _MAX_VOLUME_DESCRIPTORS,
+                            _VOLUME_DESCRIPTORS_BATCH):
+            sectors = self._read_sectors(
+                sector, _VOLUME_DESCRIPTORS_BATCH * SECTOR_SIZE)
+            for offset in range(0, len(sectors), SECTOR_SIZE):
+                descriptor = sectors[offset:offset + SECTOR_SIZE]
+                if (descriptor[1:6] != ISO_ID or ord(descriptor[0:1]) ==
+                        _VOLUME_DESCRIPTOR_TERMINATOR):
+                    return
+                yield ord(descriptor[0:1]), descriptor
+
+    def _get_volume_descriptors(self):
+        primary = None
+        joliet = None
+        for descriptor_type, descriptor in self._iter_volume_descriptors():
+            if descriptor_type == _PRIMARY_VOLUME_DESCRIPTOR:
+                primary = primary or descriptor
+            elif (descriptor_type == _SUPPLEMENTARY_VOLUME_DESCRIPTOR and
+                    descriptor[_OFFSET_JOLIET_ESCAPE_SEQUENCE:
+                               _OFFSET_JOLIET_ESCAPE_SEQUENCE + 3] in
+                    _JOLIET_ESCAPE_SEQUENCES):
+                joliet = joliet or descriptor
+
+        if not primary:
+            raise ISO9660Error('No ISO9660 primary volume descriptor found')
+        return primary, joliet
+
+    def _get_root(self, descriptor):
+        root, _ = self._parse_record(descriptor, _OFFSET_ROOT_RECORD)
+        return root._replace(name='')
+
+    def _parse_record(self, data, offset):
+        (length, ext_attr_length, extent, size, flags,
+         name_length) = _RECORD.unpack_from(data, offset)
+        name_offset = offset + _RECORD.size
+        name = data[name_offset:name_offset + name_length]
+        entry = Entry(name=name, extent=extent + ext_attr_length, size=size,
+                      is_dir=bool(flags & _FLAG_DIRECTORY))
+        # The system use area starts after the name, padded to an even
+        # offset within the record.
+        system_use = name_offset + name_length + (1 - name_length % 2)
+        return entry, data[system_use:offset + length]
+
+    def _iter_susp_entries(self, system_use):
+        areas = [system_use]
+        continuations = set()
+        while areas:
+            area = areas.pop()
+            offset = 0
+            while offset + _SUSP_HEADER.size <= len(area):
+                signature, length, _ = _SUSP_HEADER.unpack_from(area, offset)
+                if length < _SUSP_HEADER.size:
+                    break
+                data = area[offset + _SUSP_HEADER.size:offset + length]
+                if signature == b'CE':
+                    continuation = _SUSP_CONTINUATION.unpack_from(data)
+                    if continuation in continuations:
+                        raise ISO9660Error('Rock Ridge continuation loop')
+                    continuations.add(continuation)
+                    sector, area_offset, area_length = continuation
+                    data = self._read_sectors(
+                        sector, SECTOR_SIZE * (
+                            (area_offset + area_length - 1) //
+                            SECTOR_SIZE + 1))
+                    areas.append(data[area_offset:area_offset + area_length])
+                elif signature == b'ST':
+                    break
+                else:
+                    yield signature, data
+                offset += length
+
+    def _has_rock_ridge(self, root):
+        data = self._read_sectors(root.extent, SECTOR_SIZE)
+        _, system_use = self._parse_record(data, 0)
+        return any(signature == b'SP'
+                   for signature, _ in self._iter_susp_entries(system_use))
+
+    def _get_name(self, raw_name, system_use):
+        if self._rock_ridge:
+            parts = []
+            for signature, data in self._iter_susp_entries(system_use):
+                if signature == b'NM':
+                    parts.append(data[1:])
+                    if not ord(data[0:1]) & _NM_CONTINUE:
+                        break
+            if parts:
+                return b''.join(parts).decode('utf-8')
+        if self._joliet:
+            return _strip_version(raw_name.decode('utf-16-be'))
+        return _strip_version(raw_name.decode('ascii'))
+
+    def _read_directory(self, directory):
+        """Get the entries of a directory, keyed by their names."""
+        entries = self._directories.get(directory.extent)
+        if entries is not None:
+            return entries
+
+        entries = collections.OrderedDict()
+        data = self._read_sectors(directory.extent, directory.size)
+        offset = 0
+        while offset < len(data):
+            length = ord(data[offset:offset + 1])
+            if not length:
+                # Records do not span sectors, the rest is padding.
+                offset = (offset // SECTOR_SIZE + 1) * SECTOR_SIZE
+                continue
+            entry, system_use = self._parse_record(data, offset)
+            offset += length
+            if entry.name in (_SELF_NAME, _PARENT_NAME):
+                continue
+            name = self._get_name(entry.name, system_use)
+            if name in ('', '.', '..') or '/' in name or '\\' in name:
+                raise ISO9660Error('Invalid file name: %r' % name)
+            entries[name] = entry._replace(name=name)
+
+        self._directories[directory.extent] = entries
+        return entries
+
+    def _get_entry(self, path):
+        entry = self._root
+        for name in path.replace('\\', '/').split('/'):
+            if not name:
+                continue
+            if not entry.is_dir:
+                raise ISO9660Error('Not a directory: %s' % entry.name)
+            entry = self._read_directory(entry).get(name)
+            if not entry:
+                raise ISO9660Error('Path not found: %s' % path)
+        return entry
+
+    def isdir(self, path):
+        try:
+            return self._get_entry(path).is_dir
+        except ISO9660Error:
+            return False
+
+    def listdir(self, path=''):
+        entry = self._get_entry(path)
+        if not entry.is_dir:
+            raise ISO9660Error('Not a directory: %s' % path)
+        return list(self._read_directory(entry))
+
+    def _iter_file_data(self, entry):
+        offset = 0
+        while offset < entry.size:
+            size = min(_CHUNK_SIZE, entry.size - offset)
+            yield self._read_sectors(entry.extent + offset // SECTOR_SIZE,
+                                     size)
+            offset += size
+
+    def read_file(self, path):
+        """Get the content of the file found at the given path."""
+        entry = self._get_entry(path)
+        if entry.is_dir:
+            raise ISO9660Error('Not a file: %s' % path)
+        return b''.join(self._iter_file_data(entry))
+
+    def extract(self, target_path, path=''):
+        """Copy the files of a directory to an existing target path."""
+        pending = [(self._get_entry(path), target_path)]
+        extracted = set()
+        while pending:
+            directory, directory_path = pending.pop()
+            if directory.extent in extracted:
+                raise ISO9660Error('Directory loop found at: %s' %
+                                   directory_path)
+            extracted.add(directory.extent)
+            for name, entry in self._read_directory(directory).items():
+                entry_path = os.path.join(directory_path, name)
+                if entry.is_dir:
+                    if not os.path.isdir(entry_path):
+                        os.mkdir(entry_path)
+                    pending.append((entry, entry_path))
+                else:
+                    with open(entry_path, 'wb') as stream:
+                        for data in self._iter_file_data(entry):
+                            stream.write(data)
@@ -22,9 +22,11 @@ from oslo_log import log as oslo_logging
 from six.moves.urllib import parse
 from six.moves.urllib import request
 
+from cloudbaseinit import conf as cloudbaseinit_conf
 from cloudbaseinit.osutils import factory as osutils_factory
 
 
+CONF = cloudbaseinit_conf.CONF
 LOG = oslo_logging.getLogger(__name__)
 MAX_URL_CHECK_RETRIES = 3
 
@@ -35,11 +37,13 @@ def get_local_ip(address=None):
     return s.getsockname()[0]
 
 
-def check_url(url, retries_count=MAX_URL_CHECK_RETRIES):
+def check_url(url, retries_count=MAX_URL_CHECK_RETRIES, timeout=None):
+    if timeout is None:
+        timeout = CONF.metadata_http_connect_timeout
     for i in range(0, MAX_URL_CHECK_RETRIES):
         try:
             LOG.debug("Testing url: %s" % url)
-            request.urlopen(url)
+            request.urlopen(url, timeout=timeout)
             return True
         except Exception:
             pass
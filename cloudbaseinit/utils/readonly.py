@@ -0,0 +1,80 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Read-only containers, used for sharing parsed documents safely."""
+
+
+def _read_only(*args, **kwargs):
+    raise TypeError("The object is read-only")
+
+
+class ReadOnlyDict(dict):
+
+    """A dict which cannot be modified.
+
+    Copies made with the copy module are regular, mutable containers.
+    """
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (ReadOnlyDict, (dict(self),))
+
+
+class ReadOnlyList(list):
+
+    """A list which cannot be modified.
+
+    Copies made with the copy module are regular, mutable containers.
+    """
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = _read_only
+    clear = reverse = sort = _read_only
+    # Python 2 list slicing methods.
+    __setslice__ = __delslice__ = _read_only
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (ReadOnlyList, (list(self),))
+
+
+def freeze(value):
+    """Get a read-only copy of a JSON-like document."""
+    if isinstance(value, dict):
+        return ReadOnlyDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return ReadOnlyList(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Get a mutable copy of a JSON-like document."""
+    if isinstance(value, dict):
+        return dict((k, thaw(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [thaw(item) for item in value]
+    return value
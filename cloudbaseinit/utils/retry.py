@@ -0,0 +1,295 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import email.utils
+import errno
+import random
+import socket
+import ssl
+import threading
+import time
+
+from oslo_log import log as oslo_logging
+import requests
+from six.moves import http_client
+from six.moves.urllib import error as urllib_error
+
+from cloudbaseinit import conf as cloudbaseinit_conf
+from cloudbaseinit import exception
+
+CONF = cloudbaseinit_conf.CONF
+LOG = oslo_logging.getLogger(__name__)
+
+ERROR_CONNECTION_REFUSED = "connection_refused"
+ERROR_CONNECTION = "connection"
+ERROR_TIMEOUT = "timeout"
+ERROR_SERVER = "server"
+ERROR_CLIENT = "client"
+ERROR_TLS = "tls"
+ERROR_UNKNOWN = "unknown"
+
+RETRYABLE_ERRORS = (ERROR_CONNECTION_REFUSED, ERROR_CONNECTION,
+                    ERROR_TIMEOUT, ERROR_SERVER, ERROR_UNKNOWN)
+# Client errors which are worth retrying: Request Timeout and
+# Too Many Requests.
+RETRYABLE_CLIENT_STATUS_CODES = (408, 429)
+
+
+def _get_status_code(exc):
+    response = getattr(exc, "response", None)
+    if response is not None:
+        return getattr(response, "status_code", None)
+    return getattr(exc, "code", None)
+
+
+def classify_error(exc):
+    """Get the category of the given error.
+
+    The category is used to decide whether an action which failed
+    with the given error should be retried or not.
+    """
+    if isinstance(exc, (exception.CertificateVerifyFailed,
+                        requests.exceptions.SSLError, ssl.SSLError)):
+        return ERROR_TLS
+
+    if isinstance(exc, (requests.HTTPError, urllib_error.HTTPError)):
+        status_code = _get_status_code(exc)
+        if status_code is None:
+            return ERROR_UNKNOWN
+        if status_code >= 500:
+            return ERROR_SERVER
+        if status_code in RETRYABLE_CLIENT_STATUS_CODES:
+            return ERROR_TIMEOUT
+        return ERROR_CLIENT
+
+    if isinstance(exc, (requests.Timeout, socket.timeout)):
+        return ERROR_TIMEOUT
+
+    error_number = getattr(exc, "errno", None)
+    if isinstance(exc, requests.ConnectionError):
+        # The original socket error is wrapped by urllib3 / requests.
+        reason = exc.args[0] if exc.args else None
+        reason = getattr(reason, "reason", reason)
+        error_number = getattr(reason, "errno", None) or error_number
+        if error_number == errno.ECONNREFUSED or (
+                "refused" in str(reason).lower()):
+            return ERROR_CONNECTION_REFUSED
+        return ERROR_CONNECTION
+
+    if isinstance(exc, (socket.error, http_client.HTTPException,
+                        urllib_error.URLError)):
+        if error_number == errno.ECONNREFUSED:
+            return ERROR_CONNECTION_REFUSED
+        return ERROR_CONNECTION
+
+    return ERROR_UNKNOWN
+
+
+def get_retry_after(exc):
+    """Get the delay requested by the server through `Retry-After`.
+
+    The header value can be either a number of seconds or an HTTP date.
+    None is returned if the header is missing or invalid.
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or getattr(
+        exc, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    retry_date = email.utils.parsedate_tz(value)
+    if not retry_date:
+        LOG.debug("Invalid Retry-After header value: %s", value)
+        return None
+    return max(0.0, email.utils.mktime_tz(retry_date) - time.time())
+
+
+class RetryBudget(object):
+
+    """Amount of time which can be spent waiting between retries.
+
+    A single budget is shared by all the retry policies during
+    a boot, so that a slow or broken metadata provider cannot
+    stall the boot indefinitely, regardless of the number of
+    different actions being retried.
+    """
+
+    def __init__(self, budget=None):
+        self._budget = budget
+        self._spent = 0.0
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        if self._budget is None:
+            return None
+        with self._lock:
+            return max(0.0, self._budget - self._spent)
+
+    def consume(self, amount):
+        with self._lock:
+            self._spent += amount
+
+
+_boot_budget = None
+_boot_budget_lock = threading.Lock()
+
+
+def get_boot_budget():
+    """Get the retry budget shared by the current boot."""
+    global _boot_budget
+
+    with _boot_budget_lock:
+        if _boot_budget is None:
+            _boot_budget = RetryBudget(CONF.retry_boot_deadline)
+        return _boot_budget
+
+
+class RetryPolicy(object):
+
+    """Retry an action with exponential backoff and full jitter.
+
+    :param retry_count:
+        Max. number of retries after the first failed attempt.
+    :param interval:
+        Base interval between attempts, expressed in seconds. It is
+        doubled after each attempt, up to `max_interval`.
+    :param max_interval:
+        Upper bound of the interval between attempts, including the
+        delays requested through `Retry-After`.
+    :param jitter:
+        Whether to wait a random amount of time between 0 and the
+        computed interval, in order to avoid lockstep retries from
+        multiple instances booting at the same time.
+    :param call_deadline:
+        Max. number of seconds spent on a single action, including
+        all its retries. None means no limit.
+    :param boot_budget:
+        A :class:`RetryBudget` shared with other policies.
+    """
+
+    def __init__(self, retry_count, interval, max_interval=None,
+                 jitter=True, call_deadline=None, boot_budget=None):
+        self.retry_count = retry_count
+        self.interval = interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.call_deadline = call_deadline
+        self.boot_budget = boot_budget or RetryBudget()
+
+    @classmethod
+    def from_config(cls, group=None):
+        """Create a policy based on the options from the given section.
+
+        The options which are not set in the given section are taken
+        from the DEFAULT section.
+        """
+        def _get_option(name):
+            value = None
+            if group:
+                value = CONF[group].get(name)
+            if value is None:
+                value = CONF.get(name)
+            return value
+
+        return cls(retry_count=_get_option("retry_count"),
+                   interval=_get_option("retry_count_interval"),
+                   max_interval=_get_option("retry_max_interval"),
+                   jitter=CONF.retry_jitter,
+                   call_deadline=_get_option("retry_call_deadline"),
+                   boot_budget=get_boot_budget())
+
+    def get_interval(self, attempt):
+        """Get the time to wait after the given failed attempt."""
+        interval = self.interval * (2 ** attempt)
+        if self.max_interval is not None:
+            interval = min(interval, self.max_interval)
+        if self.jitter:
+            interval = random.uniform(0, interval)
+        return interval
+
+    @staticmethod
+    def is_retryable(exc):
+        return classify_error(exc) in RETRYABLE_ERRORS
+
+    def _get_delay(self, attempt, exc, start_time):
+        """Get the delay before the next attempt or None to stop."""
+        if attempt >= self.retry_count:
+            return None
+
+        elapsed = None
+        if self.call_deadline is not None:
+            elapsed = time.time() - start_time
+        remaining_budget = self.boot_budget.remaining()
+
+        retry_after = get_retry_after(exc)
+        if retry_after is not None:
+            # The delay requested by the server is honored up to the
+            # max. interval and the time left to the deadlines.
+            limits = [limit for limit in (self.max_interval,
+                                          remaining_budget)
+                      if limit is not None]
+            if elapsed is not None:
+                limits.append(max(0.0, self.call_deadline - elapsed))
+            delay = min([retry_after] + limits)
+        else:
+            delay = self.get_interval(attempt)
+
+        if elapsed is not None and elapsed + delay > self.call_deadline:
+            LOG.debug("Retry deadline of %s seconds reached",
+                      self.call_deadline)
+            return None
+
+        if remaining_budget is not None and delay > remaining_budget:
+            LOG.debug("Boot retry budget exhausted")
+            return None
+
+        return delay
+
+    def execute(self, action, is_retryable=None):
+        """Execute the action, retrying it in case of transient errors.
+
+        :param action: A callable with no arguments.
+        :param is_retryable:
+            A callable receiving the raised exception, returning
+            whether the action can be retried. It defaults to
+            :meth:`~is_retryable`.
+        """
+        is_retryable = is_retryable or self.is_retryable
+        start_time = time.time()
+        attempt = 0
+        while True:
+            try:
+                return action()
+            except Exception as exc:
+                if not is_retryable(exc):
+                    raise
+                delay = self._get_delay(attempt, exc, start_time)
+                if delay is None:
+                    raise
+                LOG.debug("Attempt %(attempt)s failed with %(error)r, "
+                          "retrying in %(delay).2f seconds",
+                          {"attempt": attempt + 1, "error": exc,
+                           "delay": delay})
+                self.boot_budget.consume(delay)
+                time.sleep(delay)
+                attempt += 1
@@ -0,0 +1,47 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from cloudbaseinit.utils import dmi
+from cloudbaseinit.utils.windows import wmi_loader
+
+wmi = wmi_loader.wmi()
+
+
+def _get_first(conn, wmi_class, properties):
+    items = conn.query("SELECT %s FROM %s" % (", ".join(properties),
+                                              wmi_class))
+    return items[0] if items else None
+
+
+class WindowsDMISource(dmi.BaseDMISource):
+
+    """Read the SMBIOS identifiers exposed through WMI."""
+
+    def get_dmi_info(self):
+        conn = wmi.WMI(moniker='//./root/cimv2')
+        dmi_info = dict.fromkeys(dmi.DMI_FIELDS)
+
+        product = _get_first(conn, "Win32_ComputerSystemProduct",
+                             ["Vendor", "Name", "UUID"])
+        if product:
+            dmi_info[dmi.SYS_VENDOR] = product.Vendor or None
+            dmi_info[dmi.PRODUCT_NAME] = product.Name or None
+            dmi_info[dmi.PRODUCT_UUID] = product.UUID or None
+
+        enclosure = _get_first(conn, "Win32_SystemEnclosure",
+                               ["SMBIOSAssetTag"])
+        if enclosure:
+            dmi_info[dmi.CHASSIS_ASSET_TAG] = (
+                (enclosure.SMBIOSAssetTag or "").strip() or None)
+        return dmi_info
@@ -0,0 +1,128 @@
+# Copyright 2019 Cloudbase Solutions Srl
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Extract a few fields from XML documents, without building object trees."""
+
+import collections
+import io
+from xml.etree import ElementTree
+
+import six
+
+# The fields of an element: its text, its attributes and the text of
+# its direct children, keyed by their local name.
+Record = collections.namedtuple("Record", ["text", "attrib", "fields"])
+
+
+def _get_local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _get_qualified_name(name, prefixes):
+    """Get the prefix:name form of a {uri}name attribute name."""
+    if not name.startswith("{"):
+        return name
+    uri, local_name = name[1:].split("}", 1)
+    prefix = prefixes.get(uri)
+    return "%s:%s" % (prefix, local_name) if prefix else local_name
+
+
+def _get_record(element, prefixes):
+    attrib = dict((_get_qualified_name(name, prefixes), value)
+                  for name, value in element.attrib.items())
+    fields = {}
+    for child in element:
+        fields.setdefault(_get_local_name(child.tag), child.text or "")
+    return Record(text=element.text or "", attrib=attrib, fields=fields)
+
+
+def _parse(source, paths):
+    paths = frozenset(paths)
+    records = dict((path, []) for path in paths)
+    prefixes = {}
+    stack = []
+    open_records = 0
+
+    for event, item in ElementTree.iterparse(
+            source, events=("start-ns", "start", "end")):
+        if event == "start-ns":
+            prefix, uri = item
+            # Only the prefixed attributes belong to a namespace.
+            if prefix:
+                prefixes.setdefault(uri, prefix)
+        elif event == "start":
+            stack.append(_get_local_name(item.tag))
+            if "/".join(stack) in paths:
+                open_records += 1
+        else:
+            path = "/".join(stack)
+            stack.pop()
+            if path in paths:
+                records[path].append(_get_record(item, prefixes))
+                open_records -= 1
+            if not open_records:
+                # Not part of a record, the element is no longer needed.
+                item.clear()
+    return records
+
+
+def parse(data, paths):
+    """Get the records of the elements found at the given paths.
+
+    The document is parsed incrementally and the elements which are
+    not part of a requested record are discarded as soon as they end.
+
+    :param data: The XML document, as bytes or text.
+    :param paths: Element paths, made of the local names of the
+                  elements starting with the root, e.g.
+                  "GoalState/Incarnation". The namespace prefixes are
+                  not part of the paths, while the attribute names of
+                  the records keep them, e.g. "oe:key".
+    :returns: A dict with a list of :class:`Record` for each path.
+    """
+    if isinstance(data, six.text_type):
+        data = data.encode("utf-8")
+    return _parse(io.BytesIO(data), paths)
+
+
+def parse_file(path, paths):
+    """Get the records of an XML file, see :func:`parse`."""
+    with open(path, "rb") as stream:
+        return _parse(stream, paths)
+
+
+def find_text(data, path, default=None):
+    """Get the text of the first element found at the given path.
+
+    Unlike :func:`parse`, the parsing stops at the first match, which
+    makes it cheap to read a field found at the top of a document.
+    """
+    if isinstance(data, six.text_type):
+        data = data.encode("utf-8")
+    stack = []
+    for event, element in ElementTree.iterparse(
+            io.BytesIO(data), events=("start", "end")):
+        if event == "start":
+            stack.append(_get_local_name(element.tag))
+        else:
+            if "/".join(stack) == path:
+                return element.text or ""
+            stack.pop()
+    return default
+
+
+def get_text(records, path, default=None):
+    """Get the text of the first record found at the given path."""
+    found = records.get(path)
+    return found[0].text if found else default